@@ -0,0 +1,38 @@
+-- ========================================
+-- 知識庫向量索引改為 HNSW
+-- ========================================
+-- 用途：既有部署由 ivfflat（idx_kb_embedding）改為 HNSW 主索引 + target_user 分區部分索引
+-- 相關：rag-orchestrator/services/vector_index.py、scripts/manage_vector_indexes.py
+--       （同內容也可用 `python scripts/manage_vector_indexes.py create --drop-ivfflat` 執行，
+--        並可加 --vendor-ids 建立熱門業者分區索引）
+-- 注意：CREATE INDEX CONCURRENTLY 不可在交易中執行，請以 psql 逐句執行（勿用 -1）
+-- ========================================
+
+-- 1. HNSW 主索引（啟用中且有 embedding）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_kb_embedding_hnsw ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE;
+
+-- 2. 常見 target_user 分區
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_kb_embedding_hnsw_tu_tenant_all_users ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['tenant','all_users']::text[]);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_kb_embedding_hnsw_tu_landlord_all_users ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['landlord','all_users']::text[]);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_kb_embedding_hnsw_tu_property_manager ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['property_manager']::text[]);
+
+-- 3. 移除舊 ivfflat 索引並更新統計
+DROP INDEX CONCURRENTLY IF EXISTS idx_kb_embedding;
+ANALYZE knowledge_base;
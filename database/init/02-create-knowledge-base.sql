@@ -74,11 +74,32 @@ CREATE INDEX IF NOT EXISTS idx_kb_is_active ON knowledge_base(is_active);
 CREATE INDEX IF NOT EXISTS idx_kb_source_type ON knowledge_base(source_type);
 CREATE INDEX IF NOT EXISTS idx_kb_category ON knowledge_base(category);
 
--- 向量索引（IVFFlat 演算法加速向量搜尋）
--- lists 參數：建議設為 sqrt(總資料筆數)，這裡預估 1000 筆，設為 100
-CREATE INDEX IF NOT EXISTS idx_kb_embedding ON knowledge_base
-USING ivfflat (embedding vector_cosine_ops)
-WITH (lists = 100);
+-- 向量索引（HNSW；由 rag-orchestrator/services/vector_index.py 管理，參數 VECTOR_INDEX_*）
+-- 部分索引述詞須與檢索 SQL 的 WHERE 子句一致，planner 才會使用；
+-- 檢索 SQL 以純距離 ORDER BY embedding <=> q 排序，查詢時 hnsw.ef_search 由檢索器逐交易設定
+CREATE INDEX IF NOT EXISTS idx_kb_embedding_hnsw ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE;
+
+-- 常見 target_user 分區（b2c 租客 / 房東含 all_users 通用標記；b2b 物業管理師）
+CREATE INDEX IF NOT EXISTS idx_kb_embedding_hnsw_tu_tenant_all_users ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['tenant','all_users']::text[]);
+
+CREATE INDEX IF NOT EXISTS idx_kb_embedding_hnsw_tu_landlord_all_users ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['landlord','all_users']::text[]);
+
+CREATE INDEX IF NOT EXISTS idx_kb_embedding_hnsw_tu_property_manager ON knowledge_base
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE embedding IS NOT NULL AND is_active = TRUE
+  AND (target_user IS NULL OR target_user && ARRAY['property_manager']::text[]);
 
 -- GIN 索引（陣列欄位）
 CREATE INDEX IF NOT EXISTS idx_kb_keywords ON knowledge_base USING GIN(keywords);
@@ -1,15 +1,28 @@
 """
 Embedding API Service
 統一的向量生成服務，支援快取
+
+- 單筆 /api/v1/embeddings：快取未命中時交給 micro-batcher，
+  數毫秒內的並發請求合併成一次上游 embeddings.create(input=[...])
+- 批次 /api/v1/embeddings/batch：一次 Redis MGET、未命中者合併為一次上游呼叫、
+  pipeline SETEX 回寫
+- 快取以二進位 float32（可選 float16）儲存，key 帶版本前綴 embedding:v2:<fmt>:；
+  舊版 JSON 條目讀到時 lazy 遷移
+- encoding_format=base64 時回傳二進位向量的 base64，省去 JSON 浮點數序列化
 """
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
-from openai import OpenAI
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional, Tuple
+from openai import APIConnectionError, OpenAI
+from array import array
+import asyncio
+import base64
 import redis
 import hashlib
 import json
 import os
+import struct
+import sys
 
 app = FastAPI(
     title="Embedding API Service",
@@ -24,6 +37,18 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 EMBEDDING_MODEL = "text-embedding-3-small"
 CACHE_TTL = 86400  # 24 小時
 
+# 批次配置
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256"))  # 單次上游呼叫的 input 上限
+MAX_BATCH_REQUEST_TEXTS = int(os.getenv("EMBEDDING_MAX_BATCH_REQUEST_TEXTS", "2048"))  # 批次端點單次請求上限
+MICRO_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_MICRO_BATCH_WINDOW_MS", "5"))  # 0 = 停用 micro-batching
+MICRO_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_MICRO_BATCH_MAX_SIZE", "64"))
+
+# 快取向量格式（f32 / f16）；與 rag-orchestrator services/vector_codec.py 保持一致
+VECTOR_CACHE_FORMAT = os.getenv("VECTOR_CACHE_FORMAT", "f32").lower()
+if VECTOR_CACHE_FORMAT not in ("f32", "f16"):
+    VECTOR_CACHE_FORMAT = "f32"
+LEGACY_CACHE_READ = os.getenv("EMBEDDING_LEGACY_CACHE_READ", "true").lower() == "true"
+
 # OpenAI 客戶端
 client = OpenAI(api_key=OPENAI_API_KEY)
 
@@ -40,17 +65,306 @@ except Exception as e:
     print(f"⚠️  Redis 連線失敗: {e}")
     redis_client = None
 
+# ============================================================
+# 向量二進位編碼（little-endian；f32 = 4 bytes/維，f16 = 2 bytes/維）
+# ============================================================
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def encode_vector(vector: List[float], fmt: str = VECTOR_CACHE_FORMAT) -> bytes:
+    if fmt == "f16":
+        return struct.pack(f"<{len(vector)}e", *vector)
+    buf = array("f", vector)
+    if not _LITTLE_ENDIAN:
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def decode_vector(data: bytes, fmt: str = VECTOR_CACHE_FORMAT) -> List[float]:
+    if fmt == "f16":
+        return list(struct.unpack(f"<{len(data) // 2}e", data))
+    buf = array("f")
+    buf.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        buf.byteswap()
+    return buf.tolist()
+
+
+def encode_vector_b64(vector: List[float]) -> str:
+    """回應用：float32 二進位的 base64（客戶端以 f32 解碼）"""
+    return base64.b64encode(encode_vector(vector, "f32")).decode("ascii")
+
+
 # 資料模型
 class EmbeddingRequest(BaseModel):
     text: str
     model: str = EMBEDDING_MODEL
+    encoding_format: Literal["float", "base64"] = "float"
 
 class EmbeddingResponse(BaseModel):
-    embedding: List[float]
+    embedding: Optional[List[float]] = None
+    embedding_b64: Optional[str] = None  # encoding_format=base64：float32 little-endian
     model: str
     dimensions: int
     cached: bool
 
+class BatchEmbeddingRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    model: str = EMBEDDING_MODEL
+    encoding_format: Literal["float", "base64"] = "float"
+
+class BatchEmbeddingResponse(BaseModel):
+    embeddings: Optional[List[List[float]]] = None
+    embeddings_b64: Optional[List[str]] = None  # encoding_format=base64：float32 little-endian
+    model: str
+    dimensions: int
+    cached: List[bool]
+    cache_hits: int
+    upstream_calls: int
+
+
+# ============================================================
+# 快取與上游呼叫（同步；由 async 端點以 asyncio.to_thread 呼叫，不阻塞 event loop）
+# ============================================================
+
+def _text_hash(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _cache_key(model: str, text: str) -> str:
+    return f"embedding:v2:{VECTOR_CACHE_FORMAT}:{model}:{_text_hash(text)}"
+
+
+def _legacy_cache_key(model: str, text: str) -> str:
+    """舊版 JSON 快取 key（僅 lazy 遷移讀取）"""
+    return f"embedding:{model}:{_text_hash(text)}"
+
+
+def _cache_get_many(keys: List[str], legacy_keys: Optional[List[str]] = None) -> List[Optional[List[float]]]:
+    """
+    一次 MGET 讀取多個快取；Redis 不可用或讀取失敗時全部視為未命中
+
+    v2 未命中者再以一次 MGET 讀舊版 JSON 條目，命中則以 pipeline 改寫為 v2 並刪除舊 key。
+    """
+    if not redis_client or not keys:
+        return [None] * len(keys)
+    try:
+        raw_values = redis_client.mget(keys)
+    except Exception as e:
+        print(f"Redis 讀取失敗: {e}")
+        return [None] * len(keys)
+
+    results: List[Optional[List[float]]] = []
+    for raw in raw_values:
+        try:
+            results.append(decode_vector(raw) if raw else None)
+        except Exception:
+            results.append(None)
+
+    missing = [i for i, value in enumerate(results) if value is None]
+    if LEGACY_CACHE_READ and legacy_keys and missing:
+        try:
+            legacy_values = redis_client.mget([legacy_keys[i] for i in missing])
+            pipe = redis_client.pipeline(transaction=False)
+            migrated = 0
+            for i, raw in zip(missing, legacy_values):
+                if not raw:
+                    continue
+                vector = json.loads(raw)
+                results[i] = vector
+                pipe.setex(keys[i], CACHE_TTL, encode_vector(vector))
+                pipe.delete(legacy_keys[i])
+                migrated += 1
+            if migrated:
+                pipe.execute()
+        except Exception as e:
+            print(f"Redis 舊格式快取遷移失敗: {e}")
+    return results
+
+
+def _cache_set_many(items: Dict[str, List[float]]):
+    """以 pipeline 一次送出多個 SETEX（二進位格式）"""
+    if not redis_client or not items:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key, embedding in items.items():
+            pipe.setex(key, CACHE_TTL, encode_vector(embedding))
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis 寫入失敗: {e}")
+
+
+def _embed_upstream(texts: List[str], model: str) -> Tuple[List[List[float]], int]:
+    """
+    呼叫 OpenAI 生成向量（依 MAX_BATCH_SIZE 切塊，每塊一次 embeddings.create）
+
+    Returns:
+        (與 texts 同順序的向量列表, 上游呼叫次數)
+    """
+    embeddings: List[List[float]] = []
+    calls = 0
+    for start in range(0, len(texts), MAX_BATCH_SIZE):
+        chunk = texts[start:start + MAX_BATCH_SIZE]
+        response = client.embeddings.create(model=model, input=chunk)
+        calls += 1
+        # 上游回傳以 index 對應輸入順序
+        ordered = sorted(response.data, key=lambda d: d.index)
+        embeddings.extend(d.embedding for d in ordered)
+    return embeddings, calls
+
+
+async def embed_texts(texts: List[str], model: str) -> Tuple[List[List[float]], List[bool], int]:
+    """
+    批次生成向量：MGET 快取 → 未命中者去重後合併上游呼叫 → pipeline 回寫
+
+    Returns:
+        (向量列表, 每筆是否命中快取, 上游呼叫次數)
+    """
+    keys = [_cache_key(model, t) for t in texts]
+    legacy_keys = [_legacy_cache_key(model, t) for t in texts]
+    cached_values = await asyncio.to_thread(_cache_get_many, keys, legacy_keys)
+
+    # 未命中的文字去重（同一批內重複文字只送一次）
+    miss_texts: List[str] = []
+    miss_index: Dict[str, int] = {}
+    for text, value in zip(texts, cached_values):
+        if value is None and text not in miss_index:
+            miss_index[text] = len(miss_texts)
+            miss_texts.append(text)
+
+    upstream_calls = 0
+    fresh: List[List[float]] = []
+    if miss_texts:
+        fresh, upstream_calls = await asyncio.to_thread(_embed_upstream, miss_texts, model)
+        await asyncio.to_thread(
+            _cache_set_many,
+            {_cache_key(model, t): fresh[i] for t, i in miss_index.items()}
+        )
+
+    embeddings = []
+    cached_flags = []
+    for text, value in zip(texts, cached_values):
+        if value is not None:
+            embeddings.append(value)
+            cached_flags.append(True)
+        else:
+            embeddings.append(fresh[miss_index[text]])
+            cached_flags.append(False)
+    return embeddings, cached_flags, upstream_calls
+
+
+# ============================================================
+# Micro-batcher：合併並發的單筆請求
+# ============================================================
+
+class EmbeddingMicroBatcher:
+    """
+    將並發的單筆 embedding 請求在 window_ms 內合併成一次上游呼叫
+
+    每個 submit() 拿到自己的 future；收集迴圈在第一筆到達後最多等待 window_ms
+    或湊滿 max_size 即送出，送出在背景進行，不擋下一批的收集。
+    整批被上游拒絕（輸入錯誤）時對半拆開重送，只有出問題的那筆收到錯誤；
+    暫時性錯誤（429 / 5xx / 連線）不拆批，整批回傳錯誤。
+    """
+
+    def __init__(self, window_ms: float, max_size: int):
+        self.window = window_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_tasks: set = set()  # 持有背景送出的 task，避免執行中被 GC
+        self.stats = {"batches": 0, "texts": 0, "upstream_calls": 0, "max_batch_size": 0, "split_retries": 0}
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._collect_loop())
+
+    async def submit(self, text: str, model: str) -> List[float]:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, model, future))
+        return await future
+
+    async def _collect_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            by_model: Dict[str, list] = {}
+            for item in batch:
+                by_model.setdefault(item[1], []).append(item)
+            for model, items in by_model.items():
+                task = loop.create_task(self._flush(model, items))
+                self._flush_tasks.add(task)
+                task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, model: str, items: list):
+        texts = list(dict.fromkeys(text for text, _, _ in items))
+        try:
+            by_text = await self._embed_isolating_failures(texts, model)
+        except Exception as e:  # 防呆：任何未預期錯誤都不能讓等待者卡住
+            by_text = {text: e for text in texts}
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(items)
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(items))
+        await asyncio.to_thread(
+            _cache_set_many,
+            {_cache_key(model, t): e for t, e in by_text.items() if not isinstance(e, Exception)}
+        )
+        for text, _, future in items:
+            if future.done():
+                continue
+            result = by_text[text]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _embed_isolating_failures(self, texts: List[str], model: str) -> Dict[str, object]:
+        """
+        送出一批；輸入錯誤時對半拆開重送（log2(n) 層），只讓出錯的文字拿到例外
+
+        Returns:
+            {text: 向量 或 Exception}
+        """
+        try:
+            embeddings, calls = await asyncio.to_thread(_embed_upstream, texts, model)
+            self.stats["upstream_calls"] += calls
+            return dict(zip(texts, embeddings))
+        except Exception as e:
+            if len(texts) == 1 or _is_transient_upstream_error(e):
+                return {text: e for text in texts}
+            self.stats["split_retries"] += 1
+            mid = len(texts) // 2
+            left, right = await asyncio.gather(
+                self._embed_isolating_failures(texts[:mid], model),
+                self._embed_isolating_failures(texts[mid:], model),
+            )
+            return {**left, **right}
+
+
+def _is_transient_upstream_error(e: Exception) -> bool:
+    """429 / 5xx / 連線逾時：與輸入無關，拆批重送只會放大流量"""
+    if isinstance(e, APIConnectionError):  # 含 APITimeoutError
+        return True
+    status = getattr(e, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+micro_batcher = EmbeddingMicroBatcher(MICRO_BATCH_WINDOW_MS, MICRO_BATCH_MAX_SIZE)
+
 @app.get("/")
 async def root():
     return {
@@ -69,76 +383,115 @@ async def health_check():
         "model": EMBEDDING_MODEL
     }
 
-@app.post("/api/v1/embeddings", response_model=EmbeddingResponse)
+def _single_response(embedding: List[float], request: EmbeddingRequest, cached: bool) -> EmbeddingResponse:
+    if request.encoding_format == "base64":
+        return EmbeddingResponse(
+            embedding_b64=encode_vector_b64(embedding),
+            model=request.model,
+            dimensions=len(embedding),
+            cached=cached
+        )
+    return EmbeddingResponse(
+        embedding=embedding,
+        model=request.model,
+        dimensions=len(embedding),
+        cached=cached
+    )
+
+@app.post("/api/v1/embeddings", response_model=EmbeddingResponse, response_model_exclude_none=True)
 async def create_embedding(request: EmbeddingRequest):
     """
     生成文字向量
 
     - **text**: 要轉換的文字
     - **model**: 使用的模型（預設: text-embedding-3-small）
+    - **encoding_format**: float（預設，回傳 embedding）或 base64（回傳 embedding_b64，float32 little-endian）
     """
     try:
-        # 生成快取 key
-        cache_key = f"embedding:{request.model}:{hashlib.md5(request.text.encode()).hexdigest()}"
-
         # 檢查快取
-        if redis_client:
-            try:
-                cached_embedding = redis_client.get(cache_key)
-                if cached_embedding:
-                    embedding = json.loads(cached_embedding)
-                    return EmbeddingResponse(
-                        embedding=embedding,
-                        model=request.model,
-                        dimensions=len(embedding),
-                        cached=True
-                    )
-            except Exception as e:
-                print(f"Redis 讀取失敗: {e}")
-
-        # 呼叫 OpenAI API
-        response = client.embeddings.create(
-            model=request.model,
-            input=request.text
-        )
+        cache_key = _cache_key(request.model, request.text)
+        cached_embedding = (await asyncio.to_thread(
+            _cache_get_many, [cache_key], [_legacy_cache_key(request.model, request.text)]
+        ))[0]
+        if cached_embedding is not None:
+            return _single_response(cached_embedding, request, cached=True)
 
-        embedding = response.data[0].embedding
+        # 快取未命中：交給 micro-batcher 與其他並發請求合併上游呼叫（回寫快取在批次內完成）
+        if MICRO_BATCH_WINDOW_MS > 0:
+            embedding = await micro_batcher.submit(request.text, request.model)
+        else:
+            embeddings, _ = await asyncio.to_thread(_embed_upstream, [request.text], request.model)
+            embedding = embeddings[0]
+            await asyncio.to_thread(_cache_set_many, {cache_key: embedding})
 
-        # 儲存到快取
-        if redis_client:
-            try:
-                redis_client.setex(
-                    cache_key,
-                    CACHE_TTL,
-                    json.dumps(embedding)
-                )
-            except Exception as e:
-                print(f"Redis 寫入失敗: {e}")
+        return _single_response(embedding, request, cached=False)
 
-        return EmbeddingResponse(
-            embedding=embedding,
-            model=request.model,
-            dimensions=len(embedding),
-            cached=False
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成向量失敗: {str(e)}")
+
+@app.post("/api/v1/embeddings/batch", response_model=BatchEmbeddingResponse, response_model_exclude_none=True)
+async def create_embeddings_batch(request: BatchEmbeddingRequest):
+    """
+    批次生成文字向量
+
+    - **texts**: 要轉換的文字列表（回傳順序與輸入一致）
+    - **model**: 使用的模型（預設: text-embedding-3-small）
+    - **encoding_format**: float（預設）或 base64（回傳 embeddings_b64）
+
+    一次 Redis MGET 讀快取；未命中者（批內去重）合併為一次上游
+    embeddings.create(input=[...])（超過 EMBEDDING_MAX_BATCH_SIZE 自動切塊）；
+    新向量以 pipeline SETEX 回寫。
+    """
+    if len(request.texts) > MAX_BATCH_REQUEST_TEXTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"單次批次最多 {MAX_BATCH_REQUEST_TEXTS} 筆，收到 {len(request.texts)} 筆"
         )
 
+    try:
+        embeddings, cached_flags, upstream_calls = await embed_texts(request.texts, request.model)
+        as_b64 = request.encoding_format == "base64"
+        return BatchEmbeddingResponse(
+            embeddings=None if as_b64 else embeddings,
+            embeddings_b64=[encode_vector_b64(e) for e in embeddings] if as_b64 else None,
+            model=request.model,
+            dimensions=len(embeddings[0]) if embeddings else 0,
+            cached=cached_flags,
+            cache_hits=sum(cached_flags),
+            upstream_calls=upstream_calls
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"生成向量失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批次生成向量失敗: {str(e)}")
 
 @app.get("/api/v1/stats")
 async def get_stats():
     """取得統計資訊"""
     cache_size = 0
+    legacy_size = 0
     if redis_client:
         try:
             cache_keys = redis_client.keys("embedding:*")
+            legacy_size = sum(1 for k in cache_keys if not k.startswith(b"embedding:v2:"))
             cache_size = len(cache_keys)
         except:
             pass
 
+    batch_stats = micro_batcher.stats
     return {
         "cache_size": cache_size,
-        "model": EMBEDDING_MODEL
+        "legacy_json_entries": legacy_size,
+        "cache_format": VECTOR_CACHE_FORMAT,
+        "model": EMBEDDING_MODEL,
+        "micro_batching": {
+            "enabled": MICRO_BATCH_WINDOW_MS > 0,
+            "window_ms": MICRO_BATCH_WINDOW_MS,
+            "max_size": MICRO_BATCH_MAX_SIZE,
+            "batches": batch_stats["batches"],
+            "texts": batch_stats["texts"],
+            "upstream_calls": batch_stats["upstream_calls"],
+            "avg_batch_size": round(batch_stats["texts"] / batch_stats["batches"], 2) if batch_stats["batches"] else 0,
+            "max_batch_size": batch_stats["max_batch_size"]
+        }
     }
 
 if __name__ == "__main__":
@@ -11,7 +11,9 @@ from psycopg2.extras import RealDictCursor, Json
 import requests
 import os
 import secrets
+import uuid
 import hashlib
+import json
 import pandas as pd
 from datetime import datetime
 
@@ -23,6 +25,8 @@ from routes_auth import router as auth_router, get_current_user
 from routes_admins import router as admins_router
 # 導入角色管理路由
 from routes_roles import router as roles_router
+# 向量批次重新生成（背景作業）
+import embedding_regeneration
 
 app = FastAPI(
     title="知識庫管理 API",
@@ -593,25 +597,64 @@ async def delete_knowledge(knowledge_id: int, user: dict = Depends(get_current_u
         cur.close()
         conn.close()
 
+class EmbeddingRegenerationRequest(BaseModel):
+    """向量批次重新生成"""
+    mode: str = "missing"  # missing：只補缺失向量；all：全部重建（embedding 模型更換後使用）
+    model: Optional[str] = None  # embedding 模型（None 表示 embedding-service 預設模型）
+
+
+def _start_embedding_regeneration(job_id: str):
+    """在背景執行緒執行重新生成作業（每頁 commit，中斷後可續跑）"""
+    import threading
+
+    thread = threading.Thread(
+        target=embedding_regeneration.run_job,
+        args=(job_id, get_db_connection),
+        daemon=True
+    )
+    thread.start()
+
+
+def _validate_job_id(job_id: str):
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="作業不存在")
+
+
 @app.post("/api/knowledge/regenerate-embeddings")
-async def regenerate_all_embeddings(user: dict = Depends(get_current_user)):
-    """批量重新生成所有缺失的 embedding"""
+async def regenerate_all_embeddings(
+    request: Optional[EmbeddingRegenerationRequest] = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    批量重新生成 embedding（背景作業）
+
+    建立 unified_jobs 作業後立即返回 job_id，前端以
+    GET /api/knowledge/regenerate-embeddings/{job_id} 輪詢進度。
+    """
+    request = request or EmbeddingRegenerationRequest()
+    if request.mode not in embedding_regeneration.MODES:
+        raise HTTPException(status_code=400, detail=f"mode 必須為 {' 或 '.join(embedding_regeneration.MODES)}")
+
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur = conn.cursor()
 
     try:
-        # 1. 查询所有没有 embedding 的知识
-        cur.execute("""
-            SELECT id, question_summary, answer, keywords
-            FROM knowledge_base
-            WHERE embedding IS NULL
-            ORDER BY id
-        """)
-
-        rows = cur.fetchall()
-        total = len(rows)
+        active = embedding_regeneration.find_active_job(cur)
+        if active:
+            raise HTTPException(
+                status_code=409,
+                detail=f"向量重新生成作業已在執行中（job_id: {active['job_id']}），請等待完成後再試"
+            )
 
-        if total == 0:
+        job = embedding_regeneration.create_job(
+            conn,
+            mode=request.mode,
+            model=request.model,
+            user_id=user.get("username", "admin")
+        )
+        if not job:
             return {
                 "success": True,
                 "message": "所有知识已有向量",
@@ -619,61 +662,96 @@ async def regenerate_all_embeddings(user: dict = Depends(get_current_user)):
                 "generated": 0
             }
 
-        # 2. 逐笔生成 embedding
-        success_count = 0
-        failed_ids = []
+        _start_embedding_regeneration(job['job_id'])
 
-        for row in rows:
-            kb_id = row['id']
-            question = row['question_summary']
-            answer = row['answer']
-            keywords = row.get('keywords', [])
+        return {
+            "success": True,
+            "message": f"已開始批量生成向量（共 {job['total']} 筆）",
+            "job_id": job['job_id'],
+            "status": "processing",
+            "mode": request.mode,
+            "total": job['total']
+        }
 
-            # ✅ 方案 A：將 keywords 融入 embedding
-            keywords_str = ", ".join(keywords) if keywords else ""
-            base_text = question if question else answer[:200]
-            text_for_embedding = f"{base_text}. 關鍵字: {keywords_str}" if keywords_str else base_text
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"批量生成失败: {str(e)}")
 
-            try:
-                embedding_response = requests.post(
-                    EMBEDDING_API_URL,
-                    json={"text": text_for_embedding},
-                    timeout=30
-                )
+    finally:
+        cur.close()
+        conn.close()
 
-                if embedding_response.status_code == 200:
-                    embedding = embedding_response.json()['embedding']
 
-                    # 更新数据库
-                    cur.execute("""
-                        UPDATE knowledge_base
-                        SET embedding = %s, updated_at = NOW()
-                        WHERE id = %s
-                    """, (embedding, kb_id))
+@app.get("/api/knowledge/regenerate-embeddings/{job_id}")
+async def get_embedding_regeneration_job(job_id: str, user: dict = Depends(get_current_user)):
+    """查詢向量重新生成作業進度（供前端輪詢）"""
+    _validate_job_id(job_id)
+    conn = get_db_connection()
+    cur = conn.cursor()
 
-                    success_count += 1
-                else:
-                    failed_ids.append(kb_id)
+    try:
+        job = embedding_regeneration.get_job(cur, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="作業不存在")
 
-            except Exception as e:
-                print(f"⚠️  生成 embedding 失败 (ID {kb_id}): {e}")
-                failed_ids.append(kb_id)
+        return {
+            "job_id": str(job['job_id']),
+            "status": job['status'],
+            "stale": job['stale'] and job['status'] in ('pending', 'processing'),
+            "progress": job['progress'],
+            "result": job['job_result'],
+            "error": job['error_message'],
+            "total": job['total_records'],
+            "processed": job['processed_records'],
+            "generated": job['success_records'],
+            "failed": job['failed_records'],
+            "created_at": job['created_at'].isoformat() if job['created_at'] else None,
+            "updated_at": job['updated_at'].isoformat() if job['updated_at'] else None,
+            "completed_at": job['completed_at'].isoformat() if job['completed_at'] else None
+        }
 
-        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+@app.post("/api/knowledge/regenerate-embeddings/{job_id}/resume")
+async def resume_embedding_regeneration_job(job_id: str, user: dict = Depends(get_current_user)):
+    """續跑失敗或中斷（服務重啟）的向量重新生成作業，從最後提交的游標繼續"""
+    _validate_job_id(job_id)
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        job = embedding_regeneration.get_job(cur, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="作業不存在")
+
+        interrupted = job['status'] in ('pending', 'processing') and job['stale']
+        if job['status'] != 'failed' and not interrupted:
+            raise HTTPException(
+                status_code=400,
+                detail=f"只有失敗或已中斷的作業可以續跑（當前: {job['status']}）"
+            )
+
+        active = embedding_regeneration.find_active_job(cur)
+        if active:
+            raise HTTPException(
+                status_code=409,
+                detail=f"向量重新生成作業已在執行中（job_id: {active['job_id']}），請等待完成後再試"
+            )
+
+        _start_embedding_regeneration(job_id)
 
         return {
             "success": True,
-            "message": f"批量生成完成：成功 {success_count}/{total}",
-            "total": total,
-            "generated": success_count,
-            "failed": len(failed_ids),
-            "failed_ids": failed_ids
+            "message": f"作業已續跑（已處理 {job['processed_records']}/{job['total_records']} 筆）",
+            "job_id": job_id,
+            "status": "processing"
         }
 
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"批量生成失败: {str(e)}")
-
     finally:
         cur.close()
         conn.close()
@@ -2849,6 +2927,31 @@ def _hash_api_key(key: str) -> str:
     return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 
+# rag-orchestrator 各 worker 訂閱此頻道，收到即剔除該金鑰的驗證快取（撤銷立即生效）
+API_KEY_CHANNEL = "rag:api_keys:changed"
+_api_key_redis = None
+
+
+def _publish_api_key_change(key_id: int, action: str):
+    """發布金鑰異動（建立/停用/啟用/刪除）。失敗只記錄，不擋管理操作——rag 端快取 TTL 到期兜底。"""
+    global _api_key_redis
+    try:
+        import redis  # 延遲匯入：舊映像未裝 redis 時只是不通知
+        if _api_key_redis is None:
+            _api_key_redis = redis.Redis(
+                host=os.getenv("REDIS_HOST", "localhost"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                socket_connect_timeout=3,
+                socket_timeout=3,
+            )
+        receivers = _api_key_redis.publish(
+            API_KEY_CHANNEL, json.dumps({"key_id": key_id, "action": action})
+        )
+        print(f"✅ 金鑰異動通知已發布: key {key_id} {action}（{receivers} 個訂閱者）")
+    except Exception as e:
+        print(f"⚠️  金鑰異動通知失敗（rag 端快取將於 TTL 後過期）: {e}")
+
+
 @app.get("/api/api-keys")
 async def list_api_keys(user: dict = Depends(get_current_user)):
     """列出所有 API 金鑰（不回傳 hash 或明文，只有前綴）。"""
@@ -2880,6 +2983,8 @@ async def create_api_key(data: ApiKeyCreate, user: dict = Depends(get_current_us
         )
         new_id = cur.fetchone()["id"]
         conn.commit()
+        # 新金鑰可能剛被 rag 端負向快取（建立前先試打過）：通知各 worker 清掉，建立後立即可用
+        _publish_api_key_change(new_id, "create")
         return {
             "id": new_id, "name": data.name.strip(), "key_prefix": plain[:8],
             "api_key": plain,
@@ -2903,6 +3008,7 @@ async def update_api_key(key_id: int, data: ApiKeyToggle, user: dict = Depends(g
         if not cur.fetchone():
             raise HTTPException(status_code=404, detail="金鑰不存在")
         conn.commit()
+        _publish_api_key_change(key_id, "activate" if data.is_active else "deactivate")
         return {"message": "已更新"}
     except HTTPException:
         raise
@@ -2924,6 +3030,7 @@ async def delete_api_key(key_id: int, user: dict = Depends(get_current_user)):
         if not cur.fetchone():
             raise HTTPException(status_code=404, detail="金鑰不存在")
         conn.commit()
+        _publish_api_key_change(key_id, "delete")
         return {"message": "已刪除"}
     except HTTPException:
         raise
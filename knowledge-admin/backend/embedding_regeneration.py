@@ -0,0 +1,355 @@
+"""
+知識向量批次重新生成（背景作業）
+
+背景：POST /api/knowledge/regenerate-embeddings 原本在請求內同步執行，每筆一次阻塞 requests.post、
+每筆一次 UPDATE、最後才一次 commit；筆數一多請求就逾時，已生成的向量全部遺失。
+
+做法：
+- 作業記錄在 unified_jobs（job_type = embedding_regeneration），請求只建立作業並啟動背景執行緒
+- 依 id 游標分頁撈出待處理知識（missing：embedding IS NULL；all：作業建立時 id 上限內全部，
+  供 embedding 模型更換後全量重建）
+- 每頁切成批次呼叫 embedding-service 批次端點，ThreadPoolExecutor 限制同時進行的批次數
+- 整頁以一次 UPDATE ... FROM (VALUES ...) 寫回，同一交易更新作業進度與游標，每頁 commit；
+  失敗或服務重啟中斷的作業從游標續跑
+"""
+import base64
+import json
+import os
+import struct
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from psycopg2.extras import execute_values
+
+JOB_TYPE = "embedding_regeneration"
+MODES = ("missing", "all")
+
+EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL", "http://localhost:5000/api/v1/embeddings")
+PAGE_SIZE = int(os.getenv("EMBEDDING_REGEN_PAGE_SIZE", "500"))
+BATCH_SIZE = int(os.getenv("EMBEDDING_REGEN_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("EMBEDDING_REGEN_CONCURRENCY", "4"))
+# processing 狀態超過此時間未更新視為中斷（服務重啟），可續跑、也不再擋新作業
+STALE_AFTER_MINUTES = int(os.getenv("EMBEDDING_REGEN_STALE_MINUTES", "10"))
+
+FAILED_IDS_LIMIT = 200
+
+# pgvector 文字格式的數值精度：與 rag-orchestrator services/vector_codec.py 的 _PG_FLOAT 相同（需保持一致）
+_PG_FLOAT = "{:.9g}"
+
+
+# ========== 向量 ==========
+
+def build_embedding_text(row: Dict) -> str:
+    """向量文字：question_summary（無則取答案前 200 字）+ 關鍵字"""
+    keywords = row.get('keywords') or []
+    keywords_str = ", ".join(keywords)
+    base_text = row.get('question_summary') or (row.get('answer') or '')[:200]
+    return f"{base_text}. 關鍵字: {keywords_str}" if keywords_str else base_text
+
+
+def to_pgvector_literal(vector: List[float]) -> str:
+    """轉為 pgvector 文字格式（'[0.1,0.2,...]'）"""
+    return '[' + ','.join(map(_PG_FLOAT.format, vector)) + ']'
+
+
+def _decode_b64_vector(data: str) -> List[float]:
+    """embedding-service encoding_format=base64 回應：float32 little-endian"""
+    raw = base64.b64decode(data)
+    return list(struct.unpack(f'<{len(raw) // 4}f', raw))
+
+
+def _embed_single(text: str, model: Optional[str]) -> Optional[List[float]]:
+    payload = {"text": text}
+    if model:
+        payload["model"] = model
+    try:
+        response = requests.post(EMBEDDING_API_URL, json=payload, timeout=30)
+        if response.status_code != 200:
+            return None
+        return response.json().get('embedding')
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️  生成 embedding 失败: {e}")
+        return None
+
+
+def embed_texts(texts: List[str], model: Optional[str] = None) -> List[Optional[List[float]]]:
+    """
+    一次批次請求取得多筆向量（失敗的位置為 None）
+
+    批次端點不存在（舊版 embedding-service 回 404/405）時降級為逐筆呼叫。
+    """
+    payload = {"texts": texts, "encoding_format": "base64"}
+    if model:
+        payload["model"] = model
+    try:
+        response = requests.post(EMBEDDING_API_URL.rstrip('/') + '/batch', json=payload, timeout=120)
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️  批次 embedding 請求失败: {e}")
+        return [None] * len(texts)
+
+    if response.status_code in (404, 405):
+        return [_embed_single(text, model) for text in texts]
+    if response.status_code != 200:
+        print(f"⚠️  批次 embedding API 錯誤 ({response.status_code}): {response.text[:200]}")
+        return [None] * len(texts)
+
+    data = response.json()
+    if data.get('embeddings_b64') is not None:
+        embeddings = [_decode_b64_vector(e) for e in data['embeddings_b64']]
+    else:
+        embeddings = data.get('embeddings') or []
+    if len(embeddings) != len(texts):
+        return [None] * len(texts)
+    return embeddings
+
+
+def _embed_rows(rows: List[Dict], model: Optional[str]) -> Tuple[List[Tuple[int, str]], List[int]]:
+    """一個批次：回傳 (可寫入的 (id, 向量)，失敗的 id)"""
+    embeddings = embed_texts([build_embedding_text(row) for row in rows], model)
+    updates, failed = [], []
+    for row, embedding in zip(rows, embeddings):
+        if embedding:
+            updates.append((row['id'], to_pgvector_literal(embedding)))
+        else:
+            failed.append(row['id'])
+    return updates, failed
+
+
+# ========== 作業記錄（unified_jobs） ==========
+
+def _page_query(mode: str) -> str:
+    if mode == "all":
+        return """
+            SELECT id, question_summary, answer, keywords
+            FROM knowledge_base
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s
+        """
+    return """
+        SELECT id, question_summary, answer, keywords
+        FROM knowledge_base
+        WHERE embedding IS NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """
+
+
+def find_active_job(cur) -> Optional[Dict]:
+    """進行中的重新生成作業（超過 STALE_AFTER_MINUTES 未更新的視為已中斷）"""
+    cur.execute("""
+        SELECT job_id, status, progress
+        FROM unified_jobs
+        WHERE job_type = %s
+          AND status IN ('pending', 'processing')
+          AND updated_at > NOW() - make_interval(mins => %s)
+        ORDER BY created_at DESC
+        LIMIT 1
+    """, (JOB_TYPE, STALE_AFTER_MINUTES))
+    return cur.fetchone()
+
+
+def create_job(conn, mode: str = "missing", model: Optional[str] = None, user_id: str = "admin") -> Optional[Dict]:
+    """
+    建立重新生成作業
+
+    Args:
+        conn: psycopg2 連線（RealDictCursor）
+        mode: missing（只補缺失向量）/ all（全部重建，換模型時使用）
+        model: embedding 模型（None 表示 embedding-service 預設模型）
+        user_id: 建立者
+
+    Returns:
+        {"job_id", "total"}；沒有需要處理的知識時回傳 None
+    """
+    cur = conn.cursor()
+    if mode == "all":
+        cur.execute("SELECT COUNT(*) AS total, COALESCE(MAX(id), 0) AS max_id FROM knowledge_base")
+    else:
+        cur.execute("SELECT COUNT(*) AS total, COALESCE(MAX(id), 0) AS max_id FROM knowledge_base WHERE embedding IS NULL")
+    stats = cur.fetchone()
+    if not stats['total']:
+        return None
+
+    job_config = {
+        "mode": mode,
+        "model": model,
+        "page_size": PAGE_SIZE,
+        "batch_size": BATCH_SIZE,
+        "concurrency": CONCURRENCY,
+        # all 模式只處理建立時已存在的知識（之後新增的由建立流程生成向量）
+        "max_id": stats['max_id'],
+        "cursor": 0,
+    }
+    job_id = str(uuid.uuid4())
+    cur.execute("""
+        INSERT INTO unified_jobs (
+            job_id, job_type, user_id, status, job_config, progress,
+            total_records, processed_records, success_records, failed_records,
+            created_at, updated_at
+        ) VALUES (%s, %s, %s, 'pending', %s, %s, %s, 0, 0, 0, NOW(), NOW())
+    """, (
+        job_id, JOB_TYPE, user_id, json.dumps(job_config),
+        json.dumps({"current": 0, "total": stats['total'], "stage": "embedding"}),
+        stats['total'],
+    ))
+    conn.commit()
+    return {"job_id": job_id, "total": stats['total']}
+
+
+def get_job(cur, job_id: str) -> Optional[Dict]:
+    """作業狀態（供前端輪詢）"""
+    cur.execute("""
+        SELECT job_id, status, job_config, progress, job_result, error_message,
+               total_records, processed_records, success_records, failed_records,
+               created_at, updated_at, started_at, completed_at,
+               updated_at <= NOW() - make_interval(mins => %s) AS stale
+        FROM unified_jobs
+        WHERE job_id = %s AND job_type = %s
+    """, (STALE_AFTER_MINUTES, job_id, JOB_TYPE))
+    row = cur.fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    for key in ('job_config', 'progress', 'job_result'):
+        job[key] = _as_dict(job[key])
+    return job
+
+
+def _as_dict(value) -> Dict:
+    if not value:
+        return {}
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def write_page(cur, updates: List[Tuple[int, str]]):
+    """整頁向量一次寫回"""
+    execute_values(cur, """
+        UPDATE knowledge_base AS kb
+        SET embedding = v.embedding::vector, updated_at = NOW()
+        FROM (VALUES %s) AS v(id, embedding)
+        WHERE kb.id = v.id
+    """, updates, template="(%s::int, %s)", page_size=len(updates))
+
+
+# ========== 執行 ==========
+
+def run_job(job_id: str, connect: Callable):
+    """
+    執行（或續跑）重新生成作業；於背景執行緒呼叫
+
+    Args:
+        job_id: 作業 ID
+        connect: 建立 psycopg2 連線的函式（RealDictCursor）
+    """
+    conn = connect()
+    cur = conn.cursor()
+    started = time.time()
+    try:
+        job = get_job(cur, job_id)
+        if not job:
+            return
+        config = job['job_config']
+        mode = config.get('mode', 'missing')
+        model = config.get('model')
+        page_size = config.get('page_size', PAGE_SIZE)
+        batch_size = config.get('batch_size', BATCH_SIZE)
+        cursor_id = config.get('cursor', 0)
+        total = job['total_records'] or 0
+        processed = job['processed_records'] or 0
+        success = job['success_records'] or 0
+        failed_ids = job['job_result'].get('failed_ids', [])
+        failed = job['failed_records'] or 0
+
+        cur.execute("""
+            UPDATE unified_jobs
+            SET status = 'processing', error_message = NULL,
+                started_at = COALESCE(started_at, NOW()), updated_at = NOW()
+            WHERE job_id = %s
+        """, (job_id,))
+        conn.commit()
+        print(f"🔄 向量重新生成作業開始 (job_id: {job_id}, mode: {mode}, 游標: {cursor_id})")
+
+        query = _page_query(mode)
+        with ThreadPoolExecutor(max_workers=max(1, config.get('concurrency', CONCURRENCY))) as pool:
+            while True:
+                if mode == "all":
+                    cur.execute(query, (cursor_id, config.get('max_id', 0), page_size))
+                else:
+                    cur.execute(query, (cursor_id, page_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                updates, page_failed = [], []
+                for batch_updates, batch_failed in pool.map(lambda b: _embed_rows(b, model), batches):
+                    updates.extend(batch_updates)
+                    page_failed.extend(batch_failed)
+
+                if updates:
+                    write_page(cur, updates)
+
+                cursor_id = rows[-1]['id']
+                processed += len(rows)
+                success += len(updates)
+                failed += len(page_failed)
+                failed_ids = (failed_ids + page_failed)[:FAILED_IDS_LIMIT]
+                total = max(total, processed)
+
+                # 進度與游標與本頁向量同一交易提交
+                cur.execute("""
+                    UPDATE unified_jobs
+                    SET job_config = jsonb_set(job_config::jsonb, '{cursor}', to_jsonb(%s::int)),
+                        progress = %s,
+                        job_result = %s,
+                        processed_records = %s,
+                        success_records = %s,
+                        failed_records = %s,
+                        updated_at = NOW()
+                    WHERE job_id = %s
+                """, (
+                    cursor_id,
+                    json.dumps({"current": processed, "total": total, "stage": "embedding"}),
+                    json.dumps({"failed_ids": failed_ids}),
+                    processed, success, failed, job_id,
+                ))
+                conn.commit()
+                print(f"   進度: {processed}/{total}（成功 {success}，失敗 {failed}）")
+
+        result = {
+            "mode": mode,
+            "model": model,
+            "total": processed,
+            "generated": success,
+            "failed": failed,
+            "failed_ids": failed_ids,
+        }
+        cur.execute("""
+            UPDATE unified_jobs
+            SET status = 'completed',
+                progress = %s,
+                job_result = %s,
+                completed_at = NOW(),
+                processing_time_seconds = EXTRACT(EPOCH FROM (NOW() - started_at)),
+                updated_at = NOW()
+            WHERE job_id = %s
+        """, (json.dumps({"current": processed, "total": processed, "stage": "completed"}),
+              json.dumps(result), job_id))
+        conn.commit()
+        print(f"✅ 向量重新生成完成：成功 {success}/{processed}（{time.time() - started:.1f}s）")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ 向量重新生成失敗 (job_id: {job_id}): {e}")
+        cur.execute("""
+            UPDATE unified_jobs
+            SET status = 'failed', error_message = %s, updated_at = NOW()
+            WHERE job_id = %s
+        """, (str(e), job_id))
+        conn.commit()
+    finally:
+        conn.close()
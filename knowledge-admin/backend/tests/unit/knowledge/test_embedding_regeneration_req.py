@@ -0,0 +1,172 @@
+"""unit:向量批次重新生成作業(embedding_regeneration)。
+
+- 批次端點一次取多筆向量;舊版服務(404)降級逐筆
+- 依 id 游標分頁、批次寫回(UPDATE ... FROM VALUES)、每頁 commit 並更新游標
+- 續跑從作業記錄的游標繼續;all 模式以建立時的 max_id 為上限
+"""
+import base64
+import json
+import struct
+
+import pytest
+
+import embedding_regeneration as er
+
+pytestmark = pytest.mark.unit
+
+
+class _Resp:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.text = json.dumps(self._data)
+
+    def json(self):
+        return self._data
+
+
+def _b64(vec):
+    return base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode()
+
+
+class _Cursor:
+    def __init__(self, db):
+        self.db = db
+        self._result = []
+
+    def execute(self, sql, params=()):
+        self.db.sql.append(sql)
+        if "FROM unified_jobs" in sql and "SELECT" in sql:
+            self._result = [dict(self.db.job)]
+        elif "FROM knowledge_base" in sql and "SELECT" in sql:
+            if "embedding IS NULL" in sql:
+                cursor_id, limit = params
+                rows = [r for r in self.db.rows if r["id"] > cursor_id and r["id"] not in self.db.embedded]
+            else:
+                cursor_id, max_id, limit = params
+                rows = [r for r in self.db.rows if cursor_id < r["id"] <= max_id]
+            self._result = rows[:limit]
+        elif "SET job_config = jsonb_set" in sql:
+            self.db.pages.append({"cursor": params[0], "processed": params[3], "committed": False})
+            self.db.job["job_config"]["cursor"] = params[0]
+        elif "status = 'completed'" in sql:
+            self.db.job["status"] = "completed"
+            self.db.result = json.loads(params[1])
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+
+class _Conn:
+    def __init__(self, rows, job):
+        self.rows = rows
+        self.job = job
+        self.embedded = set()
+        self.pending = []
+        self.pages = []
+        self.sql = []
+        self.result = None
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.embedded.update(self.pending)
+        self.pending = []
+        for page in self.pages:
+            page["committed"] = True
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def _job(mode="missing", cursor=0, max_id=0):
+    return {
+        "job_id": "00000000-0000-0000-0000-000000000001", "status": "pending",
+        "job_config": {"mode": mode, "model": None, "page_size": 3, "batch_size": 2,
+                       "concurrency": 2, "cursor": cursor, "max_id": max_id},
+        "progress": {}, "job_result": {}, "error_message": None, "total_records": 5,
+        "processed_records": 0, "success_records": 0, "failed_records": 0, "stale": False,
+    }
+
+
+@pytest.fixture
+def batch_api(monkeypatch):
+    calls = []
+
+    def fake_post(url, json=None, timeout=None):
+        calls.append((url, json))
+        texts = json["texts"]
+        return _Resp(200, {"embeddings_b64": [_b64([0.5, float(len(t))]) for t in texts]})
+
+    monkeypatch.setattr(er.requests, "post", fake_post)
+    return calls
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    written = []
+
+    def fake_execute_values(cur, sql, updates, template=None, page_size=None):
+        assert "FROM (VALUES %s)" in sql
+        written.append(list(updates))
+        cur.db.pending.extend(i for i, _ in updates)
+
+    monkeypatch.setattr(er, "execute_values", fake_execute_values)
+    return written
+
+
+def _rows(n):
+    return [{"id": i, "question_summary": f"問題 {i}", "answer": "答", "keywords": ["租金"]} for i in range(1, n + 1)]
+
+
+def test_build_text_and_single_fallback(monkeypatch):
+    assert er.build_embedding_text({"question_summary": None, "answer": "a" * 300, "keywords": []}) == "a" * 200
+    assert er.build_embedding_text({"question_summary": "Q", "keywords": ["k1", "k2"]}) == "Q. 關鍵字: k1, k2"
+
+    def fake_post(url, json=None, timeout=None):
+        if url.endswith("/batch"):
+            return _Resp(404)
+        return _Resp(200, {"embedding": [0.1, 0.2]}) if json["text"] != "bad" else _Resp(500)
+
+    monkeypatch.setattr(er.requests, "post", fake_post)
+    assert er.embed_texts(["ok", "bad"]) == [[0.1, 0.2], None]
+
+
+def test_run_job_pages_batches_and_commits(batch_api, writes):
+    conn = _Conn(_rows(5), _job())
+    er.run_job(conn.job["job_id"], lambda: conn)
+
+    assert conn.embedded == {1, 2, 3, 4, 5}
+    assert [len(w) for w in writes] == [3, 2]                # 每頁一次批次寫回
+    assert all(len(c[1]["texts"]) <= 2 for c in batch_api)    # 每次請求最多 batch_size 筆
+    assert [p["cursor"] for p in conn.pages] == [3, 5] and all(p["committed"] for p in conn.pages)
+    assert writes[0][0] == (1, "[0.5,13]")                    # 「問題 1. 關鍵字: 租金」13 字
+    assert conn.result["generated"] == 5 and conn.result["failed"] == 0
+
+
+def test_resume_from_cursor_and_all_mode(batch_api, writes):
+    conn = _Conn(_rows(5), _job(mode="all", cursor=2, max_id=4))
+    conn.job["processed_records"] = 2
+    conn.job["success_records"] = 2
+    er.run_job(conn.job["job_id"], lambda: conn)
+
+    assert conn.embedded == {3, 4}                            # 從游標續跑、不超過 max_id
+    assert conn.result["total"] == 4 and conn.result["generated"] == 4
+
+
+def test_pgvector_literal_roundtrips_float32_exactly():
+    import random
+    rng = random.Random(0)
+    raw = struct.pack("<1536f", *(rng.gauss(0, 0.05) for _ in range(1536)))
+    vec = list(struct.unpack("<1536f", raw))              # 與 _decode_b64_vector 相同：float32 值
+
+    parsed = [float(x) for x in er.to_pgvector_literal(vec)[1:-1].split(",")]
+
+    assert struct.pack("<1536f", *parsed) == raw
@@ -0,0 +1,72 @@
+"""unit:API 金鑰異動通知(_publish_api_key_change)。
+
+- 建立金鑰也發布 create:rag 端建立前留下的負向快取會被清掉,新金鑰立即可用
+- 寫入失敗(rollback)不發布
+"""
+import asyncio
+
+import pytest
+
+import app as app_mod
+
+pytestmark = pytest.mark.unit
+
+
+class _Cursor:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def execute(self, sql, params=()):
+        if self.fail:
+            raise RuntimeError("insert failed")
+
+    def fetchone(self):
+        return {"id": 42}
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.log = []
+
+    def cursor(self, cursor_factory=None):
+        return _Cursor(self.fail)
+
+    def commit(self):
+        self.log.append("commit")
+
+    def rollback(self):
+        self.log.append("rollback")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+    monkeypatch.setattr(app_mod, "_publish_api_key_change", lambda key_id, action: events.append((key_id, action)))
+    return events
+
+
+def test_create_publishes_change_after_commit(monkeypatch, published):
+    conn = _Conn()
+    monkeypatch.setattr(app_mod, "get_db_connection", lambda: conn)
+
+    result = asyncio.run(app_mod.create_api_key(app_mod.ApiKeyCreate(name=" svc "), user={"id": 0}))
+
+    assert result["id"] == 42 and result["name"] == "svc"
+    assert conn.log == ["commit"] and published == [(42, "create")]
+
+
+def test_failed_create_does_not_publish(monkeypatch, published):
+    conn = _Conn(fail=True)
+    monkeypatch.setattr(app_mod, "get_db_connection", lambda: conn)
+
+    with pytest.raises(app_mod.HTTPException):
+        asyncio.run(app_mod.create_api_key(app_mod.ApiKeyCreate(name="svc"), user={"id": 0}))
+
+    assert conn.log == ["rollback"] and published == []
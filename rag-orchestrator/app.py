@@ -2,6 +2,7 @@
 RAG Orchestrator 主服務
 整合意圖分類、RAG 檢索、信心度評估和未釐清問題管理
 """
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
@@ -21,7 +22,7 @@ from services.form_manager import FormManager
 from services.sop_orchestrator import SOPOrchestrator
 
 # 導入路由
-from routers import chat, unclear_questions, knowledge, vendors, knowledge_import, knowledge_export, knowledge_generation, platform_sop, cache, videos, images, business_types, document_converter, target_user_config, forms, api_endpoints, lookup, loops, loop_knowledge, system_health, conversational_configs
+from routers import chat, unclear_questions, knowledge, vendors, knowledge_import, knowledge_export, knowledge_generation, platform_sop, cache, videos, images, business_types, document_converter, target_user_config, forms, api_endpoints, lookup, loops, loop_knowledge, system_health, conversational_configs, debug
 
 # 全局變數
 db_pool: Pool = None
@@ -56,6 +57,17 @@ async def lifespan(app: FastAPI):
     )
     print("✅ 資料庫連接池已建立")
 
+    # usage_events 批次寫入器（finalize 只入佇列，背景整批寫入；DB 不可用時落地 spill 檔）
+    from services.usage_event_writer import start_usage_writer, stop_usage_writer
+    start_usage_writer(db_pool)
+
+    # 建立服務間共用 HTTP 客戶端（embedding / reranker / jgb / universal_api，各自連接池與 timeout）
+    from services.http_clients import get_http_registry
+    http_registry = get_http_registry()
+    await http_registry.open()
+    app.state.http_clients = http_registry
+    print("✅ 共用 HTTP 客戶端已建立")
+
     # 初始化服務
     intent_classifier = IntentClassifier()
     print("✅ 意圖分類器已初始化")
@@ -116,6 +128,19 @@ async def lifespan(app: FastAPI):
     )
     print("✅ 對話式回答引擎已初始化（conversational：多輪自適應問答→收斂，售前為首例）")
 
+    # 知識庫關鍵字倒排索引（背景建立 + 增量同步；就緒前 keyword 檢索走 SQL）
+    from services.keyword_index import keyword_index_enabled, keyword_index_sync_loop
+    keyword_index_task = asyncio.create_task(keyword_index_sync_loop()) if keyword_index_enabled() else None
+
+    # 行程內快取失效匯流排：訂閱其他 worker 的失效廣播（業者參數 / 對話設定 / 系統脈絡…）
+    # API Key 驗證快取的金鑰異動頻道共用同一條訂閱連線（knowledge-admin 停用 / 刪除後各 worker 立即剔除）
+    from services.cache_bus import get_cache_bus
+    from services.api_key_auth import subscribe_api_key_changes
+    cache_bus = get_cache_bus()
+    if auth_enforced():
+        subscribe_api_key_changes(cache_bus)
+    cache_bus_task = asyncio.create_task(cache_bus.listen()) if cache_bus.has_subscriptions() else None
+
     # 將服務注入到 app.state
     app.state.db_pool = db_pool
     app.state.intent_classifier = intent_classifier
@@ -136,7 +161,19 @@ async def lifespan(app: FastAPI):
 
     # 關閉時清理
     print("🔄 關閉 RAG Orchestrator...")
+    if keyword_index_task:
+        keyword_index_task.cancel()
+    if cache_bus_task:
+        cache_bus_task.cancel()
+    await stop_usage_writer()                 # 排空佇列、最後一批寫入（須在關閉連接池前）
     await db_pool.close()
+    # 檢索器用的同步連接池 + DB 執行緒池
+    from services.db_utils import close_sync_pool
+    close_sync_pool()
+    await http_registry.aclose()
+    # trace 匯出執行緒：寫完佇列中的 trace
+    from services.tracing import get_tracer
+    await asyncio.to_thread(get_tracer().close)
     print("👋 RAG Orchestrator 已關閉")
 
 
@@ -158,9 +195,8 @@ app.add_middleware(
 )
 
 # ── 服務對服務 API Key 認證（金鑰存 DB；RAG_API_AUTH_ENFORCE 關→不強制，安全上線）──
-from fastapi import Request
-from fastapi.responses import JSONResponse
-from services.api_key_auth import is_exempt, auth_enforced, verify_api_key
+from services.api_key_auth import auth_enforced
+from services.asgi_middleware import ApiKeyGuardMiddleware, UsageMeteringMiddleware
 
 if auth_enforced():
     print("🔒 [security] rag API Key 認證【已啟用】，金鑰來源＝api_keys 表")
@@ -168,79 +204,9 @@ else:
     print("⚠️ [security] RAG_API_AUTH_ENFORCE 未開 → API Key 認證【停用】，rag 對外無保護。正式環境務必開啟。")
 
 
-@app.middleware("http")
-async def usage_metering_middleware(request: Request, call_next):
-    """usage-metering（spec usage-metering 2.1）：/api/v1/message 進場建計量
-    context、出場落事件（fire-and-forget）。串流回應（SSE）由 generator finally
-    落點（finalize 冪等使雙落點安全）；其餘路徑零觸碰；任何失敗不影響回應。"""
-    from services import usage_metering as _um
-    metered = (request.url.path == "/api/v1/message" and request.method == "POST"
-               and _um.is_enabled())
-    if metered:
-        try:
-            import json as _json
-            _body = await request.body()
-            # ⚠️ BaseHTTPMiddleware 讀 body 會吃掉 receive channel，下游 handler
-            #    等 body 永久卡死（實測）——回灌 _receive 供下游重читать
-            async def _replay():
-                return {"type": "http.request", "body": _body, "more_body": False}
-            request._receive = _replay
-            _fields = _json.loads(_body) if _body else {}
-            _um.begin(_fields if isinstance(_fields, dict) else {})
-        except Exception:
-            _fields = {}
-            _um.begin({})
-    _pool = getattr(request.app.state, "db_pool", None)
-    _quota = None
-    if metered:
-        # quota-management：達限短路（進檢索/LLM 前，零成本，R4.1）；fail-open
-        _ctx_obj = _um._ctx.get()
-        _quota = await _um.quota_check(_pool, (_fields or {}).get("vendor_id"),
-                                       bool(_ctx_obj and _ctx_obj.is_internal))
-        if _quota.state == "blocked":
-            _um.set_path("quota_blocked")
-            _um.finalize("blocked", 200, db_pool=_pool)      # 記事件供舉證（R4.6）
-            _body_dict = _um.quota_blocked_body(
-                _ctx_obj.user_type if _ctx_obj else "unknown", _quota, _fields or {})
-            return JSONResponse(status_code=200, content=_body_dict)
-    try:
-        response = await call_next(request)
-    except Exception:
-        if metered:
-            _um.finalize("error", 500, db_pool=_pool)
-        raise
-    if metered:
-        _ctype = response.headers.get("content-type", "")
-        if "text/event-stream" not in _ctype:      # 串流由 generator finally 收尾
-            _um.finalize("success" if response.status_code < 500 else "error",
-                         response.status_code, db_pool=_pool)
-            # quota 警示：2026-07-06 改判——警示不進對話（改寄信），
-            # env QUOTA_WARN_IN_CHAT=true 可重新啟用對話內提示
-            if (os.getenv("QUOTA_WARN_IN_CHAT", "false").lower() == "true"
-                    and _quota is not None and _quota.state == "warn"
-                    and "application/json" in _ctype and response.status_code == 200):
-                _ctx_obj = _um._ctx.get()
-                _ut = _ctx_obj.user_type if _ctx_obj else "unknown"
-                _raw = b""
-                async for _chunk in response.body_iterator:
-                    _raw += _chunk
-                _new_raw = _um.append_quota_hint(_raw, _ut, _quota)
-                from starlette.responses import Response as _Resp
-                _hdrs = dict(response.headers)
-                _hdrs.pop("content-length", None)      # 重算（research 風險 2）
-                return _Resp(content=_new_raw if _new_raw is not None else _raw,
-                             status_code=response.status_code, headers=_hdrs,
-                             media_type="application/json")
-    return response
-
-
-@app.middleware("http")
-async def api_key_guard(request: Request, call_next):
-    if auth_enforced() and request.method != "OPTIONS" and not is_exempt(request.url.path):
-        pool = getattr(request.app.state, "db_pool", None)
-        if not await verify_api_key(pool, request.headers.get("x-api-key")):
-            return JSONResponse(status_code=401, content={"detail": "Invalid or missing API key"})
-    return await call_next(request)
+# 純 ASGI middleware（不經 BaseHTTPMiddleware 的 call_next 轉送；後加者在外層：先認證、再計量）
+app.add_middleware(UsageMeteringMiddleware)
+app.add_middleware(ApiKeyGuardMiddleware)
 
 
 # 註冊路由
@@ -265,6 +231,7 @@ app.include_router(lookup.router, tags=["lookup"])  # Lookup Table System (通
 app.include_router(loops.router, prefix="/api/v1/loops", tags=["loops"])  # Knowledge Completion Loop Management (知識完善迴圈管理)
 app.include_router(loop_knowledge.router, prefix="/api/v1/loops", tags=["loop_knowledge"])  # Loop Knowledge Review API (知識審核 API)
 app.include_router(system_health.router, tags=["system_health"])  # Pipeline Health Dashboard (系統健康檢查)
+app.include_router(debug.router, tags=["debug"])  # Request Tracing (請求階段 span 追蹤)
 
 
 @app.get("/")
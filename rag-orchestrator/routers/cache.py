@@ -3,10 +3,19 @@
 
 提供緩存失效、統計和監控端點
 """
+import asyncio
+
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
+from services.cache_bus import get_cache_bus
+from services.conversational_rules import RULES_CATEGORY
+from services.db_utils import run_in_db_executor
+from services.keyword_index import get_keyword_index
+from services.semantic_reranker import get_semantic_reranker
+from services.system_context import SYSTEM_DOC_CATEGORY
+
 router = APIRouter(prefix="/api/v1", tags=["cache"])
 
 
@@ -18,6 +27,26 @@ class CacheInvalidationRequest(BaseModel):
     vendor_id: Optional[int] = None
 
 
+async def _invalidate_process_caches(request: CacheInvalidationRequest, db_pool) -> None:
+    """失效各 worker 的行程內快取（經 cache_bus 廣播；與本服務 Redis 回答快取是否啟用無關）"""
+    bus = get_cache_bus()
+    if request.type == "knowledge_update" and request.knowledge_id:
+        category = None
+        if db_pool is not None:
+            async with db_pool.acquire() as conn:
+                category = await conn.fetchval(
+                    "SELECT category FROM knowledge_base WHERE id = $1", request.knowledge_id
+                )
+        # 查無該筆（已刪除）時無從判斷分類，兩者都清
+        if category in (None, SYSTEM_DOC_CATEGORY):
+            bus.invalidate("system_context")
+        if category in (None, RULES_CATEGORY):
+            bus.invalidate("conversational")
+    elif request.type == "vendor_update" and request.vendor_id:
+        for name in ("vendors", "vendor_configs", "digression_config"):
+            bus.invalidate(name, request.vendor_id)
+
+
 class CacheInvalidationResponse(BaseModel):
     """緩存失效回應"""
     success: bool
@@ -40,6 +69,22 @@ async def invalidate_cache(request: CacheInvalidationRequest, req: Request):
     """
     cache_service = req.app.state.cache_service
 
+    if request.type == "knowledge_update" and request.knowledge_id:
+        # 語義模型服務的 reranker pair 分數快取（與本服務 Redis 是否啟用無關）
+        reranker = await asyncio.to_thread(get_semantic_reranker)
+        pair_count = await asyncio.to_thread(reranker.invalidate_pair_cache, [request.knowledge_id])
+        if pair_count:
+            print(f"🗑️  Reranker pair 分數快取失效: knowledge_id={request.knowledge_id}, 清除 {pair_count} 條")
+        # 關鍵字倒排索引即時重載該筆（未載入時由背景同步處理）
+        keyword_index = get_keyword_index()
+        if keyword_index.is_ready:
+            await run_in_db_executor(keyword_index.refresh_knowledge, [request.knowledge_id])
+
+    try:
+        await _invalidate_process_caches(request, getattr(req.app.state, "db_pool", None))
+    except Exception as e:
+        print(f"⚠️  行程內快取失效失敗: {e}")
+
     if not cache_service._is_available():
         return CacheInvalidationResponse(
             success=False,
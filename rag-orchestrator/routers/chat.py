@@ -21,6 +21,13 @@ import psycopg2.extras
 from services.llm_provider import chat_completion   # 相關性把關用（測試以模組屬性 patch）
 from services.db_utils import get_db_config
 from services.embedding_utils import get_embedding_client
+from services.cache_bus import get_cache_bus
+from services.cache_service import set_semantic_query
+from services.llm_judgment_cache import get_llm_judgment_cache, normalize_question, prompt_version
+from services.request_stages import StageScheduler
+from services.tracing import span, start_trace, trace_stream
+from services.sop_orchestrator import CONTEXT_NOT_PREFETCHED
+from contextvars import ContextVar
 
 router = APIRouter()
 
@@ -385,6 +392,11 @@ class ChatRequestContext:
     """跨 /message handler 共享的請求情境(分階段填入、部分可變)。"""
     session_state: Optional[dict] = None     # 會話狀態(可被降級設 None)
     vendor_info: Optional[dict] = None        # 業者驗證結果(原位填入)
+    stages: Optional[StageScheduler] = None   # 檢索路徑的階段排程(handle_retrieval 建立;embedding/rewrite/sop_context/intent 結果由此共用)
+
+
+# 本請求的階段排程：_build_debug_info 讀取時間軸（各回應構建函式不必逐一傳遞）
+_request_stages: ContextVar[Optional[StageScheduler]] = ContextVar('request_stages', default=None)
 
 
 async def handle_form_session(request, req, ctx: ChatRequestContext):
@@ -463,7 +475,11 @@ async def handle_collecting(request, req, ctx: ChatRequestContext):
     print(f"📋 檢測到進行中的表單會話（{session_state['form_id']}, 狀態: {session_state['state']}），使用表單收集流程")
 
     intent_classifier = req.app.state.intent_classifier
-    intent_result = intent_classifier.classify(request.message)  # 真意圖(非 stub)
+    # kNN 快速層可用時先取 embedding：意圖明確即免呼叫 LLM，模糊才升級
+    query_embedding = None
+    if intent_classifier.knn_ready:
+        query_embedding = await get_embedding_client().get_embedding(request.message, verbose=False)
+    intent_result = intent_classifier.classify(request.message, query_embedding=query_embedding)  # 真意圖(非 stub)
 
     form_result = await form_manager.collect_field_data(
         user_message=request.message,
@@ -602,32 +618,123 @@ async def handle_cache(request, req, ctx: ChatRequestContext):
     print(f"🔍 [DEBUG] stream參數值: {request.stream}, 類型: {type(request.stream)}")
     if request.stream:
         config_version = _generate_config_version()
-        cached_answer = cache_service.get_cached_answer(
-            vendor_id=request.vendor_id,
-            question=request.message,
-            target_user=request.target_user,
-            config_version=config_version,
-        )
+        with span("cache.question") as _sp:
+            cached_answer = cache_service.get_cached_answer(
+                vendor_id=request.vendor_id,
+                question=request.message,
+                target_user=request.target_user,
+                config_version=config_version,
+            )
+            _sp.set(hit=bool(cached_answer))
         if cached_answer:
             print(f"⚡ 緩存命中！使用串流模式輸出 - 配置版本: {config_version}")
-            return StreamingResponse(
-                _metered_stream(stream_cached_answer(cached_answer), req.app.state.db_pool),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no",  # 禁用 nginx 緩衝
-                },
-            )
+            return _cached_answer_response(cached_answer, request, req)
         return None
     # 非串流:Debug 模式不使用緩存,保證調試信息最新
     if not request.include_debug_info:
-        cached_response = _check_cache(cache_service, request.vendor_id, request.message, request.target_user)
+        with span("cache.question") as _sp:
+            cached_response = _check_cache(cache_service, request.vendor_id, request.message, request.target_user)
+            _sp.set(hit=bool(cached_response))
         if cached_response:
             return cached_response
     return None
 
 
+def _cached_answer_response(cached_answer: dict, request, req):
+    """緩存答案轉回應：stream → stream_cached_answer SSE；非 stream → VendorChatResponse"""
+    if request.stream:
+        return StreamingResponse(
+            _metered_stream(stream_cached_answer(cached_answer), req.app.state.db_pool),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",  # 禁用 nginx 緩衝
+            },
+        )
+    return VendorChatResponse(**cached_answer)
+
+
+def _start_retrieval_stages(request, sop_orchestrator, intent_classifier=None,
+                            started_at: Optional[float] = None,
+                            precomputed_embedding=None,
+                            start_rewrite: bool = True) -> StageScheduler:
+    """
+    同時啟動檢索前的獨立階段（彼此不等待）：
+    - embedding：query 向量（語義緩存、SOP、知識庫共用）
+    - rewrite：Query Rewrite（同步 LLM 呼叫 → 執行緒）；只有改寫查詢的檢索會等它
+    - sop_context：SOP context 讀取（同步 Redis → 執行緒）；B2B / 回測模式不走 SOP，不讀
+    - intent：kNN 意圖分類（等 embedding；只在意圖明確時填入 intent_result，不呼叫 LLM）
+
+    已有 precomputed_embedding 時不啟動 embedding 階段。
+    start_rewrite=False 時由呼叫端在語義緩存未命中後再呼叫 _start_rewrite_stage
+    （執行緒中的 LLM 呼叫一旦開始就無法取消，命中時不該付這次費用）。
+    """
+    stages = StageScheduler(started_at)
+    if precomputed_embedding is None:
+        stages.start("embedding", get_embedding_client().get_embedding(request.message, verbose=False))
+
+    if start_rewrite:
+        _start_rewrite_stage(request, stages)
+
+    is_b2b = request.mode in ('b2b', 'customer_service')
+    if not request.skip_sop and not is_b2b:
+        stages.start_blocking(
+            "sop_context", sop_orchestrator.trigger_handler.get_context, request.session_id,
+            default=CONTEXT_NOT_PREFETCHED,
+        )
+
+    if intent_classifier is not None and intent_classifier.knn_ready:
+        async def _classify_intent():
+            embedding = precomputed_embedding or await stages.get("embedding")
+            if not embedding:
+                return None
+            return await asyncio.to_thread(intent_classifier.classify_local, request.message, embedding)
+        stages.start("intent", _classify_intent(), deps=("embedding",))
+
+    return stages
+
+
+def _start_rewrite_stage(request, stages: StageScheduler) -> None:
+    """啟動 Query Rewrite 階段（ENABLE_QUERY_REWRITE 且改寫器可用時）"""
+    if os.getenv("ENABLE_QUERY_REWRITE", "false").lower() != "true" or stages.has("rewrite"):
+        return
+    try:
+        from services.query_rewriter import get_query_rewriter
+        _qr = get_query_rewriter()
+        if _qr and _qr.enabled:
+            stages.start_blocking("rewrite", _qr.rewrite, request.message, default=[])
+    except Exception:
+        pass
+
+
+async def _semantic_cache_lookup(request, cache_service, started_at: float, stages: StageScheduler):
+    """
+    語義緩存（Layer 1.5）：精確問題未命中後，以 query embedding 找同業者/角色/配置下的相近問題
+
+    Returns:
+        (cached_answer 或 None, query_embedding 或 None)；embedding 取自 embedding 階段，後續檢索共用
+    """
+    if request.include_debug_info or not cache_service.semantic_available():
+        return None, None
+    embedding = await stages.get("embedding")
+    if not embedding:
+        return None, None
+    # 記錄 embedding 與開始時間：本次若走完整流程，cache_answer 會一併登錄語義條目
+    set_semantic_query(embedding, started_at)
+    with span("cache.semantic") as _sp:
+        # 同步 Redis 讀取 + 矩陣運算移出事件迴圈
+        cached_answer = await asyncio.to_thread(
+            cache_service.get_semantic_cached_answer,
+            vendor_id=request.vendor_id,
+            query_embedding=embedding,
+            target_user=request.target_user,
+            config_version=_generate_config_version(),
+        )
+        _sp.set(hit=bool(cached_answer))
+    return cached_answer, embedding
+
+
 def _knowledge_category(best_knowledge) -> list:
     """取知識的分類候選（conversational-diagnosis 元件 5）。
 
@@ -674,6 +781,55 @@ def _drop_empty_answer_rows(rows: list) -> list:
     return [k for k in (rows or []) if _keep(k)]
 
 
+_RELEVANCE_GATE_PROMPT = ("你判斷一筆客服知識能否用來回應使用者的問題。判定從寬："
+                          "主題相關、能回答到一部分、或說明了該問題的處理管道"
+                          "（例如告知此事屬廠商/客服範疇並導向）都算 YES；"
+                          "只有主題不同、答非所問才是 NO。只輸出 YES 或 NO。")
+_RELEVANCE_GATE_BATCH_PROMPT = ("你判斷多筆客服知識各自能否用來回應使用者的問題。判定從寬："
+                                "主題相關、能回答到一部分、或說明了該問題的處理管道"
+                                "（例如告知此事屬廠商/客服範疇並導向）都算 YES；"
+                                "只有主題不同、答非所問才是 NO。"
+                                "逐筆輸出一行「編號:YES」或「編號:NO」，不要其他文字。")
+
+
+def _relevance_gate_exempt(k: dict) -> bool:
+    """表單/API 觸發列不判（不擋表單）；raw 向量近精確命中免判（省延遲）"""
+    if k.get('form_id') or k.get('action_type') in ('form_fill', 'api_call', 'form_then_api'):
+        return True
+    return (k.get('vector_similarity') or 0) >= float(os.getenv("RELEVANCE_GATE_SKIP_VEC", "0.85"))
+
+
+def _relevance_cache_parts(question: str, k: dict, model: str, prompt: str):
+    """判定只取決於 (問題, 知識 id, 知識 updated_at)；缺 id / updated_at 的列不快取（無法確認版本）"""
+    if k.get('id') is None or not k.get('updated_at'):
+        return None
+    return (normalize_question(question), k['id'], k['updated_at'], model, prompt_version(prompt))
+
+
+def _knowledge_excerpt(k: dict) -> str:
+    return f"知識標題：{k.get('question_summary', '')}\n知識內容（節錄）：{(k.get('answer') or '')[:180]}"
+
+
+async def _judge_relevance_batch(question: str, candidates: list, model: str) -> dict:
+    """一次 prompt 判多筆候選；回傳 {候選索引: True/False}，未解析到的索引不含（呼叫端放行）"""
+    import re
+    body = "\n\n".join(f"[{n}] {_knowledge_excerpt(k)}" for n, (_, k) in enumerate(candidates, 1))
+    resp = await asyncio.to_thread(
+        chat_completion,
+        model=model,
+        messages=[
+            {"role": "system", "content": _RELEVANCE_GATE_BATCH_PROMPT},
+            {"role": "user", "content": f"問題：{question}\n\n{body}"},
+        ],
+        temperature=0, max_tokens=8 * len(candidates))
+    verdicts = {}
+    for num, verdict in re.findall(r"(\d+)\s*[:：]\s*(YES|NO)", (resp.get("content") or "").upper()):
+        n = int(num)
+        if 1 <= n <= len(candidates):
+            verdicts[candidates[n - 1][0]] = verdict == "YES"
+    return verdicts
+
+
 async def _top1_relevance_gate(question: str, rows: list, max_checks: int = 2) -> list:
     """錯位直答把關（51 題全面抽驗逼出）：分數＝0.1×向量＋0.9×rerank，reranker
     對表面詞彙重疊的無關知識會打 0.9+（實例：「電表度數登記錯誤怎麼改」top1=
@@ -682,37 +838,69 @@ async def _top1_relevance_gate(question: str, rows: list, max_checks: int = 2) -
     走誠實 fallback（勝過給錯答案）。
     豁免：表單/API 觸發列不判（不擋表單）；raw 向量 ≥0.85 近精確命中跳過（省
     延遲）；LLM 失敗放行（fail-open 不阻斷）。env RELEVANCE_GATE_ENABLED=false 可關。
+    判定以 (問題, 知識 id, updated_at) 記憶於 LlmJudgmentCache（知識更新時失效）；
+    RELEVANCE_GATE_BATCH=true 時未快取的候選一次 prompt 批次判定（取代逐筆往返）。
     """
     rows = list(rows or [])
     if not rows or os.getenv("RELEVANCE_GATE_ENABLED", "true").lower() == "false":
         return rows
 
-    for i in range(min(max_checks, len(rows))):
+    model = os.getenv("RELEVANCE_GATE_MODEL") or os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+    cache = get_llm_judgment_cache()
+    checks = min(max_checks, len(rows))
+
+    # 先查快取；批次模式下未快取的候選（遇豁免列為止）一次判定
+    verdicts = {}
+    pending = []
+    for i in range(checks):
         k = rows[i]
-        if k.get('form_id') or k.get('action_type') in ('form_fill', 'api_call', 'form_then_api'):
-            return rows[i:]                                   # 表單/API 觸發不判
-        if (k.get('vector_similarity') or 0) >= float(os.getenv("RELEVANCE_GATE_SKIP_VEC", "0.85")):
-            return rows[i:]                                   # 近精確命中免判
+        if _relevance_gate_exempt(k):
+            break
+        parts = _relevance_cache_parts(question, k, model, _RELEVANCE_GATE_PROMPT)
+        cached = await cache.aget("relevance_gate", parts) if parts else None
+        if cached is not None:
+            verdicts[i] = cached
+        else:
+            pending.append((i, k))
+    if len(pending) > 1 and os.getenv("RELEVANCE_GATE_BATCH", "false").lower() == "true":
         try:
-            resp = await asyncio.to_thread(
-                chat_completion,
-                model=os.getenv("RELEVANCE_GATE_MODEL") or os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
-                messages=[
-                    {"role": "system",
-                     "content": "你判斷一筆客服知識能否用來回應使用者的問題。判定從寬："
-                                "主題相關、能回答到一部分、或說明了該問題的處理管道"
-                                "（例如告知此事屬廠商/客服範疇並導向）都算 YES；"
-                                "只有主題不同、答非所問才是 NO。只輸出 YES 或 NO。"},
-                    {"role": "user",
-                     "content": f"問題：{question}\n知識標題：{k.get('question_summary', '')}\n"
-                                f"知識內容（節錄）：{(k.get('answer') or '')[:180]}"},
-                ],
-                temperature=0, max_tokens=3)
-            verdict = (resp.get("content") or "").strip().upper()
+            _t0 = time.perf_counter()
+            batch = await _judge_relevance_batch(question, pending, model)
+            per_item_ms = (time.perf_counter() - _t0) * 1000 / len(pending)
+            for i, k in pending:
+                if i in batch:
+                    verdicts[i] = batch[i]
+                    parts = _relevance_cache_parts(question, k, model, _RELEVANCE_GATE_PROMPT)
+                    if parts:
+                        await cache.aset("relevance_gate", parts, batch[i], knowledge_id=k['id'], llm_ms=per_item_ms)
         except Exception as e:
-            print(f"⚠️ [相關性把關] LLM 失敗放行：{e}")
+            print(f"⚠️ [相關性把關] 批次判定失敗，改逐筆：{e}")
+
+    for i in range(checks):
+        k = rows[i]
+        if _relevance_gate_exempt(k):
             return rows[i:]
-        if verdict.startswith("YES"):
+        relevant = verdicts.get(i)
+        if relevant is None:
+            try:
+                _t0 = time.perf_counter()
+                resp = await asyncio.to_thread(
+                    chat_completion,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": _RELEVANCE_GATE_PROMPT},
+                        {"role": "user", "content": f"問題：{question}\n{_knowledge_excerpt(k)}"},
+                    ],
+                    temperature=0, max_tokens=3)
+                relevant = (resp.get("content") or "").strip().upper().startswith("YES")
+            except Exception as e:
+                print(f"⚠️ [相關性把關] LLM 失敗放行：{e}")
+                return rows[i:]
+            parts = _relevance_cache_parts(question, k, model, _RELEVANCE_GATE_PROMPT)
+            if parts:
+                await cache.aset("relevance_gate", parts, relevant, knowledge_id=k['id'],
+                                 llm_ms=(time.perf_counter() - _t0) * 1000)
+        if relevant:
             return rows[i:]
         print(f"🛡️ [相關性把關] top{i+1}「{k.get('question_summary','')[:24]}」判不相關（sim={k.get('similarity',0):.3f}）→ 次筆晉位")
     return []
@@ -738,28 +926,49 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
         'keywords': [],
     }
 
+    # Step 3.1: 同時啟動 embedding / SOP context / 意圖 階段（結果經 ctx.stages 共用）
+    # rewrite（LLM）等語義緩存未命中才啟動：命中時不付改寫的 LLM 呼叫
+    stages = _start_retrieval_stages(
+        request, req.app.state.sop_orchestrator,
+        getattr(req.app.state, 'intent_classifier', None),
+        started_at=_time.perf_counter() - (_time.time() - _total_start),
+        start_rewrite=False,
+    )
+    ctx.stages = stages
+    _request_stages.set(stages)
+
+    # Step 3.5: 語義緩存（改寫說法的相同問題直接回答；embedding 檢索共用）
+    cached_answer, precomputed_embedding = await _semantic_cache_lookup(request, cache_service, _total_start, stages)
+    if cached_answer:
+        stages.cancel_pending()
+        print(f"⚡ 語義緩存命中！跳過檢索與 LLM: {int((_time.time()-_total_start)*1000)}ms")
+        return _cached_answer_response(cached_answer, request, req)
+    _start_rewrite_stage(request, stages)
+
     if not request.skip_sop:
         sop_orchestrator = req.app.state.sop_orchestrator
 
-        _t0 = _time.time()
-        decision = await _smart_retrieval_with_comparison(
-            request=request,
-            intent_result=intent_result,
-            sop_orchestrator=sop_orchestrator,
-            resolver=resolver,
-        )
-        print(f"⏱️ [Step 4] 智能檢索: {int((_time.time()-_t0)*1000)}ms")
+        with span("smart_retrieval") as _sp:
+            decision = await _smart_retrieval_with_comparison(
+                request=request,
+                intent_result=intent_result,
+                sop_orchestrator=sop_orchestrator,
+                resolver=resolver,
+                precomputed_embedding=precomputed_embedding,
+                stages=stages,
+            )
+            _sp.set(decision=decision['type'])
         print(f"🎯 [最終決策] {decision['type']} - {decision['reason']}")
+        # 意圖階段（kNN）與檢索並行；意圖明確時取代固定 stub（回應 / debug / 計量用）
+        intent_result = await stages.get("intent") or intent_result
 
         if decision['type'] == 'sop':
-            _t0 = _time.time()
-            response = await _build_orchestrator_response(
-                request, req, decision['sop_result'],
-                resolver, vendor_info, cache_service,
-                decision=decision,
-            )
-            print(f"⏱️ [Step 5] SOP 回應構建: {int((_time.time()-_t0)*1000)}ms")
-            print(f"⏱️ [總計] 端到端: {int((_time.time()-_total_start)*1000)}ms")
+            with span("build_response", path="sop"):
+                response = await _build_orchestrator_response(
+                    request, req, decision['sop_result'],
+                    resolver, vendor_info, cache_service,
+                    decision=decision,
+                )
 
             if request.stream:
                 print(f"📡 [串流模式] 將 SOP 響應轉換為串流輸出")
@@ -796,8 +1005,10 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
 
             # 相關性把關（51 題抽驗逼出）：reranker 高分錯位直答比查無更糟——
             # top1 判不相關讓次筆晉位，全不相關空列走誠實 fallback
-            decision['knowledge_list'] = await _top1_relevance_gate(
-                request.message, decision['knowledge_list'])
+            with span("relevance_gate", candidates=len(decision['knowledge_list'])) as _sp:
+                decision['knowledge_list'] = await _top1_relevance_gate(
+                    request.message, decision['knowledge_list'])
+                _sp.set(passed=len(decision['knowledge_list']))
 
             # 串流模式：先檢查是否有表單/API 動作需要完整處理
             if request.stream:
@@ -808,13 +1019,12 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
                 if _k_action in ('form_fill', 'api_call', 'form_then_api') or _k_form_id:
                     # 表單/API 類型：走完整回應路徑（非串流），再包裝成串流輸出
                     print(f"📡 [串流模式] 知識 action_type={_k_action}，走完整回應再轉串流")
-                    _t0 = _time.time()
-                    response = await _build_knowledge_response(
-                        request, req, intent_result, decision['knowledge_list'],
-                        resolver, vendor_info, cache_service,
-                        decision=decision,
-                    )
-                    print(f"⏱️ [Step 5] KB 回應構建（表單）: {int((_time.time()-_t0)*1000)}ms")
+                    with span("build_response", path="knowledge_form"):
+                        response = await _build_knowledge_response(
+                            request, req, intent_result, decision['knowledge_list'],
+                            resolver, vendor_info, cache_service,
+                            decision=decision,
+                        )
                     print(f"📡 [串流模式] 將表單響應轉換為串流輸出")
                     return StreamingResponse(
                         _metered_stream(stream_response_wrapper(response.dict() if hasattr(response, 'dict') else response), req.app.state.db_pool),
@@ -827,7 +1037,6 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
                     )
 
                 print(f"📡 [串流模式] 使用串流合成回應")
-                print(f"⏱️ [總計] 檢索完成，開始串流: {int((_time.time()-_total_start)*1000)}ms")
                 return StreamingResponse(
                     _metered_stream(stream_synthesis_response(
                         request, req, intent_result, decision['knowledge_list'],
@@ -843,26 +1052,22 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
                 )
 
             # 非串流模式：等待完整回應
-            _t0 = _time.time()
-            response = await _build_knowledge_response(
-                request, req, intent_result, decision['knowledge_list'],
-                resolver, vendor_info, cache_service,
-                decision=decision,
-            )
-            print(f"⏱️ [Step 5] KB 回應構建: {int((_time.time()-_t0)*1000)}ms")
-            print(f"⏱️ [總計] 端到端: {int((_time.time()-_total_start)*1000)}ms")
+            with span("build_response", path="knowledge"):
+                response = await _build_knowledge_response(
+                    request, req, intent_result, decision['knowledge_list'],
+                    resolver, vendor_info, cache_service,
+                    decision=decision,
+                )
             return response
 
         elif decision['type'] == 'none':
             # 無結果，進入 RAG fallback
-            _t0 = _time.time()
-            response = await _handle_no_knowledge_found(
-                request, req, intent_result, resolver,
-                cache_service, vendor_info,
-                decision=decision,
-            )
-            print(f"⏱️ [Step 5] Fallback 回應: {int((_time.time()-_t0)*1000)}ms")
-            print(f"⏱️ [總計] 端到端: {int((_time.time()-_total_start)*1000)}ms")
+            with span("build_response", path="fallback"):
+                response = await _handle_no_knowledge_found(
+                    request, req, intent_result, resolver,
+                    cache_service, vendor_info,
+                    decision=decision,
+                )
 
             if request.stream:
                 print(f"📡 [串流模式] 將無結果響應轉換為串流輸出")
@@ -873,9 +1078,13 @@ async def handle_retrieval(request, req, ctx: ChatRequestContext):
         # 回測模式：只使用知識庫
         print(f"ℹ️  [回測模式] 跳過 SOP 檢索，僅使用知識庫")
         intent_id = None
+        if precomputed_embedding is None:
+            precomputed_embedding = await stages.get("embedding")
         knowledge_list, _knowledge_list_unfiltered = await _retrieve_knowledge(
-            request, intent_id, intent_result
+            request, intent_id, intent_result, precomputed_embedding=precomputed_embedding,
+            precomputed_rewrites=stages.task("rewrite")
         )
+        intent_result = await stages.get("intent") or intent_result
         if not knowledge_list:
             return await _handle_no_knowledge_found(
                 request, req, intent_result, resolver,
@@ -1372,16 +1581,17 @@ async def stream_synthesis_response(
             cache_response_and_return(cache_service, request.vendor_id, request.message, cache_response, request.target_user)
         else:
             # 非合成：用快速路徑/模板/完美匹配
-            optimization_result = llm_optimizer.optimize_answer(
-                question=request.message,
-                search_results=search_results,
-                confidence_level=evaluation['confidence_level'],
-                confidence_score=evaluation['confidence_score'],
-                intent_info=intent_result,
-                vendor_params=vendor_params,
-                vendor_name=vendor_info['name'],
-                vendor_info=vendor_info
-            )
+            with span("llm_synthesis"):
+                optimization_result = llm_optimizer.optimize_answer(
+                    question=request.message,
+                    search_results=search_results,
+                    confidence_level=evaluation['confidence_level'],
+                    confidence_score=evaluation['confidence_score'],
+                    intent_info=intent_result,
+                    vendor_params=vendor_params,
+                    vendor_name=vendor_info['name'],
+                    vendor_info=vendor_info
+                )
             final_answer, _ = _clean_answer_with_tracking(
                 optimization_result['optimized_answer'], request.vendor_id, resolver
             )
@@ -1662,6 +1872,9 @@ def _build_debug_info(
     if system_config:
         system_config_default.update(system_config)
 
+    # 檢索路徑的階段時間軸（handle_retrieval 設定；其他路徑為 None）
+    _stages = _request_stages.get()
+
     return DebugInfo(
         processing_path=processing_path,
         sop_candidates=sop_candidates_list,
@@ -1672,7 +1885,8 @@ def _build_debug_info(
         vendor_params_injected=vendor_params_injected,
         thresholds=thresholds,
         system_config=system_config_default,
-        comparison_metadata=comparison_metadata  # 🆕 2026-01-28: 比較資訊
+        comparison_metadata=comparison_metadata,  # 🆕 2026-01-28: 比較資訊
+        stage_timings=_stages.report() if _stages else None
     )
 
 
@@ -1700,7 +1914,9 @@ async def _smart_retrieval_with_comparison(
     request: VendorChatRequest,
     intent_result: dict,
     sop_orchestrator,
-    resolver
+    resolver,
+    precomputed_embedding=None,
+    stages: Optional[StageScheduler] = None
 ) -> dict:
     """
     智能檢索：SOP 與知識庫同時檢索 + 分數比較
@@ -1716,6 +1932,8 @@ async def _smart_retrieval_with_comparison(
         intent_result: 意圖分類結果
         sop_orchestrator: SOP 編排器
         resolver: 參數解析器
+        precomputed_embedding: 已算好的 query embedding（語義緩存查詢時產生；None 則等 embedding 階段）
+        stages: 請求的階段排程（handle_retrieval 建立；None 則於此啟動前置階段）
 
     Returns:
         {
@@ -1739,6 +1957,13 @@ async def _smart_retrieval_with_comparison(
     intent_id = None
     primary_intent_id = None
 
+    if stages is None:
+        stages = _start_retrieval_stages(request, sop_orchestrator, precomputed_embedding=precomputed_embedding)
+    # 原始查詢的向量檢索只需 embedding；rewrite 以未完成的 Task 傳入，改寫查詢檢索時才等待
+    if precomputed_embedding is None:
+        precomputed_embedding = await stages.get("embedding")
+    precomputed_rewrites = stages.task("rewrite") or []
+
     # B2B 模式：只走 JGB 知識庫，不走 SOP
     is_b2b = request.mode in ('b2b', 'customer_service')
     if is_b2b:
@@ -1746,11 +1971,22 @@ async def _smart_retrieval_with_comparison(
         print(f"🏢 [B2B 模式] 只檢索 JGB 知識庫（system_provider）")
         print(f"{'='*80}")
 
-        knowledge_list, knowledge_list_unfiltered = await _retrieve_knowledge(
-            request=request,
-            intent_id=intent_id,
-            intent_result=intent_result
-        )
+        try:
+            knowledge_list, knowledge_list_unfiltered = await stages.start(
+                "kb_retrieval",
+                _retrieve_knowledge(
+                    request=request,
+                    intent_id=intent_id,
+                    intent_result=intent_result,
+                    precomputed_embedding=precomputed_embedding,
+                    precomputed_rewrites=precomputed_rewrites
+                ),
+                deps=("embedding", "rewrite"),
+                raise_errors=True,
+            )
+        except BaseException:
+            stages.cancel_pending()
+            raise
 
         return {
             'type': 'knowledge' if knowledge_list else 'none',
@@ -1764,52 +2000,53 @@ async def _smart_retrieval_with_comparison(
     print(f"🔍 [智能檢索] 同時檢索 SOP 和知識庫")
     print(f"{'='*80}")
 
-    # ✅ 預計算共用資源（避免 SOP+KB 重複呼叫 LLM/Embedding API）
-    import time as _time
-
-    _t0 = _time.time()
-    # 預計算 Query Rewrite（一次 LLM 呼叫，SOP+KB 共用）
-    precomputed_rewrites = []
-    if os.getenv("ENABLE_QUERY_REWRITE", "false").lower() == "true":
-        try:
-            from services.query_rewriter import get_query_rewriter
-            _qr = get_query_rewriter()
-            if _qr and _qr.enabled:
-                precomputed_rewrites = _qr.rewrite(request.message)
-        except Exception:
-            pass
-    # 預計算 Embedding（一次 API 呼叫，SOP+KB 共用）
-    _ec = get_embedding_client()
-    precomputed_embedding = await _ec.get_embedding(request.message, verbose=False)
-    print(f"⏱️ [預計算] Query Rewrite + Embedding: {int((_time.time()-_t0)*1000)}ms")
+    # B2C：並行執行 SOP 和知識庫檢索（共用前置階段結果）
+    async def _sop_retrieval():
+        # SOP context 已與 embedding 同時讀取；只有 SOP 檢索需要等它
+        prefetched_context = await stages.get("sop_context", CONTEXT_NOT_PREFETCHED)
+        return await sop_orchestrator.process_message(
+            user_message=request.message,
+            session_id=request.session_id,
+            user_id=request.user_id or "unknown",
+            vendor_id=request.vendor_id,
+            precomputed_embedding=precomputed_embedding,
+            precomputed_rewrites=precomputed_rewrites,
+            role_id=request.role_id,
+            prefetched_context=prefetched_context
+        )
 
-    # B2C：並行執行 SOP 和知識庫檢索（共用預計算結果）
-    sop_task = sop_orchestrator.process_message(
-        user_message=request.message,
-        session_id=request.session_id,
-        user_id=request.user_id or "unknown",
-        vendor_id=request.vendor_id,
-        precomputed_embedding=precomputed_embedding,
-        precomputed_rewrites=precomputed_rewrites,
-        role_id=request.role_id
+    sop_task = stages.start(
+        "sop_retrieval", _sop_retrieval(),
+        deps=("embedding", "sop_context", "rewrite"),
+        raise_errors=True,
     )
 
-    knowledge_task = _retrieve_knowledge(
-        request=request,
-        intent_id=intent_id,
-        intent_result=intent_result,
-        precomputed_embedding=precomputed_embedding,
-        precomputed_rewrites=precomputed_rewrites
+    knowledge_task = stages.start(
+        "kb_retrieval",
+        _retrieve_knowledge(
+            request=request,
+            intent_id=intent_id,
+            intent_result=intent_result,
+            precomputed_embedding=precomputed_embedding,
+            precomputed_rewrites=precomputed_rewrites
+        ),
+        deps=("embedding", "rewrite"),
+        raise_errors=True,
     )
 
     # 等待兩個都完成
     # _retrieve_knowledge 回傳 (filtered, unfiltered)：
     # - filtered: 通過 threshold 的知識，供決策邏輯與 LLM 使用
     # - unfiltered: include_debug_info=True 時才有，供 chat-test debug 顯示
-    sop_result, knowledge_retrieval = await asyncio.gather(
-        sop_task,
-        knowledge_task
-    )
+    try:
+        sop_result, knowledge_retrieval = await asyncio.gather(
+            sop_task,
+            knowledge_task
+        )
+    except BaseException:
+        # 任一檢索失敗：取消另一個檢索與仍在等待的 rewrite 等階段（不留下無人 await 的 Task）
+        stages.cancel_pending()
+        raise
     knowledge_list, knowledge_list_unfiltered = knowledge_retrieval
 
     # ==================== Step 2: 提取最高分 ====================
@@ -2439,17 +2676,18 @@ async def _build_rag_response(
     confidence_score = confidence_score_map.get(confidence_level, 0.70)
 
     # LLM 優化（添加 confidence_score 以確保參數注入）
-    optimization_result = llm_optimizer.optimize_answer(
-        question=request.message,
-        search_results=rag_results,
-        confidence_level=confidence_level,
-        confidence_score=confidence_score,  # 根據 confidence_level 設定分數
-        intent_info=intent_result,
-        vendor_params=vendor_params,
-        vendor_name=vendor_info['name'],
-        vendor_info=vendor_info,  # 傳入完整業者資訊
-        enable_synthesis_override=False if request.disable_answer_synthesis else None
-    )
+    with span("llm_synthesis"):
+        optimization_result = llm_optimizer.optimize_answer(
+            question=request.message,
+            search_results=rag_results,
+            confidence_level=confidence_level,
+            confidence_score=confidence_score,  # 根據 confidence_level 設定分數
+            intent_info=intent_result,
+            vendor_params=vendor_params,
+            vendor_name=vendor_info['name'],
+            vendor_info=vendor_info,  # 傳入完整業者資訊
+            enable_synthesis_override=False if request.disable_answer_synthesis else None
+        )
 
     # prospect 自由問答 grounded 合成（R13.2/13.3）：RAG fallback 路徑
     optimization_result = await _maybe_synth_prospect_freetext(
@@ -3092,17 +3330,18 @@ async def _build_knowledge_response(
     print(f"📊 [知識庫信心度評估] level={confidence_level}, score={confidence_score:.3f}, decision={evaluation['decision']}")
 
     # LLM 優化（使用評估後的信心度）
-    optimization_result = llm_optimizer.optimize_answer(
-        question=request.message,
-        search_results=search_results,
-        confidence_level=confidence_level,
-        confidence_score=confidence_score,  # 使用 ConfidenceEvaluator 計算的分數
-        intent_info=intent_result,
-        vendor_params=vendor_params,
-        vendor_name=vendor_info['name'],
-        vendor_info=vendor_info,  # 傳入完整業者資訊
-        enable_synthesis_override=False if request.disable_answer_synthesis else None
-    )
+    with span("llm_synthesis"):
+        optimization_result = llm_optimizer.optimize_answer(
+            question=request.message,
+            search_results=search_results,
+            confidence_level=confidence_level,
+            confidence_score=confidence_score,  # 使用 ConfidenceEvaluator 計算的分數
+            intent_info=intent_result,
+            vendor_params=vendor_params,
+            vendor_name=vendor_info['name'],
+            vendor_info=vendor_info,  # 傳入完整業者資訊
+            enable_synthesis_override=False if request.disable_answer_synthesis else None
+        )
 
     # prospect 自由問答 grounded 合成（R13.2/13.3）：主 handler direct_answer 路徑（競品等走此）
     optimization_result = await _maybe_synth_prospect_freetext(
@@ -3710,6 +3949,9 @@ class DebugInfo(BaseModel):
     # 智能檢索比較資訊（2026-01-28 新增）
     comparison_metadata: Optional[Dict] = Field(None, description="SOP 與知識庫比較資訊（分數、候選數、決策依據等）")
 
+    # 請求階段時間軸
+    stage_timings: Optional[Dict] = Field(None, description="檢索路徑各階段 start/end（ms，相對請求開始）、依賴與關鍵路徑")
+
 
 class QuickReply(BaseModel):
     """快速回复按钮"""
@@ -3774,7 +4016,21 @@ async def vendor_chat_message(request: VendorChatRequest, req: Request):
     重構：單一職責原則（Single Responsibility Principle）
     - 主函數作為編排器（Orchestrator）
     - 各功能模塊獨立為輔助函數
+
+    整個請求為一個 tracing root span（TRACING_ENABLED，見 services/tracing.py）；
+    串流回應的 root span 延續到串流結束（LLM 合成在 body 內執行）
     """
+    root = start_trace("chat.message", vendor_id=request.vendor_id, mode=request.mode,
+                       target_user=request.target_user, stream=bool(request.stream))
+    with root:
+        response = await _vendor_chat_message(request, req)
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = trace_stream(root.defer(), response.body_iterator)
+    return response
+
+
+async def _vendor_chat_message(request: VendorChatRequest, req: Request):
+    """vendor_chat_message 的主體（流程見端點說明）"""
     try:
         # DEBUG: 檢查 session_id 是否被正確接收
         print(f"🔍 [DEBUG] vendor_chat_message received - session_id: {request.session_id}, user_id: {request.user_id}")
@@ -3831,7 +4087,13 @@ async def vendor_chat_message(request: VendorChatRequest, req: Request):
         if is_b2b and not request.vendor_id:
             ctx.vendor_info = {'id': 0, 'name': 'JGB System', 'business_types': ['system_provider']}
         else:
-            ctx.vendor_info = _validate_vendor(request.vendor_id, resolver)
+            # 業者資訊 / 參數為同步 psycopg2 查詢：移到執行緒，並預熱參數快取，
+            # 後續 handler 在 event loop 上讀參數時直接命中快取
+            ctx.vendor_info = await asyncio.to_thread(_validate_vendor, request.vendor_id, resolver)
+            try:
+                await asyncio.to_thread(resolver.get_vendor_parameters, request.vendor_id)
+            except Exception as e:
+                print(f"⚠️ 業者參數預熱失敗（由使用處重試）: {e}")
 
         # 對話/緩存/檢索 handler 群：依序嘗試,首個命中即回(handle_retrieval 為終點必回)
         for handler in (handle_conversational_entry, handle_cache, handle_retrieval):
@@ -3862,17 +4124,17 @@ async def test_vendor_config(vendor_id: int):
     try:
         resolver = get_vendor_param_resolver()
 
-        # 獲取業者資訊
-        vendor_info = resolver.get_vendor_info(vendor_id)
+        # 獲取業者資訊（同步查詢移到執行緒）
+        vendor_info = await asyncio.to_thread(resolver.get_vendor_info, vendor_id)
         if not vendor_info:
             raise HTTPException(status_code=404, detail="業者不存在")
 
         # 獲取業者參數
-        params = resolver.get_vendor_parameters(vendor_id)
+        params = await asyncio.to_thread(resolver.get_vendor_parameters, vendor_id)
 
         # 測試模板解析
         test_template = "繳費日為 {{payment_day}}，逾期費 {{late_fee}}。"
-        resolved = resolver.resolve_template(test_template, vendor_id)
+        resolved = await asyncio.to_thread(resolver.resolve_template, test_template, vendor_id)
 
         return {
             "vendor": vendor_info,
@@ -3898,11 +4160,8 @@ async def reload_vendor_services():
     用於意圖或知識更新後重新載入
     """
     try:
-        global _vendor_param_resolver
-
-        # 清除參數快取
-        if _vendor_param_resolver:
-            _vendor_param_resolver.clear_cache()
+        # 清除所有已註冊的行程內快取（業者參數 / 業者資訊 / 對話設定 / 系統脈絡…），並通知其他 worker
+        get_cache_bus().invalidate(None)
 
         return {
             "success": True,
@@ -30,11 +30,10 @@ class ConversationalConfigPayload(BaseModel):
 
 
 def _reset_caches() -> None:
+    """清對話設定 / 規則快取（本行程立即清，並經 cache_bus 通知其他 worker）"""
     try:
-        from services.conversational_config import reset_cache as reset_cfg
-        from services.conversational_rules import reset_cache as reset_rules
-        reset_cfg()
-        reset_rules()
+        from services.cache_bus import get_cache_bus
+        get_cache_bus().invalidate("conversational")
     except Exception as e:
         print(f"⚠️ 清對話設定快取失敗：{e}")
 
@@ -0,0 +1,49 @@
+"""
+追蹤除錯路由
+
+查詢行程內 ring buffer 的請求 trace 與各 span 耗時分佈（services/tracing.py）。
+TRACING_ENABLED=false 時回傳空列表。
+"""
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from services.tracing import get_tracer
+
+router = APIRouter(prefix="/api/v1/debug", tags=["debug"])
+
+
+@router.get("/traces")
+async def list_traces(
+    limit: int = Query(50, ge=1, le=500, description="最多回傳筆數（新到舊）"),
+    min_ms: Optional[float] = Query(None, description="只回傳總耗時 ≥ min_ms 的 trace"),
+    span: Optional[str] = Query(None, description="只回傳含此 span 名稱的 trace"),
+) -> Dict[str, Any]:
+    """
+    最近的請求 trace 與各 span 的 p50 / p95 / p99
+
+    Returns:
+        config（抽樣/匯出設定與計數）、span_stats（ring buffer 內各 span 耗時分佈）、traces
+    """
+    tracer = get_tracer()
+    return {
+        "config": tracer.get_config(),
+        "span_stats": tracer.span_stats(),
+        "traces": tracer.recent(limit=limit, min_ms=min_ms, span_name=span),
+    }
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str) -> Dict[str, Any]:
+    """單一 trace 的完整 span 樹"""
+    trace = get_tracer().get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"trace 不存在或已移出 buffer: {trace_id}")
+    return trace
+
+
+@router.delete("/traces")
+async def clear_traces() -> Dict[str, Any]:
+    """清空 ring buffer"""
+    get_tracer().clear()
+    return {"success": True}
@@ -4,7 +4,7 @@
 提供規格書轉知識庫的 RESTful API
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request, BackgroundTasks
 from fastapi.responses import JSONResponse
 from typing import List, Dict, Optional
 from pydantic import BaseModel
@@ -54,6 +54,7 @@ class QAListUpdate(BaseModel):
 class ConvertRequest(BaseModel):
     """轉換請求"""
     custom_prompt: Optional[str] = None
+    background: bool = False  # True：立即返回，前端輪詢 GET /{job_id} 取得逐段產出的 Q&A
 
 
 # ==================== API 端點 ====================
@@ -140,15 +141,22 @@ async def parse_document(request: Request, job_id: str):
 
 
 @router.post("/{job_id}/convert")
-async def convert_to_qa(job_id: str, convert_request: ConvertRequest, request: Request):
+async def convert_to_qa(
+    job_id: str,
+    convert_request: ConvertRequest,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
     """
     將文件內容轉換為 Q&A
 
-    使用 AI 自動提取問題和答案
+    使用 AI 自動提取問題和答案（各段並行處理）。background=true 時立即返回
+    {"job_id", "status": "processing"}，轉換過程中每完成一段，作業的 result.qa_list
+    即更新為目前已提取的 Q&A（result.partial = true）。
 
     Args:
         job_id: 任務 ID
-        convert_request: 轉換請求（可包含自訂 prompt）
+        convert_request: 轉換請求（可包含自訂 prompt、是否背景執行）
         request: FastAPI Request 對象
 
     Returns:
@@ -173,6 +181,21 @@ async def convert_to_qa(job_id: str, convert_request: ConvertRequest, request: R
     """
     try:
         service = _get_service(request)
+
+        if convert_request.background:
+            job = await service.get_job(job_id)
+            if not job:
+                raise ValueError(f"任務不存在: {job_id}")
+            if not job.get('result') or 'content' not in job.get('result', {}):
+                raise ValueError(f"任務狀態錯誤。請先解析文件")
+
+            background_tasks.add_task(
+                service.convert_to_qa,
+                job_id=job_id,
+                custom_prompt=convert_request.custom_prompt
+            )
+            return JSONResponse(content={"job_id": job_id, "status": "processing"})
+
         result = await service.convert_to_qa(
             job_id=job_id,
             custom_prompt=convert_request.custom_prompt
@@ -151,7 +151,9 @@ async def get_intent_stats(req: Request):
                 "disabled_intents": total - enabled,
                 "by_type": [dict(row) for row in by_type],
                 "knowledge_coverage": [dict(row) for row in coverage],
-                "top_used": [dict(row) for row in top_used]
+                "top_used": [dict(row) for row in top_used],
+                # 分類器執行期統計（kNN 直接回傳 vs 升級 LLM）
+                "classifier": req.app.state.intent_classifier.get_classification_stats()
             }
 
     except Exception as e:
@@ -494,7 +496,8 @@ async def reload_intents(req: Request):
             return {
                 "message": "意圖配置已重新載入",
                 "total_intents": len(intent_classifier.intents),
-                "last_reload": intent_classifier.last_reload.isoformat() if intent_classifier.last_reload else None
+                "last_reload": intent_classifier.last_reload.isoformat() if intent_classifier.last_reload else None,
+                "knn_index": intent_classifier.knn_index.get_stats()
             }
         else:
             raise HTTPException(
@@ -129,6 +129,16 @@ async def upload_knowledge_file(
     from services.knowledge_import_service import KnowledgeImportService
     service = KnowledgeImportService(db_pool)
 
+    # 解析業態類型
+    business_types_list = []
+    if business_types:
+        try:
+            import json
+            business_types_list = json.loads(business_types)
+            print(f"📋 業態類型: {business_types_list}")
+        except Exception as e:
+            print(f"⚠️ 無法解析業態類型: {e}")
+
     job_id = await service.create_job(
         job_type='knowledge_import',
         vendor_id=vendor_id,
@@ -139,6 +149,7 @@ async def upload_knowledge_file(
             'skip_review': skip_review,
             'default_priority': default_priority,
             'enable_quality_evaluation': enable_quality_evaluation,
+            'business_types': business_types_list,
             'file_type': file_ext[1:]
         },
         file_path=temp_file_path,
@@ -152,16 +163,6 @@ async def upload_knowledge_file(
 
     print(f"🚀 啟動背景處理任務 (job_id: {job_id})")
 
-    # 解析業態類型
-    business_types_list = []
-    if business_types:
-        try:
-            import json
-            business_types_list = json.loads(business_types)
-            print(f"📋 業態類型: {business_types_list}")
-        except Exception as e:
-            print(f"⚠️ 無法解析業態類型: {e}")
-
     background_tasks.add_task(
         service.process_import_job,
         job_id=job_id,
@@ -578,6 +579,84 @@ async def confirm_test_scenarios(
     }
 
 
+@router.post("/jobs/{job_id}/resume")
+async def resume_import_job(
+    job_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """
+    續跑失敗的匯入任務
+
+    以原上傳檔案與設定重新執行；寫入階段每個 chunk 都與 checkpoint 同交易提交，
+    續跑時會略過先前已寫入的知識，不會重複匯入。
+
+    Args:
+        job_id: 任務 ID
+
+    Returns:
+        Dict: 續跑結果
+    """
+    db_pool = request.app.state.db_pool
+
+    from services.knowledge_import_service import KnowledgeImportService
+    service = KnowledgeImportService(db_pool)
+
+    job = await service.get_job(job_id)
+    if not job or job['job_type'] != 'knowledge_import':
+        raise HTTPException(status_code=404, detail="任務不存在")
+
+    if job['status'] != 'failed':
+        raise HTTPException(
+            status_code=409,
+            detail=f"只有失敗的任務可以續跑（當前: {job['status']}）"
+        )
+
+    file_path = job.get('file_path')
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(status_code=410, detail="原上傳檔案已不存在，請重新上傳")
+
+    # 以條件式 UPDATE 原子地取得續跑權：並發的重複請求只有一個能把 failed 改成 processing，
+    # 其餘拿不到 row 回 409，避免同一任務被排進兩個背景作業
+    async with db_pool.acquire() as conn:
+        claimed = await conn.fetchrow("""
+            UPDATE unified_jobs
+            SET status = 'processing', error_message = NULL, updated_at = NOW()
+            WHERE job_id = $1 AND status = 'failed'
+            RETURNING job_config, vendor_id, user_id
+        """, uuid.UUID(job_id))
+
+    if not claimed:
+        raise HTTPException(status_code=409, detail="任務已在續跑中或狀態已變更")
+
+    import json
+    config = json.loads(claimed['job_config']) if claimed['job_config'] else {}
+    checkpoint = (config.get('write_checkpoint') or {}).get('keys', [])
+
+    print(f"🔁 續跑匯入任務 (job_id: {job_id}，已寫入 {len(checkpoint)} 條)")
+
+    background_tasks.add_task(
+        service.process_import_job,
+        job_id=job_id,
+        file_path=file_path,
+        vendor_id=claimed['vendor_id'],
+        import_mode=config.get('import_mode', 'append'),
+        enable_deduplication=config.get('enable_deduplication', True),
+        skip_review=config.get('skip_review', False),
+        default_priority=config.get('default_priority', 0),
+        enable_quality_evaluation=config.get('enable_quality_evaluation', True),
+        business_types=config.get('business_types', []),
+        user_id=claimed['user_id'] or "admin"
+    )
+
+    return {
+        "job_id": job_id,
+        "status": "processing",
+        "message": "任務已重新開始處理，先前已寫入的知識將被略過",
+        "already_written": len(checkpoint)
+    }
+
+
 @router.delete("/jobs/{job_id}")
 async def delete_import_job(job_id: str, request: Request):
     """
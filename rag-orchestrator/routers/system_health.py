@@ -6,7 +6,11 @@ Pipeline 健康檢查路由
 import logging
 from fastapi import APIRouter, HTTPException
 
+from services.cache_bus import get_cache_bus
 from services.pipeline_health_service import PipelineHealthService
+from services.http_clients import get_http_registry
+from services.keyword_index import get_keyword_index
+from services.usage_event_writer import get_usage_writer
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +61,49 @@ async def run_pipeline_e2e_test():
     except Exception as e:
         logger.error(f"Pipeline E2E test failed: {e}")
         raise HTTPException(status_code=500, detail=f"端到端測試失敗: {str(e)}")
+
+
+@router.get("/http-clients")
+async def get_http_client_stats():
+    """
+    服務間共用 HTTP 客戶端指標（依目標：embedding / reranker / jgb / universal_api）
+
+    回傳每個目標的請求數、錯誤數、在途請求數、連接池飽和度（in_flight / max_connections）、
+    峰值飽和度、新建連線數與平均/最大建連耗時，用於判斷連接池是否需要調大。
+
+    NOTE: 此端點目前無認證保護（同上述說明）。
+    """
+    return {"targets": get_http_registry().stats()}
+
+
+@router.get("/keyword-index")
+async def get_keyword_index_stats():
+    """
+    知識庫關鍵字倒排索引狀態（是否就緒、知識 / keyword / token 數、同步水位與更新次數）
+
+    NOTE: 此端點目前無認證保護（同上述說明）。
+    """
+    return get_keyword_index().get_stats()
+
+
+@router.get("/usage-writer")
+async def get_usage_writer_stats():
+    """
+    usage_events 批次寫入器狀態（佇列深度、寫入 / 丟棄 / spill / 回放計數、最近錯誤）
+
+    NOTE: 此端點目前無認證保護（同上述說明）。
+    """
+    writer = get_usage_writer()
+    if writer is None:
+        return {"running": False}
+    return writer.get_stats()
+
+
+@router.get("/cache-bus")
+async def get_cache_bus_stats():
+    """
+    行程內快取失效匯流排狀態（訂閱是否正常、已註冊快取、發布 / 接收 / 套用 / 重連次數）
+
+    NOTE: 此端點目前無認證保護（同上述說明）。
+    """
+    return get_cache_bus().get_stats()
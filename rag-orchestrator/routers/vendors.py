@@ -14,6 +14,7 @@ import asyncio
 import httpx
 from services.sop_utils import parse_sop_excel, identify_cashflow_sensitive_items
 from services.cache_service import CacheService
+from services.cache_bus import get_cache_bus
 
 
 router = APIRouter(prefix="/api/v1/vendors", tags=["vendors"])
@@ -314,6 +315,8 @@ async def update_vendor(vendor_id: int, vendor: VendorUpdate):
         conn.commit()
         cursor.close()
 
+        get_cache_bus().invalidate("vendors", vendor_id)
+
         return VendorResponse(**dict(updated_vendor))
 
     except HTTPException:
@@ -349,6 +352,8 @@ async def delete_vendor(vendor_id: int):
         conn.commit()
         cursor.close()
 
+        get_cache_bus().invalidate("vendors", vendor_id)
+
         return {"message": "業者已停用", "vendor_id": vendor_id}
 
     except HTTPException:
@@ -499,10 +504,8 @@ async def update_vendor_configs(vendor_id: int, config_update: VendorConfigUpdat
         conn.commit()
         cursor.close()
 
-        # 清除快取
-        from services.vendor_parameter_resolver import VendorParameterResolver
-        resolver = VendorParameterResolver()
-        resolver.clear_cache(vendor_id)
+        # 清除快取（所有 worker 的 VendorParameterResolver / VendorConfigService）
+        get_cache_bus().invalidate("vendor_configs", vendor_id)
 
         return {
             "message": "配置已更新",
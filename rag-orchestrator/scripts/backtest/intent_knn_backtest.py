@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+意圖分類回測：kNN 快速層 vs LLM 的準確率 / 延遲取捨
+
+以 test_scenarios 中有 expected_intent_id 的情境為標準答案：
+1. 每題算一次 embedding，以 IntentClassifier 的 kNN 索引取得各意圖相似度
+2. 每題呼叫一次 LLM 分類（--skip-llm 可略過，僅評估 kNN）
+3. 在 (min_score, min_margin) 參數網格上離線模擬「kNN 明確即回傳，模糊才升級 LLM」：
+   - knn_rate：kNN 直接回傳的比例（免呼叫 LLM）
+   - knn_accuracy：kNN 直接回傳者的準確率
+   - combined_accuracy：整體準確率（升級者以 LLM 結果計）
+   - avg_ms：平均分類延遲（embedding + kNN + 升級時的 LLM）
+
+    python scripts/backtest/intent_knn_backtest.py --limit 200
+    python scripts/backtest/intent_knn_backtest.py --scores 0.75 0.8 0.85 --margins 0.02 0.05 0.08 --skip-llm
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+
+from services.db_utils import get_db_config  # noqa: E402
+from services.embedding_utils import get_embedding_client  # noqa: E402
+from services.intent_classifier import IntentClassifier  # noqa: E402
+
+
+def load_scenarios(limit: int = None) -> List[Dict]:
+    """載入有標準意圖的已審核測試情境"""
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT ts.id, ts.test_question, i.name
+            FROM test_scenarios ts
+            JOIN intents i ON i.id = ts.expected_intent_id
+            WHERE ts.is_active = true AND ts.status = 'approved'
+            ORDER BY ts.id
+            """ + (" LIMIT %s" if limit else ""),
+            (limit,) if limit else None,
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return [{"id": r[0], "question": r[1], "expected": r[2]} for r in rows]
+
+
+async def collect_samples(classifier: IntentClassifier, scenarios: List[Dict], skip_llm: bool) -> List[Dict]:
+    """逐題收集 embedding / kNN 排名 / LLM 結果與各自延遲"""
+    client = get_embedding_client()
+    samples = []
+    for n, scenario in enumerate(scenarios, 1):
+        t0 = time.perf_counter()
+        embedding = await client.get_embedding(scenario["question"], verbose=False)
+        embed_ms = (time.perf_counter() - t0) * 1000
+        if not embedding:
+            print(f"⚠️ #{scenario['id']} embedding 失敗，略過")
+            continue
+
+        t0 = time.perf_counter()
+        ranked = classifier.knn_index.score(embedding)
+        knn_ms = (time.perf_counter() - t0) * 1000
+
+        llm_intent, llm_ms = None, None
+        if not skip_llm:
+            t0 = time.perf_counter()
+            llm_result = await asyncio.to_thread(classifier._classify_with_llm, scenario["question"])
+            llm_ms = (time.perf_counter() - t0) * 1000
+            llm_intent = llm_result.get("intent_name")
+
+        samples.append({
+            **scenario,
+            "top1": ranked[0] if ranked else None,
+            "top2_score": ranked[1][1] if len(ranked) > 1 else -1.0,
+            "embed_ms": embed_ms,
+            "knn_ms": knn_ms,
+            "llm_intent": llm_intent,
+            "llm_ms": llm_ms,
+        })
+        if n % 20 == 0:
+            print(f"  進度 {n}/{len(scenarios)}")
+    return samples
+
+
+def evaluate(samples: List[Dict], scores: Sequence[float], margins: Sequence[float]) -> List[Dict]:
+    """在參數網格上模擬 kNN 優先 + LLM 升級的準確率與延遲"""
+    has_llm = any(s["llm_ms"] is not None for s in samples)
+    llm_ms = [s["llm_ms"] for s in samples if s["llm_ms"] is not None]
+    avg_llm_ms = sum(llm_ms) / len(llm_ms) if llm_ms else None
+
+    rows = []
+    for min_score in scores:
+        for min_margin in margins:
+            local = correct_local = correct_total = 0
+            latency = 0.0
+            for s in samples:
+                top1 = s["top1"]
+                confident = (
+                    top1 is not None
+                    and top1[1] >= min_score
+                    and top1[1] - s["top2_score"] >= min_margin
+                )
+                latency += s["embed_ms"] + s["knn_ms"]
+                if confident:
+                    local += 1
+                    hit = top1[0] == s["expected"]
+                    correct_local += hit
+                    correct_total += hit
+                elif has_llm:
+                    correct_total += s["llm_intent"] == s["expected"]
+                    latency += s["llm_ms"] if s["llm_ms"] is not None else avg_llm_ms
+            total = len(samples)
+            rows.append({
+                "min_score": min_score,
+                "min_margin": min_margin,
+                "knn_rate": round(local / total, 4) if total else 0.0,
+                "knn_accuracy": round(correct_local / local, 4) if local else None,
+                "combined_accuracy": round(correct_total / total, 4) if total and has_llm else None,
+                "avg_ms": round(latency / total, 1) if total and has_llm else None,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意圖分類回測：kNN 快速層 vs LLM")
+    parser.add_argument("--limit", type=int, help="最多測試題數")
+    parser.add_argument("--scores", nargs="*", type=float, default=[0.75, 0.80, 0.85, 0.90])
+    parser.add_argument("--margins", nargs="*", type=float, default=[0.0, 0.02, 0.05, 0.08])
+    parser.add_argument("--skip-llm", action="store_true", help="不呼叫 LLM，只評估 kNN 直接回傳的覆蓋率與準確率")
+    parser.add_argument("--output-dir", default=os.getenv("BACKTEST_OUTPUT_DIR", "output/backtest"))
+    args = parser.parse_args()
+
+    classifier = IntentClassifier()
+    if classifier.knn_index.matrix is None:
+        print("❌ 意圖 kNN 索引為空（intents.embedding 尚未生成？請先呼叫 /api/v1/intents/regenerate-embeddings）")
+        return
+    print(f"📊 kNN 索引: {classifier.knn_index.get_stats()}")
+
+    scenarios = load_scenarios(args.limit)
+    print(f"🧪 測試情境: {len(scenarios)} 題")
+    if not scenarios:
+        return
+
+    samples = asyncio.run(collect_samples(classifier, scenarios, args.skip_llm))
+    rows = evaluate(samples, args.scores, args.margins)
+
+    llm_samples = [s for s in samples if s["llm_ms"] is not None]
+    baseline = None
+    if llm_samples:
+        baseline = {
+            "accuracy": round(sum(s["llm_intent"] == s["expected"] for s in llm_samples) / len(llm_samples), 4),
+            "avg_ms": round(sum(s["llm_ms"] for s in llm_samples) / len(llm_samples), 1),
+        }
+        print(f"\n🤖 LLM-only 基準: 準確率 {baseline['accuracy']:.2%}，平均 {baseline['avg_ms']:.0f}ms")
+
+    print(f"\n{'min_score':>9} {'margin':>7} {'kNN率':>8} {'kNN準確':>9} {'整體準確':>9} {'平均ms':>8}")
+    for r in rows:
+        fmt = lambda v, pct=True: "-" if v is None else (f"{v:.2%}" if pct else f"{v:.0f}")
+        print(f"{r['min_score']:>9.2f} {r['min_margin']:>7.2f} {fmt(r['knn_rate']):>8} "
+              f"{fmt(r['knn_accuracy']):>9} {fmt(r['combined_accuracy']):>9} {fmt(r['avg_ms'], False):>8}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"intent_knn_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "scenarios": len(samples),
+            "index": classifier.knn_index.get_stats(),
+            "llm_baseline": baseline,
+            "grid": rows,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 報告已輸出: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
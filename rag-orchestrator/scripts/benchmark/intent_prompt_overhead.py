@@ -0,0 +1,137 @@
+"""
+意圖分類 LLM prompt 預先編譯：每次呼叫的 Python 開銷與 LLM 延遲
+
+1. 離線（預設）：比較每次分類前的準備工作
+   - rebuild：每次呼叫重建 function schema + system prompt（等同改版前 _classify_with_llm 的作法）
+   - compiled：意圖載入時編譯一次，分類時直接取用
+2. --live：以固定前綴實際呼叫 LLM，統計延遲與 provider 回報的 cached prompt tokens
+   （OpenAI 前綴 ≥1024 tokens 時自動快取；同一 prompt_version 的第二次起應命中）
+
+用法：
+    python scripts/benchmark/intent_prompt_overhead.py --iterations 20000
+    python scripts/benchmark/intent_prompt_overhead.py --live --calls 20    # 需 OPENAI_API_KEY，會產生費用
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from services.intent_classifier import (  # noqa: E402
+    _CLASSIFY_SYSTEM_PROMPT,
+    IntentClassifier,
+    _build_classify_functions,
+    _format_intents_for_prompt,
+)
+
+DEFAULT_QUESTIONS = [
+    "租金怎麼繳",
+    "退租押金什麼時候退",
+    "冷氣壞了怎麼辦",
+    "合約到期要怎麼續約",
+    "租約條款 租金、押金、租期",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近排名法百分位數"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def load_offline_classifier(config_path: str) -> IntentClassifier:
+    """不連 DB / LLM：以 intents.yaml 建立分類器"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    c = object.__new__(IntentClassifier)
+    c.intents = config["intents"]
+    return c
+
+
+def bench_offline(c: IntentClassifier, iterations: int):
+    def rebuild():
+        functions = _build_classify_functions([i["name"] for i in c.intents])
+        return functions, _CLASSIFY_SYSTEM_PROMPT.format(intents=_format_intents_for_prompt(c.intents))
+
+    def compiled():
+        return c._llm_functions, c._llm_system_prompt
+
+    print(f"\n意圖 {len(c.intents)} 個，{iterations} 次（prompt_version={c.prompt_version}）")
+    print("| 作法 | 每次 (µs) |")
+    print("|---|---:|")
+    for name, fn in (("rebuild", rebuild), ("compiled", compiled)):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call = (time.perf_counter() - t0) / iterations * 1e6
+        print(f"| {name} | {per_call:.2f} |")
+
+
+def bench_live(c: IntentClassifier, calls: int, questions: List[str]):
+    from services.llm_provider import get_llm_provider
+
+    c.llm_provider = get_llm_provider()
+    c.use_database = False
+    c.intent_ids = {}
+    c.default_config = {"confidence_threshold": 0.70, "fallback_intent": "unclear", "max_intents": 3}
+    c.classifier_config = {
+        "model": os.getenv("INTENT_CLASSIFIER_MODEL", "gpt-4o-mini"),
+        "temperature": 0.1,
+        "max_tokens": 500,
+    }
+
+    # 記錄每次回應的 usage（cached_tokens 在 raw_response.usage.prompt_tokens_details）
+    usages = []
+    original = c.llm_provider.chat_completion
+
+    def recording(*args, **kwargs):
+        result = original(*args, **kwargs)
+        usages.append(getattr(result["raw_response"], "usage", None))
+        return result
+    c.llm_provider.chat_completion = recording
+
+    latencies = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        c._classify_with_llm(questions[i % len(questions)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    prompt_tokens = [u.prompt_tokens for u in usages if u is not None]
+    cached = [
+        getattr(getattr(u, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        for u in usages if u is not None
+    ]
+    print(f"\nLLM 分類 {calls} 次（model={c.classifier_config['model']}，prompt_version={c.prompt_version}）")
+    print(f"   p50={percentile(latencies, 50):.0f}ms  p95={percentile(latencies, 95):.0f}ms  "
+          f"mean={statistics.fmean(latencies):.0f}ms")
+    print(f"   第一次={latencies[0]:.0f}ms  其後平均={statistics.fmean(latencies[1:] or latencies):.0f}ms")
+    if prompt_tokens:
+        hit_calls = sum(1 for x in cached if x > 0)
+        print(f"   prompt tokens={prompt_tokens[0]}  cached 命中 {hit_calls}/{len(cached)} 次"
+              f"（平均 cached {statistics.fmean(cached):.0f} tokens）")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="意圖分類 prompt 預先編譯基準")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(__file__), "..", "..",
+                                                         "config", "intents.yaml"))
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--live", action="store_true", help="實際呼叫 LLM（需 OPENAI_API_KEY）")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--questions", nargs="*", help="自訂題組")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    classifier = load_offline_classifier(args.config)
+    bench_offline(classifier, args.iterations)
+    if args.live:
+        bench_live(classifier, args.calls, args.questions or DEFAULT_QUESTIONS)
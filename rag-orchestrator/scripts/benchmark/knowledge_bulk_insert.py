@@ -0,0 +1,143 @@
+"""
+知識匯入寫入階段：逐筆 INSERT vs COPY 暫存表 + 集合式寫入（rows/sec）
+
+以合成資料（預設 10k 條、1536 維向量）比較兩種寫入方式：
+- per_row：改版前作法，每條知識各自 INSERT（知識庫另加意圖映射；審核佇列逐筆 INSERT 候選）
+- bulk：copy_records_to_table 進暫存表，再 INSERT ... SELECT；每 chunk 一個交易並寫入 checkpoint
+
+每種作法都在獨立交易內執行，結束後 ROLLBACK，不會留下資料；需要可連線的 PostgreSQL（DB_* 環境變數）。
+
+用法：
+    python scripts/benchmark/knowledge_bulk_insert.py --rows 10000
+    python scripts/benchmark/knowledge_bulk_insert.py --rows 10000 --target review --chunk-size 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import asyncpg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from services.knowledge_bulk_writer import (  # noqa: E402
+    bulk_write_candidates,
+    bulk_write_knowledge,
+    chunked,
+)
+from services.knowledge_import_service import KnowledgeImportService  # noqa: E402
+
+SCENARIO_NOTE = "benchmark"
+
+
+class _Rollback(Exception):
+    """結束量測交易用"""
+
+
+def synthetic_knowledge(n: int, dim: int, seed: int = 7) -> List[Dict]:
+    """合成匯入知識（與 _run_enrichment_pipeline 輸出同形）"""
+    rng = random.Random(seed)
+    return [
+        {
+            "question_summary": f"合成問題 {i}：租金與押金的處理方式",
+            "answer": f"合成答案 {i}。" + "說明文字" * 20,
+            "keywords": ["租金", "押金", f"k{i % 50}"],
+            "business_types": ["full_service"],
+            "target_user": "tenant",
+            "source_file": "benchmark.xlsx",
+            "embedding": [rng.uniform(-1, 1) for _ in range(dim)],
+            "recommended_intent": None,
+            "warnings": [],
+            "quality_evaluation": {"is_acceptable": i % 10 != 0, "quality_score": 5, "reasoning": "合成"},
+        }
+        for i in range(n)
+    ]
+
+
+def build_rows(service: KnowledgeImportService, knowledge: List[Dict], target: str, intent_id) -> List[Dict]:
+    keys = service._write_keys(knowledge)
+    if target == "kb":
+        return [service._knowledge_stage_row(i, k, key, None, 0, intent_id)
+                for i, (k, key) in enumerate(zip(knowledge, keys), 1)]
+    return [service._candidate_stage_row(i, k, key, None, "external_file", "external_excel", "benchmark.xlsx")
+            for i, (k, key) in enumerate(zip(knowledge, keys), 1)]
+
+
+async def run_per_row(conn, service, rows: List[Dict], target: str):
+    for row in rows:
+        if target == "kb":
+            await service._write_knowledge_row(conn, row)
+        else:
+            await service._write_candidate_row(conn, row, SCENARIO_NOTE)
+
+
+async def run_bulk(conn, service, rows: List[Dict], target: str, chunk_size: int):
+    async def bulk_write(c, chunk):
+        if target == "kb":
+            return await bulk_write_knowledge(c, chunk)
+        return await bulk_write_candidates(c, chunk, SCENARIO_NOTE)
+
+    async def write_row(c, row):
+        if target == "kb":
+            await service._write_knowledge_row(c, row)
+        else:
+            await service._write_candidate_row(c, row, SCENARIO_NOTE)
+
+    for chunk in chunked(rows, chunk_size):
+        # job_id=None：不寫 checkpoint，只量測資料寫入（checkpoint 為每 chunk 一次 UPDATE）
+        await service._write_chunk(conn, chunk, None, bulk_write, write_row)
+
+
+async def measure(conn, fn) -> float:
+    t0 = time.perf_counter()
+    try:
+        async with conn.transaction():
+            await fn()
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return time.perf_counter() - t0
+
+
+async def main(args):
+    conn = await asyncpg.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT", "5432")),
+        database=os.getenv("DB_NAME", "aichatbot_admin"),
+        user=os.getenv("DB_USER", "aichatbot"),
+        password=os.getenv("DB_PASSWORD", "aichatbot_password"),
+    )
+    try:
+        service = object.__new__(KnowledgeImportService)
+        intent_id = await conn.fetchval("SELECT id FROM intents ORDER BY id LIMIT 1")
+        knowledge = synthetic_knowledge(args.rows, args.dim)
+
+        targets = ["kb", "review"] if args.target == "both" else [args.target]
+        print(f"\n合成知識 {args.rows} 條（{args.dim} 維），chunk_size={args.chunk_size}")
+        print("| 目標 | 作法 | 秒數 | rows/sec |")
+        print("|---|---|---:|---:|")
+        for target in targets:
+            t0 = time.perf_counter()
+            rows = build_rows(service, knowledge, target, intent_id)
+            build_s = time.perf_counter() - t0
+            print(f"| {target} | 準備暫存列 | {build_s:.2f} | {len(rows) / build_s:,.0f} |")
+            for name, fn in (
+                ("per_row", lambda: run_per_row(conn, service, rows, target)),
+                ("bulk", lambda: run_bulk(conn, service, rows, target, args.chunk_size)),
+            ):
+                elapsed = await measure(conn, fn)
+                print(f"| {target} | {name} | {elapsed:.2f} | {len(rows) / elapsed:,.0f} |")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--target", choices=["kb", "review", "both"], default="both")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,164 @@
+"""
+/api/v1/message 並發壓測（p50 / p99 延遲）
+
+以 1 / 8 / 32 個並發客戶端（可調）對 /api/v1/message 送出固定題組，
+每個並發等級統計 p50 / p95 / p99 / 吞吐量，用來比較檢索 DB 存取層改動前後：
+舊版每次檢索 psycopg2.connect() 且阻塞 event loop，並發越高 p99 越差；
+改為連接池 + DB 執行緒池後，p99 應隨並發近似持平。
+
+用法：
+    python scripts/benchmark/message_concurrency.py \\
+        --base-url http://localhost:8100 --vendor-id 1 \\
+        --concurrency 1 8 32 --requests-per-level 64
+
+    # 啟用 API Key 認證時
+    RAG_API_KEY=xxx python scripts/benchmark/message_concurrency.py
+
+注意：會真的呼叫 LLM / Embedding，請於測試環境執行；建議先跑一輪暖機（--warmup）。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "租金怎麼繳",
+    "房租如何繳納",
+    "可以養寵物嗎",
+    "退租流程是什麼",
+    "冷氣壞了怎麼辦",
+    "押金什麼時候退",
+    "電費怎麼計算",
+    "合約到期要怎麼續約",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近排名法百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+
+async def _worker(
+    client: httpx.AsyncClient,
+    queue: asyncio.Queue,
+    payload_base: Dict,
+    latencies: List[float],
+    errors: List[str],
+):
+    while True:
+        try:
+            question = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        payload = dict(payload_base, message=question)
+        t0 = time.perf_counter()
+        try:
+            resp = await client.post("/api/v1/message", json=payload)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if resp.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(f"HTTP {resp.status_code}")
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+
+async def run_level(args, concurrency: int) -> Dict:
+    """以指定並發數跑一輪，回傳統計"""
+    questions = args.questions or DEFAULT_QUESTIONS
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests_per_level):
+        queue.put_nowait(questions[i % len(questions)])
+
+    headers = {}
+    if os.getenv("RAG_API_KEY"):
+        headers["X-API-Key"] = os.getenv("RAG_API_KEY")
+    payload_base = {
+        "vendor_id": args.vendor_id,
+        "target_user": args.target_user,
+        "mode": "b2c",
+        "user_id": "benchmark",
+    }
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, timeout=args.timeout, headers=headers, limits=limits
+    ) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(client, queue, payload_base, latencies, errors)
+            for _ in range(concurrency)
+        ])
+        wall = time.perf_counter() - t0
+
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests_per_level,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+async def main_async(args):
+    if args.warmup:
+        print(f"🔥 暖機 {args.warmup} 個請求...")
+        warm = argparse.Namespace(**{**vars(args), "requests_per_level": args.warmup})
+        await run_level(warm, 1)
+
+    rows = []
+    for c in args.concurrency:
+        print(f"▶ 並發 {c}：{args.requests_per_level} 個請求...")
+        row = await run_level(args, c)
+        rows.append(row)
+        print(
+            f"   p50={row['p50_ms']}ms  p95={row['p95_ms']}ms  p99={row['p99_ms']}ms  "
+            f"rps={row['throughput_rps']}  errors={row['errors']}"
+        )
+
+    print("\n| 並發 | 成功 | 錯誤 | p50 (ms) | p95 (ms) | p99 (ms) | rps |")
+    print("|---:|---:|---:|---:|---:|---:|---:|")
+    for r in rows:
+        print(
+            f"| {r['concurrency']} | {r['ok']} | {r['errors']} | {r['p50_ms']} | "
+            f"{r['p95_ms']} | {r['p99_ms']} | {r['throughput_rps']} |"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已寫入 {args.output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="/api/v1/message 並發壓測（p50/p99）")
+    parser.add_argument("--base-url", default=os.getenv("RAG_BASE_URL", "http://localhost:8100"))
+    parser.add_argument("--vendor-id", type=int, default=1)
+    parser.add_argument("--target-user", default="tenant")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-level", type=int, default=64)
+    parser.add_argument("--warmup", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--questions", nargs="*", help="自訂題組（預設使用內建常見問題）")
+    parser.add_argument("--output", help="將結果另存為 JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async(parse_args()))
@@ -0,0 +1,150 @@
+"""
+計量 / 認證 middleware 每請求額外開銷（BaseHTTPMiddleware 舊版 vs 純 ASGI 新版）
+
+以最小 Starlette app（/api/v1/message 回固定 JSON，--stream 時改回 SSE）經 httpx.ASGITransport
+在行程內直接呼叫，不經網路、不碰 DB / LLM：
+- bare：無 middleware（基準）
+- legacy：舊版 @app.middleware("http") 實作（request.body() 回灌 receive + call_next）
+- asgi：services/asgi_middleware 的 UsageMeteringMiddleware + ApiKeyGuardMiddleware
+各情境回報每請求平均 / p50 / p99 µs 與扣除 bare 的 middleware 開銷。
+
+用法：
+    python scripts/benchmark/middleware_overhead.py --requests 5000
+    python scripts/benchmark/middleware_overhead.py --stream
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from services import usage_metering as _um  # noqa: E402
+from services.api_key_auth import auth_enforced, is_exempt, verify_api_key  # noqa: E402
+from services.asgi_middleware import ApiKeyGuardMiddleware, UsageMeteringMiddleware  # noqa: E402
+
+PAYLOAD = {"message": "租金怎麼繳", "vendor_id": 1, "target_user": "tenant", "mode": "b2c",
+           "user_id": "benchmark", "session_id": "bench"}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近排名法百分位數"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+
+async def _message(request):
+    await request.body()
+    return JSONResponse({"answer": "您可以透過 APP 繳納租金。", "sources": []})
+
+
+async def _stream(request):
+    await request.body()
+
+    async def gen():
+        for i in range(5):
+            yield f"data: {i}\n\n"
+    return StreamingResponse(gen(), media_type="text/event-stream")
+
+
+def build_bare(stream: bool):
+    return Starlette(routes=[Route("/api/v1/message", _stream if stream else _message, methods=["POST"])])
+
+
+def build_legacy(stream: bool):
+    """舊版 BaseHTTPMiddleware 實作（改寫前 app.py 的兩個 @app.middleware("http")，僅保留計量主路徑）"""
+    app = build_bare(stream)
+
+    @app.middleware("http")
+    async def usage_metering_middleware(request: Request, call_next):
+        metered = request.url.path == "/api/v1/message" and request.method == "POST" and _um.is_enabled()
+        if metered:
+            import json as _json
+            _body = await request.body()
+
+            async def _replay():
+                return {"type": "http.request", "body": _body, "more_body": False}
+            request._receive = _replay
+            _fields = _json.loads(_body) if _body else {}
+            _um.begin(_fields)
+            _ctx_obj = _um._ctx.get()
+            await _um.quota_check(None, _fields.get("vendor_id"), bool(_ctx_obj and _ctx_obj.is_internal))
+        response = await call_next(request)
+        if metered and "text/event-stream" not in response.headers.get("content-type", ""):
+            _um.finalize("success", response.status_code, db_pool=None)
+        return response
+
+    @app.middleware("http")
+    async def api_key_guard(request: Request, call_next):
+        if auth_enforced() and request.method != "OPTIONS" and not is_exempt(request.url.path):
+            if not await verify_api_key(None, request.headers.get("x-api-key")):
+                return JSONResponse(status_code=401, content={"detail": "Invalid or missing API key"})
+        return await call_next(request)
+
+    return app
+
+
+def build_asgi(stream: bool):
+    return ApiKeyGuardMiddleware(UsageMeteringMiddleware(build_bare(stream)))
+
+
+async def measure(app, n: int, warmup: int) -> List[float]:
+    transport = httpx.ASGITransport(app=app)
+    samples = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(warmup + n):
+            _um._ctx.set(None)
+            t0 = time.perf_counter()
+            resp = await client.post("/api/v1/message", json=PAYLOAD)
+            await resp.aread()
+            elapsed = (time.perf_counter() - t0) * 1e6
+            if i >= warmup:
+                samples.append(elapsed)
+    return samples
+
+
+async def main_async(args):
+    # 不碰 DB：finalize 無 db_pool 只記 warning，這裡關閉 log 避免 I/O 干擾量測
+    logging.disable(logging.WARNING)
+    os.environ.setdefault("USAGE_METERING_ENABLED", "true")
+
+    rows: Dict[str, Dict] = {}
+    for name, build in (("bare", build_bare), ("legacy", build_legacy), ("asgi", build_asgi)):
+        samples = await measure(build(args.stream), args.requests, args.warmup)
+        rows[name] = {
+            "mean_us": statistics.fmean(samples),
+            "p50_us": percentile(samples, 50),
+            "p99_us": percentile(samples, 99),
+        }
+
+    base = rows["bare"]["mean_us"]
+    print(f"\n{'SSE' if args.stream else 'JSON'} 回應，{args.requests} 個請求（暖機 {args.warmup}）")
+    print("| 情境 | mean (µs) | p50 (µs) | p99 (µs) | middleware 開銷 (µs) |")
+    print("|---|---:|---:|---:|---:|")
+    for name, r in rows.items():
+        print(f"| {name} | {r['mean_us']:.1f} | {r['p50_us']:.1f} | {r['p99_us']:.1f} | "
+              f"{r['mean_us'] - base:.1f} |")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="計量 / 認證 middleware 每請求開銷")
+    parser.add_argument("--stream", action="store_true", help="/api/v1/message 改回 SSE 串流")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=200)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async(parse_args()))
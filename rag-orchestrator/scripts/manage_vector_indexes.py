@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+knowledge_base 向量索引管理
+
+    # 檢視現有向量索引與檢索 SQL 是否走索引
+    python scripts/manage_vector_indexes.py status
+
+    # 建立 HNSW 主索引 + target_user 分區索引（加上熱門業者分區），完成後移除舊 ivfflat
+    python scripts/manage_vector_indexes.py create --vendor-ids 1 2 --drop-ivfflat
+
+    # 只印出 DDL
+    python scripts/manage_vector_indexes.py create --dry-run
+
+    # 以指定條件 EXPLAIN 檢索 SQL
+    python scripts/manage_vector_indexes.py explain --vendor-id 2 --target-user landlord
+
+參數（m / ef_construction / ef_search / probes）讀 VECTOR_INDEX_* 環境變數，
+可用 --m / --ef-construction 覆寫；建立時使用 CREATE INDEX CONCURRENTLY，不鎖表。
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.db_utils import get_db_config  # noqa: E402
+from services.vector_index import (  # noqa: E402
+    DEFAULT_TARGET_USER_PARTITIONS,
+    apply_search_settings,
+    ensure_knowledge_indexes,
+    explain_uses_vector_index,
+    get_vector_index_config,
+    knowledge_index_specs,
+    list_vector_indexes,
+)
+from services.vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2  # noqa: E402
+
+
+def _explain(conn, vendor_id: int, target_user: str, business_types):
+    config = get_vector_index_config()
+    is_b2b = target_user in ("property_manager", "system_admin")
+    target_user_param = [target_user] if is_b2b else [target_user, "all_users"]
+    if is_b2b:
+        business_types = ["system_provider"]
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT embedding::text FROM knowledge_base WHERE embedding IS NOT NULL LIMIT 1")
+        row = cursor.fetchone()
+        if not row:
+            print("❌ knowledge_base 沒有任何 embedding")
+            return None
+        sql, params = VendorKnowledgeRetrieverV2._build_vector_search_query(
+            row[0], vendor_id, business_types, target_user_param, is_b2b, 20,
+        )
+        apply_search_settings(cursor, config)
+        return explain_uses_vector_index(cursor, sql, params)
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="knowledge_base 向量索引管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status", help="列出向量索引並檢查檢索 SQL 是否走索引")
+
+    create = sub.add_parser("create", help="建立缺少的 HNSW 索引")
+    create.add_argument("--vendor-ids", nargs="*", type=int, default=[], help="額外建立分區索引的業者 ID")
+    create.add_argument("--no-partitions", action="store_true", help="不建立 target_user 分區索引")
+    create.add_argument("--drop-ivfflat", action="store_true", help="建立完成後移除舊的 ivfflat 索引")
+    create.add_argument("--m", type=int, help="HNSW m（覆寫 VECTOR_INDEX_HNSW_M）")
+    create.add_argument("--ef-construction", type=int, help="HNSW ef_construction（覆寫 VECTOR_INDEX_EF_CONSTRUCTION）")
+    create.add_argument("--dry-run", action="store_true", help="只印出 DDL")
+
+    explain = sub.add_parser("explain", help="EXPLAIN 指定條件的檢索 SQL")
+    explain.add_argument("--vendor-id", type=int, default=2)
+    explain.add_argument("--target-user", default="tenant")
+    explain.add_argument("--business-types", nargs="*", default=[])
+
+    args = parser.parse_args()
+    config = get_vector_index_config()
+
+    if args.command == "create":
+        if args.m:
+            config.m = args.m
+        if args.ef_construction:
+            config.ef_construction = args.ef_construction
+        partitions = () if args.no_partitions else DEFAULT_TARGET_USER_PARTITIONS
+        specs = knowledge_index_specs(partitions, args.vendor_ids)
+        if args.dry_run:
+            for spec in specs:
+                print(spec.create_sql(config) + ";")
+            return
+        conn = psycopg2.connect(**get_db_config())
+        try:
+            changed = ensure_knowledge_indexes(conn, specs, config, drop_ivfflat=args.drop_ivfflat)
+        finally:
+            conn.close()
+        print(f"✅ 完成，異動索引: {', '.join(changed) or '無'}")
+        return
+
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        if args.command == "status":
+            cursor = conn.cursor()
+            indexes = list_vector_indexes(cursor)
+            cursor.close()
+            print(f"📊 knowledge_base 向量索引（{len(indexes)}）")
+            for name, indexdef in indexes.items():
+                print(f"  - {name}: {indexdef}")
+            print(f"\n查詢參數: ef_search={config.ef_search}, probes={config.probes}, "
+                  f"iterative_scan={config.iterative_scan or '(未設定)'}")
+            for target_user in ("tenant", "landlord", "property_manager"):
+                result = _explain(conn, 2, target_user, [])
+                if result is not None:
+                    print(f"  {target_user:<18} {'✅ 使用索引 ' + ', '.join(result['indexes']) if result['uses_index'] else '⚠️  未使用索引'}")
+        else:
+            result = _explain(conn, args.vendor_id, args.target_user, args.business_types)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
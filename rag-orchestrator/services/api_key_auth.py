@@ -3,14 +3,32 @@
 金鑰存於 `api_keys` 表（只存 SHA-256 雜湊 + 前綴，不存明文，後台 CRUD 管理）。
 - 開關：環境變數 `RAG_API_AUTH_ENFORCE`（預設關）。關→不強制（維持現狀，安全上線）；
   開→除豁免路徑外，請求須帶 Header `X-API-Key`，且其 sha256 命中 api_keys(is_active)。
-- 命中時更新 last_used_at（看誰在用）。
+- 命中時更新 last_used_at（看誰在用；同一金鑰每 API_KEY_LAST_USED_INTERVAL 秒至多一次，不阻塞請求）。
 
-純函式（hash/exempt/enforced）可離線單元測試；DB 驗證 verify_api_key 走 integration。
+驗證結果快取（ApiKeyCache，行程內）：
+- 有效金鑰 hash → {id,name}（API_KEY_CACHE_TTL 秒），熱路徑零 DB 往返
+- 無效金鑰負向快取（API_KEY_NEGATIVE_TTL 秒），暴力嘗試不再打 DB；總筆數上限 LRU 淘汰
+- 異動即時生效：knowledge-admin 建立 / 停用 / 啟用 / 刪除金鑰時發布 Redis `rag:api_keys:changed`，
+  各 worker 經 cache_bus 的訂閱連線（subscribe_api_key_changes）收到即剔除該金鑰並清空負向快取
+  （新建金鑰不會被建立前的「無效」結果擋住）；訂閱中斷期間以 TTL 兜底，重連後整個清空
+
+純函式（hash/exempt/enforced）與快取可離線單元測試；DB 驗證 verify_api_key 走 integration。
 搭配「內網不對外」為縱深防禦；IP 白名單可於網路層另加（程式不需改）。
 """
+import asyncio
 import hashlib
+import json
+import logging
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# knowledge-admin 異動金鑰時發布的頻道（payload：{"key_id": 3, "action": "create" / "deactivate" / ...}）
+API_KEY_CHANNEL = "rag:api_keys:changed"
 
 # 豁免路徑：健康檢查 / 文件 / 首頁（CORS 預檢 OPTIONS 於 middleware 另行放行）
 _EXEMPT_EXACT = {"/", "/api/v1/health"}
@@ -32,21 +50,154 @@ def auth_enforced() -> bool:
     return os.getenv("RAG_API_AUTH_ENFORCE", "").strip().lower() in ("1", "true", "yes", "on")
 
 
-async def verify_api_key(pool, key: Optional[str]) -> Optional[dict]:
-    """以 sha256(key) 查 api_keys（is_active）。命中→更新 last_used_at 並回 {id,name}；否則 None。"""
-    if not key or pool is None:
-        return None
-    key_hash = hash_key(key)
+class ApiKeyCache:
+    """金鑰驗證結果快取（hash → 金鑰資訊；無效金鑰負向快取）"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("API_KEY_CACHE_TTL", "300"))
+        self.negative_ttl = float(os.getenv("API_KEY_NEGATIVE_TTL", "30"))
+        self.max_entries = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "10000"))
+        self.touch_interval = float(os.getenv("API_KEY_LAST_USED_INTERVAL", "60"))
+
+        # key_hash → (expires_at, info 或 None（無效金鑰）)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._last_touch: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+
+    def lookup(self, key_hash: str):
+        """回傳 (命中與否, info)；info 為 None 表示已知無效"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key_hash]
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key_hash)
+            self.stats["hits" if entry[1] is not None else "negative_hits"] += 1
+            return True, entry[1]
+
+    def store(self, key_hash: str, info: Optional[Dict[str, Any]]):
+        ttl = self.ttl if info is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + ttl, info)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def should_touch(self, key_id: int) -> bool:
+        """last_used_at 節流：同一金鑰 touch_interval 內只更新一次"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_touch.get(key_id, float("-inf")) < self.touch_interval:
+                return False
+            self._last_touch[key_id] = now
+            return True
+
+    def invalidate(self, key_id: Optional[int] = None) -> int:
+        """
+        剔除某金鑰（key_id=None 則全部清空）
+
+        負向快取一律清空：金鑰重新啟用時不該被舊的「無效」結果擋住。
+
+        Returns:
+            剔除的有效金鑰筆數
+        """
+        with self._lock:
+            if key_id is None:
+                removed = sum(1 for _, info in self._entries.values() if info is not None)
+                self._entries.clear()
+            else:
+                stale = [h for h, (_, info) in self._entries.items()
+                         if info is None or info.get("id") == key_id]
+                removed = sum(1 for h in stale if self._entries[h][1] is not None)
+                for h in stale:
+                    del self._entries[h]
+            self.stats["invalidations"] += 1
+        return removed
+
+    def handle_message(self, data) -> int:
+        """處理 API_KEY_CHANNEL 訊息（格式錯誤時保守地全部清空）"""
+        try:
+            payload = json.loads(data)
+            key_id = payload.get("key_id")
+            return self.invalidate(int(key_id) if key_id is not None else None)
+        except Exception:
+            return self.invalidate()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            positive = sum(1 for _, info in self._entries.values() if info is not None)
+            return {
+                "entries": positive,
+                "negative_entries": len(self._entries) - positive,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                **self.stats,
+            }
+
+
+_api_key_cache: Optional[ApiKeyCache] = None
+
+
+def get_api_key_cache() -> ApiKeyCache:
+    """取得 ApiKeyCache 單例"""
+    global _api_key_cache
+    if _api_key_cache is None:
+        _api_key_cache = ApiKeyCache()
+    return _api_key_cache
+
+
+# 背景 last_used_at 更新：保留參照（event loop 只持弱參照，未保留的 Task 可能執行中被回收）
+_touch_tasks: Set[asyncio.Task] = set()
+
+
+async def _touch_last_used(pool, key_id: int) -> None:
     try:
         async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT id, name FROM api_keys WHERE key_hash = $1 AND is_active = TRUE",
-                key_hash,
-            )
-            if row:
-                await conn.execute("UPDATE api_keys SET last_used_at = now() WHERE id = $1", row["id"])
-                return dict(row)
+            await conn.execute("UPDATE api_keys SET last_used_at = now() WHERE id = $1", key_id)
     except Exception as e:
-        print(f"⚠️ [security] API key 驗證查詢失敗：{e}")
+        logger.warning(f"[security] 更新 api_keys.last_used_at 失敗：{e}")
+
+
+async def verify_api_key(pool, key: Optional[str]) -> Optional[dict]:
+    """以 sha256(key) 查 api_keys（is_active；經 ApiKeyCache）。命中→回 {id,name}（節流更新 last_used_at）；否則 None。"""
+    if not key or pool is None:
         return None
-    return None
+    key_hash = hash_key(key)
+    cache = get_api_key_cache()
+    hit, info = cache.lookup(key_hash)
+    if not hit:
+        try:
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT id, name FROM api_keys WHERE key_hash = $1 AND is_active = TRUE",
+                    key_hash,
+                )
+        except Exception as e:
+            print(f"⚠️ [security] API key 驗證查詢失敗：{e}")
+            return None                                   # DB 錯誤不寫負向快取
+        info = dict(row) if row else None
+        cache.store(key_hash, info)
+    if info is not None and cache.should_touch(info["id"]):
+        task = asyncio.create_task(_touch_last_used(pool, info["id"]))
+        _touch_tasks.add(task)
+        task.add_done_callback(_touch_tasks.discard)
+    return info
+
+
+def subscribe_api_key_changes(bus) -> None:
+    """
+    以 cache_bus 的訂閱連線接收 API_KEY_CHANNEL，收到金鑰異動即剔除本行程快取（lifespan 呼叫）
+
+    連線中斷由 cache_bus 退避重連；重連成功後整個清空（中斷期間可能漏訊息）。
+    """
+    cache = get_api_key_cache()
+
+    def _on_message(data) -> None:
+        removed = cache.handle_message(data)
+        logger.info(f"[security] 金鑰異動通知：剔除 {removed} 筆快取")
+
+    bus.add_channel(API_KEY_CHANNEL, _on_message, on_resync=cache.invalidate)
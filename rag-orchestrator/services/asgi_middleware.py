@@ -0,0 +1,158 @@
+"""
+純 ASGI middleware：usage-metering 計量與服務對服務 API Key 認證
+
+背景：原本兩者以 @app.middleware("http")（BaseHTTPMiddleware）實作——
+- 每請求多一層 call_next task + 記憶體 stream 轉送，SSE 串流也經這層轉送
+- metering 以 request.body() 讀 body 後要另外回灌 receive，否則下游卡死
+- 對話內額度提示（QUOTA_WARN_IN_CHAT）以 _raw += chunk 累加整個回應（二次方複製）
+
+做法：直接包 ASGI (scope, receive, send)
+- 只有 POST /api/v1/message 且計量開啟時才讀 request body（收齊後由包裝的 receive 原樣交給下游，
+  之後的 receive（如 http.disconnect）仍交回原 channel）；其他路徑零觸碰直通
+- 回應經包裝的 send 觀察 http.response.start：text/event-stream 直通（由 generator finally 收尾），
+  其餘於回應標頭送出時 finalize
+- 額度提示僅在需要時暫存回應 body（chunk 以 list 收集、一次 join），改寫後重算 content-length；
+  其餘回應 body 不經手
+"""
+import json
+import logging
+import os
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+from . import usage_metering as _um
+from .api_key_auth import auth_enforced, is_exempt, verify_api_key
+
+logger = logging.getLogger(__name__)
+
+_METERED_PATH = "/api/v1/message"
+
+
+def _header(headers, name: bytes) -> Optional[str]:
+    """從 ASGI 標頭列表（小寫 bytes）取值"""
+    for k, v in headers:
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+
+def _db_pool(scope):
+    app = scope.get("app")
+    return getattr(app.state, "db_pool", None) if app is not None else None
+
+
+async def _read_body(receive):
+    """收齊 request body；回傳 (body, 第一個非 body 訊息或 None)"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return b"".join(chunks), message          # client 提前斷線
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks), None
+
+
+class UsageMeteringMiddleware:
+    """usage-metering（spec usage-metering 2.1）：/api/v1/message 進場建計量
+    context、出場落事件。串流回應（SSE）由 generator finally 落點（finalize 冪等使雙落點安全）；
+    其餘路徑零觸碰；任何失敗不影響回應。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"] != _METERED_PATH
+                or scope["method"] != "POST" or not _um.is_enabled()):
+            await self.app(scope, receive, send)
+            return
+
+        body, pending = await _read_body(receive)
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed, pending
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            if pending is not None:
+                message, pending = pending, None
+                return message
+            return await receive()
+
+        try:
+            fields = json.loads(body) if body else {}
+            fields = fields if isinstance(fields, dict) else {}
+        except Exception:
+            fields = {}
+        _um.begin(fields)
+
+        pool = _db_pool(scope)
+        # quota-management：達限短路（進檢索/LLM 前，零成本，R4.1）；fail-open
+        ctx = _um._ctx.get()
+        quota = await _um.quota_check(pool, fields.get("vendor_id"), bool(ctx and ctx.is_internal))
+        if quota.state == "blocked":
+            _um.set_path("quota_blocked")
+            _um.finalize("blocked", 200, db_pool=pool)       # 記事件供舉證（R4.6）
+            content = _um.quota_blocked_body(ctx.user_type if ctx else "unknown", quota, fields)
+            await JSONResponse(status_code=200, content=content)(scope, replay_receive, send)
+            return
+
+        # quota 警示：2026-07-06 改判——警示不進對話（改寄信），
+        # env QUOTA_WARN_IN_CHAT=true 可重新啟用對話內提示
+        hint_enabled = (quota.state == "warn"
+                        and os.getenv("QUOTA_WARN_IN_CHAT", "false").lower() == "true")
+        start_message = None
+        hint_chunks = None
+
+        async def metered_send(message):
+            nonlocal start_message, hint_chunks
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                ctype = _header(message.get("headers", []), b"content-type") or ""
+                if "text/event-stream" not in ctype:  # 串流由 generator finally 收尾
+                    _um.finalize("success" if status < 500 else "error", status, db_pool=pool)
+                    if hint_enabled and status == 200 and "application/json" in ctype:
+                        start_message, hint_chunks = message, []
+                        return                        # 標頭待 body 改寫後再送（content-length 重算）
+                await send(message)
+                return
+            if hint_chunks is not None and message["type"] == "http.response.body":
+                hint_chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                raw = b"".join(hint_chunks)
+                hint_chunks = None
+                ctx_obj = _um._ctx.get()
+                new_raw = _um.append_quota_hint(raw, ctx_obj.user_type if ctx_obj else "unknown", quota)
+                out = new_raw if new_raw is not None else raw
+                headers = [(k, v) for k, v in start_message.get("headers", []) if k != b"content-length"]
+                headers.append((b"content-length", str(len(out)).encode()))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": out, "more_body": False})
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, metered_send)
+        except Exception:
+            _um.finalize("error", 500, db_pool=pool)
+            raise
+
+
+class ApiKeyGuardMiddleware:
+    """服務對服務 API Key 認證（RAG_API_AUTH_ENFORCE 開啟時；豁免路徑與 CORS 預檢放行）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and auth_enforced() and scope["method"] != "OPTIONS"
+                and not is_exempt(scope["path"])):
+            key = _header(scope.get("headers", []), b"x-api-key")
+            if not await verify_api_key(_db_pool(scope), key):
+                response = JSONResponse(status_code=401, content={"detail": "Invalid or missing API key"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
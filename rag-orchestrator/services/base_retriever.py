@@ -4,12 +4,16 @@
 Date: 2026-02-11
 """
 
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, Any
 import psycopg2
 import psycopg2.extras
-from services.db_utils import get_db_config
+from services.db_utils import get_db_config, get_pooled_connection, run_in_db_executor
 from services.embedding_utils import get_embedding_client
+from services.keyword_index import tokenize_keyword
+from services.tracing import current_span, span, traced
 import jieba
 import os
 
@@ -63,13 +67,26 @@ class BaseRetriever(ABC):
         self.keyword_boost_enabled = True
 
     def _get_db_connection(self):
-        """建立資料庫連接"""
-        return psycopg2.connect(**self.db_config)
+        """從同步連接池取得連接（close() 即歸還連接池）"""
+        return get_pooled_connection()
+
+    async def _run_db(self, fn, *args, **kwargs):
+        """
+        在 DB 執行緒池執行阻塞的檢索查詢
+
+        子類的 SQL 仍以 psycopg2 撰寫（同步），經由本方法丟到有界執行緒池，
+        避免 pgvector 查詢期間卡住 event loop、讓並發請求互相排隊。
+        """
+        return await run_in_db_executor(fn, *args, **kwargs)
 
     async def _get_embedding(self, text: str) -> Optional[List[float]]:
         """生成文字向量"""
         return await self.embedding_client.get_embedding(text, verbose=False)
 
+    async def _get_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """批次生成文字向量（一次 HTTP 往返；與 texts 對齊，失敗者為 None）"""
+        return await self.embedding_client.get_embeddings_batch(texts, verbose=False)
+
     # ==================== 抽象方法（子類必須實作） ====================
 
     @abstractmethod
@@ -96,6 +113,28 @@ class BaseRetriever(ABC):
         """
         pass
 
+    async def _vector_search_multi(
+        self,
+        query_embeddings: List[List[float]],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
+    ) -> List[List[Dict]]:
+        """
+        多查詢向量檢索（改寫查詢用）
+
+        預設逐一呼叫 _vector_search；子類可覆寫為單一 SQL（LATERAL 展開查詢向量陣列），
+        一次 DB 往返取回每個查詢各自的 top-k。
+
+        Returns:
+            與 query_embeddings 對齊的結果列表
+        """
+        return [
+            await self._vector_search(embedding, vendor_id, top_k, similarity_threshold, **kwargs)
+            for embedding in query_embeddings
+        ]
+
     @abstractmethod
     async def _keyword_search(
         self,
@@ -128,6 +167,7 @@ class BaseRetriever(ABC):
 
     # ==================== 共用邏輯 ====================
 
+    @traced("retrieve")
     async def retrieve(
         self,
         query: str,
@@ -167,8 +207,7 @@ class BaseRetriever(ABC):
         enable_keyword_fallback = enable_keyword_fallback if enable_keyword_fallback is not None else self.keyword_fallback_enabled
         enable_keyword_boost = enable_keyword_boost if enable_keyword_boost is not None else self.keyword_boost_enabled
 
-        import time as _time
-        _retrieve_start = _time.time()
+        current_span().set(retriever=type(self).__name__, vendor_id=vendor_id, top_k=top_k)
 
         print(f"\n🔍 [統一檢索] 查詢: {query}")
         print(f"   業者: {vendor_id}, Top-K: {top_k}, 閾值: {similarity_threshold}")
@@ -181,15 +220,19 @@ class BaseRetriever(ABC):
         precomputed_rewrites = kwargs.pop('precomputed_rewrites', None)
         precomputed_embedding = kwargs.pop('precomputed_embedding', None)
 
-        if precomputed_rewrites is not None:
+        # 改寫結果可為 list 或尚未完成的 awaitable（請求階段排程的 rewrite Task）：
+        # 原始查詢的向量檢索不需等改寫，到 Step 2.1 才取用
+        pending_rewrites = own_rewrite_task = None
+        if inspect.isawaitable(precomputed_rewrites):
+            pending_rewrites = precomputed_rewrites
+        elif precomputed_rewrites is not None:
             rewritten_queries = precomputed_rewrites
             print(f"   ♻️ 使用預計算 Query Rewrite ({len(rewritten_queries)} 個)")
         elif self.query_rewriter:
-            _t0 = _time.time()
-            rewritten_queries = self.query_rewriter.rewrite(query)
-            print(f"   ⏱️ Query Rewrite: {int((_time.time()-_t0)*1000)}ms")
-            if rewritten_queries:
-                print(f"   🔄 Query Rewrite: {rewritten_queries}")
+            # 同步 LLM 呼叫移到執行緒，與 embedding / 向量檢索並行
+            own_rewrite_task = pending_rewrites = asyncio.ensure_future(
+                asyncio.to_thread(self.query_rewriter.rewrite, query)
+            )
         else:
             rewritten_queries = []
 
@@ -199,42 +242,60 @@ class BaseRetriever(ABC):
             query_embedding = precomputed_embedding
             print(f"   ♻️ 使用預計算 Embedding")
         else:
-            _t0 = _time.time()
-            query_embedding = await self._get_embedding(query)
-            print(f"   ⏱️ Embedding(原始): {int((_time.time()-_t0)*1000)}ms")
+            with span("embedding"):
+                query_embedding = await self._get_embedding(query)
         if not query_embedding:
             print("⚠️ 向量生成失敗，降級為純關鍵字檢索")
+            if own_rewrite_task is not None:
+                own_rewrite_task.cancel()
             if enable_keyword_fallback:
                 return await self._keyword_search(query, vendor_id, top_k, **kwargs)
             return []
 
         # Step 2: 向量檢索（原始查詢）
-        _t0 = _time.time()
-        results = await self._vector_search(
-            query_embedding, vendor_id, top_k, similarity_threshold, **kwargs
-        )
-        print(f"   ⏱️ 向量檢索(原始): {int((_time.time()-_t0)*1000)}ms, 找到 {len(results)} 個結果")
+        try:
+            with span("vector_search") as sp:
+                results = await self._vector_search(
+                    query_embedding, vendor_id, top_k, similarity_threshold, **kwargs
+                )
+                sp.set(results=len(results))
+        except BaseException:
+            # 向量檢索失敗時自己啟動的改寫不會再被取用；共用的 rewrite 階段由請求排程器收尾
+            if own_rewrite_task is not None:
+                own_rewrite_task.cancel()
+            raise
+
+        if pending_rewrites is not None:
+            with span("rewrite_wait"):
+                try:
+                    rewritten_queries = await pending_rewrites or []
+                except Exception as e:
+                    print(f"   ⚠️ Query Rewrite 失敗: {e}")
+                    rewritten_queries = []
+            if rewritten_queries:
+                print(f"   🔄 Query Rewrite: {rewritten_queries}")
 
         # Step 2.1: 改寫查詢的向量檢索（取聯集，去重）
+        # 所有改寫一次批次 embedding + 一次多查詢向量檢索（2 次往返，而非每個改寫各 2 次）
         if rewritten_queries:
-            _t0 = _time.time()
-            existing_ids = {r.get('id') for r in results}
-            rewrite_added = 0
-            for rq in rewritten_queries:
-                rq_embedding = await self._get_embedding(rq)
-                if not rq_embedding:
-                    continue
-                rq_results = await self._vector_search(
-                    rq_embedding, vendor_id, top_k, similarity_threshold, **kwargs
-                )
-                for rr in rq_results:
-                    if rr.get('id') not in existing_ids:
-                        rr['search_method'] = 'query_rewrite'
-                        rr['rewrite_source'] = rq
-                        results.append(rr)
-                        existing_ids.add(rr.get('id'))
-                        rewrite_added += 1
-            print(f"   ⏱️ 改寫查詢檢索: {int((_time.time()-_t0)*1000)}ms, 新增 {rewrite_added} 個候選")
+            with span("rewrite_search", rewrites=len(rewritten_queries)) as sp:
+                rq_embeddings = await self._get_embeddings_batch(list(rewritten_queries))
+                rq_pairs = [(rq, emb) for rq, emb in zip(rewritten_queries, rq_embeddings) if emb]
+                rq_result_lists = await self._vector_search_multi(
+                    [emb for _, emb in rq_pairs], vendor_id, top_k, similarity_threshold, **kwargs
+                ) if rq_pairs else []
+                existing_ids = {r.get('id') for r in results}
+                rewrite_added = 0
+                for (rq, _), rq_results in zip(rq_pairs, rq_result_lists):
+                    for rr in rq_results:
+                        if rr.get('id') not in existing_ids:
+                            rr['search_method'] = 'query_rewrite'
+                            rr['rewrite_source'] = rq
+                            results.append(rr)
+                            existing_ids.add(rr.get('id'))
+                            rewrite_added += 1
+                sp.set(embedded=len(rq_pairs), added=rewrite_added)
+            print(f"   改寫查詢檢索: {len(rq_pairs)} 個改寫，新增 {rewrite_added} 個候選")
 
         # Step 3: 關鍵字備選（如果「達標」結果不足）
         # 修正(retrieval-fixes #1):以通過 similarity_threshold 的候選數判斷,而非過濾前原始候選數。
@@ -244,12 +305,12 @@ class BaseRetriever(ABC):
             1 for r in results if r.get('vector_similarity', 0) >= similarity_threshold
         )
         if enable_keyword_fallback and relevant_count < top_k:
-            _t0 = _time.time()
             need = top_k - relevant_count
             print(f"   啟動關鍵字備選（達標 {relevant_count} < top_k {top_k}，需補充 {need} 個）")
-            keyword_results = await self._keyword_search(
-                query, vendor_id, need, **kwargs
-            )
+            with span("keyword_fallback", need=need) as sp:
+                keyword_results = await self._keyword_search(
+                    query, vendor_id, need, **kwargs
+                )
 
             # 合併結果（去重）
             existing_ids = {r.get('id') for r in results}
@@ -259,14 +320,13 @@ class BaseRetriever(ABC):
                     kr['search_method'] = 'keyword_fallback'
                     results.append(kr)
                     added += 1
-
-            print(f"   ⏱️ 關鍵字備選: {int((_time.time()-_t0)*1000)}ms, 新增 {added} 個結果")
+            sp.set(added=added)
+            print(f"   關鍵字備選: 新增 {added} 個結果")
 
         # Step 4: 關鍵字加成（只寫 keyword_boost / keyword_matches）
         if enable_keyword_boost and results:
-            _t0 = _time.time()
-            results = await self._apply_keyword_boost(results, query)
-            print(f"   ⏱️ 關鍵字加成: {int((_time.time()-_t0)*1000)}ms")
+            with span("keyword_boost"):
+                results = await self._apply_keyword_boost(results, query)
 
         # Step 5: SemanticReranker（只寫 rerank_score）
         # hotfix (.kiro/issues/reranker-returning-zero.md)：
@@ -323,12 +383,10 @@ class BaseRetriever(ABC):
                 )
 
             if results:
-                import asyncio
-                _t0 = _time.time()
-                results = await asyncio.to_thread(
-                    self._apply_semantic_reranker, query, results, top_k
-                )
-                print(f"   ⏱️ Reranker: {int((_time.time()-_t0)*1000)}ms ({len(results)} 筆)")
+                with span("rerank", candidates=len(results)):
+                    results = await asyncio.to_thread(
+                        self._apply_semantic_reranker, query, results, top_k
+                    )
             else:
                 print(f"   Reranker: 過濾後無候選，跳過 rerank")
 
@@ -351,7 +409,7 @@ class BaseRetriever(ABC):
         results = results[:top_k]
 
         print(f"   最終結果: {len(results)} 個")
-        print(f"   ⏱️ [統一檢索] 總耗時: {int((_time.time()-_retrieve_start)*1000)}ms")
+        current_span().set(results=len(results))
         return results
 
     async def _apply_keyword_boost(self, results: List[Dict], query: str) -> List[Dict]:
@@ -382,10 +440,10 @@ class BaseRetriever(ABC):
             if not keywords:
                 continue
 
-            # 計算關鍵字匹配
+            # 計算關鍵字匹配（keyword 分詞有快取；SOP 與知識共用，不依 id 查索引）
             matched_keywords = []
             for keyword in keywords:
-                keyword_tokens = set(jieba.cut(keyword.lower()))
+                keyword_tokens = tokenize_keyword(keyword)
                 if query_tokens & keyword_tokens:  # 有交集
                     matched_keywords.append(keyword)
 
@@ -0,0 +1,257 @@
+"""
+行程內快取的跨 worker 失效匯流排（Redis pub/sub）
+
+背景：業者參數、業者資訊、業者配置、對話規則 / 設定、系統脈絡、語氣配置、離題偵測配置
+都是各 worker 的行程內 dict；POST /reload 或管理端寫入只清到收到請求的那個 worker，
+其他 worker 只能靠短 TTL 或重啟。
+
+做法：
+- 各快取以「資料來源名稱」註冊失效 handler：handler(key)，key 為 None 表示全部
+  （bound method 以弱參考保存，短命實例不會被匯流排留住）
+- 寫入端呼叫 invalidate(name, key)：本行程立即失效，並在背景執行緒發布到 rag:cache:invalidate
+  （不阻塞 event loop）；其他 worker 的 listen() 收到後失效同一範圍（自己發的訊息略過）
+- 訂閱連線正常（live）時，有寫入端發布的來源（PUBLISHED_CACHES）可無限期保存（ttl() 回 None）；
+  沒有發布者的來源（只經 SQL / migration 修改）一律保留原 TTL；
+  訂閱中斷期間退回原 TTL，重連成功後全部失效一次（中斷期間可能漏訊息）
+- 其他模組的失效頻道（如 API 金鑰異動）以 add_channel() 共用同一條訂閱連線
+
+資料來源名稱（發布者）：
+    vendor_configs       vendor_configs 表（key=vendor_id；業者設定 API）
+    vendors              vendors 表（key=vendor_id；業者 API）
+    conversational       knowledge_base 對話規則 / 對話設定（key=None；對話設定 API、知識異動通知）
+    system_context       knowledge_base 系統脈絡（key=None；知識異動通知）
+    tone_config          業態語氣配置（key=None；無發布者，僅 POST /reload 全部失效）
+    digression_config    digression_config 表（key=vendor_id；無發布者，表只經 SQL 修改）
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import types
+import uuid
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUS_CHANNEL = "rag:cache:invalidate"
+
+# 有寫入端發布失效的來源：訂閱正常時可無限期快取；其餘來源保留各自的 TTL
+PUBLISHED_CACHES = frozenset({"vendor_configs", "vendors", "conversational", "system_context"})
+
+
+class CacheBus:
+    """行程內快取註冊表 + 跨 worker 失效"""
+
+    def __init__(self):
+        self.enabled = os.getenv("CACHE_BUS_ENABLED", "true").lower() == "true"
+        self.redis_host = os.getenv("REDIS_HOST", "localhost")
+        self.redis_port = int(os.getenv("REDIS_PORT", "6379"))
+        self.worker_id = uuid.uuid4().hex[:12]
+
+        self._handlers: Dict[str, List[Callable]] = {}
+        self._channels: Dict[str, Tuple[Callable[[Any], Any], Optional[Callable[[], Any]]]] = {}
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._publish_tasks: set = set()
+        self.live = False
+        self.stats = {"published": 0, "publish_errors": 0, "received": 0, "applied": 0, "resyncs": 0}
+
+    # ==================== 註冊 / 本行程失效 ====================
+
+    def register(self, name: str, handler: Callable[[Optional[Any]], Any]):
+        """
+        註冊快取失效 handler
+
+        Args:
+            name: 資料來源名稱（見模組說明）
+            handler: handler(key)；key 為 None 表示清除全部
+        """
+        ref = weakref.WeakMethod(handler) if isinstance(handler, types.MethodType) else (lambda h=handler: h)
+        with self._lock:
+            self._handlers.setdefault(name, []).append(ref)
+
+    def invalidate_local(self, name: str, key: Optional[Any] = None) -> int:
+        """只失效本行程；回傳呼叫的 handler 數"""
+        with self._lock:
+            refs = list(self._handlers.get(name, ()))
+        called = 0
+        dead = []
+        for ref in refs:
+            handler = ref()
+            if handler is None:
+                dead.append(ref)
+                continue
+            try:
+                handler(key)
+                called += 1
+            except Exception as e:
+                logger.warning(f"快取失效 handler 失敗（{name}:{key}）: {e}")
+        if dead:
+            with self._lock:
+                alive = [r for r in self._handlers.get(name, ()) if r not in dead]
+                self._handlers[name] = alive
+        return called
+
+    def invalidate_all_local(self) -> int:
+        with self._lock:
+            names = list(self._handlers)
+        return sum(self.invalidate_local(name) for name in names)
+
+    # ==================== 跨 worker ====================
+
+    def invalidate(self, name: Optional[str], key: Optional[Any] = None) -> int:
+        """
+        失效本行程並通知其他 worker
+
+        Args:
+            name: 資料來源名稱；None 表示所有已註冊快取
+            key: 失效範圍（如 vendor_id）；None 表示該來源全部
+        """
+        called = self.invalidate_all_local() if name is None else self.invalidate_local(name, key)
+        self._publish({"cache": name, "key": key, "origin": self.worker_id})
+        return called
+
+    def _publish(self, payload: Dict[str, Any]):
+        """在 event loop 中呼叫時改由背景執行緒發布（同步 Redis 呼叫不阻塞請求）"""
+        if not self.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._publish_sync(payload)
+            return
+        task = loop.create_task(asyncio.to_thread(self._publish_sync, payload))
+        self._publish_tasks.add(task)
+        task.add_done_callback(self._publish_tasks.discard)
+
+    def _publish_sync(self, payload: Dict[str, Any]):
+        try:
+            with self._lock:
+                if self._publisher is None:
+                    import redis
+                    self._publisher = redis.Redis(
+                        host=self.redis_host, port=self.redis_port, db=0,
+                        socket_connect_timeout=2, socket_timeout=2,
+                    )
+            self._publisher.publish(CACHE_BUS_CHANNEL, json.dumps(payload, ensure_ascii=False))
+            self.stats["published"] += 1
+        except Exception as e:
+            self.stats["publish_errors"] += 1
+            logger.warning(f"快取失效廣播失敗（其他 worker 待 TTL 到期）: {e}")
+
+    def handle_message(self, data) -> int:
+        """處理其他 worker 發布的失效訊息（格式錯誤時保守地全部失效）"""
+        self.stats["received"] += 1
+        try:
+            payload = json.loads(data)
+            if payload.get("origin") == self.worker_id:
+                return 0
+            name = payload.get("cache")
+            called = (self.invalidate_all_local() if name is None
+                      else self.invalidate_local(name, payload.get("key")))
+        except Exception:
+            called = self.invalidate_all_local()
+        self.stats["applied"] += called
+        return called
+
+    def ttl(self, name: str, seconds: Optional[float]) -> Optional[float]:
+        """快取有效期：訂閱正常且該來源有發布者時無限期（None），否則為原 TTL"""
+        return None if self.live and name in PUBLISHED_CACHES else seconds
+
+    def add_channel(self, channel: str, on_message: Callable[[Any], Any],
+                    on_resync: Optional[Callable[[], Any]] = None):
+        """
+        以同一條訂閱連線另收其他頻道（每個 worker 只保留一條 pub/sub 連線）
+
+        Args:
+            channel: Redis 頻道
+            on_message: on_message(data)
+            on_resync: 訂閱建立 / 重連後呼叫（中斷期間可能漏訊息）
+        """
+        with self._lock:
+            self._channels[channel] = (on_message, on_resync)
+
+    def has_subscriptions(self) -> bool:
+        """是否需要啟動 listen()（匯流排啟用，或有其他模組註冊頻道）"""
+        return self.enabled or bool(self._channels)
+
+    def _dispatch(self, channel: str, data) -> None:
+        if channel == CACHE_BUS_CHANNEL:
+            self.handle_message(data)
+            return
+        entry = self._channels.get(channel)
+        if entry is None:
+            return
+        try:
+            entry[0](data)
+        except Exception as e:
+            logger.warning(f"訂閱頻道 {channel} 的訊息處理失敗: {e}")
+
+    def _resync(self) -> None:
+        if self.enabled:
+            self.invalidate_all_local()
+            self.stats["resyncs"] += 1
+        for channel, (_, on_resync) in list(self._channels.items()):
+            if on_resync is None:
+                continue
+            try:
+                on_resync()
+            except Exception as e:
+                logger.warning(f"訂閱頻道 {channel} 重新同步失敗: {e}")
+
+    async def listen(self):
+        """訂閱失效頻道與 add_channel() 註冊的頻道（lifespan 背景 task）；中斷時退避重連，重連後重新同步"""
+        import redis.asyncio as aioredis
+
+        backoff = 1.0
+        while True:
+            client = aioredis.Redis(host=self.redis_host, port=self.redis_port, db=0,
+                                    decode_responses=True, socket_connect_timeout=5)
+            try:
+                pubsub = client.pubsub()
+                channels = ([CACHE_BUS_CHANNEL] if self.enabled else []) + list(self._channels)
+                await pubsub.subscribe(*channels)
+                self._resync()
+                self.live = self.enabled
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._dispatch(message.get("channel"), message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"快取失效訂閱中斷，{backoff:.0f}s 後重連（期間退回 TTL）: {e}")
+            finally:
+                self.live = False
+                try:
+                    await client.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            registered = {name: len(refs) for name, refs in self._handlers.items()}
+        return {
+            "enabled": self.enabled,
+            "live": self.live,
+            "worker_id": self.worker_id,
+            "registered": registered,
+            "channels": sorted(self._channels),
+            **self.stats,
+        }
+
+
+# 全局實例
+_cache_bus: Optional[CacheBus] = None
+
+
+def get_cache_bus() -> CacheBus:
+    """取得 CacheBus 單例"""
+    global _cache_bus
+    if _cache_bus is None:
+        _cache_bus = CacheBus()
+    return _cache_bus
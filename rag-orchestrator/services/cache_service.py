@@ -5,15 +5,51 @@ RAG 緩存服務 (Redis)
 
 分層緩存架構:
 - Layer 1: Question Cache (相同問題直接返回)
+- Layer 1.5: Semantic Cache (改寫說法的相同問題：query embedding 餘弦相似度 ≥ 嚴格門檻)
 - Layer 2: Vector Cache (常見問題 embedding)
 - Layer 3: RAG Result Cache (檢索結果)
+- 附屬：LLM 判斷快取（Query Rewrite / 相關性把關，見 llm_judgment_cache）共用本服務的 Redis 連線與知識失效
 """
 import json
 import hashlib
 import os
-from typing import Optional, Dict, Any, List
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
 import redis
 
+from services.llm_judgment_cache import get_llm_judgment_cache
+from services.vector_codec import encode_vector, decode_vector, get_vector_format
+
+
+# 語義快取寫入所需的請求情境：(query embedding, 請求開始時間)
+# 由 chat handle_retrieval 設定，cache_answer 讀取（不必修改所有 cache_response_and_return 呼叫點）
+_semantic_query: ContextVar[Optional[Tuple[List[float], float]]] = ContextVar("semantic_query", default=None)
+
+
+# 語義快取變更記錄保留的最近筆數；本地鏡像落後超過此數（或版本重置）時整組重載
+_SEMANTIC_LOG_MAX = 512
+
+
+def set_semantic_query(embedding: Optional[List[float]], started_at: float):
+    """記錄本請求的 query embedding 與開始時間（供 cache_answer 寫入語義快取、計算省下的延遲）"""
+    _semantic_query.set((embedding, started_at) if embedding else None)
+
+
+class _SemanticPartition:
+    """單一 (業者, 角色, 配置版本) 的本地向量索引（Redis hash 的行程內鏡像）"""
+
+    __slots__ = ("version", "keys", "matrix", "latencies")
+
+    def __init__(self, version: Optional[bytes], keys: List[str], matrix: Optional[np.ndarray], latencies: List[float]):
+        self.version = version
+        self.keys = keys
+        self.matrix = matrix
+        self.latencies = latencies
+
 
 class CacheService:
     """RAG 緩存服務"""
@@ -31,8 +67,26 @@ class CacheService:
             "rag_result_cache": int(os.getenv("CACHE_TTL_RAG_RESULT", "1800"))   # 30 分鐘
         }
 
-        # Redis 連接
+        # 向量快取二進位格式（f32 / f16），寫在 key 的版本前綴中
+        self.vector_format = get_vector_format()
+
+        # 語義快取（Layer 1.5）
+        self.semantic_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+        self.semantic_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+        self.semantic_max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+        self._semantic_partitions: Dict[str, _SemanticPartition] = {}
+        self._semantic_lock = threading.Lock()
+        self._semantic_stats = {
+            "lookups": 0, "hits": 0, "misses": 0, "stale": 0, "writes": 0,
+            "saved_latency_ms_total": 0.0, "hit_latency_ms_total": 0.0,
+        }
+
+        # LLM 判斷快取（行程內單例；Redis 連線成功後接上 L2）
+        self.judgment_cache = get_llm_judgment_cache()
+
+        # Redis 連接（redis_client 為文字模式；向量快取另用二進位模式的 redis_binary）
         self.redis_client: Optional[redis.Redis] = None
+        self.redis_binary: Optional[redis.Redis] = None
 
         if self.enabled:
             try:
@@ -46,11 +100,21 @@ class CacheService:
                 )
                 # 測試連接
                 self.redis_client.ping()
+                self.redis_binary = redis.Redis(
+                    host=self.redis_host,
+                    port=self.redis_port,
+                    db=0,
+                    decode_responses=False,
+                    socket_connect_timeout=5,
+                    socket_timeout=5
+                )
+                self.judgment_cache.attach_redis(self.redis_client)
                 print(f"✅ Redis 緩存已啟用: {self.redis_host}:{self.redis_port}")
             except Exception as e:
                 print(f"⚠️  Redis 連接失敗，緩存已禁用: {e}")
                 self.enabled = False
                 self.redis_client = None
+                self.redis_binary = None
         else:
             print("ℹ️  緩存已禁用 (CACHE_ENABLED=false)")
 
@@ -142,6 +206,15 @@ class CacheService:
             # 記錄關聯（用於失效）
             self._track_cache_relations(key, vendor_id, answer_data)
 
+            # 語義快取：本請求有 query embedding 時一併登錄（答案本體仍在 question key，失效機制共用）
+            semantic_query = _semantic_query.get()
+            if semantic_query and self.semantic_enabled:
+                embedding, started_at = semantic_query
+                self._add_semantic_entry(
+                    self._semantic_partition_id(vendor_id, target_user, config_version),
+                    key, embedding, (time.time() - started_at) * 1000,
+                )
+
             print(f"💾 答案已緩存: {key} (TTL: {ttl}s)")
             return True
 
@@ -149,25 +222,289 @@ class CacheService:
             print(f"⚠️  緩存寫入失敗: {e}")
             return False
 
+    # ==================== 語義緩存 (Layer 1.5) ====================
+    #
+    # Redis 結構（每個 業者:角色:配置版本 一組）：
+    #   rag:semantic:{partition}      hash  question key → 正規化 query embedding（二進位）
+    #   rag:semantic:lat:{partition}  hash  question key → 原本完整處理耗時（ms，計算省下的延遲）
+    #   rag:semantic:ver:{partition}  int   每筆增刪 +1（與 log 同一交易）
+    #   rag:semantic:log:{partition}  list  最近 _SEMANTIC_LOG_MAX 筆變更（"+key" / "-key"），
+    #                                       各 worker 依版本差只套用落後的變更（不整組重載）
+    #   rag:semantic:age:{partition}  zset  question key → 登錄時間；分區滿時淘汰最舊的條目
+    # 答案本體仍存在 question key；知識 / 意圖 / 業者失效刪掉 question key 後，
+    # 語義條目在下次命中時發現答案已不存在即移除（lazy 清理）。
+
+    def _semantic_partition_id(self, vendor_id: int, target_user: str, config_version: str) -> str:
+        return f"{vendor_id}:{target_user}:{config_version}"
+
+    def semantic_available(self) -> bool:
+        """語義快取是否可用（啟用且 Redis 已連線）"""
+        return self.semantic_enabled and self._is_available() and self.redis_binary is not None
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        return arr / norm if norm > 0 else None
+
+    def _load_semantic_partition(self, partition: str) -> _SemanticPartition:
+        """讀取本地鏡像；Redis 版本號變動時套用變更記錄，落後太多或版本重置才整組重載"""
+        version = self.redis_binary.get(f"rag:semantic:ver:{partition}")
+        local = self._semantic_partitions.get(partition)
+        if local is not None and local.version == version:
+            return local
+
+        if local is not None and local.version is not None and version is not None:
+            updated = self._apply_semantic_changes(partition, local)
+            if updated is not None:
+                with self._semantic_lock:
+                    self._semantic_partitions[partition] = updated
+                return updated
+
+        # 先讀版本再讀資料：期間若有新變更，下次依舊版本號重套（增刪皆可重複套用）
+        pipe = self.redis_binary.pipeline(transaction=False)
+        pipe.hgetall(f"rag:semantic:{partition}")
+        pipe.hgetall(f"rag:semantic:lat:{partition}")
+        vectors, latencies = pipe.execute()
+
+        keys, rows, lats = [], [], []
+        for field, blob in (vectors or {}).items():
+            try:
+                rows.append(decode_vector(blob, self.vector_format))
+            except ValueError:
+                continue  # 向量格式切換前寫入的條目
+            key = field.decode() if isinstance(field, bytes) else field
+            keys.append(key)
+            lats.append(float((latencies or {}).get(field, 0) or 0))
+        matrix = np.asarray(rows, dtype=np.float32) if rows else None
+        local = _SemanticPartition(version, keys, matrix, lats)
+        with self._semantic_lock:
+            self._semantic_partitions[partition] = local
+        return local
+
+    def _apply_semantic_changes(self, partition: str, local: _SemanticPartition) -> Optional[_SemanticPartition]:
+        """依變更記錄把本地鏡像更新到最新版本（只讀新增的向量）；無法補齊時回 None 改整組重載"""
+        pipe = self.redis_binary.pipeline(transaction=True)
+        pipe.get(f"rag:semantic:ver:{partition}")
+        pipe.lrange(f"rag:semantic:log:{partition}", -_SEMANTIC_LOG_MAX, -1)
+        version, entries = pipe.execute()
+        if version is None:
+            return None
+        missed = int(version) - int(local.version)
+        entries = entries or []
+        if missed <= 0 or missed > len(entries):
+            return None  # 版本重置（key 過期）或記錄已被截斷
+
+        changes: Dict[str, str] = {}
+        for entry in entries[len(entries) - missed:]:
+            entry = entry.decode() if isinstance(entry, bytes) else entry
+            changes[entry[1:]] = entry[0]
+        added = [key for key, op in changes.items() if op == "+"]
+
+        new_keys, new_rows, new_lats = [], [], []
+        if added:
+            pipe = self.redis_binary.pipeline(transaction=False)
+            pipe.hmget(f"rag:semantic:{partition}", added)
+            pipe.hmget(f"rag:semantic:lat:{partition}", added)
+            vectors, latencies = pipe.execute()
+            for key, blob, lat in zip(added, vectors, latencies):
+                if blob is None:
+                    continue  # 記錄之後又被移除
+                try:
+                    new_rows.append(decode_vector(blob, self.vector_format))
+                except ValueError:
+                    continue
+                new_keys.append(key)
+                new_lats.append(float(lat or 0))
+
+        keep = [i for i, key in enumerate(local.keys) if key not in changes]
+        keys = [local.keys[i] for i in keep] + new_keys
+        lats = [local.latencies[i] for i in keep] + new_lats
+        parts = []
+        if local.matrix is not None and keep:
+            parts.append(local.matrix[keep])
+        if new_rows:
+            parts.append(np.asarray(new_rows, dtype=np.float32))
+        try:
+            matrix = np.vstack(parts) if parts else None
+        except ValueError:
+            return None  # 向量維度不一致（換 embedding 模型）→ 整組重載
+        return _SemanticPartition(version, keys, matrix, lats)
+
+    def get_semantic_cached_answer(
+        self,
+        vendor_id: int,
+        query_embedding: List[float],
+        target_user: str = "tenant",
+        config_version: str = "default",
+    ) -> Optional[Dict[str, Any]]:
+        """
+        語義快取查詢：同業者 / 角色 / 配置版本下，找 query embedding 最相近的已回答問題
+
+        Args:
+            vendor_id: 業者 ID
+            query_embedding: 本次問題的 embedding（檢索會共用同一份，不額外呼叫 API）
+            target_user: 目標用戶角色
+            config_version: 配置版本
+
+        Returns:
+            相似度 ≥ SEMANTIC_CACHE_THRESHOLD 時回傳快取的完整 RAG 回應，否則 None
+        """
+        if not self.semantic_available() or not query_embedding:
+            return None
+
+        start = time.time()
+        partition = self._semantic_partition_id(vendor_id, target_user, config_version)
+        try:
+            local = self._load_semantic_partition(partition)
+            query = self._normalize(query_embedding)
+            self._semantic_stats["lookups"] += 1
+            if local.matrix is None or query is None or local.matrix.shape[1] != query.shape[0]:
+                self._semantic_stats["misses"] += 1
+                return None
+
+            scores = local.matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.semantic_threshold:
+                self._semantic_stats["misses"] += 1
+                return None
+
+            question_key = local.keys[best]
+            cached = self.redis_client.get(question_key)
+            if not cached:
+                # 答案已失效（知識更新 / TTL 到期）：移除語義條目
+                self._remove_semantic_entry(partition, question_key)
+                self._semantic_stats["stale"] += 1
+                self._semantic_stats["misses"] += 1
+                return None
+
+            hit_ms = (time.time() - start) * 1000
+            self._semantic_stats["hits"] += 1
+            self._semantic_stats["hit_latency_ms_total"] += hit_ms
+            self._semantic_stats["saved_latency_ms_total"] += max(0.0, local.latencies[best] - hit_ms)
+            print(f"🎯 語義緩存命中: {question_key} (similarity={similarity:.4f})")
+            return json.loads(cached)
+
+        except Exception as e:
+            print(f"⚠️  語義緩存讀取失敗: {e}")
+            return None
+
+    def _add_semantic_entry(self, partition: str, question_key: str, embedding: List[float], latency_ms: float):
+        """登錄語義條目（分區已滿時依登錄時間淘汰最舊的條目）"""
+        vector = self._normalize(embedding)
+        if vector is None or self.redis_binary is None:
+            return
+        try:
+            index_key = f"rag:semantic:{partition}"
+            age_key = f"rag:semantic:age:{partition}"
+            count = self.redis_binary.hlen(index_key) or 0
+            if count >= self.semantic_max_entries:
+                oldest = self.redis_binary.zpopmin(age_key, count - self.semantic_max_entries + 1)
+                evicted = [m.decode() if isinstance(m, bytes) else m for m, _ in oldest or []]
+                if evicted:
+                    self._remove_semantic_entry(partition, *evicted)
+                else:
+                    self._reset_semantic_partition(partition)  # 無年齡索引的舊版條目：整組重建
+
+            ttl = self.ttl_config["question_cache"]
+            pipe = self.redis_binary.pipeline(transaction=True)
+            pipe.hset(index_key, question_key, encode_vector(vector.tolist(), self.vector_format))
+            pipe.hset(f"rag:semantic:lat:{partition}", question_key, str(round(latency_ms, 1)))
+            pipe.zadd(age_key, {question_key: time.time()})
+            self._log_semantic_changes(pipe, partition, "+", [question_key])
+            for key in (index_key, f"rag:semantic:lat:{partition}", age_key,
+                        f"rag:semantic:ver:{partition}", f"rag:semantic:log:{partition}"):
+                pipe.expire(key, ttl)
+            pipe.execute()
+            self._semantic_stats["writes"] += 1
+        except Exception as e:
+            print(f"⚠️  語義緩存寫入失敗: {e}")
+
+    def _remove_semantic_entry(self, partition: str, *question_keys: str):
+        pipe = self.redis_binary.pipeline(transaction=True)
+        pipe.hdel(f"rag:semantic:{partition}", *question_keys)
+        pipe.hdel(f"rag:semantic:lat:{partition}", *question_keys)
+        pipe.zrem(f"rag:semantic:age:{partition}", *question_keys)
+        self._log_semantic_changes(pipe, partition, "-", question_keys)
+        pipe.execute()
+
+    @staticmethod
+    def _log_semantic_changes(pipe, partition: str, op: str, question_keys) -> None:
+        """變更記錄與版本號同一交易寫入：版本 v 對應記錄中倒數第 (最新版本 - v) 筆之後的變更"""
+        log_key = f"rag:semantic:log:{partition}"
+        pipe.rpush(log_key, *(f"{op}{key}" for key in question_keys))
+        pipe.incrby(f"rag:semantic:ver:{partition}", len(question_keys))
+        pipe.ltrim(log_key, -_SEMANTIC_LOG_MAX, -1)
+
+    def _reset_semantic_partition(self, partition: str):
+        self.redis_binary.delete(*(f"rag:semantic:{kind}{partition}" for kind in ("", "lat:", "age:", "ver:", "log:")))
+
+    def get_semantic_stats(self) -> Dict[str, Any]:
+        """語義快取命中率與省下的延遲（本 worker 行程累計）"""
+        stats = dict(self._semantic_stats)
+        lookups = stats["lookups"]
+        hits = stats["hits"]
+        return {
+            "enabled": self.semantic_enabled,
+            "threshold": self.semantic_threshold,
+            "max_entries_per_partition": self.semantic_max_entries,
+            "partitions_loaded": len(self._semantic_partitions),
+            "lookups": lookups,
+            "hits": hits,
+            "misses": stats["misses"],
+            "stale": stats["stale"],
+            "writes": stats["writes"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_hit_latency_ms": round(stats["hit_latency_ms_total"] / hits, 2) if hits else 0.0,
+            "saved_latency_ms_total": round(stats["saved_latency_ms_total"], 1),
+            "avg_saved_latency_ms": round(stats["saved_latency_ms_total"] / hits, 1) if hits else 0.0,
+        }
+
     # ==================== 向量緩存 (Layer 2) ====================
 
     def _make_vector_key(self, text: str) -> str:
-        """生成向量緩存 key"""
+        """生成向量緩存 key（v2：二進位格式，格式名寫在前綴）"""
+        text_hash = hashlib.md5(text.lower().strip().encode()).hexdigest()[:16]
+        return f"rag:vector:v2:{self.vector_format}:{text_hash}"
+
+    def _make_legacy_vector_key(self, text: str) -> str:
+        """舊版（JSON）向量緩存 key，僅供 lazy 遷移讀取"""
         text_hash = hashlib.md5(text.lower().strip().encode()).hexdigest()[:16]
         return f"rag:vector:{text_hash}"
 
     def get_cached_vector(self, text: str) -> Optional[List[float]]:
-        """獲取緩存的向量"""
-        if not self._is_available():
+        """
+        獲取緩存的向量
+
+        先讀 v2 二進位條目；未命中時讀舊版 JSON 條目，命中則改寫為 v2 並刪除舊 key（lazy 遷移）。
+        """
+        if not self._is_available() or self.redis_binary is None:
             return None
 
         try:
             key = self._make_vector_key(text)
-            cached = self.redis_client.get(key)
+            cached = self.redis_binary.get(key)
 
             if cached:
                 print(f"🎯 向量緩存命中: {key}")
-                return json.loads(cached)
+                return decode_vector(cached, self.vector_format)
+
+            legacy_key = self._make_legacy_vector_key(text)
+            legacy = self.redis_binary.get(legacy_key)
+            if legacy:
+                vector = json.loads(legacy)
+                ttl = self.redis_binary.ttl(legacy_key)
+                pipe = self.redis_binary.pipeline(transaction=False)
+                pipe.setex(
+                    key,
+                    ttl if ttl and ttl > 0 else self.ttl_config["vector_cache"],
+                    encode_vector(vector, self.vector_format)
+                )
+                pipe.delete(legacy_key)
+                pipe.execute()
+                print(f"🎯 向量緩存命中（舊格式，已遷移）: {key}")
+                return vector
 
             return None
 
@@ -176,18 +513,18 @@ class CacheService:
             return None
 
     def cache_vector(self, text: str, vector: List[float]) -> bool:
-        """緩存向量"""
-        if not self._is_available():
+        """緩存向量（二進位格式，1536 維 f32 約 6 KB，JSON 約 30 KB）"""
+        if not self._is_available() or self.redis_binary is None:
             return False
 
         try:
             key = self._make_vector_key(text)
             ttl = self.ttl_config["vector_cache"]
 
-            self.redis_client.setex(
+            self.redis_binary.setex(
                 key,
                 ttl,
-                json.dumps(vector)
+                encode_vector(vector, self.vector_format)
             )
 
             return True
@@ -309,11 +646,17 @@ class CacheService:
         """
         按知識 ID 失效緩存（知識更新時觸發）
 
+        一併清除依賴該知識的 LLM 判斷（相關性把關；本行程 L1 不需 Redis 也會清）
+
         Returns:
             失效的緩存條目數量
         """
+        judged = self.judgment_cache.invalidate_knowledge(knowledge_id)
+        if judged:
+            print(f"🗑️  知識更新失效: knowledge_id={knowledge_id}, 清除 {judged} 條 LLM 判斷")
+
         if not self._is_available():
-            return 0
+            return judged
 
         try:
             relation_key = f"rag:relation:knowledge:{knowledge_id}"
@@ -323,9 +666,9 @@ class CacheService:
                 count = self.redis_client.delete(*cache_keys)
                 self.redis_client.delete(relation_key)
                 print(f"🗑️  知識更新失效: knowledge_id={knowledge_id}, 清除 {count} 條緩存")
-                return count
+                return count + judged
 
-            return 0
+            return judged
 
         except Exception as e:
             print(f"⚠️  按知識 ID 失效緩存失敗: {e}")
@@ -389,8 +732,9 @@ class CacheService:
             return False
 
         try:
-            # 查找所有 rag: 開頭的 key
-            keys = self.redis_client.keys("rag:*")
+            # 查找所有 rag: 開頭的 key（含 LLM 判斷快取 llm:judge:）
+            keys = self.redis_client.keys("rag:*") + self.redis_client.keys("llm:judge:*")
+            self.judgment_cache.clear()
 
             if keys:
                 count = self.redis_client.delete(*keys)
@@ -409,12 +753,14 @@ class CacheService:
         if not self._is_available():
             return {
                 "enabled": False,
-                "reason": "Redis 未連接"
+                "reason": "Redis 未連接",
+                "llm_judgment_cache": self.judgment_cache.get_stats()
             }
 
         try:
             # 統計各類緩存數量
             question_keys = self.redis_client.keys("rag:question:*")
+            semantic_keys = self.redis_client.keys("rag:semantic:lat:*")
             vector_keys = self.redis_client.keys("rag:vector:*")
             result_keys = self.redis_client.keys("rag:result:*")
             relation_keys = self.redis_client.keys("rag:relation:*")
@@ -430,9 +776,13 @@ class CacheService:
                     "question_cache": len(question_keys),
                     "vector_cache": len(vector_keys),
                     "rag_result_cache": len(result_keys),
-                    "relation_tracking": len(relation_keys)
+                    "relation_tracking": len(relation_keys),
+                    "semantic_partitions": len(semantic_keys)
                 },
+                "semantic_cache": self.get_semantic_stats(),
+                "llm_judgment_cache": self.judgment_cache.get_stats(),
                 "ttl_config": self.ttl_config,
+                "vector_format": self.vector_format,
                 "memory_used_mb": round(info["used_memory"] / 1024 / 1024, 2),
                 "peak_memory_mb": round(info["used_memory_peak"] / 1024 / 1024, 2)
             }
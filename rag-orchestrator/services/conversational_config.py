@@ -20,6 +20,8 @@ import json
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
+from .cache_bus import get_cache_bus
+
 CONFIG_CATEGORY = "對話規則"
 
 
@@ -94,7 +96,7 @@ PRESALES_CONFIG = ConversationalConfig(
 )
 _CODE_DEFAULTS: Dict[str, ConversationalConfig] = {PRESALES_CONFIG.key: PRESALES_CONFIG}
 
-# 進程級快取（每輪都要查設定，不可每次查庫；資料更新後重啟或呼叫 reset_cache）
+# 進程級快取（每輪都要查設定，不可每次查庫；設定寫入經 cache_bus "conversational" 跨 worker 清除）
 _cache: Dict[str, Any] = {"loaded": False, "by_key": {}, "by_role": {}, "by_category": {}}
 
 
@@ -203,3 +205,6 @@ def reset_cache() -> None:
     _cache["by_key"] = {}
     _cache["by_role"] = {}
     _cache["by_category"] = {}
+
+
+get_cache_bus().register("conversational", lambda _key: reset_cache())
@@ -11,6 +11,8 @@
 
 from typing import Optional
 
+from .cache_bus import get_cache_bus
+
 RULES_CATEGORY = "對話規則"
 
 # code 內建 fallback（DB 無資料時用）。售前顧問（prospect）為第一個角色。
@@ -64,7 +66,7 @@ CONVERSATIONAL_RULES_BY_ROLE = {
     ),
 }
 
-# 進程級快取（每輪 brain 都要規則，不可每次查庫）
+# 進程級快取（每輪 brain 都要規則，不可每次查庫；規則寫入經 cache_bus "conversational" 跨 worker 清除）
 _cache: dict = {}
 
 
@@ -106,3 +108,6 @@ async def load_rules(db_pool, role: Optional[str]) -> Optional[str]:
 def reset_cache() -> None:
     """清快取（規則資料更新後可呼叫；或進程重啟自然重載）。"""
     _cache.clear()
+
+
+get_cache_bus().register("conversational", lambda _key: reset_cache())
@@ -3,9 +3,14 @@
 統一處理所有資料庫配置相關功能，避免代碼重複
 """
 import os
+import asyncio
+import functools
+import threading
 import psycopg2
 import psycopg2.extras
-from typing import Dict, Optional
+import psycopg2.pool
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
 from contextlib import contextmanager
 
 
@@ -149,6 +154,190 @@ def execute_query(
             raise ValueError(f"Invalid fetch mode: {fetch}")
 
 
+# ============================================================
+# 同步連接池 + 有界 DB 執行緒池（檢索熱路徑用）
+# ============================================================
+#
+# 檢索器（BaseRetriever 子類）沿用 psycopg2 SQL，但不再「每次查詢 connect 一次」，
+# 也不在 event loop 上直接跑阻塞查詢：
+#   - 連接取自 BoundedConnectionPool（滿了會等待，不像 ThreadedConnectionPool 直接拋錯）
+#   - 查詢透過 run_in_db_executor 丟到有界執行緒池，worker 數 = 連接池上限，
+#     同時在跑的查詢永遠不會超過可用連接數
+# 大小由 DB_SYNC_POOL_MIN / DB_SYNC_POOL_MAX 控制（每個 uvicorn worker 各一份）。
+
+def _on_event_loop() -> bool:
+    """目前執行緒是否正在跑 asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class BoundedConnectionPool:
+    """
+    有上限且會阻塞等待的 psycopg2 連接池
+
+    psycopg2 的 ThreadedConnectionPool 在連接用盡時直接拋 PoolError；
+    這裡以 semaphore 包一層，讓取用方排隊等待（最多 acquire_timeout 秒）。
+    只有 DB 執行緒池（run_in_db_executor）裡的取用才排隊；在 event loop 執行緒上取用時
+    用盡即拋錯，不讓整個 worker 卡住最多 acquire_timeout 秒。
+    """
+
+    def __init__(self, minconn: int, maxconn: int, acquire_timeout: float = 30.0, **config):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **config)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+
+    def getconn(self):
+        """取得連接（用盡時阻塞等待；event loop 執行緒上則立即失敗）"""
+        if _on_event_loop():
+            if not self._slots.acquire(blocking=False):
+                raise psycopg2.pool.PoolError(
+                    f"connection pool exhausted (max={self.maxconn}); "
+                    f"called on the event loop, use run_in_db_executor"
+                )
+        elif not self._slots.acquire(timeout=self.acquire_timeout):
+            raise psycopg2.pool.PoolError(
+                f"connection pool exhausted (waited {self.acquire_timeout}s, max={self.maxconn})"
+            )
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                # 伺服器端已斷線的連接：丟棄後補一條新的
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """歸還連接（已斷線者直接關閉，未結束的交易由 psycopg2 pool 自動 rollback）"""
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+class PooledConnection:
+    """
+    連接池中的連接代理
+
+    行為與 psycopg2 connection 相同（屬性轉發），差別只在 close() 是歸還到連接池，
+    因此既有 `conn = ...; try: ... finally: conn.close()` 的寫法不需要修改。
+    """
+
+    def __init__(self, pool: BoundedConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+_sync_pool: Optional[BoundedConnectionPool] = None
+_db_executor: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _sync_pool_max() -> int:
+    return max(1, int(os.getenv('DB_SYNC_POOL_MAX', '10')))
+
+
+def get_sync_pool() -> BoundedConnectionPool:
+    """
+    獲取同步連接池（單例，首次呼叫時建立）
+
+    Returns:
+        BoundedConnectionPool 實例
+    """
+    global _sync_pool
+    if _sync_pool is None:
+        with _pool_lock:
+            if _sync_pool is None:
+                maxconn = _sync_pool_max()
+                minconn = min(maxconn, max(0, int(os.getenv('DB_SYNC_POOL_MIN', '1'))))
+                _sync_pool = BoundedConnectionPool(minconn, maxconn, **get_db_config())
+    return _sync_pool
+
+
+def get_pooled_connection() -> PooledConnection:
+    """
+    從同步連接池取得連接（close() 即歸還）
+
+    使用方式與 psycopg2.connect() 相同：
+    ```python
+    conn = get_pooled_connection()
+    try:
+        cursor = conn.cursor()
+        ...
+    finally:
+        conn.close()  # 歸還連接池
+    ```
+    """
+    pool = get_sync_pool()
+    return PooledConnection(pool, pool.getconn())
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """獲取 DB 專用的有界執行緒池（worker 數 = 同步連接池上限）"""
+    global _db_executor
+    if _db_executor is None:
+        with _pool_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=_sync_pool_max(),
+                    thread_name_prefix='db-sync'
+                )
+    return _db_executor
+
+
+async def run_in_db_executor(fn: Callable, *args, **kwargs):
+    """
+    在 DB 執行緒池中執行阻塞的資料庫函式，不佔用 event loop
+
+    Args:
+        fn: 同步函式（內部自行取得/歸還連接）
+        *args, **kwargs: 傳給 fn 的參數
+
+    Returns:
+        fn 的回傳值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), functools.partial(fn, *args, **kwargs)
+    )
+
+
+def close_sync_pool():
+    """關閉同步連接池與 DB 執行緒池（應用關閉時呼叫）"""
+    global _sync_pool, _db_executor
+    with _pool_lock:
+        if _db_executor is not None:
+            _db_executor.shutdown(wait=True)
+            _db_executor = None
+        if _sync_pool is not None:
+            _sync_pool.closeall()
+            _sync_pool = None
+
+
 # ============================================================
 # 使用範例與測試
 # ============================================================
@@ -7,6 +7,7 @@
 """
 from typing import Tuple, Optional, Dict
 from services.embedding_utils import get_embedding_client
+from services.cache_bus import get_cache_bus
 from datetime import datetime, timedelta
 import asyncpg
 
@@ -34,7 +35,8 @@ class DigressionDetectorDB:
 
         # 配置緩存
         self._config_cache = {}
-        self._cache_ttl = timedelta(minutes=5)  # 緩存 5 分鐘
+        self._cache_ttl = timedelta(minutes=5)  # 緩存 5 分鐘（表只經 SQL 修改、無失效發布者，一律依 TTL 重新載入）
+        get_cache_bus().register("digression_config", self.clear_cache)
 
         # 默認配置（當資料庫查詢失敗時使用）
         self._default_exit_keywords = [
@@ -73,7 +75,8 @@ class DigressionDetectorDB:
         # 檢查緩存
         if cache_key in self._config_cache:
             cached_config, cached_time = self._config_cache[cache_key]
-            if datetime.now() - cached_time < self._cache_ttl:
+            ttl = get_cache_bus().ttl("digression_config", self._cache_ttl)
+            if ttl is None or datetime.now() - cached_time < ttl:
                 print(f"🔧 [配置] 使用緩存配置（vendor={vendor_id}, lang={language}）")
                 return cached_config
 
@@ -147,8 +150,13 @@ class DigressionDetectorDB:
                 'thresholds': self._default_thresholds
             }
 
-    def clear_cache(self):
-        """清空配置緩存（用於測試或強制重新載入）"""
+    def clear_cache(self, vendor_id: Optional[int] = None):
+        """清空配置緩存（用於測試或強制重新載入）；指定 vendor_id 時只清該業者"""
+        if vendor_id is not None:
+            prefix = f"{vendor_id}:"
+            for key in [k for k in self._config_cache if k.startswith(prefix)]:
+                del self._config_cache[key]
+            return
         self._config_cache.clear()
         print("🗑️  [配置] 緩存已清空")
 
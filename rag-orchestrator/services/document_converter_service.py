@@ -27,6 +27,8 @@ from asyncpg.pool import Pool
 # 引入統一 Job 服務
 from services.unified_job_service import UnifiedJobService
 from services.llm_provider import get_llm_provider, LLMProvider
+from services.item_pipeline import PipelineStage, run_item_pipeline
+from services.openai_rate_limiter import call_with_limiter, get_rate_limiter
 
 
 class DocumentConverterService(UnifiedJobService):
@@ -49,6 +51,11 @@ class DocumentConverterService(UnifiedJobService):
         self.temp_dir = Path('/tmp/document_converter')
         self.temp_dir.mkdir(exist_ok=True)
 
+        # 並行轉換配置（速率由 OPENAI_CHAT_RPM / OPENAI_CHAT_TPM 共用限制器控制）
+        self.convert_concurrency = int(os.getenv("DOCUMENT_CONVERTER_CONCURRENCY", "4"))
+        self.intent_batch_size = int(os.getenv("DOCUMENT_CONVERTER_INTENT_BATCH_SIZE", "20"))
+        self.llm_max_retries = int(os.getenv("DOCUMENT_CONVERTER_MAX_RETRIES", "3"))
+
         # ✅ 已移除記憶體存儲 self.jobs = {}，改用資料庫 unified_jobs 表
 
         # 意圖快取（減少資料庫查詢）
@@ -226,6 +233,10 @@ class DocumentConverterService(UnifiedJobService):
         """
         使用 AI 將文件內容轉換為 Q&A
 
+        各段經串流管線並行處理（抽取 Q&A → 批次推薦意圖），呼叫速率由共用 chat 限制器的
+        RPM / TPM 額度控制（取代固定間隔 sleep）；每完成一段即把目前累積的 Q&A 寫回作業記錄，
+        前端輪詢 GET /{job_id} 可先看到部分結果。
+
         Args:
             job_id: 任務 ID
             custom_prompt: 自訂提示詞（可選）
@@ -256,10 +267,9 @@ class DocumentConverterService(UnifiedJobService):
             # 根據模型動態調整分段大小
             max_context = self.MODEL_CONTEXT_LIMITS.get(self.model, 16385)
 
-            # TPM (Tokens Per Minute) 考量
-            # gpt-4o 組織 TPM 限制通常為 30K-90K，保守估計使用 30K
-            # 為了避免 rate limit，單次請求應該小於 TPM 限制的 70%
-            tpm_limit = 30000 if self.model == 'gpt-4o' else 90000  # gpt-3.5-turbo 通常更高
+            # TPM (Tokens Per Minute) 考量：以共用 chat 限制器的 TPM 額度為準（OPENAI_CHAT_TPM）
+            # 單次請求應該小於 TPM 限制的 70%，其餘額度留給並行的其他段與意圖推薦
+            tpm_limit = get_rate_limiter("chat").tpm
             safe_request_tokens = int(tpm_limit * 0.7)  # 單次請求安全上限
 
             # 根據模型容量和 TPM 限制計算安全的分段大小
@@ -276,40 +286,65 @@ class DocumentConverterService(UnifiedJobService):
             content_chunks = self._split_content(content, max_chars)
 
             print(f"🤖 開始 AI 轉換 (job_id: {job_id})")
-            print(f"   內容分為 {len(content_chunks)} 段處理")
+            print(f"   內容分為 {len(content_chunks)} 段處理（並行 {self.convert_concurrency} 段）")
             print(f"   使用模型: {self.model}")
 
-            # 計算 TPM 限制下的安全延遲
-            # gpt-4o: 30K TPM，每段約 20K tokens，需要等待 40 秒避免超限
-            if len(content_chunks) > 1:
-                estimated_tokens_per_chunk = max_chars * 2 + 4000  # 輸入 + 輸出
-                delay_seconds = int((estimated_tokens_per_chunk / tpm_limit) * 60 * 1.2)  # 加 20% 緩衝
-                delay_seconds = max(20, min(60, delay_seconds))  # 限制在 20-60 秒之間
-                print(f"   ⏱️  每段間隔: {delay_seconds} 秒 (避免 TPM 超限)")
-
-            all_qa = []
-            for i, chunk in enumerate(content_chunks, 1):
-                print(f"   處理第 {i}/{len(content_chunks)} 段...")
-                qa_list = await self._call_openai_extract_qa(chunk, custom_prompt)
-
-                # 為每個 Q&A 推薦意圖
-                if self.db_pool and qa_list:
-                    print(f"   📌 為 {len(qa_list)} 個 Q&A 推薦意圖...")
-                    for qa in qa_list:
-                        recommended_intent = await self._recommend_intent_for_qa(qa)
-                        qa['recommended_intent'] = recommended_intent
-
-                        if recommended_intent['intent_id']:
-                            print(f"      ✅ {qa['question_summary'][:30]}... → {recommended_intent['intent_name']} ({recommended_intent['confidence']:.2f})")
-                        else:
-                            print(f"      ⚠️  {qa['question_summary'][:30]}... → 未分類")
-
-                all_qa.extend(qa_list)
-
-                # 在分段之間添加延遲以避免超過 TPM 限制
-                if i < len(content_chunks) and len(content_chunks) > 1:
-                    print(f"   ⏳ 等待 {delay_seconds} 秒後處理下一段...")
-                    await asyncio.sleep(delay_seconds)
+            # 意圖清單每個作業建立一次（所有批次共用同一段 prompt）
+            intent_catalog = await self._build_intent_catalog() if self.db_pool else None
+
+            completed: Dict[int, List[Dict]] = {}
+            publish_lock = asyncio.Lock()
+
+            async def extract_stage(item: Dict) -> Dict:
+                print(f"   處理第 {item['index'] + 1}/{len(content_chunks)} 段...")
+                item['qa_list'] = await self._call_openai_extract_qa(item['chunk'], custom_prompt)
+                return item
+
+            async def intent_stage(item: Dict) -> Dict:
+                qa_list = item['qa_list']
+                if intent_catalog and qa_list:
+                    print(f"   📌 第 {item['index'] + 1} 段：為 {len(qa_list)} 個 Q&A 推薦意圖...")
+                    batches = [qa_list[i:i + self.intent_batch_size]
+                               for i in range(0, len(qa_list), self.intent_batch_size)]
+                    recommendations = await asyncio.gather(
+                        *(self._recommend_intents_batch(batch, intent_catalog) for batch in batches)
+                    )
+                    for batch, batch_recommendations in zip(batches, recommendations):
+                        for qa, recommended_intent in zip(batch, batch_recommendations):
+                            qa['recommended_intent'] = recommended_intent
+
+                # 串流部分結果：依段落順序寫回目前已完成的 Q&A
+                async with publish_lock:
+                    completed[item['index']] = qa_list
+                    partial = [qa for idx in sorted(completed) for qa in completed[idx]]
+                    await self.update_status(
+                        job_id,
+                        status='processing',
+                        result={
+                            'content': content,
+                            'content_length': len(content),
+                            'qa_list': partial,
+                            'qa_count': len(partial),
+                            'partial': True
+                        },
+                        progress={
+                            'stage': 'converting',
+                            'current': len(completed),
+                            'total': len(content_chunks),
+                            'message': f'已完成 {len(completed)}/{len(content_chunks)} 段，提取到 {len(partial)} 個 Q&A'
+                        }
+                    )
+                return item
+
+            items = await run_item_pipeline(
+                [{'index': i, 'chunk': chunk} for i, chunk in enumerate(content_chunks)],
+                [
+                    PipelineStage("extract", extract_stage, concurrency=self.convert_concurrency),
+                    PipelineStage("intent", intent_stage, concurrency=self.convert_concurrency),
+                ],
+                queue_size=max(1, self.convert_concurrency)
+            )
+            all_qa = [qa for item in items for qa in item['qa_list']]
 
             # 保存 Q&A 列表到資料庫
             intent_recommended = sum(1 for qa in all_qa if qa.get('recommended_intent', {}).get('intent_id'))
@@ -383,6 +418,19 @@ class DocumentConverterService(UnifiedJobService):
 
         return chunks
 
+    async def _call_llm_limited(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        tokens: Optional[int] = None,
+        **kwargs
+    ) -> Dict:
+        """以本服務的模型與重試次數經共用限制器呼叫 LLM（見 call_with_limiter）"""
+        return await call_with_limiter(
+            self.llm_provider, self.model, messages, max_tokens,
+            tokens=tokens, max_retries=self.llm_max_retries, **kwargs
+        )
+
     async def _call_openai_extract_qa(self, content: str, custom_prompt: Optional[str] = None) -> List[Dict]:
         """
         呼叫 OpenAI API 提取 Q&A
@@ -459,14 +507,13 @@ class DocumentConverterService(UnifiedJobService):
 
             print(f"   📊 Token 估算: 輸入 ~{estimated_input_tokens}, 輸出上限 {safe_max_tokens}")
 
-            llm_result = self.llm_provider.chat_completion(
-                model=self.model,
+            llm_result = await self._call_llm_limited(
                 messages=[
                     {"role": "system", "content": "你是一個專業的知識庫管理專家，擅長從技術規格書中提取實用的Q&A。請仔細分析文件內容，提取對使用者有實際幫助的問答對。"},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3,
-                max_tokens=safe_max_tokens  # 設置動態計算的安全上限
+                max_tokens=safe_max_tokens,  # 設置動態計算的安全上限
+                tokens=estimated_input_tokens + safe_max_tokens
             )
 
             result_text = llm_result['content'].strip()
@@ -580,10 +627,13 @@ class DocumentConverterService(UnifiedJobService):
         await self.delete_job(job_id, delete_file=True)
         print(f"✅ 任務已清理 (job_id: {job_id})")
 
-    async def _get_all_intents(self) -> List[Dict]:
+    async def _get_all_intents(self, refresh: bool = False) -> List[Dict]:
         """
         取得所有可用的意圖
 
+        Args:
+            refresh: 忽略快取重新載入（每個轉換作業開始時使用，避免沿用過期的意圖）
+
         Returns:
             意圖列表，包含 id, name, description
         """
@@ -593,7 +643,7 @@ class DocumentConverterService(UnifiedJobService):
 
         try:
             # 使用快取避免重複查詢
-            if self._cached_intents is not None:
+            if self._cached_intents is not None and not refresh:
                 return self._cached_intents
 
             async with self.db_pool.acquire() as conn:
@@ -611,11 +661,28 @@ class DocumentConverterService(UnifiedJobService):
             print(f"   ⚠️  載入意圖失敗: {e}")
             return []
 
-    async def _recommend_intent_for_qa(self, qa: Dict) -> Dict:
+    async def _build_intent_catalog(self, refresh: bool = True) -> Optional[Dict]:
         """
-        為單個 Q&A 推薦意圖
+        建立意圖清單 prompt（每個作業一次，所有推薦批次共用）
 
-        複製自 knowledge_import_service._recommend_intents() 的邏輯
+        Returns:
+            {"intent_list": 意圖清單文字, "names": {intent_id: intent_name}}；沒有意圖時為 None
+        """
+        intents = await self._get_all_intents(refresh=refresh)
+        if not intents:
+            return None
+
+        return {
+            'intent_list': "\n".join([
+                f"- {i['id']}: {i['name']} ({i['description']})"
+                for i in intents
+            ]),
+            'names': {i['id']: i['name'] for i in intents}
+        }
+
+    async def _recommend_intent_for_qa(self, qa: Dict) -> Dict:
+        """
+        為單個 Q&A 推薦意圖（_recommend_intents_batch 的單筆版本）
 
         Args:
             qa: Q&A 資料，包含 question_summary, content, keywords
@@ -623,67 +690,95 @@ class DocumentConverterService(UnifiedJobService):
         Returns:
             推薦結果，包含 intent_id, intent_name, confidence, reasoning
         """
-        try:
-            # 1. 取得所有意圖（使用快取）
-            intents = await self._get_all_intents()
-
-            if not intents:
-                return {
-                    'intent_id': None,
-                    'intent_name': '未分類',
-                    'confidence': 0.0,
-                    'reasoning': '系統中沒有可用意圖'
-                }
-
-            # 2. 建立意圖清單文字
-            intent_list = "\n".join([
-                f"- {i['id']}: {i['name']} ({i['description']})"
-                for i in intents
-            ])
+        catalog = await self._build_intent_catalog(refresh=False)
+        return (await self._recommend_intents_batch([qa], catalog))[0]
+
+    async def _recommend_intents_batch(self, qa_batch: List[Dict], catalog: Optional[Dict]) -> List[Dict]:
+        """
+        一次 LLM 呼叫為多個 Q&A 推薦意圖
+
+        意圖清單放在 prompt 開頭，同一作業的每個批次前綴相同（可命中 provider 的 prompt 快取）。
+
+        Args:
+            qa_batch: Q&A 列表，每個包含 question_summary, content, keywords
+            catalog: _build_intent_catalog() 的結果
 
-            # 3. 呼叫 LLM 推薦
-            keywords_str = ', '.join(qa.get('keywords', []))
-            prompt = f"""請根據以下問答內容，從意圖清單中選擇最合適的意圖。
+        Returns:
+            與 qa_batch 等長的推薦結果，每個包含 intent_id, intent_name, confidence, reasoning
+        """
+        def unclassified(reasoning: str) -> Dict:
+            return {
+                'intent_id': None,
+                'intent_name': '未分類',
+                'confidence': 0.0,
+                'reasoning': reasoning
+            }
 
-問題：{qa['question_summary']}
-答案：{qa['content'][:200]}
-關鍵字：{keywords_str}
+        if not catalog:
+            return [unclassified('系統中沒有可用意圖') for _ in qa_batch]
+
+        try:
+            qa_text = "\n\n".join(
+                f"[{idx}]\n問題：{qa['question_summary']}\n答案：{qa['content'][:200]}\n關鍵字：{', '.join(qa.get('keywords', []))}"
+                for idx, qa in enumerate(qa_batch, 1)
+            )
+            prompt = f"""請根據意圖清單，為下列每一組問答選擇最合適的意圖。
 
 可用的意圖清單：
-{intent_list}
+{catalog['intent_list']}
+
+問答列表：
+{qa_text}
 
-請以 JSON 格式回應：
+請以 JSON 格式回應，results 依問答編號各一筆：
 {{
-  "intent_id": 推薦的意圖 ID（數字）,
-  "intent_name": 意圖名稱,
-  "confidence": 信心度（0.0-1.0）,
-  "reasoning": 推薦理由（簡短說明）
+  "results": [
+    {{
+      "index": 問答編號（數字）,
+      "intent_id": 推薦的意圖 ID（數字）,
+      "intent_name": 意圖名稱,
+      "confidence": 信心度（0.0-1.0）,
+      "reasoning": 推薦理由（簡短說明）
+    }}
+  ]
 }}
 
 只輸出 JSON，不要加其他說明。"""
 
-            llm_result = self.llm_provider.chat_completion(
-                model=self.model,
-                temperature=0.3,
-                max_tokens=500,  # 意圖推薦只需要小量輸出
-                response_format={"type": "json_object"},
-                messages=[{"role": "user", "content": prompt}]
+            llm_result = await self._call_llm_limited(
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=200 + 120 * len(qa_batch),  # 每個 Q&A 只需要小量輸出
+                response_format={"type": "json_object"}
             )
 
-            result = json.loads(llm_result['content'])
-
-            return {
-                'intent_id': result.get('intent_id'),
-                'intent_name': result.get('intent_name'),
-                'confidence': result.get('confidence', 0.8),
-                'reasoning': result.get('reasoning', '')
-            }
+            by_index = {}
+            for item in json.loads(llm_result['content']).get('results', []):
+                try:
+                    by_index[int(item.get('index'))] = item
+                except (TypeError, ValueError):
+                    continue
+
+            recommendations = []
+            for idx in range(1, len(qa_batch) + 1):
+                item = by_index.get(idx)
+                if not item:
+                    recommendations.append(unclassified('推薦結果缺少此問答'))
+                    continue
+                try:
+                    intent_id = int(item.get('intent_id'))
+                except (TypeError, ValueError):
+                    intent_id = None
+                if intent_id not in catalog['names']:
+                    recommendations.append(unclassified(f"推薦的意圖不存在: {item.get('intent_id')}"))
+                    continue
+                recommendations.append({
+                    'intent_id': intent_id,
+                    'intent_name': item.get('intent_name') or catalog['names'][intent_id],
+                    'confidence': item.get('confidence', 0.8),
+                    'reasoning': item.get('reasoning', '')
+                })
+            return recommendations
 
         except Exception as e:
             print(f"   ⚠️  意圖推薦失敗: {e}")
-            return {
-                'intent_id': None,
-                'intent_name': '未分類',
-                'confidence': 0.0,
-                'reasoning': f'推薦失敗: {str(e)}'
-            }
+            return [unclassified(f'推薦失敗: {str(e)}') for _ in qa_batch]
@@ -3,9 +3,15 @@ Embedding 工具模組
 統一處理所有 embedding 相關功能，避免代碼重複
 """
 import os
-import httpx
 from typing import Optional, List
 
+try:
+    from .vector_codec import decode_b64_vector, to_pgvector_literal
+    from .http_clients import get_async_client
+except ImportError:
+    from vector_codec import decode_b64_vector, to_pgvector_literal
+    from http_clients import get_async_client
+
 
 class EmbeddingClient:
     """
@@ -45,28 +51,30 @@ class EmbeddingClient:
                 print(f"🔍 [Embedding Client] 呼叫 API: {self.embedding_api_url}")
                 print(f"   文本: {text[:50]}...")
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.embedding_api_url,
-                    json={"text": text}
-                )
-
-                if response.status_code != 200:
-                    if verbose:
-                        print(f"⚠️ Embedding API 錯誤: {response.status_code}")
-                    return None
-
-                data = response.json()
-                embedding = data.get('embedding')
-
-                if embedding:
-                    if verbose:
-                        print(f"✅ 成功獲得向量: 維度 {len(embedding)}")
-                    return embedding
-                else:
-                    if verbose:
-                        print(f"⚠️ 回應中無 embedding 欄位")
-                    return None
+            # 共用連接池（services/http_clients.py），不再每次呼叫重建 TCP 連線
+            client = get_async_client("embedding")
+            response = await client.post(
+                self.embedding_api_url,
+                json={"text": text, "encoding_format": "base64"}
+            )
+
+            if response.status_code != 200:
+                if verbose:
+                    print(f"⚠️ Embedding API 錯誤: {response.status_code}")
+                return None
+
+            data = response.json()
+            # 新版服務回 embedding_b64（float32 二進位），舊版回 embedding（JSON 浮點數）
+            embedding = decode_b64_vector(data.get('embedding_b64')) or data.get('embedding')
+
+            if embedding:
+                if verbose:
+                    print(f"✅ 成功獲得向量: 維度 {len(embedding)}")
+                return embedding
+            else:
+                if verbose:
+                    print(f"⚠️ 回應中無 embedding 欄位")
+                return None
 
         except Exception as e:
             print(f"❌ Embedding API 呼叫失敗: {e}")
@@ -75,34 +83,70 @@ class EmbeddingClient:
                 traceback.print_exc()
             return None
 
+    @property
+    def batch_api_url(self) -> str:
+        """批次端點 URL（由單筆端點推導：.../embeddings → .../embeddings/batch）"""
+        return self.embedding_api_url.rstrip('/') + '/batch'
+
     async def get_embeddings_batch(
         self,
         texts: List[str],
-        verbose: bool = False
+        verbose: bool = False,
+        batch_size: int = 256
     ) -> List[Optional[List[float]]]:
         """
-        批量生成 embeddings（並發執行）
+        批量生成 embeddings
+
+        優先走 embedding-service 的批次端點（每 batch_size 筆一次 HTTP 往返，
+        服務端一次 MGET + 一次上游呼叫）；批次端點不可用（舊版服務 404 等）時
+        降級為逐筆並發呼叫。
 
         Args:
             texts: 文本列表
             verbose: 是否顯示詳細日誌
+            batch_size: 每次批次請求的文本數
 
         Returns:
             embedding 向量列表，每個可能為 None（如果失敗）
         """
         import asyncio
 
-        tasks = [self.get_embedding(text, verbose=False) for text in texts]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if not texts:
+            return []
 
-        # 處理異常
-        embeddings = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                print(f"⚠️ 第 {i+1} 個文本 embedding 生成失敗: {result}")
-                embeddings.append(None)
-            else:
-                embeddings.append(result)
+        embeddings: List[Optional[List[float]]] = []
+        try:
+            client = get_async_client("embedding")
+            for start in range(0, len(texts), batch_size):
+                chunk = texts[start:start + batch_size]
+                response = await client.post(
+                    self.batch_api_url,
+                    json={"texts": chunk, "encoding_format": "base64"},
+                    timeout=120.0
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(f"batch endpoint HTTP {response.status_code}")
+                data = response.json()
+                if data.get('embeddings_b64') is not None:
+                    chunk_embeddings = [decode_b64_vector(e) for e in data['embeddings_b64']]
+                else:
+                    chunk_embeddings = data.get('embeddings') or []
+                if len(chunk_embeddings) != len(chunk):
+                    raise RuntimeError("batch endpoint returned mismatched length")
+                embeddings.extend(chunk_embeddings)
+        except Exception as e:
+            print(f"⚠️ 批次 Embedding API 不可用（{e}），降級為逐筆呼叫")
+            tasks = [self.get_embedding(text, verbose=False) for text in texts]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            # 處理異常
+            embeddings = []
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    print(f"⚠️ 第 {i+1} 個文本 embedding 生成失敗: {result}")
+                    embeddings.append(None)
+                else:
+                    embeddings.append(result)
 
         if verbose:
             success_count = sum(1 for e in embeddings if e is not None)
@@ -123,7 +167,7 @@ class EmbeddingClient:
         if not embedding:
             raise ValueError("Embedding is empty")
 
-        return '[' + ','.join(map(str, embedding)) + ']'
+        return to_pgvector_literal(embedding)
 
 
 # ============================================================
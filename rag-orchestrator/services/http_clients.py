@@ -0,0 +1,387 @@
+"""
+服務間 HTTP 客戶端註冊表
+
+取代各處「每次呼叫 new 一個 httpx.AsyncClient / httpx.Client」的寫法：
+每個呼叫目標（embedding / reranker / jgb / universal_api）共用一個長生命週期的客戶端，
+保留 keep-alive 連線，並各自設定：
+- 連接池上限（max_connections / max_keepalive）
+- timeout（總時限 + connect 時限）
+- 重試預算（transport 層 connect 失敗重試，對非冪等請求也安全）
+- HTTP/2（有安裝 h2 且目標為 https 時啟用）
+
+生命週期：app.py lifespan 啟動時 open()、關閉時 aclose()。
+未經 lifespan 的場景（腳本、測試）首次取用時自動建立。
+非同步客戶端依 event loop 分開保存，避免跨 loop 共用連線。
+
+環境變數（NAME 為目標名稱大寫，例如 EMBEDDING）：
+- HTTP_{NAME}_TIMEOUT / HTTP_{NAME}_CONNECT_TIMEOUT（秒）
+- HTTP_{NAME}_MAX_CONNECTIONS / HTTP_{NAME}_MAX_KEEPALIVE
+- HTTP_{NAME}_RETRIES
+
+監控：每個目標記錄請求數、錯誤數、在途請求數、連接池飽和度與 TCP/TLS 建連耗時；
+可透過 set_instrumentation_hook() 註冊回呼即時接收事件，或由 stats() 取快照。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@dataclass
+class HttpTarget:
+    """單一呼叫目標的連線設定"""
+    name: str
+    base_url: str = ""
+    timeout: float = 30.0
+    connect_timeout: float = 5.0
+    max_connections: int = 20
+    max_keepalive: int = 10
+    retries: int = 1
+    http2: bool = True
+    transport: Optional[Any] = None  # 測試可注入 httpx.MockTransport
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "HttpTarget":
+        """以 defaults 為預設值，允許 HTTP_{NAME}_* 環境變數覆寫"""
+        prefix = f"HTTP_{name.upper()}_"
+        target = cls(name=name, **defaults)
+        target.timeout = float(os.getenv(prefix + "TIMEOUT", target.timeout))
+        target.connect_timeout = float(os.getenv(prefix + "CONNECT_TIMEOUT", target.connect_timeout))
+        target.max_connections = int(os.getenv(prefix + "MAX_CONNECTIONS", target.max_connections))
+        target.max_keepalive = int(os.getenv(prefix + "MAX_KEEPALIVE", target.max_keepalive))
+        target.retries = int(os.getenv(prefix + "RETRIES", target.retries))
+        return target
+
+    @property
+    def use_http2(self) -> bool:
+        return self.http2 and HTTP2_AVAILABLE and self.base_url.startswith("https://")
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+        )
+
+
+@dataclass
+class TargetStats:
+    """單一目標的累計指標"""
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    connects: int = 0
+    connect_ms_total: float = 0.0
+    connect_ms_max: float = 0.0
+    latency_ms_total: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class HttpClientRegistry:
+    """長生命週期 HTTP 客戶端註冊表"""
+
+    def __init__(self):
+        self._targets: Dict[str, HttpTarget] = {}
+        self._stats: Dict[str, TargetStats] = {}
+        # event loop → {name: AsyncClient}
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._lock = threading.RLock()
+        self._hook: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    # ==================== 設定 ====================
+
+    def register(self, target: HttpTarget):
+        """註冊（或覆寫）目標設定；已建立的同名客戶端會在下次取用時重建"""
+        with self._lock:
+            self._targets[target.name] = target
+            self._stats.setdefault(target.name, TargetStats())
+            stale_sync = self._sync_clients.pop(target.name, None)
+            for clients in self._async_clients.values():
+                clients.pop(target.name, None)
+        if stale_sync is not None:
+            stale_sync.close()
+
+    def target(self, name: str) -> HttpTarget:
+        if name not in self._targets:
+            self.register(HttpTarget.from_env(name))
+        return self._targets[name]
+
+    def set_instrumentation_hook(self, hook: Optional[Callable[[Dict[str, Any]], None]]):
+        """
+        註冊監控回呼
+
+        回呼收到 dict：{"target", "event": "connect" | "response" | "error",
+        "connect_ms" / "latency_ms", "in_flight", "saturation"}。
+        回呼例外一律吞掉，不影響請求。
+        """
+        self._hook = hook
+
+    # ==================== 取用客戶端 ====================
+
+    def get_async_client(self, name: str) -> httpx.AsyncClient:
+        """取得目前 event loop 上該目標的 AsyncClient（不存在則建立）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(name)
+            if client is None or client.is_closed:
+                client = self._build_async(self.target(name))
+                clients[name] = client
+            return client
+
+    def get_sync_client(self, name: str) -> httpx.Client:
+        """取得該目標的同步 Client（執行緒安全，可在 asyncio.to_thread 中使用）"""
+        with self._lock:
+            client = self._sync_clients.get(name)
+            if client is None or client.is_closed:
+                client = self._build_sync(self.target(name))
+                self._sync_clients[name] = client
+            return client
+
+    def _build_async(self, t: HttpTarget) -> httpx.AsyncClient:
+        inner = t.transport or httpx.AsyncHTTPTransport(
+            limits=t._limits(), http2=t.use_http2, retries=t.retries
+        )
+        return httpx.AsyncClient(
+            base_url=t.base_url,
+            timeout=t._timeout(),
+            transport=_InstrumentedAsyncTransport(self, t.name, inner),
+        )
+
+    def _build_sync(self, t: HttpTarget) -> httpx.Client:
+        inner = t.transport or httpx.HTTPTransport(
+            limits=t._limits(), http2=t.use_http2, retries=t.retries
+        )
+        return httpx.Client(
+            base_url=t.base_url,
+            timeout=t._timeout(),
+            transport=_InstrumentedTransport(self, t.name, inner),
+        )
+
+    # ==================== 生命週期 ====================
+
+    async def open(self, names=None):
+        """於目前 event loop 預先建立客戶端（lifespan 啟動時呼叫）"""
+        for name in names or list(self._targets):
+            self.get_async_client(name)
+        logger.info(f"HTTP 客戶端已建立: {', '.join(names or self._targets)} (HTTP/2 可用: {HTTP2_AVAILABLE})")
+
+    async def aclose(self):
+        """關閉所有客戶端（lifespan 關閉時呼叫）"""
+        with self._lock:
+            async_clients = [c for clients in self._async_clients.values() for c in clients.values()]
+            self._async_clients = weakref.WeakKeyDictionary()
+            sync_clients = list(self._sync_clients.values())
+            self._sync_clients = {}
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"關閉 HTTP 客戶端失敗: {e}")
+        for client in sync_clients:
+            client.close()
+
+    # ==================== 監控 ====================
+
+    def _emit(self, event: Dict[str, Any]):
+        if self._hook is None:
+            return
+        try:
+            self._hook(event)
+        except Exception:
+            pass
+
+    def _saturation(self, name: str, in_flight: int) -> float:
+        max_conn = self._targets[name].max_connections if name in self._targets else 0
+        return round(in_flight / max_conn, 3) if max_conn else 0.0
+
+    def _tracer(self, name: str):
+        """httpcore trace 回呼：量測新連線的建立耗時（TCP + TLS）"""
+        started: Dict[str, float] = {}
+
+        def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                started["connect"] = time.perf_counter()
+            elif event_name == "connection.connect_tcp.complete":
+                started["tcp_done"] = time.perf_counter()
+            elif event_name == "connection.start_tls.complete":
+                started["tcp_done"] = time.perf_counter()
+            elif event_name.startswith("http11.send_request_headers.started") or \
+                    event_name.startswith("http2.send_request_headers.started"):
+                # 送出請求前結算：只有本次請求真的建了新連線才會有 connect 起點
+                t0 = started.pop("connect", None)
+                t1 = started.pop("tcp_done", None)
+                if t0 is not None and t1 is not None:
+                    self._record_connect(name, (t1 - t0) * 1000)
+
+        async def atrace(event_name: str, info: Dict[str, Any]):
+            trace(event_name, info)
+
+        return trace, atrace
+
+    def _record_connect(self, name: str, connect_ms: float):
+        s = self._stats.setdefault(name, TargetStats())
+        with s.lock:
+            s.connects += 1
+            s.connect_ms_total += connect_ms
+            s.connect_ms_max = max(s.connect_ms_max, connect_ms)
+            in_flight = s.in_flight
+        self._emit({
+            "target": name, "event": "connect", "connect_ms": round(connect_ms, 2),
+            "in_flight": in_flight, "saturation": self._saturation(name, in_flight),
+        })
+
+    def _start(self, name: str, request: httpx.Request, use_async: bool) -> float:
+        trace, atrace = self._tracer(name)
+        request.extensions["trace"] = atrace if use_async else trace
+        s = self._stats.setdefault(name, TargetStats())
+        with s.lock:
+            s.requests += 1
+            s.in_flight += 1
+            s.max_in_flight = max(s.max_in_flight, s.in_flight)
+        return time.perf_counter()
+
+    def _finish(self, name: str, t0: float, status: Optional[int]):
+        """請求結束（status=None 表示未取得回應：連線錯誤 / 逾時）"""
+        latency_ms = (time.perf_counter() - t0) * 1000
+        s = self._stats.setdefault(name, TargetStats())
+        with s.lock:
+            s.in_flight = max(0, s.in_flight - 1)
+            s.latency_ms_total += latency_ms
+            if status is None or status >= 500:
+                s.errors += 1
+            in_flight = s.in_flight
+        self._emit({
+            "target": name, "event": "error" if status is None else "response",
+            "status": status, "latency_ms": round(latency_ms, 2), "in_flight": in_flight,
+            "saturation": self._saturation(name, in_flight),
+        })
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各目標指標快照"""
+        result = {}
+        for name, s in self._stats.items():
+            t = self._targets.get(name)
+            with s.lock:
+                completed = s.requests - s.in_flight
+                result[name] = {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "in_flight": s.in_flight,
+                    "max_in_flight": s.max_in_flight,
+                    "max_connections": t.max_connections if t else None,
+                    "saturation": self._saturation(name, s.in_flight),
+                    "peak_saturation": self._saturation(name, s.max_in_flight),
+                    "connects": s.connects,
+                    "avg_connect_ms": round(s.connect_ms_total / s.connects, 2) if s.connects else 0.0,
+                    "max_connect_ms": round(s.connect_ms_max, 2),
+                    "avg_latency_ms": round(s.latency_ms_total / completed, 2) if completed else 0.0,
+                    "http2": t.use_http2 if t else False,
+                }
+        return result
+
+
+class _InstrumentedAsyncTransport(httpx.AsyncBaseTransport):
+    """包住實際 transport，統計在途請求數 / 延遲 / 錯誤（含連線失敗）"""
+
+    def __init__(self, registry: HttpClientRegistry, name: str, inner: httpx.AsyncBaseTransport):
+        self._registry = registry
+        self._name = name
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = self._registry._start(self._name, request, use_async=True)
+        status = None
+        try:
+            response = await self._inner.handle_async_request(request)
+            status = response.status_code
+            return response
+        finally:
+            self._registry._finish(self._name, t0, status)
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+class _InstrumentedTransport(httpx.BaseTransport):
+    """同步版 _InstrumentedAsyncTransport"""
+
+    def __init__(self, registry: HttpClientRegistry, name: str, inner: httpx.BaseTransport):
+        self._registry = registry
+        self._name = name
+        self._inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = self._registry._start(self._name, request, use_async=False)
+        status = None
+        try:
+            response = self._inner.handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            self._registry._finish(self._name, t0, status)
+
+    def close(self):
+        self._inner.close()
+
+
+# ============================================================
+# 全域註冊表與預設目標
+# ============================================================
+
+_registry: Optional[HttpClientRegistry] = None
+
+
+def _default_targets():
+    return [
+        # embedding：URL 由 EmbeddingClient 自帶（單筆 / 批次端點不同），批次請求於呼叫端另給較長 timeout
+        HttpTarget.from_env("embedding", timeout=30.0, max_connections=50, max_keepalive=20,
+                            retries=2),
+        # reranker：CPU 推論大批次可達 25-30s，沿用 RERANKER_HTTP_TIMEOUT
+        HttpTarget.from_env("reranker", base_url=os.getenv("SEMANTIC_MODEL_API_URL", "http://aichatbot-semantic-model:8000"),
+                            timeout=float(os.getenv("RERANKER_HTTP_TIMEOUT", "60")), max_connections=20,
+                            max_keepalive=10, retries=1),
+        HttpTarget.from_env("jgb", base_url=os.getenv("JGB_API_BASE_URL", "https://www.jgbsmart.com"),
+                            timeout=10.0, max_connections=20, max_keepalive=10, retries=1),
+        # universal_api：外部 API 各自不同 host，timeout 由 api_endpoints 設定逐次覆寫
+        HttpTarget.from_env("universal_api", timeout=60.0, max_connections=50, max_keepalive=20, retries=1),
+    ]
+
+
+def get_http_registry() -> HttpClientRegistry:
+    """獲取全域 HTTP 客戶端註冊表（單例，首次呼叫時註冊預設目標）"""
+    global _registry
+    if _registry is None:
+        registry = HttpClientRegistry()
+        for target in _default_targets():
+            registry.register(target)
+        _registry = registry
+    return _registry
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """便利函數：取得目標的共用 AsyncClient"""
+    return get_http_registry().get_async_client(name)
+
+
+def get_sync_client(name: str) -> httpx.Client:
+    """便利函數：取得目標的共用同步 Client"""
+    return get_http_registry().get_sync_client(name)
@@ -2,6 +2,7 @@
 意圖分類服務
 使用 LLM Function Calling 自動識別使用者問題的意圖類型
 """
+import json
 import os
 import yaml
 import psycopg2
@@ -9,8 +10,137 @@ import psycopg2.extras
 from typing import Dict, List, Optional
 from pathlib import Path
 from datetime import datetime
+import time
 from .db_utils import get_db_config
 from .llm_provider import get_llm_provider, LLMProvider
+from .intent_knn import IntentKnnConfig, IntentKnnIndex, parse_vector
+from .llm_judgment_cache import prompt_version
+
+
+# LLM 分類 system prompt（{intents} 由意圖清單填入；意圖重載時才重新產生）
+_CLASSIFY_SYSTEM_PROMPT = """你是一個專業的意圖分類助手，專門分類 JGB 包租代管客服系統的使用者問題。
+
+可用的意圖類型：
+{intents}
+
+**分類策略：**
+1. 識別主要意圖（primary_intent）：問題的核心目的
+   - 返回意圖名稱和信心度（0-1）
+   - 信心度表示：你有多確定這是正確的分類
+
+2. 識別次要意圖（secondary_intents）：問題可能涉及的其他相關類別
+   - 例如「租金如何計算？」可能同時涉及「合約規定」和「帳務查詢」
+   - 例如「退租押金如何退還？」可能同時涉及「退租流程」和「帳務查詢」
+   - **每個次要意圖都需要獨立的信心度評分**
+   - 次要意圖的信心度通常應低於主要意圖
+
+3. 信心度評分標準：
+   - 0.9-1.0：非常確定，問題明確屬於此意圖
+   - 0.7-0.9：較為確定，問題很可能屬於此意圖
+   - 0.5-0.7：不太確定，問題可能屬於此意圖
+   - < 0.5：不確定，可能不屬於此意圖
+
+4. 如果問題明確只屬於一個類別，可不填 secondary_intents
+
+5. 如果無法確定或主要意圖信心度低於 0.7，primary_intent.name 返回 "unclear"
+
+**特殊處理規則（重要）：**
+6. 對於列表式查詢（如「A、B、C」或「A B C」格式）：
+   - 仔細分析每個列表項的業務領域
+   - 如果列表項跨越多個意圖範疇，應識別為多意圖
+   - 寧可多返回一個次要意圖（信心度 0.45-0.65），也不要遺漏潛在相關意圖
+
+7. 關鍵詞意圖對應參考（優先考慮多意圖）：
+   - 「租金」「押金」「繳費」「付款」「金額」 → 可能涉及「帳務查詢」
+   - 「租約」「合約」「租期」「條款」「規定」 → 可能涉及「合約規定」
+   - 「退租」「解約」「搬遷」「退還」 → 可能涉及「退租流程」
+   - 當問題包含 2 個以上上述關鍵詞類別時，通常應返回多個意圖
+
+8. 示例分析：
+   - 「租約條款 租金、押金、租期」應識別為：
+     主意圖: 合約規定 (0.85) - 因為「條款」「租約」
+     次要意圖: 帳務查詢 (0.55) - 因為「租金」「押金」涉及金額查詢
+
+   - 「如何查詢租金和押金？」應識別為：
+     主意圖: 帳務查詢 (0.85) - 因為動詞「查詢」
+     次要意圖: 合約規定 (0.50) - 因為可能需要了解計算規則
+
+請仔細分析問題的語義，為每個意圖提供精確的信心度評分。
+"""
+
+
+def _build_classify_functions(intent_names: List[str]) -> List[Dict]:
+    """Function Calling 定義（支援多 Intent + 獨立信心度）"""
+    return [
+        {
+            "name": "classify_intent",
+            "description": "分類使用者問題的意圖類型，可返回多個相關意圖，每個意圖都有獨立的信心度評分",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "primary_intent": {
+                        "type": "object",
+                        "description": "主要意圖及其信心度",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": f"主要意圖名稱，選項: {', '.join(intent_names)}",
+                                "enum": intent_names + ["unclear"]
+                            },
+                            "confidence": {
+                                "type": "number",
+                                "description": "主要意圖的信心度分數 (0-1)，表示你有多確定這是正確的分類",
+                                "minimum": 0,
+                                "maximum": 1
+                            }
+                        },
+                        "required": ["name", "confidence"]
+                    },
+                    "secondary_intents": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {
+                                    "type": "string",
+                                    "enum": intent_names
+                                },
+                                "confidence": {
+                                    "type": "number",
+                                    "description": "此次要意圖的信心度 (0-1)，通常應低於主要意圖",
+                                    "minimum": 0,
+                                    "maximum": 1
+                                }
+                            },
+                            "required": ["name", "confidence"]
+                        },
+                        "description": "次要相關意圖及其信心度（如果問題涉及多個類別）",
+                        "maxItems": 2
+                    },
+                    "keywords": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "從問題中提取的關鍵字"
+                    },
+                    "reasoning": {
+                        "type": "string",
+                        "description": "分類理由"
+                    }
+                },
+                "required": ["primary_intent", "keywords"]
+            }
+        }
+    ]
+
+
+def _format_intents_for_prompt(intents: List[Dict]) -> str:
+    """格式化意圖列表為 prompt"""
+    lines = []
+    for intent in intents:
+        keywords_str = ", ".join(intent['keywords'][:5])  # 只顯示前 5 個關鍵字
+        lines.append(f"- {intent['name']} ({intent['type']}): {intent['description']}")
+        lines.append(f"  關鍵字: {keywords_str}")
+    return "\n".join(lines)
 
 
 class IntentClassifier:
@@ -34,6 +164,13 @@ class IntentClassifier:
         self.use_database = use_database
         self.last_reload = None
 
+        # 意圖名稱 → ID（reload 時刷新，分類時不再逐筆查 DB）
+        self.intent_ids: Dict[str, int] = {}
+        # kNN 快速分類層（意圖 / 範例 embedding 矩陣，reload 時整個替換）
+        self.knn_config = IntentKnnConfig.from_env()
+        self.knn_index = IntentKnnIndex(self.knn_config)
+        self._stats = {"knn": 0, "llm": 0, "knn_latency_ms": 0.0, "llm_latency_ms": 0.0}
+
         # YAML 配置路徑（fallback）
         if config_path is None:
             config_path = Path(__file__).parent.parent / "config" / "intents.yaml"
@@ -86,6 +223,31 @@ class IntentClassifier:
         if os.getenv("INTENT_CLASSIFIER_MAX_TOKENS"):
             self.classifier_config["max_tokens"] = int(os.getenv("INTENT_CLASSIFIER_MAX_TOKENS"))
 
+    @property
+    def intents(self) -> List[Dict]:
+        return self._intents
+
+    @intents.setter
+    def intents(self, intents: List[Dict]):
+        """替換意圖清單（DB / YAML 載入、reload）並重新編譯 LLM 分類的 schema 與 prompt"""
+        self._intents = intents
+        self._compile_llm_prompt()
+
+    def _compile_llm_prompt(self):
+        """
+        預先產生 LLM 分類的 function schema 與 system prompt（每次意圖載入一次，分類時直接重用）
+
+        意圖依名稱排序，相同意圖集合永遠產生逐位元組相同的 tools + system 前綴，
+        讓 provider 的 prompt prefix caching 命中；prompt_version 為其摘要（意圖異動即變更）。
+        """
+        ordered = sorted(self._intents, key=lambda i: i['name'])
+        self._intent_by_name = {i['name']: i for i in self._intents}
+        self._llm_functions = _build_classify_functions([i['name'] for i in ordered])
+        self._llm_system_prompt = _CLASSIFY_SYSTEM_PROMPT.format(intents=_format_intents_for_prompt(ordered))
+        self.prompt_version = prompt_version(
+            json.dumps(self._llm_functions, ensure_ascii=False, sort_keys=True) + self._llm_system_prompt
+        )
+
     def _load_from_yaml(self):
         """從 YAML 載入意圖配置（fallback）"""
         with open(self.config_path, 'r', encoding='utf-8') as f:
@@ -107,6 +269,7 @@ class IntentClassifier:
 
             cursor.execute("""
                 SELECT
+                    id,
                     name,
                     type,
                     description,
@@ -141,12 +304,61 @@ class IntentClassifier:
                 intents.append(intent)
 
             cursor.close()
+            self.intent_ids = {row['name']: row['id'] for row in rows}
+            self.knn_index = self._load_knn_index(conn)
             self.last_reload = datetime.now()
             return intents
 
         finally:
             conn.close()
 
+    def _load_knn_index(self, conn) -> IntentKnnIndex:
+        """
+        載入 kNN 快速分類用的向量：意圖描述 embedding + 各意圖的範例知識 embedding
+
+        範例取自 knowledge_intent_mapping（primary 優先），每個意圖最多
+        exemplars_per_intent 筆；載入失敗時回傳空索引（分類全走 LLM）。
+        """
+        if not self.knn_config.enabled:
+            return IntentKnnIndex(self.knn_config)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT name, embedding::text
+                FROM intents
+                WHERE is_enabled = true AND embedding IS NOT NULL
+                ORDER BY name
+            """)
+            intent_vectors = [(name, parse_vector(vec)) for name, vec in cursor.fetchall()]
+
+            cursor.execute("""
+                SELECT name, embedding
+                FROM (
+                    SELECT
+                        i.name,
+                        kb.embedding::text AS embedding,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY kim.intent_id
+                            ORDER BY (kim.intent_type = 'primary') DESC, kim.confidence DESC NULLS LAST, kb.id
+                        ) AS rn
+                    FROM knowledge_intent_mapping kim
+                    JOIN intents i ON i.id = kim.intent_id AND i.is_enabled = true
+                    JOIN knowledge_base kb ON kb.id = kim.knowledge_id
+                    WHERE kb.embedding IS NOT NULL AND kb.is_active = true
+                ) ranked
+                WHERE rn <= %s
+            """, (self.knn_config.exemplars_per_intent,))
+            exemplar_vectors = [(name, parse_vector(vec)) for name, vec in cursor.fetchall()]
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ 無法載入意圖 kNN 向量（分類將全走 LLM）: {e}")
+            return IntentKnnIndex(self.knn_config)
+
+        index = IntentKnnIndex.build(intent_vectors, exemplar_vectors, self.knn_config)
+        print(f"✅ 意圖 kNN 索引: {index.intent_vectors} 個意圖向量 + {index.exemplar_vectors} 個範例向量")
+        return index
+
     def reload_intents(self):
         """重新載入意圖配置（支援動態更新）"""
         if self.use_database:
@@ -187,147 +399,136 @@ class IntentClassifier:
             # 忽略追蹤錯誤，不影響主流程
             pass
 
-    def classify(self, question: str) -> Dict:
+    @property
+    def knn_ready(self) -> bool:
+        """kNN 快速層是否可用（呼叫端據此決定是否先取得 query embedding）"""
+        return self.knn_index.ready
+
+    def classify(self, question: str, query_embedding: Optional[List[float]] = None) -> Dict:
         """
         分類使用者問題的意圖
 
+        有 query_embedding 時先走 kNN 快速層（意圖 / 範例向量矩陣），
+        相似度與領先差距都足夠時直接回傳；模糊時才呼叫 LLM function calling。
+
         Args:
             question: 使用者問題
+            query_embedding: 已算好的問題 embedding（可選；None 則直接走 LLM）
 
         Returns:
-            分類結果，包含:
-            - intent_name: 意圖名稱
-            - intent_type: 意圖類型 (knowledge/data_query/action/hybrid)
-            - confidence: 信心度 (0-1)
-            - sub_category: 子類別
-            - keywords: 提取的關鍵字
-            - requires_api: 是否需要呼叫 API
-            - api_endpoint: API 端點 (如果需要)
-            - api_action: API 動作 (如果需要)
+            與 LLM 分類相同格式的結果，另含 classifier: "knn" / "llm"
         """
-        # 構建 Function Calling 定義（支援多 Intent + 獨立信心度）
-        functions = [
-            {
-                "name": "classify_intent",
-                "description": "分類使用者問題的意圖類型，可返回多個相關意圖，每個意圖都有獨立的信心度評分",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "primary_intent": {
-                            "type": "object",
-                            "description": "主要意圖及其信心度",
-                            "properties": {
-                                "name": {
-                                    "type": "string",
-                                    "description": f"主要意圖名稱，選項: {', '.join([i['name'] for i in self.intents])}",
-                                    "enum": [i['name'] for i in self.intents] + ["unclear"]
-                                },
-                                "confidence": {
-                                    "type": "number",
-                                    "description": "主要意圖的信心度分數 (0-1)，表示你有多確定這是正確的分類",
-                                    "minimum": 0,
-                                    "maximum": 1
-                                }
-                            },
-                            "required": ["name", "confidence"]
-                        },
-                        "secondary_intents": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {
-                                        "type": "string",
-                                        "enum": [i['name'] for i in self.intents]
-                                    },
-                                    "confidence": {
-                                        "type": "number",
-                                        "description": "此次要意圖的信心度 (0-1)，通常應低於主要意圖",
-                                        "minimum": 0,
-                                        "maximum": 1
-                                    }
-                                },
-                                "required": ["name", "confidence"]
-                            },
-                            "description": "次要相關意圖及其信心度（如果問題涉及多個類別）",
-                            "maxItems": 2
-                        },
-                        "keywords": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "從問題中提取的關鍵字"
-                        },
-                        "reasoning": {
-                            "type": "string",
-                            "description": "分類理由"
-                        }
-                    },
-                    "required": ["primary_intent", "keywords"]
-                }
-            }
-        ]
-
-        # 構建系統提示
-        system_prompt = f"""你是一個專業的意圖分類助手，專門分類 JGB 包租代管客服系統的使用者問題。
-
-可用的意圖類型：
-{self._format_intents_for_prompt()}
-
-**分類策略：**
-1. 識別主要意圖（primary_intent）：問題的核心目的
-   - 返回意圖名稱和信心度（0-1）
-   - 信心度表示：你有多確定這是正確的分類
-
-2. 識別次要意圖（secondary_intents）：問題可能涉及的其他相關類別
-   - 例如「租金如何計算？」可能同時涉及「合約規定」和「帳務查詢」
-   - 例如「退租押金如何退還？」可能同時涉及「退租流程」和「帳務查詢」
-   - **每個次要意圖都需要獨立的信心度評分**
-   - 次要意圖的信心度通常應低於主要意圖
+        start = time.perf_counter()
+        if query_embedding is not None:
+            result = self.classify_local(question, query_embedding)
+            if result is not None:
+                self._record("knn", start)
+                return result
+
+        result = self._classify_with_llm(question)
+        result["classifier"] = "llm"
+        self._record("llm", start)
+        return result
+
+    def classify_local(self, question: str, query_embedding: List[float]) -> Optional[Dict]:
+        """
+        kNN 快速分類；模糊（top1 不夠高或與 top2 差距過小）時回傳 None
 
-3. 信心度評分標準：
-   - 0.9-1.0：非常確定，問題明確屬於此意圖
-   - 0.7-0.9：較為確定，問題很可能屬於此意圖
-   - 0.5-0.7：不太確定，問題可能屬於此意圖
-   - < 0.5：不確定，可能不屬於此意圖
+        Args:
+            question: 使用者問題（用於比對意圖關鍵字）
+            query_embedding: 問題 embedding
+        """
+        decision = self.knn_index.decide(query_embedding)
+        if decision is None:
+            return None
+        intent_config = self.get_intent_config(decision["intent_name"])
+        if not intent_config:
+            return None
+
+        primary_name = decision["intent_name"]
+        secondary_names = [name for name, _ in decision["secondary"]]
+        all_intent_names = [primary_name] + secondary_names
+        all_intents_with_confidence = [
+            {"name": primary_name, "confidence": decision["score"], "type": "primary"}
+        ] + [
+            {"name": name, "confidence": score, "type": "secondary"}
+            for name, score in decision["secondary"]
+        ]
 
-4. 如果問題明確只屬於一個類別，可不填 secondary_intents
+        classification = {
+            "intent_name": primary_name,
+            "intent_type": intent_config['type'],
+            "confidence": decision["score"],
+            "sub_category": intent_config.get('description', ''),
+            "keywords": [k for k in intent_config.get('keywords', []) if k and k in question],
+            "reasoning": f"embedding kNN（相似度 {decision['score']:.3f}，領先 {decision['margin']:.3f}）",
+            "requires_api": intent_config.get('api_required', False),
+            "all_intents": all_intent_names,
+            "secondary_intents": secondary_names,
+            "intent_ids": self._resolve_intent_ids(all_intent_names),
+            "all_intents_with_confidence": all_intents_with_confidence,
+            "classifier": "knn",
+        }
+        if classification['requires_api']:
+            classification['api_endpoint'] = intent_config.get('api_endpoint')
+            classification['api_action'] = intent_config.get('api_action')
+            if intent_config['type'] == 'hybrid':
+                classification['requires_both'] = intent_config.get('requires_both', {})
 
-5. 如果無法確定或主要意圖信心度低於 0.7，primary_intent.name 返回 "unclear"
+        if self.use_database:
+            self.increment_usage_count(primary_name)
+        return classification
 
-**特殊處理規則（重要）：**
-6. 對於列表式查詢（如「A、B、C」或「A B C」格式）：
-   - 仔細分析每個列表項的業務領域
-   - 如果列表項跨越多個意圖範疇，應識別為多意圖
-   - 寧可多返回一個次要意圖（信心度 0.45-0.65），也不要遺漏潛在相關意圖
+    def _resolve_intent_ids(self, intent_names: List[str]) -> List[int]:
+        """意圖名稱轉 ID（保持順序；找不到的略過）"""
+        return [self.intent_ids[name] for name in intent_names if name in self.intent_ids]
 
-7. 關鍵詞意圖對應參考（優先考慮多意圖）：
-   - 「租金」「押金」「繳費」「付款」「金額」 → 可能涉及「帳務查詢」
-   - 「租約」「合約」「租期」「條款」「規定」 → 可能涉及「合約規定」
-   - 「退租」「解約」「搬遷」「退還」 → 可能涉及「退租流程」
-   - 當問題包含 2 個以上上述關鍵詞類別時，通常應返回多個意圖
+    def _record(self, tier: str, start: float):
+        self._stats[tier] += 1
+        self._stats[f"{tier}_latency_ms"] += (time.perf_counter() - start) * 1000
 
-8. 示例分析：
-   - 「租約條款 租金、押金、租期」應識別為：
-     主意圖: 合約規定 (0.85) - 因為「條款」「租約」
-     次要意圖: 帳務查詢 (0.55) - 因為「租金」「押金」涉及金額查詢
+    def get_classification_stats(self) -> Dict:
+        """分類統計：kNN 直接回傳 / 升級 LLM 的次數與平均延遲"""
+        total = self._stats["knn"] + self._stats["llm"]
+        return {
+            "total": total,
+            "knn": self._stats["knn"],
+            "llm": self._stats["llm"],
+            "knn_rate": round(self._stats["knn"] / total, 4) if total else 0.0,
+            "knn_avg_ms": round(self._stats["knn_latency_ms"] / self._stats["knn"], 2) if self._stats["knn"] else 0.0,
+            "llm_avg_ms": round(self._stats["llm_latency_ms"] / self._stats["llm"], 2) if self._stats["llm"] else 0.0,
+            "prompt_version": getattr(self, "prompt_version", None),
+            "index": self.knn_index.get_stats(),
+        }
 
-   - 「如何查詢租金和押金？」應識別為：
-     主意圖: 帳務查詢 (0.85) - 因為動詞「查詢」
-     次要意圖: 合約規定 (0.50) - 因為可能需要了解計算規則
+    def _classify_with_llm(self, question: str) -> Dict:
+        """
+        以 LLM function calling 分類使用者問題的意圖
 
-請仔細分析問題的語義，為每個意圖提供精確的信心度評分。
-"""
+        Args:
+            question: 使用者問題
 
+        Returns:
+            分類結果，包含:
+            - intent_name: 意圖名稱
+            - intent_type: 意圖類型 (knowledge/data_query/action/hybrid)
+            - confidence: 信心度 (0-1)
+            - sub_category: 子類別
+            - keywords: 提取的關鍵字
+            - requires_api: 是否需要呼叫 API
+            - api_endpoint: API 端點 (如果需要)
+            - api_action: API 動作 (如果需要)
+        """
         # 呼叫 LLM API
         llm_result = self.llm_provider.chat_completion(
             model=self.classifier_config['model'],
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": self._llm_system_prompt},
                 {"role": "user", "content": question}
             ],
             temperature=self.classifier_config['temperature'],
             max_tokens=self.classifier_config['max_tokens'],
-            functions=functions,
+            functions=self._llm_functions,
             function_call={"name": "classify_intent"}
         )
 
@@ -337,7 +538,6 @@ class IntentClassifier:
         # 解析結果
         function_call = response.choices[0].message.function_call
         if function_call and function_call.name == "classify_intent":
-            import json
             result = json.loads(function_call.arguments)
 
             # 解析主要意圖（新格式：對象包含 name 和 confidence）
@@ -368,7 +568,7 @@ class IntentClassifier:
                 }
 
             # 查找主要意圖配置
-            intent_config = next((i for i in self.intents if i['name'] == primary_intent_name), None)
+            intent_config = self._intent_by_name.get(primary_intent_name)
 
             if not intent_config:
                 print(f"⚠️ Intent config not found: {primary_intent_name}")
@@ -396,7 +596,7 @@ class IntentClassifier:
             # 【方案 B 改進 2+3】：過濾次要意圖 + 嘗試降級機制
             valid_secondary_intents = []
             for sec_intent in secondary_intents_objs:
-                sec_config = next((i for i in self.intents if i['name'] == sec_intent['name']), None)
+                sec_config = self._intent_by_name.get(sec_intent['name'])
                 if not sec_config:
                     continue
 
@@ -466,7 +666,6 @@ class IntentClassifier:
             # 收集所有相關意圖（主要 + 已過濾的次要）
             valid_secondary_names = [s['name'] for s in valid_secondary_intents]
             all_intent_names = [primary_intent_name] + valid_secondary_names
-            all_intent_ids = []
 
             # 構建完整的意圖信心度列表（包含主意圖和副意圖）
             all_intents_with_confidence = [
@@ -485,26 +684,8 @@ class IntentClassifier:
                     "type": "secondary"
                 })
 
-            # 從資料庫查詢所有意圖的 ID（保持順序）
-            if self.use_database:
-                try:
-                    # 使用共用的資料庫配置
-                    db_config = get_db_config()
-                    conn = psycopg2.connect(**db_config)
-                    cursor = conn.cursor()
-                    # 逐個查詢以保持順序
-                    for intent_name in all_intent_names:
-                        cursor.execute("""
-                            SELECT id FROM intents
-                            WHERE name = %s AND is_enabled = true
-                        """, (intent_name,))
-                        db_result = cursor.fetchone()
-                        if db_result:
-                            all_intent_ids.append(db_result[0])
-                    cursor.close()
-                    conn.close()
-                except Exception as e:
-                    print(f"⚠️ 無法查詢 intent IDs: {e}")
+            # 意圖 ID 由 reload 時建立的記憶體對照表取得（保持順序）
+            all_intent_ids = self._resolve_intent_ids(all_intent_names)
 
             # 構建完整結果
             classification = {
@@ -548,15 +729,6 @@ class IntentClassifier:
             "requires_api": False
         }
 
-    def _format_intents_for_prompt(self) -> str:
-        """格式化意圖列表為 prompt"""
-        lines = []
-        for intent in self.intents:
-            keywords_str = ", ".join(intent['keywords'][:5])  # 只顯示前 5 個關鍵字
-            lines.append(f"- {intent['name']} ({intent['type']}): {intent['description']}")
-            lines.append(f"  關鍵字: {keywords_str}")
-        return "\n".join(lines)
-
     def get_intent_config(self, intent_name: str) -> Optional[Dict]:
         """
         取得特定意圖的配置
@@ -567,7 +739,7 @@ class IntentClassifier:
         Returns:
             意圖配置字典，如果找不到則返回 None
         """
-        return next((i for i in self.intents if i['name'] == intent_name), None)
+        return self._intent_by_name.get(intent_name)
 
     def list_intents(self) -> List[Dict]:
         """
@@ -0,0 +1,175 @@
+"""
+意圖 kNN 快速分類（IntentClassifier 的本地層）
+
+背景：IntentClassifier.classify 每輪都同步呼叫 LLM function calling（~1.5s），
+但多數問題的意圖其實很明確。intents 表已有 embedding（意圖描述向量），
+已分類的知識（knowledge_intent_mapping）也帶有 embedding，可當作各意圖的範例。
+
+做法：
+- reload 時把「意圖描述向量 + 範例向量」堆成一個正規化的 float32 矩陣，每列標記所屬意圖
+- 分類時以一次矩陣乘法算出 query 與所有向量的餘弦相似度，
+  各意圖取最大值（1-NN per intent）
+- top1 ≥ min_score 且 top1 - top2 ≥ min_margin → 直接回傳；否則視為模糊，交給 LLM
+
+query 向量直接沿用呼叫端已算好的 embedding，不額外呼叫 embedding API。
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IntentKnnConfig:
+    """kNN 快速分類參數"""
+
+    enabled: bool = True
+    min_score: float = 0.80           # top1 意圖相似度下限
+    min_margin: float = 0.05          # top1 與 top2 意圖的相似度差距下限（低於即視為模糊）
+    exemplars_per_intent: int = 50    # 每個意圖最多載入的範例知識數
+    secondary_max: int = 2            # 次要意圖上限（與 LLM schema 的 maxItems 一致）
+
+    @classmethod
+    def from_env(cls) -> "IntentKnnConfig":
+        return cls(
+            enabled=os.getenv("INTENT_KNN_ENABLED", "true").lower() == "true",
+            min_score=float(os.getenv("INTENT_KNN_MIN_SCORE", "0.80")),
+            min_margin=float(os.getenv("INTENT_KNN_MIN_MARGIN", "0.05")),
+            exemplars_per_intent=int(os.getenv("INTENT_KNN_EXEMPLARS_PER_INTENT", "50")),
+        )
+
+
+def parse_vector(value) -> Optional[List[float]]:
+    """pgvector 欄位（字串 '[0.1,0.2,...]'、list 或 ndarray）轉為 list；無值回 None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        body = value.strip().strip('[]')
+        return [float(x) for x in body.split(',')] if body else None
+    return [float(x) for x in value]
+
+
+class IntentKnnIndex:
+    """意圖向量矩陣（不可變快照；reload 時整個替換）"""
+
+    def __init__(self, config: Optional[IntentKnnConfig] = None):
+        self.config = config or IntentKnnConfig.from_env()
+        self.intent_names: List[str] = []
+        self.matrix: Optional[np.ndarray] = None   # (N, D) 已正規化
+        self.labels: Optional[np.ndarray] = None   # (N,) 每列所屬意圖的索引
+        self.intent_vectors = 0
+        self.exemplar_vectors = 0
+
+    @classmethod
+    def build(
+        cls,
+        intent_vectors: Iterable[Tuple[str, Sequence[float]]],
+        exemplar_vectors: Iterable[Tuple[str, Sequence[float]]] = (),
+        config: Optional[IntentKnnConfig] = None,
+    ) -> "IntentKnnIndex":
+        """
+        建立索引
+
+        Args:
+            intent_vectors: (意圖名稱, 意圖描述 embedding)
+            exemplar_vectors: (意圖名稱, 範例 embedding)；名稱不在 intent_vectors 中者忽略
+            config: 參數
+        """
+        index = cls(config)
+        names: Dict[str, int] = {}
+        rows, labels = [], []
+
+        def _add(name, vector):
+            if vector is None or len(vector) == 0:
+                return False
+            if rows and len(vector) != len(rows[0]):
+                return False
+            rows.append(vector)
+            labels.append(names[name])
+            return True
+
+        for name, vector in intent_vectors:
+            names.setdefault(name, len(names))
+            index.intent_vectors += _add(name, vector)
+        for name, vector in exemplar_vectors:
+            if name in names:
+                index.exemplar_vectors += _add(name, vector)
+
+        index.intent_names = list(names)
+        if rows:
+            matrix = np.asarray(rows, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            index.matrix = matrix / norms
+            index.labels = np.asarray(labels, dtype=np.int64)
+        return index
+
+    @property
+    def ready(self) -> bool:
+        return self.config.enabled and self.matrix is not None and len(self.intent_names) >= 2
+
+    def score(self, query_embedding: Sequence[float]) -> List[Tuple[str, float]]:
+        """
+        計算 query 對每個意圖的相似度（該意圖所有向量中的最大值）
+
+        Returns:
+            [(意圖名稱, 相似度)]，依相似度由高到低；維度不符或索引為空時回 []
+        """
+        if self.matrix is None or query_embedding is None:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.ndim != 1 or query.shape[0] != self.matrix.shape[1]:
+            return []
+        norm = float(np.linalg.norm(query))
+        if norm == 0:
+            return []
+
+        sims = self.matrix @ (query / norm)
+        per_intent = np.full(len(self.intent_names), -1.0, dtype=np.float32)
+        np.maximum.at(per_intent, self.labels, sims)
+
+        order = np.argsort(-per_intent)
+        return [(self.intent_names[i], float(per_intent[i])) for i in order if per_intent[i] > -1.0]
+
+    def decide(self, query_embedding: Sequence[float]) -> Optional[Dict]:
+        """
+        判斷是否能直接給出意圖
+
+        Returns:
+            {"intent_name", "score", "margin", "secondary": [(name, score)]}；模糊或無法判斷時回 None
+        """
+        if not self.ready:
+            return None
+        ranked = self.score(query_embedding)
+        if not ranked:
+            return None
+        top_name, top_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        margin = top_score - runner_up
+        if top_score < self.config.min_score or margin < self.config.min_margin:
+            return None
+        secondary = [
+            (name, score) for name, score in ranked[1:1 + self.config.secondary_max]
+            if score >= self.config.min_score
+        ]
+        return {
+            "intent_name": top_name,
+            "score": top_score,
+            "margin": margin,
+            "secondary": secondary,
+        }
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.config.enabled,
+            "ready": self.ready,
+            "intents": len(self.intent_names),
+            "intent_vectors": self.intent_vectors,
+            "exemplar_vectors": self.exemplar_vectors,
+            "min_score": self.config.min_score,
+            "min_margin": self.config.min_margin,
+        }
@@ -0,0 +1,136 @@
+"""
+批次作業的串流處理管線（逐筆流經各階段）
+
+背景：知識匯入原本一個階段對全部知識跑完才進下一階段，且每階段逐筆 await；
+數千筆時 LLM / embedding / DB 呼叫全部串行。
+
+做法：
+- 每個階段一個有界 asyncio.Queue + N 個 worker；前一階段處理完的項目立即進下一階段
+  （佇列滿時上游自然等待，記憶體與在途呼叫數有上限）
+- 一般階段 handler(item) → item 或 None（None 表示丟棄，如語意去重判定重複）
+- 批次階段（batch_size > 1）handler(items) → 同長度 list；湊滿 batch_size 或等待
+  batch_wait 秒即送出（embedding 一次送多筆）
+- 任一階段拋例外：取消所有 worker 並把例外拋給呼叫端（與原本逐筆 raise 的語意一致）
+- 每筆項目完成（到達終點或被丟棄）呼叫 on_progress(done, total)
+- 回傳依原始順序排列的存活項目
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional
+
+_DONE = object()
+
+
+@dataclass
+class PipelineStage:
+    """管線階段"""
+    name: str
+    handler: Callable[..., Awaitable[Any]]
+    concurrency: int = 1
+    batch_size: int = 1
+    batch_wait: float = 0.05
+
+
+async def run_item_pipeline(
+    items: List[Any],
+    stages: List[PipelineStage],
+    queue_size: int = 64,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+) -> List[Any]:
+    """
+    讓 items 逐筆流經 stages
+
+    Args:
+        items: 輸入項目
+        stages: 階段列表（依序）
+        queue_size: 每個階段輸入佇列上限
+        on_progress: async on_progress(done, total)，每筆項目完成時呼叫
+
+    Returns:
+        通過所有階段的項目（依原始順序）
+    """
+    total = len(items)
+    if total == 0 or not stages:
+        return list(items)
+
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    results: List[tuple] = []
+    done = 0
+
+    async def _finish(count: int):
+        nonlocal done
+        done += count
+        if on_progress:
+            await on_progress(done, total)
+
+    async def _forward(stage_idx: int, pairs: List[tuple]):
+        is_last = stage_idx + 1 == len(stages)
+        finished = 0
+        for pos, item in pairs:
+            if item is None or is_last:
+                finished += 1
+            if item is None:
+                continue
+            if is_last:
+                results.append((pos, item))
+            else:
+                await queues[stage_idx + 1].put((pos, item))
+        if finished:
+            await _finish(finished)
+
+    async def _worker(stage_idx: int):
+        stage = stages[stage_idx]
+        queue = queues[stage_idx]
+        while True:
+            entry = await queue.get()
+            if entry is _DONE:
+                return
+            if stage.batch_size <= 1:
+                pos, item = entry
+                await _forward(stage_idx, [(pos, await stage.handler(item))])
+                continue
+
+            batch = [entry]
+            closing = False
+            while len(batch) < stage.batch_size:
+                try:
+                    nxt = await asyncio.wait_for(queue.get(), timeout=stage.batch_wait)
+                except asyncio.TimeoutError:
+                    break
+                if nxt is _DONE:
+                    closing = True
+                    break
+                batch.append(nxt)
+            outputs = await stage.handler([item for _, item in batch])
+            await _forward(stage_idx, list(zip((pos for pos, _ in batch), outputs)))
+            if closing:
+                return
+
+    async def _run_stage(stage_idx: int):
+        workers = [asyncio.create_task(_worker(stage_idx)) for _ in range(max(1, stages[stage_idx].concurrency))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+        if stage_idx + 1 < len(stages):
+            for _ in range(max(1, stages[stage_idx + 1].concurrency)):
+                await queues[stage_idx + 1].put(_DONE)
+
+    async def _feed():
+        for pos, item in enumerate(items):
+            await queues[0].put((pos, item))
+        for _ in range(max(1, stages[0].concurrency)):
+            await queues[0].put(_DONE)
+
+    tasks = [asyncio.create_task(_feed())] + [asyncio.create_task(_run_stage(i)) for i in range(len(stages))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    results.sort(key=lambda pair: pair[0])
+    return [item for _, item in results]
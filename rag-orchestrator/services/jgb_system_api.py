@@ -17,6 +17,8 @@ from typing import Any, Optional
 
 import httpx
 
+from .http_clients import get_async_client
+
 logger = logging.getLogger(__name__)
 
 # 降級回答訊息
@@ -74,14 +76,15 @@ class JGBSystemAPI:
         """Send HTTP request to JGB API with error/timeout handling."""
         url = f"{self.api_base_url}{path}"
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.request(
-                    method, url,
-                    params=params, json=data,
-                    headers=self._headers(),
-                )
-                response.raise_for_status()
-                return response.json()
+            # 共用連接池（services/http_clients.py，jgb 目標），避免每次查詢重新 TLS 握手
+            response = await get_async_client("jgb").request(
+                method, url,
+                params=params, json=data,
+                headers=self._headers(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            return response.json()
         except httpx.TimeoutException as e:
             logger.error(f"JGB API {method} 逾時: {url} - {e}")
             return self._fallback_response(f"API 逾時: {str(e)}")
@@ -0,0 +1,244 @@
+"""
+知識庫關鍵字倒排索引（行程內）
+
+取代 VendorKnowledgeRetrieverV2._keyword_search 的「撈 1000 筆 + 每筆 keyword 重跑 jieba」：
+- 啟動時載入所有啟用中、有 keywords 的知識，keyword 預先分詞
+- 兩張倒排表：
+    keyword 原字串 → knowledge ids（對應 SQL 快速路徑 keywords && query_tokens）
+    keyword 分詞 token → knowledge ids（對應 fallback 的 jieba 交集比對）
+- 每個 worker 各持一份，只存 id 與 keyword（分詞結果由 tokenize_keyword 快取共用），
+  不存答案等整列內容；檢索器以候選 id 走主鍵查詢取回資料列並套用業者 / 業態 / target_user 過濾，
+  取代 fallback 撈 1000 筆全表掃描
+
+更新方式：
+- knowledge-admin 編輯 / 刪除知識時經 /api/v1/cache/invalidate 通知 → refresh_knowledge(ids) 即時重載單筆
+- 背景同步（app lifespan）：每 KEYWORD_INDEX_SYNC_INTERVAL 秒依 updated_at 增量重載，
+  啟用筆數對不上（硬刪除等）時整份重建，涵蓋其他寫入路徑（匯入、知識完善迴圈等）
+
+索引未載入前（啟動中 / 停用）檢索器自動走原本的 SQL 路徑。
+"""
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+import jieba
+import psycopg2.extras
+
+try:
+    from .db_utils import get_pooled_connection, run_in_db_executor
+except ImportError:
+    from db_utils import get_pooled_connection, run_in_db_executor
+
+logger = logging.getLogger(__name__)
+
+_SELECT_SQL = """
+    SELECT kb.id, kb.keywords, kb.updated_at
+    FROM knowledge_base kb
+    WHERE kb.is_active = TRUE
+      AND kb.keywords IS NOT NULL
+      AND array_length(kb.keywords, 1) > 0
+"""
+
+_COUNT_SQL = """
+    SELECT count(*) FROM knowledge_base kb
+    WHERE kb.is_active = TRUE
+      AND kb.keywords IS NOT NULL
+      AND array_length(kb.keywords, 1) > 0
+"""
+
+
+@lru_cache(maxsize=50000)
+def tokenize_keyword(keyword: str) -> FrozenSet[str]:
+    """keyword 分詞（小寫後 jieba.cut；結果快取，keyword 集合有限且重複出現）"""
+    return frozenset(jieba.cut(keyword.lower()))
+
+
+class KeywordIndex:
+    """知識庫關鍵字倒排索引"""
+
+    def __init__(self):
+        self._entries: Dict[int, Tuple[str, ...]] = {}   # knowledge id → keywords
+        self._by_keyword: Dict[str, Set[int]] = {}
+        self._by_token: Dict[str, Set[int]] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._high_watermark: Optional[datetime] = None
+        self.stats = {"builds": 0, "incremental_updates": 0, "lookups": 0}
+
+    @property
+    def is_ready(self) -> bool:
+        return self._loaded
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ==================== 建立 / 更新 ====================
+
+    def rebuild(self):
+        """從資料庫整份重建（於 DB 執行緒池呼叫）"""
+        conn = get_pooled_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(_SELECT_SQL)
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        self.load_rows(rows)
+        logger.info(f"✅ 關鍵字倒排索引已建立: {len(self._entries)} 筆知識, {len(self._by_token)} 個 token")
+
+    def load_rows(self, rows: Iterable[Dict]):
+        """以資料列（id / keywords / updated_at）整份替換索引內容"""
+        entries, by_keyword, by_token = {}, {}, {}
+        watermark = None
+        for row in rows:
+            kid, keywords = row["id"], tuple(row.get("keywords") or ())
+            entries[kid] = keywords
+            self._add_postings(kid, keywords, by_keyword, by_token)
+            updated_at = row.get("updated_at")
+            if updated_at and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+        with self._lock:
+            self._entries, self._by_keyword, self._by_token = entries, by_keyword, by_token
+            self._high_watermark = watermark
+            self._loaded = True
+            self.stats["builds"] += 1
+
+    def refresh_knowledge(self, knowledge_ids: Iterable[int]):
+        """重載指定知識（已刪除 / 停用 / 清空 keywords 者自索引移除）"""
+        ids = [int(k) for k in knowledge_ids]
+        if not ids or not self._loaded:
+            return
+        conn = get_pooled_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(_SELECT_SQL + " AND kb.id = ANY(%s)", (ids,))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        self.apply_rows(ids, rows)
+
+    def apply_rows(self, knowledge_ids: Iterable[int], rows: Iterable[Dict]):
+        """以資料列更新指定知識：先移除舊條目，再加入仍有效者"""
+        with self._lock:
+            for kid in knowledge_ids:
+                self._remove(kid)
+            for row in rows:
+                kid, keywords = row["id"], tuple(row.get("keywords") or ())
+                self._entries[kid] = keywords
+                self._add_postings(kid, keywords, self._by_keyword, self._by_token)
+                updated_at = row.get("updated_at")
+                if updated_at and (self._high_watermark is None or updated_at > self._high_watermark):
+                    self._high_watermark = updated_at
+            self.stats["incremental_updates"] += 1
+
+    def sync(self):
+        """
+        背景同步：未載入則整份建立；否則依 updated_at 增量重載，
+        啟用筆數與索引不一致（硬刪除、停用）時整份重建
+        """
+        if not self._loaded or self._high_watermark is None:
+            self.rebuild()
+            return
+        conn = get_pooled_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM knowledge_base WHERE updated_at > %s", (self._high_watermark,))
+            changed = [r[0] for r in cursor.fetchall()]
+            cursor.execute(_COUNT_SQL)
+            active_count = cursor.fetchone()[0]
+            cursor.close()
+        finally:
+            conn.close()
+        if changed:
+            self.refresh_knowledge(changed)
+        if active_count != len(self._entries):
+            self.rebuild()
+
+    @staticmethod
+    def _add_postings(kid: int, keywords: Tuple[str, ...], by_keyword: Dict, by_token: Dict):
+        for keyword in keywords:
+            by_keyword.setdefault(keyword, set()).add(kid)
+            for token in tokenize_keyword(keyword):
+                by_token.setdefault(token, set()).add(kid)
+
+    def _remove(self, kid: int):
+        keywords = self._entries.pop(kid, None)
+        if keywords is None:
+            return
+        for keyword in keywords:
+            tokens = tokenize_keyword(keyword)
+            for table, key in [(self._by_keyword, keyword)] + [(self._by_token, t) for t in tokens]:
+                ids = table.get(key)
+                if ids is not None:
+                    ids.discard(kid)
+                    if not ids:
+                        del table[key]
+
+    # ==================== 查詢 ====================
+
+    def match_keywords(self, exact_tokens: Iterable[str]) -> Set[int]:
+        """keyword 與任一 token 完全相同的知識 id（對應 SQL 快速路徑 keywords && query_tokens）"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            ids: Set[int] = set()
+            for token in exact_tokens:
+                ids |= self._by_keyword.get(token, set())
+            return ids
+
+    def match_tokens(self, query_tokens: Iterable[str]) -> Set[int]:
+        """keyword 分詞與查詢分詞有交集的知識 id（對應 fallback 的 jieba 交集比對）"""
+        with self._lock:
+            ids: Set[int] = set()
+            for token in query_tokens:
+                ids |= self._by_token.get(token, set())
+            return ids
+
+    def get_stats(self) -> Dict:
+        return {
+            "ready": self._loaded,
+            "knowledge": len(self._entries),
+            "keywords": len(self._by_keyword),
+            "tokens": len(self._by_token),
+            "high_watermark": self._high_watermark.isoformat() if self._high_watermark else None,
+            **self.stats,
+        }
+
+
+_keyword_index: Optional[KeywordIndex] = None
+
+
+def keyword_index_enabled() -> bool:
+    return os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() == "true"
+
+
+def get_keyword_index() -> KeywordIndex:
+    """獲取全域關鍵字倒排索引（單例；需由 lifespan 背景同步載入後才會 ready）"""
+    global _keyword_index
+    if _keyword_index is None:
+        _keyword_index = KeywordIndex()
+    return _keyword_index
+
+
+async def keyword_index_sync_loop(interval: Optional[float] = None):
+    """
+    背景同步迴圈（app lifespan 啟動）：首次整份建立，之後每 interval 秒增量同步
+
+    Args:
+        interval: 同步間隔秒數（預設 KEYWORD_INDEX_SYNC_INTERVAL，30 秒）
+    """
+    interval = interval or float(os.getenv("KEYWORD_INDEX_SYNC_INTERVAL", "30"))
+    index = get_keyword_index()
+    while True:
+        try:
+            await run_in_db_executor(index.sync)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ 關鍵字倒排索引同步失敗（檢索暫時走 SQL 路徑）: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,310 @@
+"""
+知識匯入的批次寫入（COPY 暫存表 + 集合式 INSERT ... SELECT）
+
+背景：_import_to_database / _import_to_review_queue 逐筆 conn.execute：
+每條知識 2~3 次往返（存在檢查、INSERT/UPDATE、意圖映射；對話記錄另加測試情境查詢 / 新增），
+且未包在交易內，中途失敗時已寫入的部分無從得知，只能整批重來。
+
+做法（每個 chunk 一個交易）：
+- copy_records_to_table 把整批列寫進 ON COMMIT DROP 的暫存表（向量以 pgvector 文字格式暫存，
+  INSERT 時 ::vector 轉型）
+- 知識庫：先在暫存表決定目標 ID（既有 ID → UPDATE；否則以 nextval 預先配號），
+  再以 UPDATE ... FROM / INSERT ... SELECT 一次寫入，意圖映射同樣一次 upsert
+- 審核佇列：對話記錄來源先一次找出 / 建立測試情境，再 INSERT ... SELECT 候選知識
+- checkpoint：同一交易內把本 chunk 各列的內容指紋寫入 unified_jobs.job_config.write_checkpoint；
+  交易失敗時資料與 checkpoint 一起回滾，重跑同一作業時略過指紋已提交的列
+"""
+import hashlib
+import json
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+KB_STAGE_TABLE = "_import_kb_stage"
+KB_STAGE_COLUMNS = [
+    "seq", "knowledge_id", "vendor_ids", "question_summary", "answer", "keywords",
+    "business_types", "target_user", "source_file", "source_date", "embedding",
+    "scope", "priority", "intent_id",
+]
+
+CANDIDATE_STAGE_TABLE = "_import_candidate_stage"
+CANDIDATE_STAGE_COLUMNS = [
+    "seq", "needs_scenario", "source_type", "import_source", "source_file_name",
+    "question", "generated_answer", "question_embedding", "confidence_score",
+    "generation_prompt", "ai_model", "generation_reasoning", "suggested_sources",
+    "warnings", "intent_ids", "keywords", "priority", "scope", "vendor_id",
+    "business_types", "target_user", "status",
+]
+
+# 暫存表欄位 → 寫入目標欄位（INSERT ... SELECT 的 SELECT 端表達式）
+_CANDIDATE_INSERT_COLUMNS = [
+    ("test_scenario_id", "s.test_scenario_id"),
+    ("source_type", "s.source_type"),
+    ("import_source", "s.import_source"),
+    ("source_file_name", "s.source_file_name"),
+    ("question", "s.question"),
+    ("generated_answer", "s.generated_answer"),
+    ("question_embedding", "s.question_embedding::vector"),
+    ("confidence_score", "s.confidence_score"),
+    ("generation_prompt", "s.generation_prompt"),
+    ("ai_model", "s.ai_model"),
+    ("generation_reasoning", "s.generation_reasoning"),
+    ("suggested_sources", "s.suggested_sources"),
+    ("warnings", "s.warnings"),
+    ("intent_ids", "s.intent_ids"),
+    ("keywords", "s.keywords"),
+    ("priority", "s.priority"),
+    ("scope", "s.scope"),
+    ("vendor_id", "s.vendor_id"),
+    ("business_types", "s.business_types"),
+    ("target_user", "s.target_user"),
+    ("status", "s.status"),
+]
+
+
+def row_keys(rows: Iterable[Dict], fields: Sequence[str]) -> List[str]:
+    """
+    每列的內容指紋（checkpoint 用；與順序無關，重跑時去重結果不同也對得上）
+
+    同內容重複出現時以出現次序區分（第二次為 "<hash>#1"）。
+    """
+    seen: Dict[str, int] = {}
+    keys = []
+    for row in rows:
+        raw = "\x1f".join(str(row.get(f) or "") for f in fields)
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        keys.append(digest if n == 0 else f"{digest}#{n}")
+    return keys
+
+
+def chunked(items: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(items), max(1, size)):
+        yield items[start:start + size]
+
+
+def _records(rows: Sequence[Dict], columns: Sequence[str]) -> List[tuple]:
+    return [tuple(row[c] for c in columns) for row in rows]
+
+
+# ==================== checkpoint ====================
+
+async def load_checkpoint(conn, job_id: Optional[str]) -> Set[str]:
+    """讀取作業已提交列的指紋（無作業或無 checkpoint 時為空集合）"""
+    if not job_id:
+        return set()
+    raw = await conn.fetchval("""
+        SELECT job_config::jsonb #> '{write_checkpoint,keys}'
+        FROM unified_jobs WHERE job_id = $1
+    """, uuid.UUID(job_id))
+    if not raw:
+        return set()
+    return set(json.loads(raw) if isinstance(raw, str) else raw)
+
+
+async def record_checkpoint(conn, job_id: Optional[str], keys: List[str]):
+    """把本 chunk 已寫入列的指紋附加到 checkpoint（須在寫入資料的同一交易內呼叫）"""
+    if not job_id or not keys:
+        return
+    await conn.execute("""
+        UPDATE unified_jobs
+        SET job_config = jsonb_set(
+            COALESCE(job_config::jsonb, '{}'::jsonb),
+            '{write_checkpoint}',
+            jsonb_build_object(
+                'keys', COALESCE(job_config::jsonb #> '{write_checkpoint,keys}', '[]'::jsonb) || $2::jsonb,
+                'updated_at', to_jsonb(CURRENT_TIMESTAMP)
+            )
+        )
+        WHERE job_id = $1
+    """, uuid.UUID(job_id), json.dumps(keys))
+
+
+# ==================== 知識庫 ====================
+
+async def bulk_write_knowledge(conn, rows: Sequence[Dict]) -> Dict[str, int]:
+    """
+    一次寫入一批知識與主要意圖映射（呼叫端負責交易）
+
+    Args:
+        conn: asyncpg 連線
+        rows: 每列含 KB_STAGE_COLUMNS 欄位的 dict（embedding 為 pgvector 文字或 None）
+
+    Returns:
+        {"inserted": 新增數, "updated": 更新數}
+    """
+    await conn.execute(f"""
+        DROP TABLE IF EXISTS {KB_STAGE_TABLE};
+        CREATE TEMP TABLE {KB_STAGE_TABLE} (
+            seq INT,
+            knowledge_id INT,
+            vendor_ids INT[],
+            question_summary TEXT,
+            answer TEXT,
+            keywords TEXT[],
+            business_types TEXT[],
+            target_user TEXT[],
+            source_file TEXT,
+            source_date DATE,
+            embedding TEXT,
+            scope TEXT,
+            priority INT,
+            intent_id INT,
+            target_id INT,
+            is_new BOOLEAN NOT NULL DEFAULT FALSE
+        ) ON COMMIT DROP
+    """)
+    await conn.copy_records_to_table(KB_STAGE_TABLE, records=_records(rows, KB_STAGE_COLUMNS),
+                                     columns=KB_STAGE_COLUMNS)
+
+    # 目標 ID：提供的 ID 存在 → 更新該筆；否則預先配號新增（ID 不存在時忽略提供的 ID，與逐筆版一致）
+    await conn.execute(f"""
+        UPDATE {KB_STAGE_TABLE} s SET target_id = kb.id
+        FROM knowledge_base kb WHERE kb.id = s.knowledge_id
+    """)
+    await conn.execute(f"""
+        UPDATE {KB_STAGE_TABLE}
+        SET target_id = nextval(pg_get_serial_sequence('knowledge_base', 'id')), is_new = TRUE
+        WHERE target_id IS NULL
+    """)
+
+    updated = await conn.fetchval(f"""
+        WITH upd AS (
+            UPDATE knowledge_base kb SET
+                vendor_ids = s.vendor_ids,
+                question_summary = s.question_summary,
+                answer = s.answer,
+                keywords = s.keywords,
+                business_types = s.business_types,
+                target_user = s.target_user,
+                source_file = s.source_file,
+                source_date = s.source_date,
+                embedding = s.embedding::vector,
+                scope = s.scope,
+                priority = s.priority,
+                updated_at = CURRENT_TIMESTAMP
+            FROM {KB_STAGE_TABLE} s
+            WHERE kb.id = s.target_id AND NOT s.is_new
+            RETURNING kb.id
+        )
+        SELECT COUNT(*) FROM upd
+    """)
+    inserted = await conn.fetchval(f"""
+        WITH ins AS (
+            INSERT INTO knowledge_base (
+                id, vendor_ids, question_summary, answer, keywords, business_types,
+                target_user, source_file, source_date, embedding, scope, priority,
+                created_at, updated_at
+            )
+            SELECT
+                s.target_id, s.vendor_ids, s.question_summary, s.answer, s.keywords, s.business_types,
+                s.target_user, s.source_file, s.source_date, s.embedding::vector, s.scope, s.priority,
+                CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM {KB_STAGE_TABLE} s
+            WHERE s.is_new
+            ORDER BY s.seq
+            RETURNING id
+        )
+        SELECT COUNT(*) FROM ins
+    """)
+    # 同一 (knowledge_id, intent_id) 只能 upsert 一次（同一批內重複提供同一 ID 時）
+    await conn.execute(f"""
+        INSERT INTO knowledge_intent_mapping (knowledge_id, intent_id, intent_type, confidence, assigned_by)
+        SELECT DISTINCT ON (s.target_id, s.intent_id) s.target_id, s.intent_id, 'primary', 1.0, 'import'
+        FROM {KB_STAGE_TABLE} s
+        WHERE s.intent_id IS NOT NULL
+        ORDER BY s.target_id, s.intent_id, s.seq DESC
+        ON CONFLICT (knowledge_id, intent_id)
+        DO UPDATE SET intent_type = 'primary', confidence = 1.0, updated_at = CURRENT_TIMESTAMP
+    """)
+    return {"inserted": inserted or 0, "updated": updated or 0}
+
+
+# ==================== 審核佇列 ====================
+
+async def bulk_write_candidates(conn, rows: Sequence[Dict], scenario_note: str) -> int:
+    """
+    一次寫入一批審核佇列候選知識（呼叫端負責交易）
+
+    Args:
+        conn: asyncpg 連線
+        rows: 每列含 CANDIDATE_STAGE_COLUMNS 欄位的 dict
+        scenario_note: 新建測試情境的 notes（對話記錄來源）
+
+    Returns:
+        寫入筆數
+    """
+    await conn.execute(f"""
+        DROP TABLE IF EXISTS {CANDIDATE_STAGE_TABLE};
+        CREATE TEMP TABLE {CANDIDATE_STAGE_TABLE} (
+            seq INT,
+            needs_scenario BOOLEAN,
+            source_type TEXT,
+            import_source TEXT,
+            source_file_name TEXT,
+            question TEXT,
+            generated_answer TEXT,
+            question_embedding TEXT,
+            confidence_score FLOAT8,
+            generation_prompt TEXT,
+            ai_model TEXT,
+            generation_reasoning TEXT,
+            suggested_sources TEXT[],
+            warnings TEXT[],
+            intent_ids INT[],
+            keywords TEXT[],
+            priority INT,
+            scope TEXT,
+            vendor_id INT,
+            business_types TEXT[],
+            target_user TEXT,
+            status TEXT,
+            test_scenario_id INT
+        ) ON COMMIT DROP
+    """)
+    await conn.copy_records_to_table(CANDIDATE_STAGE_TABLE, records=_records(rows, CANDIDATE_STAGE_COLUMNS),
+                                     columns=CANDIDATE_STAGE_COLUMNS)
+
+    if any(row["needs_scenario"] for row in rows):
+        # 對話記錄：沿用同題最新的測試情境，沒有的每個問題建立一個
+        await conn.execute(f"""
+            UPDATE {CANDIDATE_STAGE_TABLE} s SET test_scenario_id = ts.id
+            FROM (
+                SELECT DISTINCT ON (test_question) id, test_question
+                FROM test_scenarios
+                WHERE test_question IN (SELECT question FROM {CANDIDATE_STAGE_TABLE} WHERE needs_scenario)
+                ORDER BY test_question, created_at DESC
+            ) ts
+            WHERE s.needs_scenario AND s.question = ts.test_question
+        """)
+        await conn.execute(f"""
+            WITH ins AS (
+                INSERT INTO test_scenarios (test_question, difficulty, status, source, notes, created_at)
+                SELECT q.question, 'medium', 'pending_review', 'imported', $1, CURRENT_TIMESTAMP
+                FROM (
+                    SELECT question, MIN(seq) AS first_seq
+                    FROM {CANDIDATE_STAGE_TABLE}
+                    WHERE needs_scenario AND test_scenario_id IS NULL
+                    GROUP BY question
+                ) q
+                ORDER BY q.first_seq
+                RETURNING id, test_question
+            )
+            UPDATE {CANDIDATE_STAGE_TABLE} s SET test_scenario_id = ins.id
+            FROM ins
+            WHERE s.needs_scenario AND s.test_scenario_id IS NULL AND s.question = ins.test_question
+        """, scenario_note)
+
+    columns = ", ".join(c for c, _ in _CANDIDATE_INSERT_COLUMNS)
+    values = ", ".join(v for _, v in _CANDIDATE_INSERT_COLUMNS)
+    inserted = await conn.fetchval(f"""
+        WITH ins AS (
+            INSERT INTO ai_generated_knowledge_candidates ({columns}, created_at, updated_at)
+            SELECT {values}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM {CANDIDATE_STAGE_TABLE} s
+            ORDER BY s.seq
+            RETURNING id
+        )
+        SELECT COUNT(*) FROM ins
+    """)
+    return inserted or 0
@@ -26,6 +26,8 @@ from tenacity import (
     retry_if_exception_type
 )
 
+from services.vector_codec import decode_b64_vector, to_pgvector_literal
+
 
 class KnowledgeLoopEmbeddingClient:
     """
@@ -85,7 +87,7 @@ class KnowledgeLoopEmbeddingClient:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
                 response = await client.post(
                     self.embedding_api_url,
-                    json={"text": text}
+                    json={"text": text, "encoding_format": "base64"}
                 )
 
                 if response.status_code != 200:
@@ -94,7 +96,8 @@ class KnowledgeLoopEmbeddingClient:
                     return None
 
                 data = response.json()
-                embedding = data.get('embedding')
+                # 新版服務回 embedding_b64（float32 二進位），舊版回 embedding
+                embedding = decode_b64_vector(data.get('embedding_b64')) or data.get('embedding')
 
                 if embedding:
                     if verbose:
@@ -122,31 +125,60 @@ class KnowledgeLoopEmbeddingClient:
     async def generate_embeddings_batch(
         self,
         texts: List[str],
-        verbose: bool = False
+        verbose: bool = False,
+        batch_size: int = 256
     ) -> List[Optional[List[float]]]:
         """
-        批量生成 embeddings（並發執行，每個帶重試）
+        批量生成 embeddings
+
+        優先走 embedding-service 批次端點（每 batch_size 筆一次 HTTP 往返）；
+        批次端點失敗時降級為逐筆並發（每個帶重試）。
 
         Args:
             texts: 文本列表
             verbose: 是否顯示詳細日誌
+            batch_size: 每次批次請求的文本數
 
         Returns:
             embedding 向量列表，每個可能為 None（如果失敗）
         """
         import asyncio
 
-        tasks = [self.generate_embedding(text, verbose=False) for text in texts]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if not texts:
+            return []
 
-        # 處理異常
-        embeddings = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                print(f"⚠️ 第 {i+1} 個文本 embedding 生成失敗: {result}")
-                embeddings.append(None)
-            else:
-                embeddings.append(result)
+        batch_url = self.embedding_api_url.rstrip('/') + '/batch'
+        embeddings: List[Optional[List[float]]] = []
+        try:
+            async with httpx.AsyncClient(timeout=max(self.timeout, 120.0)) as client:
+                for start in range(0, len(texts), batch_size):
+                    chunk = texts[start:start + batch_size]
+                    response = await client.post(
+                        batch_url, json={"texts": chunk, "encoding_format": "base64"}
+                    )
+                    if response.status_code != 200:
+                        raise RuntimeError(f"batch endpoint HTTP {response.status_code}")
+                    data = response.json()
+                    if data.get('embeddings_b64') is not None:
+                        chunk_embeddings = [decode_b64_vector(e) for e in data['embeddings_b64']]
+                    else:
+                        chunk_embeddings = data.get('embeddings') or []
+                    if len(chunk_embeddings) != len(chunk):
+                        raise RuntimeError("batch endpoint returned mismatched length")
+                    embeddings.extend(chunk_embeddings)
+        except Exception as e:
+            print(f"⚠️ 批次 Embedding API 不可用（{e}），降級為逐筆呼叫")
+            tasks = [self.generate_embedding(text, verbose=False) for text in texts]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            # 處理異常
+            embeddings = []
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    print(f"⚠️ 第 {i+1} 個文本 embedding 生成失敗: {result}")
+                    embeddings.append(None)
+                else:
+                    embeddings.append(result)
 
         if verbose:
             success_count = sum(1 for e in embeddings if e is not None)
@@ -170,7 +202,7 @@ class KnowledgeLoopEmbeddingClient:
         if not embedding:
             raise ValueError("Embedding is empty")
 
-        return '[' + ','.join(map(str, embedding)) + ']'
+        return to_pgvector_literal(embedding)
 
 
 # ============================================================
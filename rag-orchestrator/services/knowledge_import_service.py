@@ -9,7 +9,7 @@ import json
 import asyncio
 import uuid
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from pathlib import Path
 import pandas as pd
 import asyncpg
@@ -19,6 +19,14 @@ import time
 # 引入統一 Job 服務
 from services.unified_job_service import UnifiedJobService
 from services.llm_provider import get_llm_provider, LLMProvider
+from services.item_pipeline import PipelineStage, run_item_pipeline
+from services.openai_rate_limiter import call_with_limiter, estimate_tokens, get_rate_limiter, is_rate_limit_error
+from services.semantic_dedup import SOURCE_UPLOAD, SemanticDedupEngine
+from services.knowledge_bulk_writer import (
+    CANDIDATE_STAGE_COLUMNS, bulk_write_candidates, bulk_write_knowledge,
+    chunked, load_checkpoint, record_checkpoint, row_keys,
+)
+from services.vector_codec import to_pgvector_literal
 
 
 class KnowledgeImportService(UnifiedJobService):
@@ -45,6 +53,15 @@ class KnowledgeImportService(UnifiedJobService):
         self.quality_evaluation_enabled = os.getenv("QUALITY_EVALUATION_ENABLED", "true").lower() == "true"
         self.quality_evaluation_threshold = int(os.getenv("QUALITY_EVALUATION_THRESHOLD", "6"))
 
+        # 串流管線配置（速率由 OPENAI_CHAT_* / OPENAI_EMBEDDING_* 限制器控制）
+        self.llm_concurrency = int(os.getenv("IMPORT_LLM_CONCURRENCY", "8"))
+        self.embedding_batch_size = int(os.getenv("IMPORT_EMBEDDING_BATCH_SIZE", "100"))
+        self.pipeline_queue_size = int(os.getenv("IMPORT_PIPELINE_QUEUE_SIZE", "64"))
+        self.llm_max_retries = int(os.getenv("IMPORT_LLM_MAX_RETRIES", "3"))
+
+        # 批次寫入配置（每 chunk 一個交易並記錄 checkpoint）
+        self.bulk_write_chunk_size = int(os.getenv("IMPORT_BULK_CHUNK_SIZE", "1000"))
+
         # 目標用戶配置緩存（從資料庫動態加載）
         self._target_user_config_cache = None
         self._target_user_cache_time = None
@@ -161,6 +178,18 @@ class KnowledgeImportService(UnifiedJobService):
             # 根據來源類型決定處理流程
             is_system_export = (import_source == 'system_export')
 
+            # 3.6. 寫入 checkpoint：以解析後的原始內容為指紋（LLM 摘要每次不同，不能納入），
+            #      重跑失敗的作業時先略過已提交的知識，省下重複的 LLM / embedding 呼叫
+            for knowledge, key in zip(knowledge_list, self._write_keys(knowledge_list)):
+                knowledge['_write_key'] = key
+            async with self.db_pool.acquire() as conn:
+                committed = await load_checkpoint(conn, job_id)
+            parsed_count = len(knowledge_list)
+            knowledge_list = [k for k in knowledge_list if k['_write_key'] not in committed]
+            resumed_count = parsed_count - len(knowledge_list)
+            if resumed_count:
+                print(f"⏩ 續跑作業：略過先前已寫入的 {resumed_count} 條，剩餘 {len(knowledge_list)} 條")
+
             # 4. 預先去重（文字完全相同）- 在 LLM 前執行，節省成本
             if enable_deduplication:
                 await self.update_status(job_id, "processing", progress={"current": 20, "total": 100, "stage": "extracting"})
@@ -169,31 +198,22 @@ class KnowledgeImportService(UnifiedJobService):
                 text_skipped = original_count - len(knowledge_list)
                 print(f"🔍 文字去重: 跳過 {text_skipped} 條完全相同的項目，剩餘 {len(knowledge_list)} 條")
 
-            # 5. 生成問題摘要（使用 LLM）- 只處理去重後的知識
+            # 5-8.5. 問題摘要 → 向量嵌入 → 語意去重 → 意圖推薦 → 質量評估（串流管線，只處理文字去重後的知識）
             await self.update_status(job_id, "processing", progress={"current": 35, "total": 100, "stage": "extracting"})
-            await self._generate_question_summaries(knowledge_list)
-
-            # 6. 生成向量嵌入 - 只處理去重後的知識
-            await self.update_status(job_id, "processing", progress={"current": 55, "total": 100, "stage": "embedding"})
-            await self._generate_embeddings(knowledge_list)
-
-            # 7. 語意去重（使用向量相似度）- 二次過濾
+            semantic_original = len(knowledge_list)
+            knowledge_list = await self._run_enrichment_pipeline(
+                job_id,
+                knowledge_list,
+                enable_deduplication=enable_deduplication,
+                skip_review=skip_review,
+                enable_quality_evaluation=enable_quality_evaluation,
+                vendor_id=vendor_id
+            )
             if enable_deduplication:
-                await self.update_status(job_id, "processing", progress={"current": 70, "total": 100, "stage": "embedding"})
-                semantic_original = len(knowledge_list)
-                knowledge_list = await self._deduplicate_by_similarity(knowledge_list, skip_review=skip_review, vendor_id=vendor_id)
                 semantic_skipped = semantic_original - len(knowledge_list)
                 print(f"🔍 語意去重: 跳過 {semantic_skipped} 條語意相似的項目，剩餘 {len(knowledge_list)} 條")
                 print(f"📊 總計跳過: {text_skipped + semantic_skipped} 條（文字: {text_skipped}, 語意: {semantic_skipped}）")
 
-            # 8. 推薦意圖（使用 LLM 或分類器）
-            await self.update_status(job_id, "processing", progress={"current": 76, "total": 100, "stage": "embedding"})
-            await self._recommend_intents(knowledge_list, enable_quality_evaluation=enable_quality_evaluation)
-
-            # 8.5. 質量評估（自動篩選低質量知識）
-            await self.update_status(job_id, "processing", progress={"current": 77, "total": 100, "stage": "embedding"})
-            await self._evaluate_quality(knowledge_list, enable_quality_evaluation=enable_quality_evaluation)
-
             # 9. 建立測試情境建議（需求 2：針對 B2C 知識）
             await self.update_status(job_id, "processing", progress={"current": 78, "total": 100, "stage": "embedding"})
             test_scenario_count = await self._create_test_scenario_suggestions(knowledge_list, vendor_id)
@@ -207,10 +227,12 @@ class KnowledgeImportService(UnifiedJobService):
                     vendor_id=vendor_id,
                     import_mode=import_mode,
                     default_priority=default_priority,
-                    created_by=user_id
+                    created_by=user_id,
+                    job_id=job_id
                 )
                 result['test_scenarios_created'] = test_scenario_count
                 result['mode'] = 'direct'
+                result['resumed'] += resumed_count
             else:
                 # 匯入到審核佇列（需求 3：所有知識都需要審核）
                 # 知識會先進入 ai_generated_knowledge_candidates 表
@@ -222,9 +244,11 @@ class KnowledgeImportService(UnifiedJobService):
                     created_by=user_id,
                     source_type=source_type,
                     import_source=import_source,
-                    file_name=Path(file_path).name
+                    file_name=Path(file_path).name,
+                    job_id=job_id
                 )
                 result['test_scenarios_created'] = test_scenario_count
+                result['resumed'] += resumed_count
 
             # 11. 更新作業狀態為完成（使用統一 Job 服務的方法）
             await self.update_status(
@@ -1166,82 +1190,221 @@ class KnowledgeImportService(UnifiedJobService):
         # TODO: 實作 PDF 解析（需要安裝 PyPDF2 或 pdfplumber）
         raise Exception("PDF 格式暫不支援，請先轉換為 Excel 或 TXT")
 
-    async def _generate_question_summaries(self, knowledge_list: List[Dict]):
+    async def _run_enrichment_pipeline(
+        self,
+        job_id: str,
+        knowledge_list: List[Dict],
+        enable_deduplication: bool,
+        skip_review: bool,
+        enable_quality_evaluation: bool,
+        vendor_id: Optional[int] = None
+    ) -> List[Dict]:
         """
-        為沒有問題摘要的知識生成問題
+        問題摘要 → 向量嵌入 → 語意去重 → 意圖推薦 → 質量評估（串流管線）
+
+        每條知識處理完一個階段就進下一階段，各階段以有界佇列 + 並行 worker 執行；
+        LLM / embedding 呼叫經共用 RPM / TPM 限制器，embedding 批次送出。
+        作業進度（35% → 78%）隨知識完成更新。
 
         Args:
+            job_id: 作業 ID
             knowledge_list: 知識列表（會直接修改）
+            enable_deduplication: 是否啟用語意去重
+            skip_review: 是否跳過審核（影響語意去重檢查範圍）
+            enable_quality_evaluation: 是否啟用質量評估（False 時同時跳過 LLM 意圖推薦）
+            vendor_id: 業者 ID（語意去重範圍，與文字去重一致）
+
+        Returns:
+            未被語意去重剔除的知識（依原始順序）
         """
-        need_generation = [k for k in knowledge_list if not k.get('question_summary')]
+        total = len(knowledge_list)
+        need_summary = sum(1 for k in knowledge_list if not k.get('question_summary'))
+        quality_enabled = enable_quality_evaluation and self.quality_evaluation_enabled
 
-        if not need_generation:
-            print("✅ 所有知識都已有問題摘要")
-            return
+        print(f"🔄 串流處理 {total} 條知識（問題摘要 {need_summary} 條，LLM 並行 {self.llm_concurrency}，"
+              f"embedding 每批 {self.embedding_batch_size}）...")
 
-        print(f"🤖 為 {len(need_generation)} 條知識生成問題摘要...")
+        catalog = await self._load_intent_catalog()
+        if catalog is None:
+            print("   ⚠️  找不到任何意圖，跳過推薦")
+        elif not enable_quality_evaluation:
+            print(f"🎯 意圖推薦: 已關閉質量評估，僅處理 Excel 提供的意圖（跳過 LLM 推薦）")
 
-        for knowledge in need_generation:
-            try:
-                prompt = f"""請根據以下答案，生成一個簡潔的問題摘要（15字以內）。
+        if not quality_enabled:
+            reason = "API 參數關閉" if not enable_quality_evaluation else "環境變數停用 (QUALITY_EVALUATION_ENABLED=false)"
+            print(f"⏭️  質量評估已停用（{reason}）")
+            # 所有知識預設為可接受
+            for knowledge in knowledge_list:
+                knowledge['quality_evaluation'] = {
+                    'quality_score': 8,
+                    'is_acceptable': True,
+                    'issues': [],
+                    'reasoning': f'質量評估已停用（{reason}），預設為可接受'
+                }
 
-答案：{knowledge['answer'][:200]}
+        # 只顯示每個階段前 3 條的結果
+        shown = {'intent': 0, 'quality': 0}
 
-只輸出問題摘要，不要加其他說明。"""
+        def _verbose(name: str) -> bool:
+            shown[name] += 1
+            return shown[name] <= 3
 
-                llm_result = await self.llm_provider.async_chat_completion(
-                    model=self.llm_model,
-                    temperature=0.3,
-                    max_tokens=50,
-                    messages=[{"role": "user", "content": prompt}]
-                )
+        stages = [
+            PipelineStage("summary", self._generate_question_summary, concurrency=self.llm_concurrency),
+            PipelineStage("embedding", self._generate_embeddings, concurrency=2,
+                          batch_size=self.embedding_batch_size),
+        ]
+        if enable_deduplication:
+            engine = SemanticDedupEngine(threshold=0.85)
+            async with self.db_pool.acquire() as conn:
+                await engine.load_corpus(conn, vendor_id, skip_review)
+            check_scope = "正式知識庫" if skip_review else "正式知識庫 + 審核佇列 + 測試情境"
+            print(f"🔍 語意去重（相似度閾值: {engine.threshold}，範圍: {check_scope} + 本次上傳，"
+                  f"既有向量 {engine.stats['corpus_rows']} 條，載入 {engine.stats['load_ms']}ms）")
+            # 單一 worker：跨批次累積「本次上傳已保留」向量，判定順序需固定
+            stages.append(PipelineStage(
+                "semantic_dedup",
+                lambda batch: self._filter_semantic_duplicates(batch, engine),
+                concurrency=1, batch_size=256,
+            ))
+        if catalog is not None:
+            stages.append(PipelineStage(
+                "intent",
+                lambda k: self._recommend_intent(k, catalog, enable_quality_evaluation, verbose=_verbose('intent')),
+                concurrency=self.llm_concurrency,
+            ))
+        if quality_enabled:
+            print(f"🔍 評估知識質量（門檻: {self.quality_evaluation_threshold}/10）...")
+            stages.append(PipelineStage(
+                "quality",
+                lambda k: self._evaluate_quality(k, verbose=_verbose('quality')),
+                concurrency=self.llm_concurrency,
+            ))
+
+        reported = {'done': 0}
+        step = max(1, total // 50)
+
+        async def _on_progress(done: int, total_items: int):
+            if done - reported['done'] < step and done < total_items:
+                return
+            reported['done'] = done
+            print(f"   進度: {done}/{total_items}")
+            await self.update_status(job_id, "processing", progress={
+                "current": 35 + int(43 * done / total_items),
+                "total": 100,
+                "stage": "embedding",
+                "items_done": done,
+                "items_total": total_items,
+            })
 
-                question_summary = llm_result['content'].strip()
-                knowledge['question_summary'] = question_summary
+        kept = await run_item_pipeline(
+            knowledge_list, stages,
+            queue_size=self.pipeline_queue_size,
+            on_progress=_on_progress
+        )
 
-                # 避免 rate limit
-                await asyncio.sleep(0.1)
+        # 統計推薦結果
+        if catalog is not None:
+            excel_intent_count = sum(1 for k in kept if k.get('intent'))
+            llm_recommended_count = len(kept) - excel_intent_count
+            print(f"   ✅ 意圖推薦完成")
+            if excel_intent_count > 0:
+                print(f"      來自 Excel: {excel_intent_count} 條")
+            if llm_recommended_count > 0:
+                print(f"      LLM 推薦: {llm_recommended_count} 條")
 
-            except Exception as e:
-                print(f"   ⚠️ 生成問題失敗: {e}")
-                # 備用方案：保持 question_summary 為 None，後續處理
+        # 統計質量分布
+        if quality_enabled:
+            acceptable_count = sum(1 for k in kept if k.get('quality_evaluation', {}).get('is_acceptable', True))
+            rejected_count = len(kept) - acceptable_count
+            print(f"   ✅ 質量評估完成")
+            print(f"      可接受: {acceptable_count} 條")
+            if rejected_count > 0:
+                print(f"      低質量: {rejected_count} 條（將自動標記為已拒絕）")
+
+        if enable_deduplication:
+            print(f"   ✅ 語意去重完成：重複 {engine.stats['duplicates']} 條"
+                  f"（其中本次上傳內重複 {engine.stats['upload_duplicates']} 條）")
+
+        stats = {name: get_rate_limiter(name).get_stats() for name in ("chat", "embedding")}
+        print(f"   ⏱️  限流等待: chat {stats['chat']['wait_seconds']}s / embedding {stats['embedding']['wait_seconds']}s")
+
+        return kept
+
+    async def _call_llm_limited(self, prompt: str, max_tokens: int, **kwargs) -> Dict:
+        """以匯入用模型與重試次數經共用限制器呼叫 LLM（見 call_with_limiter）"""
+        return await call_with_limiter(
+            self.llm_provider, self.llm_model, [{"role": "user", "content": prompt}], max_tokens,
+            max_retries=self.llm_max_retries, **kwargs
+        )
+
+    async def _generate_question_summary(self, knowledge: Dict) -> Dict:
+        """
+        為沒有問題摘要的知識生成問題（管線階段，會直接修改 knowledge）
+        """
+        if knowledge.get('question_summary'):
+            return knowledge
 
-        print(f"   ✅ 問題摘要生成完成")
+        try:
+            prompt = f"""請根據以下答案，生成一個簡潔的問題摘要（15字以內）。
 
-    async def _generate_embeddings(self, knowledge_list: List[Dict]):
-        """
-        為知識生成向量嵌入
+答案：{knowledge['answer'][:200]}
 
-        Args:
-            knowledge_list: 知識列表（會直接修改）
-        """
-        print(f"🔮 為 {len(knowledge_list)} 條知識生成向量嵌入...")
+只輸出問題摘要，不要加其他說明。"""
 
-        for idx, knowledge in enumerate(knowledge_list, 1):
-            try:
-                # 只使用 question_summary（不包含 answer）
-                # 根據實測：加入 answer 會降低 9.2% 的檢索匹配度（30 題測試，86.7% 受負面影響）
-                # 原因：answer 包含的格式化內容、操作步驟會稀釋語意
-                text = knowledge['question_summary']
-
-                embedding = await self.llm_provider.async_embedding(
-                    text=text,
-                    model=self.embedding_model
-                )
+            llm_result = await self._call_llm_limited(prompt, max_tokens=50)
+            knowledge['question_summary'] = llm_result['content'].strip()
+
+        except Exception as e:
+            print(f"   ⚠️ 生成問題失敗: {e}")
+            # 備用方案：保持 question_summary 為 None，後續處理
 
-                knowledge['embedding'] = embedding
+        return knowledge
 
-                if idx % 10 == 0:
-                    print(f"   進度: {idx}/{len(knowledge_list)}")
+    async def _generate_embeddings(self, batch: List[Dict]) -> List[Dict]:
+        """
+        為一批知識生成向量嵌入（管線批次階段，一次請求多筆，會直接修改 knowledge）
 
-                # 避免 rate limit
-                await asyncio.sleep(0.05)
+        Args:
+            batch: 知識列表
 
+        Returns:
+            同一批知識
+        """
+        # 只使用 question_summary（不包含 answer）
+        # 根據實測：加入 answer 會降低 9.2% 的檢索匹配度（30 題測試，86.7% 受負面影響）
+        # 原因：answer 包含的格式化內容、操作步驟會稀釋語意
+        targets = [k for k in batch if k.get('question_summary')]
+        for knowledge in batch:
+            if not knowledge.get('question_summary'):
+                knowledge['embedding'] = None
+        if not targets:
+            return batch
+
+        texts = [k['question_summary'] for k in targets]
+        limiter = get_rate_limiter("embedding")
+        embed_many = getattr(self.llm_provider, 'async_embeddings', None)
+        for attempt in range(self.llm_max_retries):
+            await limiter.acquire(estimate_tokens(*texts))
+            try:
+                if embed_many:
+                    embeddings = await embed_many(texts, model=self.embedding_model)
+                else:
+                    embeddings = await asyncio.gather(*(
+                        self.llm_provider.async_embedding(text=text, model=self.embedding_model)
+                        for text in texts
+                    ))
+                break
             except Exception as e:
-                print(f"   ⚠️ 生成向量失敗 (第 {idx} 條): {e}")
+                if is_rate_limit_error(e) and attempt + 1 < self.llm_max_retries:
+                    limiter.penalize(min(60, 5 * 2 ** attempt))
+                    continue
+                print(f"   ⚠️ 生成向量失敗（{len(texts)} 條）: {e}")
                 raise Exception(f"向量生成失敗: {e}")
 
-        print(f"   ✅ 向量嵌入生成完成")
+        for knowledge, embedding in zip(targets, embeddings):
+            knowledge['embedding'] = embedding
+        return batch
 
     async def _deduplicate_exact_match(self, knowledge_list: List[Dict], skip_review: bool = False, vendor_id: Optional[int] = None) -> List[Dict]:
         """
@@ -1315,95 +1478,51 @@ class KnowledgeImportService(UnifiedJobService):
 
         return unique_list
 
-    async def _deduplicate_by_similarity(
+    async def _filter_semantic_duplicates(
         self,
-        knowledge_list: List[Dict],
-        threshold: float = 0.85,
-        skip_review: bool = False,
-        vendor_id: Optional[int] = None
-    ) -> List[Dict]:
+        batch: List[Dict],
+        engine: SemanticDedupEngine
+    ) -> List[Optional[Dict]]:
         """
-        使用向量相似度去重（語意去重）
-        檢查知識庫、審核佇列和測試情境中是否已有語意相似的知識
+        使用向量相似度去重（語意去重，管線批次階段）
 
-        重用 unclear_questions 的相似度機制：
-        - 閾值：0.85（與 unclear_questions 一致）
-        - 使用資料庫函數 check_knowledge_exists_by_similarity()
+        與作業開始時載入的既有向量（正式知識庫 / 審核佇列 / 測試情境）及本次上傳中
+        先前保留的知識比對，一批只做幾次矩陣乘法（見 services/semantic_dedup）
 
         Args:
-            knowledge_list: 知識列表（必須已有 embedding）
-            threshold: 相似度閾值（預設 0.85）
-            skip_review: 是否跳過審核（如果 True，只檢查正式知識庫；如果 False，同時檢查審核佇列）
+            batch: 知識列表（必須已有 embedding）
+            engine: 本作業的語意去重引擎
 
         Returns:
-            去重後的知識列表
+            與 batch 等長的列表，判定重複者為 None
         """
-        check_scope = "正式知識庫" if skip_review else "正式知識庫 + 審核佇列 + 測試情境"
-        print(f"🔍 執行語意去重（相似度閾值: {threshold}，範圍: {check_scope}）...")
-
-        unique_list = []
-
-        async with self.db_pool.acquire() as conn:
-            for idx, knowledge in enumerate(knowledge_list, 1):
-                embedding = knowledge.get('embedding')
-
-                if not embedding:
-                    print(f"   ⚠️  知識缺少 embedding，跳過語意檢查: {knowledge.get('question_summary', '無問題')[:50]}")
-                    unique_list.append(knowledge)
-                    continue
-
-                # 將 embedding 轉換為 PostgreSQL vector 格式
-                vector_str = '[' + ','.join(str(x) for x in embedding) + ']'
-
-                # 使用資料庫函數檢查是否已存在相似知識
-                result = await conn.fetchrow("""
-                    SELECT * FROM check_knowledge_exists_by_similarity($1::vector, $2::DECIMAL)
-                """, vector_str, threshold)
-
-                # 根據 skip_review 決定檢查範圍
-                if skip_review:
-                    # 跳過審核模式：只檢查正式知識庫
-                    is_duplicate = result and result['exists_in_knowledge_base']
-                else:
-                    # 審核模式：檢查正式知識庫、審核佇列和測試情境
-                    is_duplicate = result and (result['exists_in_knowledge_base'] or result['exists_in_review_queue'] or result.get('exists_in_test_scenarios', False))
-
-                if is_duplicate:
-                    # 找到相似知識，跳過
-                    source = result['source_table']
-                    matched_q = result['matched_question']
-                    sim_score = result['similarity_score']
-
-                    print(f"   跳過語意相似 (相似度: {sim_score:.4f}, 來源: {source})")
-                    print(f"      新問題: {knowledge['question_summary'][:50]}...")
-                    print(f"      相似問題: {matched_q[:50]}...")
-                else:
-                    # 沒有找到相似知識，保留
-                    unique_list.append(knowledge)
-
-                # 每處理 10 條顯示進度
-                if idx % 10 == 0:
-                    print(f"   進度: {idx}/{len(knowledge_list)}")
-
-        return unique_list
-
-    async def _recommend_intents(self, knowledge_list: List[Dict], enable_quality_evaluation: bool = True):
+        for knowledge in batch:
+            if not knowledge.get('embedding'):
+                print(f"   ⚠️  知識缺少 embedding，跳過語意檢查: {(knowledge.get('question_summary') or '無問題')[:50]}")
+
+        # 矩陣運算移出 event loop（NumPy 運算期間釋放 GIL）
+        result = await asyncio.to_thread(
+            engine.dedupe,
+            [k.get('embedding') for k in batch],
+            [k.get('question_summary') for k in batch]
+        )
+
+        for group in result.groups:
+            source = "本次上傳" if group.source == SOURCE_UPLOAD else group.source
+            for pos, sim_score in group.members:
+                print(f"   跳過語意相似 (相似度: {sim_score:.4f}, 來源: {source})")
+                print(f"      新問題: {(batch[pos].get('question_summary') or '')[:50]}...")
+                print(f"      相似問題: {(group.matched_question or '')[:50]}...")
+
+        return [None if match else knowledge for knowledge, match in zip(batch, result.matches)]
+
+    async def _load_intent_catalog(self) -> Optional[Dict]:
         """
-        為知識推薦合適的意圖
-
-        使用 LLM 根據問題和答案內容推薦最合適的意圖
-        如果 Excel 已經提供意圖，則直接使用，不調用 LLM
+        取得所有可用的意圖並建立推薦用的清單文字與名稱對照（每個作業一次）
 
-        Args:
-            knowledge_list: 知識列表（會直接修改）
-            enable_quality_evaluation: 是否啟用質量評估（False 時跳過 LLM 推薦，僅處理 Excel 提供的意圖）
+        Returns:
+            {'intents', 'intent_list', 'name_to_id', 'fuzzy_match'}；找不到任何意圖時為 None
         """
-        if not enable_quality_evaluation:
-            print(f"🎯 意圖推薦: 已關閉質量評估，僅處理 Excel 提供的意圖（跳過 LLM 推薦）")
-        else:
-            print(f"🎯 為 {len(knowledge_list)} 條知識推薦意圖...")
-
-        # 1. 取得所有可用的意圖
         async with self.db_pool.acquire() as conn:
             intents = await conn.fetch("""
                 SELECT id, name, description
@@ -1412,8 +1531,7 @@ class KnowledgeImportService(UnifiedJobService):
             """)
 
         if not intents:
-            print("   ⚠️  找不到任何意圖，跳過推薦")
-            return
+            return None
 
         # 建立意圖清單文字
         intent_list = "\n".join([
@@ -1437,65 +1555,89 @@ class KnowledgeImportService(UnifiedJobService):
                     if part and part not in intent_fuzzy_match:
                         intent_fuzzy_match[part] = intent['id']
 
-        # 2. 處理每條知識
-        for idx, knowledge in enumerate(knowledge_list, 1):
-            # 如果 Excel 已提供意圖，直接使用
-            if knowledge.get('intent'):
-                excel_intent = knowledge['intent']
-
-                # 1) 嘗試精確匹配
-                matched_id = intent_name_to_id.get(excel_intent)
-                match_type = "精確匹配"
-
-                # 2) 如果精確匹配失敗，嘗試模糊匹配（查找包含該關鍵字的意圖）
-                if not matched_id:
-                    for intent in intents:
-                        # 如果資料庫意圖名稱包含 Excel 的分類，或反之
-                        if excel_intent in intent['name'] or intent['name'].startswith(excel_intent):
-                            matched_id = intent['id']
-                            match_type = "模糊匹配"
-                            break
-
-                # 3) 如果還是沒有匹配，檢查部分匹配
-                if not matched_id and excel_intent in intent_fuzzy_match:
-                    matched_id = intent_fuzzy_match[excel_intent]
-                    match_type = "部分匹配"
-
-                knowledge['recommended_intent'] = {
-                    'intent_id': matched_id,
-                    'intent_name': excel_intent,
-                    'confidence': 1.0 if matched_id else 0.5,  # 有匹配到 ID 時信心度 100%
-                    'reasoning': f'來自 Excel 分類別欄位: {excel_intent}（{match_type}）' if matched_id else f'來自 Excel 分類別欄位: {excel_intent}（未匹配到資料庫意圖）'
-                }
-                if idx <= 3:  # 只顯示前 3 條
-                    match_status = f"{match_type}→ID:{matched_id}" if matched_id else "未匹配"
-                    print(f"   ✅ {knowledge['question_summary'][:40]}... → {excel_intent} ({match_status})")
-                continue
+        return {
+            'intents': intents,
+            'intent_list': intent_list,
+            'name_to_id': intent_name_to_id,
+            'fuzzy_match': intent_fuzzy_match,
+        }
 
-            # 沒有意圖，需要 LLM 推薦
-            # 🛡️ 如果關閉質量評估，跳過 LLM 推薦
-            if not enable_quality_evaluation:
-                # 設置空的推薦（稍後可在審核時手動設定）
-                knowledge['recommended_intent'] = {
-                    'intent_id': None,
-                    'intent_name': None,
-                    'confidence': 0.0,
-                    'reasoning': '已關閉質量評估，跳過自動推薦'
-                }
-                if idx <= 3:
-                    print(f"   ⏭️  {knowledge['question_summary'][:40]}... → 跳過 LLM 推薦")
-                continue
+    async def _recommend_intent(
+        self,
+        knowledge: Dict,
+        catalog: Dict,
+        enable_quality_evaluation: bool = True,
+        verbose: bool = False
+    ) -> Dict:
+        """
+        為知識推薦合適的意圖（管線階段，會直接修改 knowledge）
 
-            # 啟用質量評估時，使用 LLM 推薦意圖
-            try:
-                prompt = f"""請根據以下問答內容，從意圖清單中選擇最合適的意圖。
+        使用 LLM 根據問題和答案內容推薦最合適的意圖
+        如果 Excel 已經提供意圖，則直接使用，不調用 LLM
+
+        Args:
+            knowledge: 知識
+            catalog: _load_intent_catalog() 的結果
+            enable_quality_evaluation: 是否啟用質量評估（False 時跳過 LLM 推薦，僅處理 Excel 提供的意圖）
+            verbose: 是否印出推薦結果（只顯示前幾條）
+        """
+        # 如果 Excel 已提供意圖，直接使用
+        if knowledge.get('intent'):
+            excel_intent = knowledge['intent']
+
+            # 1) 嘗試精確匹配
+            matched_id = catalog['name_to_id'].get(excel_intent)
+            match_type = "精確匹配"
+
+            # 2) 如果精確匹配失敗，嘗試模糊匹配（查找包含該關鍵字的意圖）
+            if not matched_id:
+                for intent in catalog['intents']:
+                    # 如果資料庫意圖名稱包含 Excel 的分類，或反之
+                    if excel_intent in intent['name'] or intent['name'].startswith(excel_intent):
+                        matched_id = intent['id']
+                        match_type = "模糊匹配"
+                        break
+
+            # 3) 如果還是沒有匹配，檢查部分匹配
+            if not matched_id and excel_intent in catalog['fuzzy_match']:
+                matched_id = catalog['fuzzy_match'][excel_intent]
+                match_type = "部分匹配"
+
+            knowledge['recommended_intent'] = {
+                'intent_id': matched_id,
+                'intent_name': excel_intent,
+                'confidence': 1.0 if matched_id else 0.5,  # 有匹配到 ID 時信心度 100%
+                'reasoning': f'來自 Excel 分類別欄位: {excel_intent}（{match_type}）' if matched_id else f'來自 Excel 分類別欄位: {excel_intent}（未匹配到資料庫意圖）'
+            }
+            if verbose:
+                match_status = f"{match_type}→ID:{matched_id}" if matched_id else "未匹配"
+                print(f"   ✅ {knowledge['question_summary'][:40]}... → {excel_intent} ({match_status})")
+            return knowledge
+
+        # 沒有意圖，需要 LLM 推薦
+        # 🛡️ 如果關閉質量評估，跳過 LLM 推薦
+        if not enable_quality_evaluation:
+            # 設置空的推薦（稍後可在審核時手動設定）
+            knowledge['recommended_intent'] = {
+                'intent_id': None,
+                'intent_name': None,
+                'confidence': 0.0,
+                'reasoning': '已關閉質量評估，跳過自動推薦'
+            }
+            if verbose:
+                print(f"   ⏭️  {knowledge['question_summary'][:40]}... → 跳過 LLM 推薦")
+            return knowledge
+
+        # 啟用質量評估時，使用 LLM 推薦意圖
+        try:
+            prompt = f"""請根據以下問答內容，從意圖清單中選擇最合適的意圖。
 
 問題：{knowledge['question_summary']}
 答案：{knowledge['answer'][:200]}
 
 
 可用的意圖清單：
-{intent_list}
+{catalog['intent_list']}
 
 請以 JSON 格式回應：
 {{
@@ -1507,80 +1649,50 @@ class KnowledgeImportService(UnifiedJobService):
 
 只輸出 JSON，不要加其他說明。"""
 
-                llm_result = await self.llm_provider.async_chat_completion(
-                    model=self.llm_model,
-                    temperature=0.3,
-                    max_tokens=500,  # 意圖推薦只需小量輸出
-                    response_format={"type": "json_object"},
-                    messages=[{"role": "user", "content": prompt}]
-                )
-
-                result = json.loads(llm_result['content'])
-
-                # 儲存推薦結果
-                knowledge['recommended_intent'] = {
-                    'intent_id': result.get('intent_id'),
-                    'intent_name': result.get('intent_name'),
-                    'confidence': result.get('confidence', 0.8),
-                    'reasoning': result.get('reasoning', '')
-                }
+            llm_result = await self._call_llm_limited(
+                prompt,
+                max_tokens=500,  # 意圖推薦只需小量輸出
+                response_format={"type": "json_object"}
+            )
 
-                if idx <= 3:  # 只顯示前 3 條的推薦
-                    print(f"   ✅ {knowledge['question_summary'][:40]}... → {result.get('intent_name')} (信心度: {result.get('confidence', 0):.2f})")
+            result = json.loads(llm_result['content'])
 
-                # 避免 rate limit
-                await asyncio.sleep(0.1)
+            # 儲存推薦結果
+            knowledge['recommended_intent'] = {
+                'intent_id': result.get('intent_id'),
+                'intent_name': result.get('intent_name'),
+                'confidence': result.get('confidence', 0.8),
+                'reasoning': result.get('reasoning', '')
+            }
 
-            except Exception as e:
-                print(f"   ⚠️  意圖推薦失敗 (第 {idx} 條): {e}")
-                # 備用方案：使用預設意圖
-                knowledge['recommended_intent'] = {
-                    'intent_id': 4,  # 服務說明
-                    'intent_name': '服務說明',
-                    'confidence': 0.5,
-                    'reasoning': '無法自動推薦，使用預設意圖'
-                }
+            if verbose:
+                print(f"   ✅ {knowledge['question_summary'][:40]}... → {result.get('intent_name')} (信心度: {result.get('confidence', 0):.2f})")
 
-        # 統計推薦結果
-        excel_intent_count = sum(1 for k in knowledge_list if k.get('intent'))
-        llm_recommended_count = len(knowledge_list) - excel_intent_count
+        except Exception as e:
+            print(f"   ⚠️  意圖推薦失敗: {e}")
+            # 備用方案：使用預設意圖
+            knowledge['recommended_intent'] = {
+                'intent_id': 4,  # 服務說明
+                'intent_name': '服務說明',
+                'confidence': 0.5,
+                'reasoning': '無法自動推薦，使用預設意圖'
+            }
 
-        print(f"   ✅ 意圖推薦完成")
-        if excel_intent_count > 0:
-            print(f"      來自 Excel: {excel_intent_count} 條")
-        if llm_recommended_count > 0:
-            print(f"      LLM 推薦: {llm_recommended_count} 條")
+        return knowledge
 
-    async def _evaluate_quality(self, knowledge_list: List[Dict], enable_quality_evaluation: bool = True):
+    async def _evaluate_quality(self, knowledge: Dict, verbose: bool = False) -> Dict:
         """
-        評估知識答案的質量
+        評估知識答案的質量（管線階段，會直接修改 knowledge）
 
         使用 LLM 評估答案是否有實用價值，避免空泛、循環邏輯或無意義的內容
         評估結果儲存到 knowledge['quality_evaluation']
 
         Args:
-            knowledge_list: 知識列表（會直接修改）
-            enable_quality_evaluation: 是否啟用質量評估（預設 True，關閉可加速大量匯入）
+            knowledge: 知識
+            verbose: 是否印出評估結果（低質量一律印出）
         """
-        # 檢查是否啟用質量評估（API 參數優先於環境變數）
-        if not enable_quality_evaluation or not self.quality_evaluation_enabled:
-            reason = "API 參數關閉" if not enable_quality_evaluation else "環境變數停用 (QUALITY_EVALUATION_ENABLED=false)"
-            print(f"⏭️  質量評估已停用（{reason}）")
-            # 所有知識預設為可接受
-            for knowledge in knowledge_list:
-                knowledge['quality_evaluation'] = {
-                    'quality_score': 8,
-                    'is_acceptable': True,
-                    'issues': [],
-                    'reasoning': f'質量評估已停用（{reason}），預設為可接受'
-                }
-            return
-
-        print(f"🔍 評估 {len(knowledge_list)} 條知識的質量（門檻: {self.quality_evaluation_threshold}/10）...")
-
-        for idx, knowledge in enumerate(knowledge_list, 1):
-            try:
-                prompt = f"""請評估以下問答內容的質量。
+        try:
+            prompt = f"""請評估以下問答內容的質量。
 
 問題：{knowledge['question_summary']}
 答案：{knowledge['answer']}
@@ -1611,52 +1723,40 @@ class KnowledgeImportService(UnifiedJobService):
 
 只輸出 JSON，不要加其他說明。"""
 
-                llm_result = await self.llm_provider.async_chat_completion(
-                    model=self.llm_model,
-                    temperature=0.3,
-                    max_tokens=500,  # 質量評估只需小量輸出
-                    response_format={"type": "json_object"},
-                    messages=[{"role": "user", "content": prompt}]
-                )
-
-                result = json.loads(llm_result['content'])
-
-                # 儲存評估結果
-                knowledge['quality_evaluation'] = {
-                    'quality_score': result.get('quality_score', 5),
-                    'is_acceptable': result.get('is_acceptable', True),
-                    'issues': result.get('issues', []),
-                    'reasoning': result.get('reasoning', '')
-                }
+            llm_result = await self._call_llm_limited(
+                prompt,
+                max_tokens=500,  # 質量評估只需小量輸出
+                response_format={"type": "json_object"}
+            )
 
-                # 顯示低質量的知識
-                if not result.get('is_acceptable', True):
-                    print(f"   ⚠️  低質量 (分數: {result.get('quality_score', 0)}): {knowledge['question_summary'][:40]}...")
-                    print(f"      理由: {result.get('reasoning', '')[:80]}")
-                elif idx <= 3:  # 顯示前 3 條的評估
-                    print(f"   ✅ {knowledge['question_summary'][:40]}... → 分數: {result.get('quality_score', 0)}/10")
+            result = json.loads(llm_result['content'])
 
-                # 避免 rate limit
-                await asyncio.sleep(0.1)
+            # 儲存評估結果
+            knowledge['quality_evaluation'] = {
+                'quality_score': result.get('quality_score', 5),
+                'is_acceptable': result.get('is_acceptable', True),
+                'issues': result.get('issues', []),
+                'reasoning': result.get('reasoning', '')
+            }
 
-            except Exception as e:
-                print(f"   ⚠️  質量評估失敗 (第 {idx} 條): {e}")
-                # 備用方案：預設為可接受
-                knowledge['quality_evaluation'] = {
-                    'quality_score': 6,
-                    'is_acceptable': True,
-                    'issues': [],
-                    'reasoning': '無法自動評估，預設為可接受'
-                }
+            # 顯示低質量的知識
+            if not result.get('is_acceptable', True):
+                print(f"   ⚠️  低質量 (分數: {result.get('quality_score', 0)}): {knowledge['question_summary'][:40]}...")
+                print(f"      理由: {result.get('reasoning', '')[:80]}")
+            elif verbose:
+                print(f"   ✅ {knowledge['question_summary'][:40]}... → 分數: {result.get('quality_score', 0)}/10")
 
-        # 統計質量分布
-        acceptable_count = sum(1 for k in knowledge_list if k.get('quality_evaluation', {}).get('is_acceptable', True))
-        rejected_count = len(knowledge_list) - acceptable_count
+        except Exception as e:
+            print(f"   ⚠️  質量評估失敗: {e}")
+            # 備用方案：預設為可接受
+            knowledge['quality_evaluation'] = {
+                'quality_score': 6,
+                'is_acceptable': True,
+                'issues': [],
+                'reasoning': '無法自動評估，預設為可接受'
+            }
 
-        print(f"   ✅ 質量評估完成")
-        print(f"      可接受: {acceptable_count} 條")
-        if rejected_count > 0:
-            print(f"      低質量: {rejected_count} 條（將自動標記為已拒絕）")
+        return knowledge
 
     async def _clear_vendor_knowledge(self, vendor_id: int):
         """
@@ -1676,16 +1776,176 @@ class KnowledgeImportService(UnifiedJobService):
 
             print(f"   ✅ 已刪除 {deleted_count or 0} 條舊知識")
 
+    @staticmethod
+    def _write_keys(knowledge_list: List[Dict]) -> List[str]:
+        """各條知識的 checkpoint 指紋（process_import_job 於解析後標記；直接呼叫寫入方法時現算）"""
+        if all('_write_key' in k for k in knowledge_list):
+            return [k['_write_key'] for k in knowledge_list]
+        return row_keys(knowledge_list, ('id', 'question_summary', 'answer'))
+
+    def _knowledge_stage_row(
+        self,
+        seq: int,
+        knowledge: Dict,
+        key: str,
+        vendor_id: Optional[int],
+        default_priority: int,
+        default_intent_id: Optional[int]
+    ) -> Dict:
+        """將一條知識轉為知識庫暫存表的一列（欄位見 knowledge_bulk_writer.KB_STAGE_COLUMNS）"""
+        # 將 embedding 轉換為 PostgreSQL vector 格式
+        embedding = knowledge.get('embedding')
+        embedding_str = to_pgvector_literal(embedding) if embedding else None
+
+        # 準備 target_user（knowledge_base 使用陣列，需要轉換）
+        target_user_value = knowledge.get('target_user', 'tenant')
+        target_user_array = [target_user_value] if target_user_value else ['tenant']
+
+        # 從 recommended_intent 取得意圖 ID
+        intent_id = None
+        recommended_intent = knowledge.get('recommended_intent')
+        if recommended_intent:
+            intent_id = recommended_intent.get('intent_id')
+
+        if intent_id is None:  # 使用 is None 而不是 not
+            intent_id = default_intent_id
+
+        return {
+            'key': key,
+            'seq': seq,
+            # 🔧 UPSERT 邏輯：有 ID 且存在時更新，否則新增
+            'knowledge_id': knowledge.get('id'),
+            'vendor_ids': [vendor_id] if vendor_id is not None else [],
+            'question_summary': knowledge['question_summary'],
+            'answer': knowledge['answer'],
+            'keywords': knowledge['keywords'],
+            # 取得業態類型（如果有）
+            'business_types': knowledge.get('business_types', []),
+            'target_user': target_user_array,
+            'source_file': knowledge['source_file'],
+            'source_date': datetime.now().date(),
+            'embedding': embedding_str,
+            'scope': 'global' if not vendor_id else 'vendor',
+            'priority': default_priority,
+            'intent_id': intent_id,
+        }
+
+    async def _write_knowledge_row(self, conn, row: Dict):
+        """逐筆寫入一條知識與意圖映射（批次寫入失敗時的備援路徑）"""
+        knowledge_id = row['knowledge_id']
+        values = (
+            row['vendor_ids'], row['question_summary'], row['answer'], row['keywords'],
+            row['business_types'], row['target_user'], row['source_file'], row['source_date'],
+            row['embedding'], row['scope'], row['priority'],
+        )
+
+        exists = False
+        if knowledge_id:
+            exists = await conn.fetchval(
+                "SELECT EXISTS(SELECT 1 FROM knowledge_base WHERE id = $1)",
+                knowledge_id
+            )
+
+        if exists:
+            # 更新現有知識
+            await conn.execute("""
+                UPDATE knowledge_base SET
+                    vendor_ids = $1,
+                    question_summary = $2,
+                    answer = $3,
+                    keywords = $4,
+                    business_types = $5,
+                    target_user = $6,
+                    source_file = $7,
+                    source_date = $8,
+                    embedding = $9::vector,
+                    scope = $10,
+                    priority = $11,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = $12
+            """, *values, knowledge_id)
+            target_id = knowledge_id
+        else:
+            # 新增知識（提供的 ID 不存在時忽略，使用自動生成）
+            target_id = await conn.fetchval("""
+                INSERT INTO knowledge_base (
+                    vendor_ids,
+                    question_summary,
+                    answer,
+                    keywords,
+                    business_types,
+                    target_user,
+                    source_file,
+                    source_date,
+                    embedding,
+                    scope,
+                    priority,
+                    created_at,
+                    updated_at
+                ) VALUES (
+                    $1, $2, $3, $4, $5, $6, $7, $8, $9::vector, $10, $11,
+                    CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                )
+                RETURNING id
+            """, *values)
+
+        # 插入 / 更新意圖映射
+        if row['intent_id']:
+            await conn.execute("""
+                INSERT INTO knowledge_intent_mapping (knowledge_id, intent_id, intent_type, confidence, assigned_by)
+                VALUES ($1, $2, 'primary', 1.0, 'import')
+                ON CONFLICT (knowledge_id, intent_id)
+                DO UPDATE SET intent_type = 'primary', confidence = 1.0, updated_at = CURRENT_TIMESTAMP
+            """, target_id, row['intent_id'])
+
+    async def _write_chunk(self, conn, chunk: List[Dict], job_id: Optional[str], bulk_write, write_row) -> Set[str]:
+        """
+        寫入一個 chunk（一個交易：集合式寫入 + checkpoint）
+
+        集合式寫入失敗時整個 chunk 回滾，改在新交易內逐筆寫入（每筆一個 savepoint），
+        只略過出錯的列；成功列的 checkpoint 與資料同交易提交。
+
+        Args:
+            conn: asyncpg 連線
+            chunk: 暫存列（需含 key / seq）
+            job_id: 作業 ID（None 時不記錄 checkpoint）
+            bulk_write: async bulk_write(conn, rows)
+            write_row: async write_row(conn, row)
+
+        Returns:
+            成功寫入列的 key
+        """
+        try:
+            async with conn.transaction():
+                await bulk_write(conn, chunk)
+                await record_checkpoint(conn, job_id, [row['key'] for row in chunk])
+            return {row['key'] for row in chunk}
+        except Exception as e:
+            print(f"   ⚠️ 批次寫入失敗，改逐筆寫入（{len(chunk)} 條）: {e}")
+
+        written = []
+        async with conn.transaction():
+            for row in chunk:
+                try:
+                    async with conn.transaction():
+                        await write_row(conn, row)
+                    written.append(row['key'])
+                except Exception as e:
+                    print(f"   ⚠️ 匯入失敗 (第 {row['seq']} 條): {e}")
+            await record_checkpoint(conn, job_id, written)
+        return set(written)
+
     async def _import_to_database(
         self,
         knowledge_list: List[Dict],
         vendor_id: Optional[int],
         import_mode: str,
         default_priority: int = 0,
-        created_by: str = "admin"
+        created_by: str = "admin",
+        job_id: Optional[str] = None
     ) -> Dict:
         """
-        匯入知識到資料庫
+        匯入知識到資料庫（COPY 暫存表 + 集合式寫入，每 chunk 一個交易並記錄 checkpoint）
 
         Args:
             knowledge_list: 知識列表
@@ -1693,6 +1953,7 @@ class KnowledgeImportService(UnifiedJobService):
             import_mode: 匯入模式
             default_priority: 統一優先級（0=未啟用，1=已啟用）
             created_by: 建立者
+            job_id: 作業 ID（重跑同一作業時略過 checkpoint 中已提交的知識）
 
         Returns:
             匯入結果統計
@@ -1702,6 +1963,7 @@ class KnowledgeImportService(UnifiedJobService):
         imported = 0
         skipped = 0
         errors = 0
+        resumed = 0
 
         async with self.db_pool.acquire() as conn:
             # 取得預設意圖 ID
@@ -1716,186 +1978,38 @@ class KnowledgeImportService(UnifiedJobService):
                 print("⚠️ 找不到預設意圖，使用第一個意圖")
                 default_intent_id = await conn.fetchval("SELECT id FROM intents ORDER BY id LIMIT 1")
 
-            for idx, knowledge in enumerate(knowledge_list, 1):
-                try:
-                    # 將 embedding 轉換為 PostgreSQL vector 格式
-                    embedding = knowledge.get('embedding')
-                    embedding_str = None
-                    if embedding:
-                        embedding_str = '[' + ','.join(str(x) for x in embedding) + ']'
-
-                    # 準備 target_user（knowledge_base 使用陣列，需要轉換）
-                    target_user_value = knowledge.get('target_user', 'tenant')
-                    target_user_array = [target_user_value] if target_user_value else ['tenant']
-
-                    # 從 recommended_intent 取得意圖 ID
-                    intent_id = None
-                    recommended_intent = knowledge.get('recommended_intent')
-                    if recommended_intent:
-                        intent_id = recommended_intent.get('intent_id')
-
-                    if intent_id is None:  # 使用 is None 而不是 not
-                        intent_id = default_intent_id
-
-                    # 取得業態類型（如果有）
-                    business_types = knowledge.get('business_types', [])
-
-                    # 🔧 UPSERT 邏輯：檢查是否有 ID（用於更新）
-                    knowledge_id = knowledge.get('id')
-
-                    if knowledge_id:
-                        # 檢查 ID 是否存在
-                        exists = await conn.fetchval(
-                            "SELECT EXISTS(SELECT 1 FROM knowledge_base WHERE id = $1)",
-                            knowledge_id
-                        )
-
-                        if exists:
-                            # 更新現有知識
-                            await conn.execute("""
-                                UPDATE knowledge_base SET
-                                    vendor_ids = $1,
-                                    question_summary = $2,
-                                    answer = $3,
-                                    keywords = $4,
-                                    business_types = $5,
-                                    target_user = $6,
-                                    source_file = $7,
-                                    source_date = $8,
-                                    embedding = $9::vector,
-                                    scope = $10,
-                                    priority = $11,
-                                    updated_at = CURRENT_TIMESTAMP
-                                WHERE id = $12
-                            """,
-                                [vendor_id] if vendor_id is not None else [],
-                                knowledge['question_summary'],
-                                knowledge['answer'],
-                                knowledge['keywords'],
-                                business_types,
-                                target_user_array,
-                                knowledge['source_file'],
-                                datetime.now().date(),
-                                embedding_str,
-                                'global' if not vendor_id else 'vendor',
-                                default_priority,
-                                knowledge_id
-                            )
-
-                            # 更新意圖映射
-                            if intent_id:
-                                await conn.execute("""
-                                    INSERT INTO knowledge_intent_mapping (knowledge_id, intent_id, intent_type, confidence, assigned_by)
-                                    VALUES ($1, $2, 'primary', 1.0, 'import')
-                                    ON CONFLICT (knowledge_id, intent_id)
-                                    DO UPDATE SET intent_type = 'primary', confidence = 1.0, updated_at = CURRENT_TIMESTAMP
-                                """, knowledge_id, intent_id)
-
-                            print(f"   ✏️  更新知識 ID: {knowledge_id}")
-                        else:
-                            # ID 不存在，新增（忽略提供的 ID，使用自動生成）
-                            new_id = await conn.fetchval("""
-                                INSERT INTO knowledge_base (
-                                    vendor_ids,
-                                    question_summary,
-                                    answer,
-                                    keywords,
-                                    business_types,
-                                    target_user,
-                                    source_file,
-                                    source_date,
-                                    embedding,
-                                    scope,
-                                    priority,
-                                    created_at,
-                                    updated_at
-                                ) VALUES (
-                                    $1, $2, $3, $4, $5, $6, $7, $8, $9::vector, $10, $11,
-                                    CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
-                                )
-                                RETURNING id
-                            """,
-                                [vendor_id] if vendor_id is not None else [],
-                                knowledge['question_summary'],
-                                knowledge['answer'],
-                                knowledge['keywords'],
-                                business_types,
-                                target_user_array,
-                                knowledge['source_file'],
-                                datetime.now().date(),
-                                embedding_str,
-                                'global' if not vendor_id else 'vendor',
-                                default_priority
-                            )
-
-                            # 插入意圖映射
-                            if intent_id:
-                                await conn.execute("""
-                                    INSERT INTO knowledge_intent_mapping (knowledge_id, intent_id, intent_type, confidence, assigned_by)
-                                    VALUES ($1, $2, 'primary', 1.0, 'import')
-                                    ON CONFLICT (knowledge_id, intent_id)
-                                    DO UPDATE SET intent_type = 'primary', confidence = 1.0, updated_at = CURRENT_TIMESTAMP
-                                """, new_id, intent_id)
-
-                            print(f"   ⚠️  ID {knowledge_id} 不存在，新增為新知識 (新 ID: {new_id})")
-                    else:
-                        # 沒有 ID，新增知識
-                        new_id = await conn.fetchval("""
-                            INSERT INTO knowledge_base (
-                                vendor_ids,
-                                question_summary,
-                                answer,
-                                keywords,
-                                business_types,
-                                target_user,
-                                source_file,
-                                source_date,
-                                embedding,
-                                scope,
-                                priority,
-                                created_at,
-                                updated_at
-                            ) VALUES (
-                                $1, $2, $3, $4, $5, $6, $7, $8, $9::vector, $10, $11,
-                                CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
-                            )
-                            RETURNING id
-                        """,
-                            [vendor_id] if vendor_id is not None else [],
-                            knowledge['question_summary'],
-                            knowledge['answer'],
-                            knowledge['keywords'],
-                            business_types,
-                            target_user_array,
-                            knowledge['source_file'],
-                            datetime.now().date(),
-                            embedding_str,
-                            'global' if not vendor_id else 'vendor',
-                            default_priority
-                        )
-
-                        # 插入意圖映射
-                        if intent_id:
-                            await conn.execute("""
-                                INSERT INTO knowledge_intent_mapping (knowledge_id, intent_id, intent_type, confidence, assigned_by)
-                                VALUES ($1, $2, 'primary', 1.0, 'import')
-                                ON CONFLICT (knowledge_id, intent_id)
-                                DO UPDATE SET intent_type = 'primary', confidence = 1.0, updated_at = CURRENT_TIMESTAMP
-                            """, new_id, intent_id)
-
-                    imported += 1
-
-                    if idx % 10 == 0:
-                        print(f"   進度: {idx}/{len(knowledge_list)}")
+            committed = await load_checkpoint(conn, job_id)
+            keys = self._write_keys(knowledge_list)
 
+            rows = []
+            for idx, (knowledge, key) in enumerate(zip(knowledge_list, keys), 1):
+                if key in committed:
+                    resumed += 1
+                    continue
+                try:
+                    rows.append(self._knowledge_stage_row(
+                        idx, knowledge, key, vendor_id, default_priority, default_intent_id
+                    ))
                 except Exception as e:
                     print(f"   ⚠️ 匯入失敗 (第 {idx} 條): {e}")
                     errors += 1
 
+            if resumed:
+                print(f"   ⏩ 依 checkpoint 略過先前已寫入的 {resumed} 條")
+
+            for chunk in chunked(rows, self.bulk_write_chunk_size):
+                written = await self._write_chunk(
+                    conn, chunk, job_id, bulk_write_knowledge, self._write_knowledge_row
+                )
+                imported += len(written)
+                errors += len(chunk) - len(written)
+                print(f"   進度: {imported + errors}/{len(rows)}")
+
         return {
             "imported": imported,
             "skipped": skipped,
             "errors": errors,
+            "resumed": resumed,
             "total": len(knowledge_list)
         }
 
@@ -2200,6 +2314,123 @@ class KnowledgeImportService(UnifiedJobService):
             "message": "測試情境已創建為草稿狀態，請前往「測試情境管理」頁面審核"
         }
 
+    def _candidate_stage_row(
+        self,
+        seq: int,
+        knowledge: Dict,
+        key: str,
+        vendor_id: Optional[int],
+        source_type: str,
+        import_source: str,
+        file_name: str
+    ) -> Dict:
+        """將一條知識轉為審核佇列暫存表的一列（欄位見 knowledge_bulk_writer.CANDIDATE_STAGE_COLUMNS）"""
+        # 1. 準備 generation_reasoning（包含意圖推薦、泛化警告和質量評估）
+        recommended_intent = knowledge.get('recommended_intent', {})
+        warnings_list = knowledge.get('warnings', [])
+        quality_eval = knowledge.get('quality_evaluation', {})
+
+        # 提取推薦意圖 ID 並建立陣列
+        intent_ids = []
+        if recommended_intent and recommended_intent.get('intent_id') not in [None, '未推薦', 'null']:
+            try:
+                intent_id = int(recommended_intent.get('intent_id'))
+                intent_ids = [intent_id]
+            except (ValueError, TypeError):
+                pass  # 如果轉換失敗，保持空陣列
+
+        reasoning = f"""對象: {knowledge.get('target_user', '')}, 關鍵字: {', '.join(knowledge.get('keywords', []))}
+
+【推薦意圖】
+意圖 ID: {recommended_intent.get('intent_id', '未推薦')}
+意圖名稱: {recommended_intent.get('intent_name', '未推薦')}
+信心度: {recommended_intent.get('confidence', 0)}
+推薦理由: {recommended_intent.get('reasoning', '無')}"""
+
+        # 如果有泛化警告，加到 reasoning 中
+        if warnings_list:
+            reasoning += f"\n\n【泛化處理】\n" + "\n".join([f"- {w}" for w in warnings_list])
+
+        # 決定狀態：根據質量評估結果
+        is_acceptable = quality_eval.get('is_acceptable', True)
+        if is_acceptable:
+            status = 'pending_review'
+        else:
+            status = 'rejected'
+            # 加入質量評估資訊到 reasoning
+            reasoning += f"\n\n【質量評估 - 自動拒絕】\n"
+            reasoning += f"質量分數: {quality_eval.get('quality_score', 0)}/10\n"
+            reasoning += f"拒絕理由: {quality_eval.get('reasoning', '')}\n"
+            if quality_eval.get('issues'):
+                reasoning += f"問題列表: " + ", ".join(quality_eval.get('issues', []))
+
+        # 2. 將 embedding 轉換為 PostgreSQL vector 格式
+        embedding = knowledge.get('embedding')
+        embedding_str = to_pgvector_literal(embedding) if embedding else None
+
+        return {
+            'key': key,
+            'seq': seq,
+            # 條件式創建測試情境（只有對話記錄需要；規格書/外部檔案 test_scenario_id = NULL）
+            'needs_scenario': source_type == 'line_chat',
+            'source_type': source_type,                 # 'spec_import', 'external_file', 'line_chat'
+            'import_source': import_source,             # 'spec_pdf', 'external_excel', 'line_chat_txt'
+            'source_file_name': file_name,
+            'question': knowledge['question_summary'],
+            'generated_answer': knowledge['answer'],
+            'question_embedding': embedding_str,
+            'confidence_score': 0.85,                   # 匯入知識固定信心分數 85%
+            'generation_prompt': f"從檔案匯入: {file_name}",
+            'ai_model': 'knowledge_import',             # 標記為知識匯入
+            'generation_reasoning': reasoning,          # 包含推薦意圖、泛化警告和質量評估
+            'suggested_sources': [file_name],
+            'warnings': warnings_list,
+            'intent_ids': intent_ids,
+            'keywords': knowledge.get('keywords', []),
+            'priority': knowledge.get('priority', 0),
+            'scope': knowledge.get('scope', 'global'),
+            'vendor_id': vendor_id,
+            'business_types': knowledge.get('business_types', []),
+            'target_user': knowledge.get('target_user'),
+            'status': status,                           # 根據質量評估動態設定
+        }
+
+    async def _write_candidate_row(self, conn, row: Dict, scenario_note: str):
+        """逐筆寫入一條審核佇列候選知識（批次寫入失敗時的備援路徑）"""
+        test_scenario_id = None
+        if row['needs_scenario']:
+            # 對話記錄 → 沿用或建立測試情境
+            test_scenario_id = await conn.fetchval("""
+                SELECT id FROM test_scenarios
+                WHERE test_question = $1
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, row['question'])
+
+            if not test_scenario_id:
+                test_scenario_id = await conn.fetchval("""
+                    INSERT INTO test_scenarios (
+                        test_question,
+                        difficulty,
+                        status,
+                        source,
+                        notes,
+                        created_at
+                    ) VALUES ($1, 'medium', 'pending_review', 'imported', $2, CURRENT_TIMESTAMP)
+                    RETURNING id
+                """, row['question'], scenario_note)
+
+        columns = CANDIDATE_STAGE_COLUMNS[2:]   # 去掉 seq / needs_scenario
+        placeholders = ", ".join(
+            f"${i}::vector" if c == 'question_embedding' else f"${i}"
+            for i, c in enumerate(columns, 2)
+        )
+        await conn.execute(f"""
+            INSERT INTO ai_generated_knowledge_candidates (
+                test_scenario_id, {", ".join(columns)}, created_at, updated_at
+            ) VALUES ($1, {placeholders}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """, test_scenario_id, *(row[c] for c in columns))
+
     async def _import_to_review_queue(
         self,
         knowledge_list: List[Dict],
@@ -2207,13 +2438,15 @@ class KnowledgeImportService(UnifiedJobService):
         created_by: str,
         source_type: str = 'external_file',
         import_source: str = 'external_unknown',
-        file_name: str = 'unknown'
+        file_name: str = 'unknown',
+        job_id: Optional[str] = None
     ) -> Dict:
         """
         將知識匯入到審核佇列（支援多種來源類型）
 
         知識會先進入 ai_generated_knowledge_candidates 表，
-        人工審核通過後才會加入正式的 knowledge_base
+        人工審核通過後才會加入正式的 knowledge_base。
+        寫入方式與 _import_to_database 相同：每 chunk 一個交易（COPY + INSERT ... SELECT + checkpoint）。
 
         Args:
             knowledge_list: 知識列表
@@ -2222,6 +2455,7 @@ class KnowledgeImportService(UnifiedJobService):
             source_type: 來源類型（'ai_generated', 'spec_import', 'external_file', 'line_chat'）
             import_source: 匯入來源（'system_export', 'external_excel', 'spec_pdf', 'line_chat_txt'等）
             file_name: 來源檔案名稱
+            job_id: 作業 ID（重跑同一作業時略過 checkpoint 中已提交的知識）
 
         Returns:
             匯入結果統計
@@ -2233,166 +2467,49 @@ class KnowledgeImportService(UnifiedJobService):
         imported = 0
         auto_rejected = 0
         errors = 0
+        resumed = 0
+        scenario_note = f"從對話記錄匯入: {file_name}"
 
-        async with self.db_pool.acquire() as conn:
-            for idx, knowledge in enumerate(knowledge_list, 1):
-                try:
-                    question = knowledge['question_summary']
-                    answer = knowledge['answer']
-
-                    # 1. 條件式創建測試情境（只有對話記錄需要）
-                    test_scenario_id = None
-                    if source_type == 'line_chat':
-                        # 對話記錄 → 創建測試情境
-                        test_scenario_id = await conn.fetchval("""
-                            SELECT id FROM test_scenarios
-                            WHERE test_question = $1
-                            ORDER BY created_at DESC
-                            LIMIT 1
-                        """, question)
-
-                        # 如果沒有測試情境，先建立一個
-                        if not test_scenario_id:
-                            test_scenario_id = await conn.fetchval("""
-                                INSERT INTO test_scenarios (
-                                    test_question,
-                                    difficulty,
-                                    status,
-                                    source,
-                                    notes,
-                                    created_at
-                                ) VALUES ($1, $2, $3, $4, $5, CURRENT_TIMESTAMP)
-                                RETURNING id
-                            """,
-                                question,
-                                'medium',
-                                'pending_review',
-                                'imported',
-                                f"從對話記錄匯入: {file_name}"
-                            )
-                    # 規格書/外部檔案 → 不創建測試情境（test_scenario_id = NULL）
-
-                    # 2. 準備 generation_reasoning（包含意圖推薦、泛化警告和質量評估）
-                    recommended_intent = knowledge.get('recommended_intent', {})
-                    warnings_list = knowledge.get('warnings', [])
-                    quality_eval = knowledge.get('quality_evaluation', {})
-
-                    # 提取推薦意圖 ID 並建立陣列
-                    intent_ids = []
-                    if recommended_intent and recommended_intent.get('intent_id') not in [None, '未推薦', 'null']:
-                        try:
-                            intent_id = int(recommended_intent.get('intent_id'))
-                            intent_ids = [intent_id]
-                        except (ValueError, TypeError):
-                            pass  # 如果轉換失敗，保持空陣列
+        async def bulk_write(conn, rows):
+            return await bulk_write_candidates(conn, rows, scenario_note)
 
-                    reasoning = f"""對象: {knowledge.get('target_user', '')}, 關鍵字: {', '.join(knowledge.get('keywords', []))}
+        async def write_row(conn, row):
+            await self._write_candidate_row(conn, row, scenario_note)
 
-【推薦意圖】
-意圖 ID: {recommended_intent.get('intent_id', '未推薦')}
-意圖名稱: {recommended_intent.get('intent_name', '未推薦')}
-信心度: {recommended_intent.get('confidence', 0)}
-推薦理由: {recommended_intent.get('reasoning', '無')}"""
-
-                    # 如果有泛化警告，加到 reasoning 中
-                    if warnings_list:
-                        reasoning += f"\n\n【泛化處理】\n" + "\n".join([f"- {w}" for w in warnings_list])
-
-                    # 決定狀態：根據質量評估結果
-                    is_acceptable = quality_eval.get('is_acceptable', True)
-                    if is_acceptable:
-                        status = 'pending_review'
-                    else:
-                        status = 'rejected'
-                        auto_rejected += 1
-                        # 加入質量評估資訊到 reasoning
-                        reasoning += f"\n\n【質量評估 - 自動拒絕】\n"
-                        reasoning += f"質量分數: {quality_eval.get('quality_score', 0)}/10\n"
-                        reasoning += f"拒絕理由: {quality_eval.get('reasoning', '')}\n"
-                        if quality_eval.get('issues'):
-                            reasoning += f"問題列表: " + ", ".join(quality_eval.get('issues', []))
-
-                    # 3. 將 embedding 轉換為 PostgreSQL vector 格式
-                    embedding = knowledge.get('embedding')
-                    embedding_str = None
-                    if embedding:
-                        embedding_str = '[' + ','.join(str(x) for x in embedding) + ']'
-
-                    # 4. 準備新欄位資料
-                    keywords = knowledge.get('keywords', [])
-                    priority = knowledge.get('priority', 0)
-                    scope = knowledge.get('scope', 'global')
-                    business_types = knowledge.get('business_types', [])
-                    target_user = knowledge.get('target_user')
-
-                    # 5. 建立知識候選記錄（含新欄位）
-                    await conn.execute("""
-                        INSERT INTO ai_generated_knowledge_candidates (
-                            test_scenario_id,
-                            source_type,
-                            import_source,
-                            source_file_name,
-                            question,
-                            generated_answer,
-                            question_embedding,
-                            confidence_score,
-                            generation_prompt,
-                            ai_model,
-                            generation_reasoning,
-                            suggested_sources,
-                            warnings,
-                            intent_ids,
-                            keywords,
-                            priority,
-                            scope,
-                            vendor_id,
-                            business_types,
-                            target_user,
-                            status,
-                            created_at,
-                            updated_at
-                        ) VALUES (
-                            $1, $2, $3, $4, $5, $6, $7::vector, $8, $9, $10, $11, $12, $13, $14,
-                            $15, $16, $17, $18, $19, $20, $21, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
-                        )
-                    """,
-                        test_scenario_id,           # $1  - NULL（規格書）或有值（對話記錄）
-                        source_type,                # $2  - 'spec_import', 'external_file', 'line_chat'
-                        import_source,              # $3  - 'spec_pdf', 'external_excel', 'line_chat_txt'
-                        file_name,                  # $4  - 來源檔名
-                        question,                   # $5
-                        answer,                     # $6
-                        embedding_str,              # $7  - 向量嵌入（字串格式）
-                        0.85,                       # $8  - 匯入知識固定信心分數 85%
-                        f"從檔案匯入: {file_name}",  # $9
-                        'knowledge_import',         # $10 - 標記為知識匯入
-                        reasoning,                  # $11 - 包含推薦意圖、泛化警告和質量評估
-                        [file_name],                # $12 - suggested_sources
-                        warnings_list,              # $13 - 泛化警告
-                        intent_ids,                 # $14 - 推薦意圖 ID 陣列
-                        keywords,                   # $15 - 關鍵字
-                        priority,                   # $16 - 優先級
-                        scope,                      # $17 - 適用範圍
-                        vendor_id,                  # $18 - 廠商 ID
-                        business_types,             # $19 - 業務類型
-                        target_user,                # $20 - 目標用戶
-                        status                      # $21 - 根據質量評估動態設定
-                    )
-
-                    imported += 1
-
-                    if idx % 10 == 0:
-                        print(f"   進度: {idx}/{len(knowledge_list)}")
+        async with self.db_pool.acquire() as conn:
+            committed = await load_checkpoint(conn, job_id)
+            keys = self._write_keys(knowledge_list)
 
+            rows = []
+            for idx, (knowledge, key) in enumerate(zip(knowledge_list, keys), 1):
+                if key in committed:
+                    resumed += 1
+                    continue
+                try:
+                    rows.append(self._candidate_stage_row(
+                        idx, knowledge, key, vendor_id, source_type, import_source, file_name
+                    ))
                 except Exception as e:
                     print(f"   ⚠️ 匯入到審核佇列失敗 (第 {idx} 條): {e}")
                     errors += 1
 
+            if resumed:
+                print(f"   ⏩ 依 checkpoint 略過先前已寫入的 {resumed} 條")
+
+            for chunk in chunked(rows, self.bulk_write_chunk_size):
+                written = await self._write_chunk(conn, chunk, job_id, bulk_write, write_row)
+                imported += len(written)
+                errors += len(chunk) - len(written)
+                auto_rejected += sum(1 for row in chunk if row['key'] in written and row['status'] == 'rejected')
+                print(f"   進度: {imported + errors}/{len(rows)}")
+
         print(f"\n   ✅ 匯入完成:")
         print(f"      總共: {len(knowledge_list)} 條")
         print(f"      待審核: {imported - auto_rejected} 條")
         if auto_rejected > 0:
             print(f"      自動拒絕: {auto_rejected} 條（質量不足）")
+        if resumed > 0:
+            print(f"      先前已寫入: {resumed} 條")
         if errors > 0:
             print(f"      錯誤: {errors} 條")
 
@@ -2402,6 +2519,7 @@ class KnowledgeImportService(UnifiedJobService):
             "pending_review": imported - auto_rejected,
             "skipped": 0,
             "errors": errors,
+            "resumed": resumed,
             "total": len(knowledge_list),
             "mode": "review_queue"
         }
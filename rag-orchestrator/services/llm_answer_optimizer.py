@@ -12,13 +12,14 @@ import time
 import psycopg2
 import psycopg2.extras
 from .answer_formatter import AnswerFormatter
+from .cache_bus import get_cache_bus
 from .db_utils import get_db_config
 from .llm_provider import get_llm_provider, LLMProvider
 
 # 業態語氣配置快取（避免頻繁查詢資料庫）
 _TONE_CONFIG_CACHE: Optional[Dict[str, Dict]] = None
 _TONE_CACHE_TIMESTAMP: Optional[float] = None
-_TONE_CACHE_TTL = 300  # 5 分鐘快取
+_TONE_CACHE_TTL = 300  # 5 分鐘快取（無失效發布者，依 TTL 重新載入；POST /reload 經 cache_bus 全部失效）
 
 
 class LLMAnswerOptimizer:
@@ -110,7 +111,8 @@ class LLMAnswerOptimizer:
 
         # 檢查快取是否有效
         if _TONE_CONFIG_CACHE is not None and _TONE_CACHE_TIMESTAMP is not None:
-            if current_time - _TONE_CACHE_TIMESTAMP < _TONE_CACHE_TTL:
+            ttl = get_cache_bus().ttl("tone_config", _TONE_CACHE_TTL)
+            if ttl is None or current_time - _TONE_CACHE_TIMESTAMP < ttl:
                 return _TONE_CONFIG_CACHE.get(business_type)
 
         # 重新載入配置
@@ -1548,3 +1550,6 @@ if __name__ == "__main__":
 
     # 執行測試
     asyncio.run(test_optimizer())
+
+
+get_cache_bus().register("tone_config", lambda _key: LLMAnswerOptimizer.clear_tone_cache())
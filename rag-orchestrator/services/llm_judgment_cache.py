@@ -0,0 +1,286 @@
+"""
+小型 LLM 判斷結果快取（Query Rewrite、相關性把關）
+
+背景：QueryRewriter.rewrite 與 chat 的 _top1_relevance_gate 每個請求各花一次 LLM 往返
+（~300-500ms），但輸出只取決於輸入：
+- 查詢改寫：(正規化問題, model, prompt)
+- 相關性判定：(正規化問題, knowledge_id, 知識 updated_at, model, prompt)
+
+做法：
+- L1：行程內 LRU（TTL + 筆數上限），命中不碰網路
+- L2：Redis（選用；由 CacheService 連線成功後 attach，多 worker 共用）；
+  event loop 上的呼叫端用 aget / aset，L1 命中仍同步、只有 Redis 往返移到執行緒
+- key 含 model 與 prompt 摘要，調整 prompt / 換模型自動失效
+- 知識相關的條目記錄 knowledge_id 關聯（rag:relation 同模式），
+  CacheService.invalidate_by_knowledge_id 時一併清除；updated_at 也在 key 中，知識編輯後舊條目自然不再命中
+- 統計各 namespace 命中率與省下的 LLM 延遲（以未命中時實測的平均 LLM 耗時估算）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text: str) -> str:
+    """問題正規化（全半形統一、小寫、壓縮空白），相同問題的不同寫法共用快取"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def prompt_version(prompt: str) -> str:
+    """prompt 摘要（放進 key，prompt 調整後舊條目自動失效）"""
+    return hashlib.md5(prompt.encode()).hexdigest()[:8]
+
+
+class LlmJudgmentCache:
+    """LLM 判斷結果快取（L1 行程內 LRU + 選用 L2 Redis）"""
+
+    def __init__(self):
+        self.enabled = os.getenv("LLM_JUDGMENT_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = int(os.getenv("LLM_JUDGMENT_CACHE_TTL", "86400"))
+        self.max_entries = int(os.getenv("LLM_JUDGMENT_CACHE_MAX_ENTRIES", "5000"))
+        self.use_redis = os.getenv("LLM_JUDGMENT_CACHE_REDIS", "true").lower() == "true"
+
+        # key → (expires_at, value, knowledge_id)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.redis_client = None
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def attach_redis(self, redis_client):
+        """接上 L2 Redis（文字模式 client；LLM_JUDGMENT_CACHE_REDIS=false 時忽略）"""
+        if self.use_redis:
+            self.redis_client = redis_client
+
+    # ==================== key / 統計 ====================
+
+    @staticmethod
+    def _make_key(namespace: str, parts: Iterable[Any]) -> str:
+        digest = hashlib.md5("\x1f".join(str(p) for p in parts).encode()).hexdigest()[:20]
+        return f"llm:judge:{namespace}:{digest}"
+
+    def _ns_stats(self, namespace: str) -> Dict[str, float]:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = {
+                "lookups": 0, "local_hits": 0, "redis_hits": 0, "misses": 0,
+                "stores": 0, "llm_ms_total": 0.0, "llm_calls_timed": 0,
+            }
+        return stats
+
+    # ==================== 讀寫 ====================
+
+    def get(self, namespace: str, parts: Iterable[Any]) -> Optional[Any]:
+        """
+        查詢快取
+
+        Args:
+            namespace: 判斷種類（如 query_rewrite / relevance_gate）
+            parts: 決定結果的所有輸入（需可轉字串）
+
+        Returns:
+            快取值；未命中回 None
+        """
+        if not self.enabled:
+            return None
+        key = self._make_key(namespace, parts)
+        value = self._get_local(namespace, key)
+        if value is None and self.redis_client is not None:
+            value = self._get_redis(namespace, key)
+        if value is None:
+            self._count_miss(namespace)
+        return value
+
+    async def aget(self, namespace: str, parts: Iterable[Any]) -> Optional[Any]:
+        """get 的 async 版（event loop 上使用）：L1 命中同步回傳，只有 L2 Redis 讀取移到執行緒"""
+        if not self.enabled:
+            return None
+        key = self._make_key(namespace, parts)
+        value = self._get_local(namespace, key)
+        if value is None and self.redis_client is not None:
+            value = await asyncio.to_thread(self._get_redis, namespace, key)
+        if value is None:
+            self._count_miss(namespace)
+        return value
+
+    def _get_local(self, namespace: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            stats = self._ns_stats(namespace)
+            stats["lookups"] += 1
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(key)
+                    stats["local_hits"] += 1
+                    return entry[1]
+                del self._local[key]
+        return None
+
+    def _get_redis(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            raw = self.redis_client.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self._put_local(key, value, None)
+                with self._lock:
+                    self._ns_stats(namespace)["redis_hits"] += 1
+                return value
+        except Exception as e:
+            logger.warning(f"LLM 判斷快取讀取 Redis 失敗: {e}")
+        return None
+
+    def _count_miss(self, namespace: str):
+        with self._lock:
+            self._ns_stats(namespace)["misses"] += 1
+
+    def set(
+        self,
+        namespace: str,
+        parts: Iterable[Any],
+        value: Any,
+        knowledge_id: Optional[int] = None,
+        llm_ms: Optional[float] = None,
+    ):
+        """
+        寫入快取
+
+        Args:
+            namespace: 判斷種類
+            parts: 與 get 相同的輸入
+            value: 判斷結果（需可 JSON 序列化）
+            knowledge_id: 結果依賴的知識（記錄關聯，知識更新時清除）
+            llm_ms: 這次 LLM 呼叫耗時（估算命中省下的延遲）
+        """
+        if not self.enabled:
+            return
+        key = self._make_key(namespace, parts)
+        self._set_local(namespace, key, value, knowledge_id, llm_ms)
+        if self.redis_client is not None:
+            self._set_redis(key, value, knowledge_id)
+
+    async def aset(
+        self,
+        namespace: str,
+        parts: Iterable[Any],
+        value: Any,
+        knowledge_id: Optional[int] = None,
+        llm_ms: Optional[float] = None,
+    ):
+        """set 的 async 版（event loop 上使用）：L1 同步寫入，L2 Redis 寫入移到執行緒"""
+        if not self.enabled:
+            return
+        key = self._make_key(namespace, parts)
+        self._set_local(namespace, key, value, knowledge_id, llm_ms)
+        if self.redis_client is not None:
+            await asyncio.to_thread(self._set_redis, key, value, knowledge_id)
+
+    def _set_local(self, namespace: str, key: str, value: Any, knowledge_id: Optional[int],
+                   llm_ms: Optional[float]):
+        self._put_local(key, value, knowledge_id)
+        with self._lock:
+            stats = self._ns_stats(namespace)
+            stats["stores"] += 1
+            if llm_ms is not None:
+                stats["llm_ms_total"] += llm_ms
+                stats["llm_calls_timed"] += 1
+
+    def _set_redis(self, key: str, value: Any, knowledge_id: Optional[int]):
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.setex(key, self.ttl, json.dumps(value, ensure_ascii=False))
+            if knowledge_id is not None:
+                relation_key = f"llm:judge:relation:knowledge:{knowledge_id}"
+                pipe.sadd(relation_key, key)
+                pipe.expire(relation_key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"LLM 判斷快取寫入 Redis 失敗: {e}")
+
+    def _put_local(self, key: str, value: Any, knowledge_id: Optional[int]):
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl, value, knowledge_id)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    # ==================== 失效 ====================
+
+    def invalidate_knowledge(self, knowledge_id: int) -> int:
+        """
+        清除依賴某筆知識的判斷（本行程 L1 + Redis L2）
+
+        Returns:
+            清除的條目數
+        """
+        with self._lock:
+            stale = [k for k, entry in self._local.items() if entry[2] == knowledge_id]
+            for k in stale:
+                del self._local[k]
+        count = len(stale)
+
+        if self.redis_client is not None:
+            try:
+                relation_key = f"llm:judge:relation:knowledge:{knowledge_id}"
+                keys = self.redis_client.smembers(relation_key)
+                if keys:
+                    count = max(count, self.redis_client.delete(*keys))
+                    # 其他 worker 由 Redis 命中回填的 L1 不帶關聯，一併依 key 清除本行程
+                    with self._lock:
+                        for k in keys:
+                            self._local.pop(k, None)
+                self.redis_client.delete(relation_key)
+            except Exception as e:
+                logger.warning(f"LLM 判斷快取 Redis 失效失敗: {e}")
+        return count
+
+    def clear(self):
+        """清除本行程 L1（測試 / 管理用）"""
+        with self._lock:
+            self._local.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各 namespace 命中率、省下的 LLM 呼叫數與估算延遲"""
+        with self._lock:
+            namespaces = {}
+            for namespace, s in self._stats.items():
+                hits = s["local_hits"] + s["redis_hits"]
+                avg_llm_ms = s["llm_ms_total"] / s["llm_calls_timed"] if s["llm_calls_timed"] else None
+                namespaces[namespace] = {
+                    "lookups": int(s["lookups"]),
+                    "hits": int(hits),
+                    "local_hits": int(s["local_hits"]),
+                    "redis_hits": int(s["redis_hits"]),
+                    "misses": int(s["misses"]),
+                    "hit_ratio": round(hits / s["lookups"], 4) if s["lookups"] else 0.0,
+                    "saved_llm_calls": int(hits),
+                    "avg_llm_ms": round(avg_llm_ms, 1) if avg_llm_ms is not None else None,
+                    "saved_latency_ms_est": round(hits * avg_llm_ms, 1) if avg_llm_ms is not None else None,
+                }
+            return {
+                "enabled": self.enabled,
+                "redis": self.redis_client is not None,
+                "ttl": self.ttl,
+                "local_entries": len(self._local),
+                "max_entries": self.max_entries,
+                "namespaces": namespaces,
+            }
+
+
+# 全局實例
+_llm_judgment_cache: Optional[LlmJudgmentCache] = None
+
+
+def get_llm_judgment_cache() -> LlmJudgmentCache:
+    """取得 LlmJudgmentCache 單例"""
+    global _llm_judgment_cache
+    if _llm_judgment_cache is None:
+        _llm_judgment_cache = LlmJudgmentCache()
+    return _llm_judgment_cache
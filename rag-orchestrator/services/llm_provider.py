@@ -230,6 +230,19 @@ class OpenAIProvider(LLMProvider):
             print(f"❌ OpenAI Async Embedding 生成失敗: {e}")
             return None
 
+    async def async_embeddings(
+        self,
+        texts: List[str],
+        model: Optional[str] = None
+    ) -> List[List[float]]:
+        """批次生成異步 OpenAI embedding（一次請求多筆，依輸入順序回傳；失敗時拋出，由呼叫端決定重試）"""
+        model = model or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        response = await self.async_client.embeddings.create(
+            model=model,
+            input=texts
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
 
 class OpenRouterProvider(LLMProvider):
     """
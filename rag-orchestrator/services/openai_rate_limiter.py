@@ -0,0 +1,162 @@
+"""
+OpenAI 呼叫速率限制（RPM / TPM token bucket）
+
+背景：批次作業（知識匯入、文件轉換）原本以固定 asyncio.sleep 間隔避免 429：
+並行時擋不住，序列時又白白浪費配額。
+
+做法：
+- 每類呼叫（chat / embedding）一個限制器，同一行程內所有批次作業共用
+- 兩個 token bucket：請求數（容量 RPM）與 token 數（容量 TPM），以每秒 1/60 速率補充；
+  acquire(tokens) 等到兩者都足夠才扣除放行（持鎖等待，先到先放行）
+- token 數為呼叫前估算（prompt 字數 + max_tokens，中文約 1 字 1 token，偏保守）
+- 收到 429 時 penalize(seconds)：所有等待者一起暫停，避免同時重試再被擋
+- call_with_limiter：批次作業共用的「取額度 → 呼叫 → 429 退避重試」入口
+
+環境變數：
+    OPENAI_CHAT_RPM / OPENAI_CHAT_TPM              chat 限制（預設 500 / 200000）
+    OPENAI_EMBEDDING_RPM / OPENAI_EMBEDDING_TPM    embedding 限制（預設 3000 / 1000000）
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+_DEFAULT_LIMITS = {
+    "chat": (500, 200_000),
+    "embedding": (3000, 1_000_000),
+}
+
+
+def estimate_tokens(*texts: Optional[str], completion: int = 0) -> int:
+    """保守估算一次呼叫的 token 數（字數 + 預留輸出）"""
+    return sum(len(t) for t in texts if t) + completion
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """是否為 provider 回報的速率限制錯誤（429）"""
+    text = str(error).lower()
+    return "rate_limit" in text or "rate limit" in text or "429" in text
+
+
+class OpenAIRateLimiter:
+    """RPM / TPM 雙 token bucket"""
+
+    def __init__(self, rpm: int, tpm: int, name: str = ""):
+        self.name = name
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.stats = {"acquired": 0, "tokens": 0, "waits": 0, "wait_seconds": 0.0, "penalties": 0}
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int = 1):
+        """
+        等到 RPM / TPM 額度足夠後扣除
+
+        Args:
+            tokens: 本次呼叫估算的 token 數（超過 TPM 時以 TPM 計，避免永遠等不到）
+        """
+        tokens = min(max(1, tokens), self.tpm)
+        async with self._lock:
+            waited = 0.0
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    wait = max(
+                        (1 - self._requests) * 60.0 / self.rpm,
+                        (tokens - self._tokens) * 60.0 / self.tpm,
+                    )
+                if wait <= 0:
+                    break
+                waited += wait
+                await asyncio.sleep(wait)
+            self._requests -= 1
+            self._tokens -= tokens
+            self.stats["acquired"] += 1
+            self.stats["tokens"] += tokens
+            if waited:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] = round(self.stats["wait_seconds"] + waited, 3)
+
+    def penalize(self, seconds: float):
+        """收到 429 後暫停所有呼叫 seconds 秒"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.stats["penalties"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "rpm": self.rpm, "tpm": self.tpm, **self.stats}
+
+
+# 全局實例（依呼叫類型）
+_rate_limiters: Dict[str, OpenAIRateLimiter] = {}
+
+
+def get_rate_limiter(kind: str = "chat") -> OpenAIRateLimiter:
+    """
+    取得共用限制器
+
+    Args:
+        kind: "chat" 或 "embedding"
+    """
+    limiter = _rate_limiters.get(kind)
+    if limiter is None:
+        default_rpm, default_tpm = _DEFAULT_LIMITS.get(kind, _DEFAULT_LIMITS["chat"])
+        prefix = f"OPENAI_{kind.upper()}"
+        limiter = OpenAIRateLimiter(
+            rpm=int(os.getenv(f"{prefix}_RPM", str(default_rpm))),
+            tpm=int(os.getenv(f"{prefix}_TPM", str(default_tpm))),
+            name=kind,
+        )
+        _rate_limiters[kind] = limiter
+    return limiter
+
+
+async def call_with_limiter(
+    provider,
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    tokens: Optional[int] = None,
+    max_retries: int = 3,
+    temperature: float = 0.3,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    經共用 chat 限制器呼叫 LLM（取代固定 sleep）；429 時暫停所有呼叫後重試
+
+    只有 OpenAIProvider 實作 async_chat_completion，其他 provider（openrouter / ollama）
+    改在執行緒中呼叫同步的 chat_completion。
+
+    Args:
+        provider: LLMProvider
+        messages: 對話訊息
+        max_tokens: 最大輸出 tokens（同時計入 TPM 估算）
+        tokens: 本次呼叫估算的 token 數（None 時以訊息字數 + max_tokens 估算）
+        max_retries: 含首次的最多呼叫次數
+    """
+    limiter = get_rate_limiter("chat")
+    if tokens is None:
+        tokens = estimate_tokens(*(m["content"] for m in messages), completion=max_tokens)
+    call_async = getattr(provider, "async_chat_completion", None)
+    for attempt in range(max(1, max_retries)):
+        await limiter.acquire(tokens)
+        try:
+            params = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+            if call_async is not None:
+                return await call_async(**params)
+            return await asyncio.to_thread(provider.chat_completion, **params)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt + 1 >= max_retries:
+                raise
+            limiter.penalize(min(60, 5 * 2 ** attempt))
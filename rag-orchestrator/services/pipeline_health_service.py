@@ -414,6 +414,9 @@ class PipelineHealthService:
                     (vector_str,),
                 )
                 rows = cursor.fetchall()
+
+                # Step 3: 檢索 SQL 的執行計畫須使用向量索引
+                index_error = self._check_vector_index_usage(cursor, vector_str) if rows else None
                 cursor.close()
             finally:
                 conn.close()
@@ -425,10 +428,10 @@ class PipelineHealthService:
             latency = (time.time() - start) * 1000
             return {
                 "name": "Vector Search",
-                "status": "healthy",
+                "status": "degraded" if index_error else "healthy",
                 "latency_ms": round(latency, 2),
                 "version": None,
-                "error": None,
+                "error": index_error,
                 "is_core": False,
                 "degradation_impact": DEGRADATION_IMPACTS["Vector Search"],
             }
@@ -444,6 +447,53 @@ class PipelineHealthService:
                 "degradation_impact": DEGRADATION_IMPACTS["Vector Search"],
             }
 
+    @staticmethod
+    def _check_vector_index_usage(cursor, vector_str: str, vendor_id: Optional[int] = None) -> Optional[str]:
+        """
+        EXPLAIN 檢索器實際的向量檢索 SQL（b2c tenant 形狀），確認使用 ANN 索引
+
+        資料筆數低於 VECTOR_INDEX_MIN_ROWS 時 planner 走 Seq Scan 屬正常，不告警。
+
+        Args:
+            vendor_id: 以哪個業者的查詢形狀檢查（None 時取第一個啟用中的業者）
+
+        Returns:
+            未使用索引時的錯誤訊息；正常則 None
+        """
+        from .vector_index import apply_search_settings, explain_uses_vector_index, get_vector_index_config
+        from .vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2
+
+        config = get_vector_index_config()
+        cursor.execute(
+            "SELECT count(*) FROM knowledge_base WHERE embedding IS NOT NULL AND is_active = TRUE"
+        )
+        row_count = cursor.fetchone()[0]
+        if row_count < config.min_rows_for_index:
+            return None
+
+        if vendor_id is None:
+            cursor.execute("SELECT id, business_types FROM vendors WHERE is_active = TRUE ORDER BY id LIMIT 1")
+            vendor = cursor.fetchone()
+            if not vendor:
+                return None  # 尚無啟用中的業者，無檢索形狀可檢查
+            vendor_id, business_types = vendor[0], vendor[1] or []
+        else:
+            cursor.execute("SELECT business_types FROM vendors WHERE id = %s", (vendor_id,))
+            row = cursor.fetchone()
+            business_types = (row[0] if row else None) or []
+
+        sql, params = VendorKnowledgeRetrieverV2._build_vector_search_query(
+            vector_str, vendor_id, business_types, ["tenant", "all_users"], False, 20,
+        )
+        apply_search_settings(cursor, config)
+        result = explain_uses_vector_index(cursor, sql, params)
+        if result["uses_index"]:
+            return None
+        if not result["vector_indexes"]:
+            return f"knowledge_base 沒有向量索引（{row_count} 筆，檢索為 Seq Scan）"
+        logger.warning(f"⚠️ 向量檢索未使用 ANN 索引: {result}")
+        return f"向量檢索未使用 ANN 索引（{row_count} 筆，現有索引: {', '.join(result['vector_indexes'])}）"
+
     # ------------------------------------------------------------------
     # 端到端測試
     # ------------------------------------------------------------------
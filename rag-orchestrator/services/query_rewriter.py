@@ -4,13 +4,16 @@
 提升向量檢索的匹配率。
 
 成本：~$0.001/次（gpt-3.5-turbo, ~200 tokens I/O）
-延遲：~300-500ms
+延遲：~300-500ms（相同問題的改寫結果經 LlmJudgmentCache 記憶，命中時 <1ms）
 """
 
 import os
 import logging
+import time
 from typing import Optional
 
+from .llm_judgment_cache import get_llm_judgment_cache, normalize_question, prompt_version
+
 logger = logging.getLogger(__name__)
 
 
@@ -59,6 +62,7 @@ class QueryRewriter:
         self.temperature = float(os.getenv("QUERY_REWRITE_TEMPERATURE", "0.3"))
         self.max_tokens = int(os.getenv("QUERY_REWRITE_MAX_TOKENS", "100"))
         self._provider = None
+        self._cache = get_llm_judgment_cache()
 
         if self.enabled:
             try:
@@ -87,7 +91,14 @@ class QueryRewriter:
         if len(query.strip()) < 3:
             return []
 
+        # 改寫結果只取決於 (正規化問題, model, prompt)
+        cache_parts = (normalize_question(query), self.model, prompt_version(self.REWRITE_PROMPT))
+        cached = self._cache.get("query_rewrite", cache_parts)
+        if cached is not None:
+            return [line for line in cached if line != query]
+
         try:
+            t0 = time.perf_counter()
             result = self._provider.chat_completion(
                 model=self.model,
                 messages=[
@@ -111,6 +122,8 @@ class QueryRewriter:
 
             if rewrites:
                 logger.info(f"🔄 Query Rewrite: 「{query}」→ {rewrites}")
+                self._cache.set("query_rewrite", cache_parts, rewrites,
+                                llm_ms=(time.perf_counter() - t0) * 1000)
 
             return rewrites
 
@@ -0,0 +1,143 @@
+"""
+請求內的階段排程（/api/v1/message 檢索路徑）
+
+背景：原本檢索前依序執行 Query Rewrite（同步 LLM 呼叫，直接卡住 event loop）、
+Embedding、SOP context 讀取，之後 SOP 與知識庫檢索才開始；這些步驟彼此大多獨立。
+
+做法：
+- 每個階段一建立就以 asyncio.Task 啟動；阻塞的同步呼叫以 asyncio.to_thread 卸載
+- 依賴以「階段內 await 另一個階段」表達，消費者只等自己需要的輸入
+  （例如原始查詢的向量檢索只等 embedding，改寫查詢的檢索才等 rewrite）
+- 前置階段失敗不拋出，回傳該階段的 default 並記錄 status=error（與原本 try/except pass 的降級一致）；
+  檢索階段以 raise_errors=True 啟動，例外照常交給呼叫端
+- 記錄每個階段相對請求開始的 start/end（ms），並依宣告的依賴推出關鍵路徑，供 debug_info 顯示
+- 每個階段同時是一個 tracing span（階段內的檢索 span 掛在其下）
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class StageScheduler:
+    """單一請求的階段排程器（不跨請求共用）"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        """
+        Args:
+            started_at: 請求開始時間（time.perf_counter()；預設為建立當下）
+        """
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._deps: Dict[str, tuple] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    async def _run(self, name: str, awaitable: Awaitable, default: Any, raise_errors: bool):
+        timing = self.timings[name] = {"start_ms": self._elapsed_ms(), "status": "running"}
+        try:
+            with span(name, stage=True):
+                result = await awaitable
+            timing["status"] = "ok"
+            return result
+        except asyncio.CancelledError:
+            timing["status"] = "cancelled"
+            raise
+        except Exception as e:
+            timing["status"] = "error"
+            timing["error"] = f"{type(e).__name__}: {e}"
+            if raise_errors:
+                raise
+            logger.warning(f"階段 {name} 失敗，使用預設值: {e}")
+            return default
+        finally:
+            timing["end_ms"] = self._elapsed_ms()
+            timing["duration_ms"] = round(timing["end_ms"] - timing["start_ms"], 1)
+
+    def start(
+        self,
+        name: str,
+        awaitable: Awaitable,
+        default: Any = None,
+        deps: Iterable[str] = (),
+        raise_errors: bool = False,
+    ) -> asyncio.Task:
+        """
+        啟動一個非同步階段
+
+        Args:
+            name: 階段名稱（同一請求內唯一）
+            awaitable: 階段的 coroutine
+            default: 失敗時的結果
+            deps: 此階段會等待的其他階段（僅用於推導關鍵路徑）
+            raise_errors: 失敗時照常拋出（由消費者處理），而非回傳 default
+        """
+        task = asyncio.ensure_future(self._run(name, awaitable, default, raise_errors))
+        self._tasks[name] = task
+        self._deps[name] = tuple(deps)
+        return task
+
+    def start_blocking(
+        self,
+        name: str,
+        fn: Callable,
+        *args,
+        default: Any = None,
+        deps: Iterable[str] = (),
+        **kwargs,
+    ) -> asyncio.Task:
+        """啟動一個阻塞的同步階段（在執行緒中執行，不卡 event loop）"""
+        return self.start(name, asyncio.to_thread(fn, *args, **kwargs), default=default, deps=deps)
+
+    def has(self, name: str) -> bool:
+        return name in self._tasks
+
+    def task(self, name: str) -> Optional[asyncio.Task]:
+        """取得階段的 Task（可被多個消費者重複 await）；未啟動回 None"""
+        return self._tasks.get(name)
+
+    async def get(self, name: str, default: Any = None) -> Any:
+        """等待並取得階段結果；未啟動的階段回 default"""
+        task = self._tasks.get(name)
+        if task is None:
+            return default
+        return await task
+
+    def cancel_pending(self):
+        """取消尚未完成的階段（例如語義緩存命中、提前返回時）"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def critical_path(self) -> List[str]:
+        """由最晚結束的階段沿依賴回溯（每步取最晚結束的依賴），即決定總延遲的階段鏈"""
+        finished = {n: t for n, t in self.timings.items() if "end_ms" in t}
+        if not finished:
+            return []
+        # 同時結束時取較晚啟動者（下游階段）
+        order = {n: i for i, n in enumerate(finished)}
+        latest = lambda n: (finished[n]["end_ms"], order[n])
+        path = [max(finished, key=latest)]
+        while True:
+            deps = [d for d in self._deps.get(path[-1], ()) if d in finished and d not in path]
+            if not deps:
+                break
+            path.append(max(deps, key=latest))
+        return list(reversed(path))
+
+    def report(self) -> Dict[str, Any]:
+        """debug_info 用：各階段時間軸與關鍵路徑"""
+        return {
+            "stages": {
+                name: dict(timing, deps=list(self._deps.get(name, ())))
+                for name, timing in sorted(self.timings.items(), key=lambda kv: kv[1]["start_ms"])
+            },
+            "critical_path": self.critical_path(),
+            "elapsed_ms": self._elapsed_ms(),
+        }
@@ -0,0 +1,240 @@
+"""
+匯入知識的批次語意去重（NumPy 相似度矩陣）
+
+背景：匯入時每條知識各呼叫一次 check_knowledge_exists_by_similarity($1::vector)，
+N 條就是 N 次循序 pgvector 掃描；且只和資料庫比，同一份 Excel 裡的近似重複會一起通過。
+
+做法：
+- 每個匯入作業一次撈出範圍內既有向量（正式知識庫 / 審核佇列 / 測試情境，業者範圍與文字去重一致），
+  正規化後堆成 float32 矩陣，每列記錄來源表、ID 與問題
+- dedupe(vectors) 以矩陣乘法分塊計算 batch×corpus 與 batch×batch 的餘弦相似度：
+  - 與既有知識最高相似度 ≥ threshold → 重複（matched source = 該列來源）
+  - 否則與本次上傳中先前保留的項目比對（跨批次累積），≥ threshold → 重複（source = upload）
+  - 保留的項目加入上傳矩陣，供後續項目比對
+- 回傳每筆的比對結果與依「代表項」分組的重複群組
+
+判定門檻與 check_knowledge_exists_by_similarity 相同（0.85）；skip_review 時只比正式知識庫。
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SOURCE_KNOWLEDGE_BASE = "knowledge_base"
+SOURCE_REVIEW_QUEUE = "review_queue"
+SOURCE_TEST_SCENARIOS = "test_scenarios"
+SOURCE_UPLOAD = "upload"
+
+
+@dataclass
+class DuplicateMatch:
+    """單筆重複判定結果"""
+    source: str                      # knowledge_base / review_queue / test_scenarios / upload
+    matched_id: int                  # 既有資料的 ID；upload 時為本次上傳中的位置
+    matched_question: Optional[str]
+    similarity: float
+
+
+@dataclass
+class DuplicateGroup:
+    """以同一代表項為準的重複群組"""
+    source: str
+    matched_id: int
+    matched_question: Optional[str]
+    members: List[Tuple[int, float]] = field(default_factory=list)   # (輸入位置, 相似度)
+
+
+@dataclass
+class DedupResult:
+    matches: List[Optional[DuplicateMatch]]      # 與輸入等長；None 表示保留
+    groups: List[DuplicateGroup]
+
+
+def _to_array(value) -> Optional[np.ndarray]:
+    """pgvector 欄位（字串 '[...]'、list 或 ndarray）轉為 float32 陣列；無值回 None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        body = value.strip().strip('[]')
+        return np.fromstring(body, sep=',', dtype=np.float32) if body else None
+    return np.asarray(value, dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class SemanticDedupEngine:
+    """單一匯入作業的語意去重引擎（既有向量快照 + 本次上傳已保留向量）"""
+
+    def __init__(self, threshold: float = 0.85, chunk_size: int = 2048):
+        """
+        Args:
+            threshold: 相似度門檻（≥ 視為重複）
+            chunk_size: 每次矩陣乘法的列數上限（控制相似度矩陣的記憶體）
+        """
+        self.threshold = threshold
+        self.chunk_size = max(1, chunk_size)
+        self.corpus: Optional[np.ndarray] = None
+        self.corpus_sources: List[Tuple[str, int, Optional[str]]] = []
+        self._uploaded: List[np.ndarray] = []
+        self._uploaded_refs: List[Tuple[int, Optional[str]]] = []
+        self._offset = 0
+        self.stats = {"corpus_rows": 0, "load_ms": 0.0, "checked": 0, "duplicates": 0, "upload_duplicates": 0}
+
+    # ==================== 既有向量 ====================
+
+    async def load_corpus(self, conn, vendor_id: Optional[int], skip_review: bool):
+        """
+        一次撈出範圍內所有既有向量
+
+        Args:
+            conn: asyncpg 連線
+            vendor_id: 業者 ID（None 表示通用知識）
+            skip_review: True 時只比正式知識庫（與原本逐筆檢查一致）
+        """
+        started = time.perf_counter()
+        if vendor_id is not None:
+            kb_sql = """
+                SELECT id, question_summary AS question, embedding AS vec FROM knowledge_base
+                WHERE embedding IS NOT NULL AND vendor_ids && ARRAY[$1]::int[]
+            """
+            queries = [(SOURCE_KNOWLEDGE_BASE, kb_sql, (vendor_id,))]
+        else:
+            kb_sql = """
+                SELECT id, question_summary AS question, embedding AS vec FROM knowledge_base
+                WHERE embedding IS NOT NULL AND array_length(vendor_ids, 1) IS NULL
+            """
+            queries = [(SOURCE_KNOWLEDGE_BASE, kb_sql, ())]
+
+        if not skip_review:
+            vendor_filter = "vendor_id = $1" if vendor_id is not None else "vendor_id IS NULL"
+            args = (vendor_id,) if vendor_id is not None else ()
+            queries.append((SOURCE_REVIEW_QUEUE, f"""
+                SELECT id, question, question_embedding AS vec FROM ai_generated_knowledge_candidates
+                WHERE question_embedding IS NOT NULL AND status = 'pending_review' AND {vendor_filter}
+            """, args))
+            queries.append((SOURCE_TEST_SCENARIOS, f"""
+                SELECT id, test_question AS question, question_embedding AS vec FROM test_scenarios
+                WHERE question_embedding IS NOT NULL AND {vendor_filter}
+            """, args))
+
+        vectors: List[np.ndarray] = []
+        sources: List[Tuple[str, int, Optional[str]]] = []
+        for source, sql, args in queries:
+            for row in await conn.fetch(sql, *args):
+                vec = _to_array(row['vec'])
+                if vec is not None:
+                    vectors.append(vec)
+                    sources.append((source, row['id'], row['question']))
+
+        self.set_corpus(vectors, sources)
+        self.stats["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def set_corpus(self, vectors: Sequence[Sequence[float]], sources: List[Tuple[str, int, Optional[str]]]):
+        """直接設定既有向量（load_corpus 內部使用；離線測試亦可直接呼叫）"""
+        if len(vectors):
+            self.corpus = _normalize(np.asarray(vectors, dtype=np.float32))
+        else:
+            self.corpus = None
+        self.corpus_sources = list(sources)
+        self.stats["corpus_rows"] = len(self.corpus_sources)
+
+    # ==================== 判定 ====================
+
+    def _best_corpus_match(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """batch 每列對既有向量的最高相似度與列索引（分塊計算）"""
+        best = np.full(len(batch), -1.0, dtype=np.float32)
+        best_idx = np.full(len(batch), -1, dtype=np.int64)
+        if self.corpus is None:
+            return best, best_idx
+        for start in range(0, len(self.corpus), self.chunk_size):
+            sims = batch @ self.corpus[start:start + self.chunk_size].T
+            idx = np.argmax(sims, axis=1)
+            score = sims[np.arange(len(batch)), idx]
+            better = score > best
+            best[better] = score[better]
+            best_idx[better] = idx[better] + start
+        return best, best_idx
+
+    def dedupe(
+        self,
+        vectors: Sequence[Optional[Sequence[float]]],
+        questions: Optional[Sequence[Optional[str]]] = None
+    ) -> DedupResult:
+        """
+        判定一批向量是否與既有知識或本次上傳中先前的項目重複
+
+        Args:
+            vectors: 向量列表（None 表示缺 embedding，不判定、不加入比對）
+            questions: 對應的問題文字（供後續項目回報「相似問題」）
+
+        Returns:
+            DedupResult（matches 與輸入等長）
+        """
+        matches: List[Optional[DuplicateMatch]] = [None] * len(vectors)
+        groups: Dict[Tuple[str, int], DuplicateGroup] = {}
+        positions = [i for i, v in enumerate(vectors) if v is not None and len(v)]
+
+        for start in range(0, len(positions), self.chunk_size):
+            chunk_pos = positions[start:start + self.chunk_size]
+            chunk = _normalize(np.asarray([vectors[i] for i in chunk_pos], dtype=np.float32))
+            best, best_idx = self._best_corpus_match(chunk)
+
+            # 與先前批次已保留的上傳項目比對
+            prev_best = np.full(len(chunk), -1.0, dtype=np.float32)
+            prev_idx = np.full(len(chunk), -1, dtype=np.int64)
+            if self._uploaded:
+                uploaded = np.vstack(self._uploaded)
+                for u_start in range(0, len(uploaded), self.chunk_size):
+                    sims = chunk @ uploaded[u_start:u_start + self.chunk_size].T
+                    idx = np.argmax(sims, axis=1)
+                    score = sims[np.arange(len(chunk)), idx]
+                    better = score > prev_best
+                    prev_best[better] = score[better]
+                    prev_idx[better] = idx[better] + u_start
+
+            # 本塊內兩兩相似度：依序判定，只和本塊中已保留的前項比
+            inner = chunk @ chunk.T
+            kept_rows: List[int] = []
+            base = sum(len(u) for u in self._uploaded)
+            for row, pos in enumerate(chunk_pos):
+                match = None
+                if best[row] >= self.threshold:
+                    source, matched_id, question = self.corpus_sources[best_idx[row]]
+                    match = DuplicateMatch(source, matched_id, question, float(best[row]))
+                else:
+                    cand_score, cand_ref = float(prev_best[row]), int(prev_idx[row])
+                    if kept_rows:
+                        inner_scores = inner[row, kept_rows]
+                        k = int(np.argmax(inner_scores))
+                        if inner_scores[k] > cand_score:
+                            cand_score, cand_ref = float(inner_scores[k]), base + k
+                    if cand_score >= self.threshold:
+                        upload_pos, question = self._uploaded_refs[cand_ref]
+                        match = DuplicateMatch(SOURCE_UPLOAD, upload_pos, question, cand_score)
+
+                if match is None:
+                    kept_rows.append(row)
+                    self._uploaded_refs.append((self._offset + pos, questions[pos] if questions else None))
+                    continue
+
+                matches[pos] = match
+                key = (match.source, match.matched_id)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = DuplicateGroup(match.source, match.matched_id, match.matched_question)
+                group.members.append((pos, match.similarity))
+
+            if kept_rows:
+                self._uploaded.append(chunk[kept_rows])
+
+        self._offset += len(vectors)
+        dup_count = sum(1 for m in matches if m is not None)
+        self.stats["checked"] += len(positions)
+        self.stats["duplicates"] += dup_count
+        self.stats["upload_duplicates"] += sum(1 for m in matches if m is not None and m.source == SOURCE_UPLOAD)
+        return DedupResult(matches=matches, groups=list(groups.values()))
@@ -8,6 +8,10 @@ import logging
 
 try:
     import httpx
+    try:
+        from .http_clients import get_sync_client
+    except ImportError:
+        from http_clients import get_sync_client
     use_httpx = True
 except ImportError:
     try:
@@ -41,8 +45,8 @@ class SemanticReranker:
 
         try:
             if use_httpx:
-                with httpx.Client() as client:
-                    response = client.get(f"{self.semantic_api_url}/", timeout=2)
+                # 共用連接池（services/http_clients.py，reranker 目標），保留 keep-alive 連線
+                response = get_sync_client("reranker").get(f"{self.semantic_api_url}/", timeout=2)
             else:
                 response = requests.get(f"{self.semantic_api_url}/", timeout=2)
 
@@ -99,12 +103,11 @@ class SemanticReranker:
             # 配合 base_retriever 的 RERANKER_INPUT_LIMIT 限制（預設 20）雙重保險。
             rerank_timeout = int(os.getenv("RERANKER_HTTP_TIMEOUT", "60"))
             if use_httpx:
-                with httpx.Client() as client:
-                    response = client.post(
-                        f"{self.semantic_api_url}/rerank",
-                        json=request_data,
-                        timeout=rerank_timeout
-                    )
+                response = get_sync_client("reranker").post(
+                    f"{self.semantic_api_url}/rerank",
+                    json=request_data,
+                    timeout=rerank_timeout
+                )
             else:
                 response = requests.post(
                     f"{self.semantic_api_url}/rerank",
@@ -137,6 +140,27 @@ class SemanticReranker:
         # 降級返回原始結果
         return candidates[:top_k]
 
+    def invalidate_pair_cache(self, knowledge_ids: List[int]) -> int:
+        """
+        通知語義模型服務清除指定知識的 pair 分數快取（知識編輯時呼叫）
+
+        Returns:
+            清除筆數（服務不可用或失敗時為 0，不影響知識更新）
+        """
+        if not self.is_available or not use_httpx or not knowledge_ids:
+            return 0
+        try:
+            response = get_sync_client("reranker").post(
+                f"{self.semantic_api_url}/cache/invalidate",
+                json={"knowledge_ids": list(knowledge_ids)},
+                timeout=3
+            )
+            if response.status_code == 200:
+                return response.json().get("invalidated_count") or 0
+        except Exception as e:
+            logger.warning(f"pair 分數快取失效通知失敗: {e}")
+        return 0
+
     def search(
         self,
         query: str,
@@ -170,12 +194,11 @@ class SemanticReranker:
 
             # 調用語義模型搜索 API
             if use_httpx:
-                with httpx.Client() as client:
-                    response = client.post(
-                        f"{self.semantic_api_url}/search",
-                        json=request_data,
-                        timeout=10
-                    )
+                response = get_sync_client("reranker").post(
+                    f"{self.semantic_api_url}/search",
+                    json=request_data,
+                    timeout=10
+                )
             else:
                 response = requests.post(
                     f"{self.semantic_api_url}/search",
@@ -24,6 +24,9 @@ from services.sop_trigger_handler import SOPTriggerHandler, TriggerMode
 from services.keyword_matcher import KeywordMatcher
 from services.sop_next_action_handler import SOPNextActionHandler
 
+# process_message 的 prefetched_context 預設值：表示呼叫端未預先讀取 context（None 代表「已讀取且無 context」）
+CONTEXT_NOT_PREFETCHED = object()
+
 
 class SOPOrchestrator:
     """
@@ -65,7 +68,8 @@ class SOPOrchestrator:
         intent_ids: Optional[List[int]] = None,
         precomputed_embedding=None,
         precomputed_rewrites=None,
-        role_id: Optional[str] = None
+        role_id: Optional[str] = None,
+        prefetched_context=CONTEXT_NOT_PREFETCHED
     ) -> Dict:
         """
         處理用戶訊息（主入口）
@@ -82,6 +86,10 @@ class SOPOrchestrator:
             vendor_id: 業者 ID
             intent_id: 主要意圖 ID
             intent_ids: 所有相關意圖 IDs
+            precomputed_embedding: 預計算的查詢向量
+            precomputed_rewrites: 預計算的改寫查詢（list，或請求階段排程的 rewrite Task）
+            prefetched_context: 已預先讀取的 SOP context（與 embedding 等並行讀取；
+                未提供時於此讀取）
 
         Returns:
             {
@@ -104,7 +112,10 @@ class SOPOrchestrator:
         # ========================================
         # 步驟 1：檢查是否有待處理的 SOP context
         # ========================================
-        sop_context = self.trigger_handler.get_context(session_id)
+        if prefetched_context is CONTEXT_NOT_PREFETCHED:
+            sop_context = self.trigger_handler.get_context(session_id)
+        else:
+            sop_context = prefetched_context
 
         if sop_context:
             print(f"\n📖 發現待處理的 SOP Context")
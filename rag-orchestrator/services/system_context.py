@@ -18,6 +18,8 @@
 
 from typing import Dict, List, Optional
 
+from .cache_bus import get_cache_bus
+
 SYSTEM_DOC_CATEGORY = "系統脈絡"
 # 大小守門：md 設計上限約 1500 中文字；以字元寬鬆估 ~4500，超過告警（不阻斷）
 MAX_CHARS_WARN = 4500
@@ -30,6 +32,7 @@ MINIMAL_FALLBACK = (
 )
 
 # per-key 進程級快取：key = domain_key 或 ""；值 = 已疊加之 system_md（None 表 base 缺）。
+# 系統脈絡知識寫入經 cache_bus "system_context" 跨 worker 清除。
 _cache: Dict[str, Optional[str]] = {}
 
 
@@ -131,3 +134,6 @@ async def get_system_context(db_pool, domain_key: Optional[str] = None) -> str:
 def reset_cache() -> None:
     """清全部 per-key 快取（md 更新後可呼叫；或進程重啟自然重載）。"""
     _cache.clear()
+
+
+get_cache_bus().register("system_context", lambda _key: reset_cache())
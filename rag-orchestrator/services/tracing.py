@@ -0,0 +1,466 @@
+"""
+輕量 span 追蹤（/api/v1/message 管線各階段耗時）
+
+背景：原本各階段耗時以 print(f"⏱️ ...") 輸出，無法彙總（找不到 p99 慢在哪個階段），
+高負載下 stdout 量本身也吃吞吐。
+
+做法：
+- 請求入口以 start_trace 建立 root span（依 TRACING_SAMPLE_RATE 抽樣）
+- 各階段以 span(name) 建立子 span；父子關係經 ContextVar 傳遞，
+  asyncio Task / asyncio.to_thread 建立時複製 context，並行階段自動掛在正確的父 span 下
+- 未啟用或未抽中時 span() 只做一次 ContextVar.get 並回傳共用的 no-op span（近乎零成本）
+- 串流回應：handler 回傳 StreamingResponse 時 body 尚未執行，以 root.defer() + trace_stream()
+  把 root span 延續到串流產生器內，串流結束（或中斷）才結束並記錄
+- 完成的 trace 進入行程內 ring buffer（/api/v1/debug/traces 查詢、各 span p50/p95/p99 彙總），
+  並可選擇匯出到檔案：jsonl（每行一個 trace）或 otlp（OTLP/JSON ExportTraceServiceRequest，
+  與 OpenTelemetry Collector 的 file exporter 格式相同）
+- 匯出由背景執行緒批次序列化 / 寫檔（有界佇列，滿了丟棄並計數），
+  record() 只做 append + put，不在 event loop 上做檔案 I/O
+
+    TRACING_ENABLED=true TRACING_SAMPLE_RATE=0.1 TRACING_EXPORT_PATH=/tmp/traces.jsonl
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TracingConfig:
+    """追蹤參數"""
+
+    enabled: bool = False
+    sample_rate: float = 1.0       # 0~1，請求抽樣比例
+    buffer_size: int = 500         # ring buffer 保留的 trace 數
+    export_path: str = ""          # 匯出檔案（空字串不匯出）
+    export_format: str = "jsonl"   # jsonl / otlp
+    export_queue_size: int = 1000  # 待匯出 trace 上限（滿了丟棄）
+
+    @classmethod
+    def from_env(cls) -> "TracingConfig":
+        return cls(
+            enabled=os.getenv("TRACING_ENABLED", "false").lower() == "true",
+            sample_rate=float(os.getenv("TRACING_SAMPLE_RATE", "1.0")),
+            buffer_size=int(os.getenv("TRACING_BUFFER_SIZE", "500")),
+            export_path=os.getenv("TRACING_EXPORT_PATH", ""),
+            export_format=os.getenv("TRACING_EXPORT_FORMAT", "jsonl").lower(),
+            export_queue_size=int(os.getenv("TRACING_EXPORT_QUEUE_SIZE", "1000")),
+        )
+
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+
+class _NoopSpan:
+    """未追蹤時的共用 span：所有操作皆為空"""
+
+    __slots__ = ()
+    trace_id = None
+
+    def set(self, **attrs):
+        return self
+
+    def defer(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """一個請求的所有 span"""
+
+    __slots__ = ("trace_id", "name", "start_ns", "start_perf", "spans", "root")
+
+    def __init__(self, name: str):
+        self.trace_id = "%032x" % random.getrandbits(128)
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.start_perf = time.perf_counter()
+        self.spans: List["Span"] = []
+        self.root: Optional["Span"] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start_time": self.start_ns / 1e9,
+            "duration_ms": self.root.duration_ms if self.root else None,
+            "attributes": dict(self.root.attrs) if self.root else {},
+            "spans": [s.to_dict() for s in spans],
+        }
+
+
+class Span:
+    """一個階段；可作 with / async with 使用"""
+
+    __slots__ = ("trace", "span_id", "parent", "name", "attrs", "start", "end", "status", "_token", "_deferred")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.end: Optional[float] = None
+        self.status = "ok"
+        self._token = None
+        self._deferred = False
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def parent_id(self) -> Optional[str]:
+        return self.parent.span_id if self.parent else None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return round((self.end - self.start) * 1000, 2) if self.end is not None else None
+
+    def set(self, **attrs) -> "Span":
+        """附加屬性（如結果筆數、是否命中）"""
+        self.attrs.update(attrs)
+        return self
+
+    def defer(self) -> "Span":
+        """離開 with 時不結束本 span（交由 trace_stream 在串流結束時結束）"""
+        self._deferred = True
+        return self
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._deferred and exc_type is None:
+            self._restore_parent()
+            return False
+        self._finish(exc_type, exc)
+        return False
+
+    def _restore_parent(self):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 在不同 context 結束（例如跨 Task 的 async generator）：直接還原父 span
+            _current_span.set(self.parent)
+
+    def _finish(self, exc_type=None, exc=None):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.status = "cancelled" if exc_type.__name__ in ("CancelledError", "GeneratorExit") else "error"
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self._restore_parent()
+        self.trace.spans.append(self)
+        if self.parent is None:
+            get_tracer().record(self.trace)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.start_perf) * 1000, 2),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attrs,
+        }
+
+
+class Tracer:
+    """抽樣、ring buffer 與匯出（行程內單例）"""
+
+    def __init__(self, config: Optional[TracingConfig] = None):
+        self.config = config or TracingConfig.from_env()
+        self._buffer: deque = deque(maxlen=max(1, self.config.buffer_size))
+        self._lock = threading.Lock()
+        self._export_queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=max(1, self.config.export_queue_size))
+        self._export_thread: Optional[threading.Thread] = None
+        self.stats = {"started": 0, "sampled_out": 0, "recorded": 0, "export_errors": 0, "export_dropped": 0}
+
+    def start_trace(self, name: str, **attrs):
+        """建立 root span；未啟用、未抽中或已在 trace 中時回傳 no-op / 子 span"""
+        if not self.config.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(parent.trace, name, parent, attrs)
+        if self.config.sample_rate < 1.0 and random.random() >= self.config.sample_rate:
+            self.stats["sampled_out"] += 1
+            return NOOP_SPAN
+        self.stats["started"] += 1
+        trace = Trace(name)
+        trace.root = Span(trace, name, None, attrs)
+        return trace.root
+
+    def record(self, trace: Trace):
+        """root span 結束：進 ring buffer，並交給背景執行緒匯出"""
+        with self._lock:
+            self._buffer.append(trace)
+            self.stats["recorded"] += 1
+            if not self.config.export_path:
+                return
+            if self._export_thread is None:
+                self._export_thread = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+                self._export_thread.start()
+        try:
+            self._export_queue.put_nowait(trace)
+        except queue.Full:
+            self.stats["export_dropped"] += 1
+
+    def _export_loop(self):
+        """背景匯出：取出目前佇列中所有 trace，序列化後一次寫入、flush"""
+        export_file = None
+        try:
+            while True:
+                batch = [self._export_queue.get()]
+                while True:
+                    try:
+                        batch.append(self._export_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                traces = [t for t in batch if t is not None]
+                if traces:
+                    try:
+                        if export_file is None:
+                            export_file = open(self.config.export_path, "a", encoding="utf-8")
+                        lines = [
+                            json.dumps(to_otlp(t) if self.config.export_format == "otlp" else t.to_dict(),
+                                       ensure_ascii=False, default=str)
+                            for t in traces
+                        ]
+                        export_file.write("\n".join(lines) + "\n")
+                        export_file.flush()
+                    except Exception as e:
+                        self.stats["export_errors"] += len(traces)
+                        logger.warning(f"trace 匯出失敗: {e}")
+                for _ in batch:
+                    self._export_queue.task_done()
+                if stop:
+                    return
+        finally:
+            if export_file is not None:
+                export_file.close()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已 record 的 trace 寫入匯出檔（測試 / 關閉前使用）；逾時回傳 False"""
+        if self._export_thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._export_queue.all_tasks_done:
+            while self._export_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._export_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """停止背景匯出執行緒（先寫完佇列中的 trace）"""
+        thread = self._export_thread
+        if thread is None:
+            return
+        try:
+            self._export_queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("trace 匯出佇列已滿，關閉時未能寫完")
+            return
+        thread.join(timeout)
+        self._export_thread = None
+
+    def recent(self, limit: int = 50, min_ms: Optional[float] = None, span_name: Optional[str] = None) -> List[Dict]:
+        """最近的 trace（新到舊）；可篩選總耗時下限、含特定 span"""
+        with self._lock:
+            traces = list(self._buffer)
+        out = []
+        for trace in reversed(traces):
+            if min_ms is not None and (trace.root.duration_ms or 0) < min_ms:
+                continue
+            if span_name and not any(s.name == span_name for s in trace.spans):
+                continue
+            out.append(trace.to_dict())
+            if len(out) >= limit:
+                break
+        return out
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        with self._lock:
+            for trace in self._buffer:
+                if trace.trace_id == trace_id:
+                    return trace.to_dict()
+        return None
+
+    def span_stats(self) -> Dict[str, Dict[str, Any]]:
+        """ring buffer 內各 span 名稱的耗時分佈（count / p50 / p95 / p99 / max，ms）"""
+        with self._lock:
+            traces = list(self._buffer)
+        durations: Dict[str, List[float]] = {}
+        for trace in traces:
+            for s in trace.spans:
+                if s.duration_ms is not None:
+                    durations.setdefault(s.name, []).append(s.duration_ms)
+
+        def _pct(values: List[float], q: float) -> float:
+            return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+        stats = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            stats[name] = {
+                "count": len(values),
+                "p50": _pct(values, 0.50),
+                "p95": _pct(values, 0.95),
+                "p99": _pct(values, 0.99),
+                "max": values[-1],
+            }
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._buffer.clear()
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config.enabled,
+            "sample_rate": self.config.sample_rate,
+            "buffer_size": self.config.buffer_size,
+            "buffered": len(self._buffer),
+            "export_path": self.config.export_path or None,
+            "export_format": self.config.export_format,
+            "export_pending": self._export_queue.qsize(),
+            **self.stats,
+        }
+
+
+def _otlp_value(value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """trace 轉 OTLP/JSON（ExportTraceServiceRequest）"""
+    spans = []
+    for s in trace.spans:
+        start_ns = trace.start_ns + int((s.start - trace.start_perf) * 1e9)
+        end_ns = start_ns + int(((s.end or s.start) - s.start) * 1e9)
+        span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attrs.items()],
+            "status": {"code": 2} if s.status == "error" else {},
+        }
+        if s.parent_id:
+            span["parentSpanId"] = s.parent_id
+        spans.append(span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "rag-orchestrator"}}]},
+            "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+# ==================== 模組層 API ====================
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """取得 Tracer 單例"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def start_trace(name: str, **attrs):
+    """建立請求的 root span（with / async with 使用）"""
+    return get_tracer().start_trace(name, **attrs)
+
+
+def span(name: str, **attrs):
+    """建立子 span；不在 trace 中時回傳 no-op span"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent, attrs)
+
+
+def current_span():
+    """目前的 span（不在 trace 中時為 no-op span），用於附加屬性"""
+    return _current_span.get() or NOOP_SPAN
+
+
+async def trace_stream(root, body):
+    """
+    在串流 body 內延續已 defer() 的 root span：串流期間 span() 掛在 root 下，
+    串流結束、出錯或客戶端中斷時結束 root 並記錄
+    """
+    if root is NOOP_SPAN:
+        async for chunk in body:
+            yield chunk
+        return
+    root._token = _current_span.set(root)
+    exc_info = (None, None)
+    try:
+        async for chunk in body:
+            yield chunk
+    except BaseException as e:
+        exc_info = (type(e), e)
+        raise
+    finally:
+        root._finish(*exc_info)
+
+
+def traced(name: str):
+    """async 函式 decorator：呼叫包成子 span（不在 trace 中時無額外成本）"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
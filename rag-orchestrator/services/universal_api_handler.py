@@ -16,6 +16,8 @@ from typing import Dict, Any, Optional, List
 import httpx
 from asyncpg.pool import Pool
 
+from .http_clients import get_async_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,7 +32,11 @@ class UniversalAPICallHandler:
             db_pool: 數據庫連接池
         """
         self.db_pool = db_pool
-        self.http_client = httpx.AsyncClient(timeout=60.0)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """共用 HTTP 客戶端（services/http_clients.py，universal_api 目標；生命週期由 app lifespan 管理）"""
+        return get_async_client('universal_api')
 
     async def execute_api_call(
         self,
@@ -470,5 +476,5 @@ class UniversalAPICallHandler:
         }
 
     async def close(self):
-        """關閉 HTTP 客戶端"""
-        await self.http_client.aclose()
+        """保留介面相容；共用 HTTP 客戶端由 HttpClientRegistry 於應用關閉時統一關閉"""
+        return None
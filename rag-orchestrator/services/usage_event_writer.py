@@ -0,0 +1,336 @@
+"""usage_events 批次寫入器（usage-metering 的背景 sink）。
+
+背景：usage_metering.finalize 原本每個請求 create_task 一次單列 INSERT——尖峰時
+每則訊息多一次 pool acquire + 往返，與檢索搶 asyncpg pool（max 10）。
+
+做法：
+- finalize 只把事件列放進有界 asyncio.Queue（put_nowait，滿了計 dropped 丟棄，寧漏勿堵 R1.3）
+- 背景 task 依筆數（USAGE_WRITER_BATCH_SIZE）或間隔（USAGE_WRITER_FLUSH_INTERVAL 秒）
+  整批一次多列 INSERT ... ON CONFLICT (request_id) DO NOTHING（一次 acquire、一次往返）
+- DB 不可用時整批寫入本地 spill 檔（JSONL）；之後任一批寫入成功即回放 spill 檔
+- lifespan 關閉時 stop()：停止收件，背景 task 寫完手上這批並排空佇列後自行結束（失敗則 spill）
+- 回放中途崩潰留下的 spill-*.jsonl.replay-<pid>（認領者已不在）於啟動時改名回可回放的 spill 檔
+- get_stats()：佇列深度、寫入/丟棄/spill/回放計數（/api/v1/system/usage-writer）
+
+未啟動 writer（腳本、測試）時 finalize 維持原本的單列 fire-and-forget。
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 序列化時需還原型別的欄位（其餘為 JSON 原生型別）
+_DATETIME_FIELDS = ("ts",)
+_DATE_FIELDS = ("date_tpe",)
+_DECIMAL_FIELDS = ("est_cost_usd",)
+
+# stop() 放入佇列的關閉訊號：worker 讀到即寫出手上這批後結束
+_CLOSE = object()
+
+
+def _row_to_json(row: Dict[str, Any]) -> str:
+    def _default(v):
+        if isinstance(v, (datetime, date)):
+            return v.isoformat()
+        if isinstance(v, Decimal):
+            return str(v)
+        raise TypeError(f"無法序列化: {type(v).__name__}")
+    return json.dumps(row, ensure_ascii=False, default=_default)
+
+
+def _row_from_json(line: str) -> Dict[str, Any]:
+    row = json.loads(line)
+    for k in _DATETIME_FIELDS:
+        if row.get(k):
+            row[k] = datetime.fromisoformat(row[k])
+    for k in _DATE_FIELDS:
+        if row.get(k):
+            row[k] = date.fromisoformat(row[k])
+    for k in _DECIMAL_FIELDS:
+        if row.get(k) is not None:
+            row[k] = Decimal(row[k])
+    return row
+
+
+async def insert_rows(db_pool, rows: List[Dict[str, Any]]) -> None:
+    """多列 INSERT（一次往返）；request_id 重複者略過（spill 回放可能重送）"""
+    if not rows:
+        return
+    cols = list(rows[0].keys())
+    n = len(cols)
+    values_sql = ", ".join(
+        "(" + ", ".join(f"${r * n + c + 1}" for c in range(n)) + ")" for r in range(len(rows))
+    )
+    sql = (f"INSERT INTO usage_events ({', '.join(cols)}) VALUES {values_sql} "
+           f"ON CONFLICT (request_id) DO NOTHING")
+    args = [row.get(c) for row in rows for c in cols]
+    async with db_pool.acquire() as conn:
+        await conn.execute(sql, *args)
+
+
+class UsageEventWriter:
+    """usage_events 背景批次寫入器（每個 worker 一個）"""
+
+    def __init__(
+        self,
+        db_pool,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        self.db_pool = db_pool
+        self.max_queue = max_queue or int(os.getenv("USAGE_WRITER_MAX_QUEUE", "10000"))
+        # asyncpg 單一語句參數上限 32767；usage_events 24 欄 → 每批最多 ~1300 列
+        self.batch_size = min(batch_size or int(os.getenv("USAGE_WRITER_BATCH_SIZE", "200")), 1000)
+        self.flush_interval = flush_interval or float(os.getenv("USAGE_WRITER_FLUSH_INTERVAL", "2.0"))
+        self.spill_dir = spill_dir or os.getenv("USAGE_SPILL_DIR", "/tmp/usage_spill")
+        self.spill_path = os.path.join(self.spill_dir, f"spill-{os.getpid()}.jsonl")
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._inflight: List[Dict[str, Any]] = []        # worker 已取出、尚未寫入 / spill 的這批
+        self.stats = {
+            "enqueued": 0, "written": 0, "batches": 0, "dropped": 0,
+            "spilled": 0, "replayed": 0, "flush_errors": 0,
+            "last_flush_ms": None, "last_error": None,
+        }
+
+    # ── 收件 ──
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """放入佇列（不等待）；佇列已滿或關閉中 → 丟棄並計數"""
+        if self._closing:
+            self.stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if self.stats["dropped"] % 100 == 1:
+                logger.warning(f"[usage] 寫入佇列已滿（{self.max_queue}），丟棄事件（累計 {self.stats['dropped']}）")
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    # ── 生命週期 ──
+
+    def start(self) -> None:
+        if self._task is None:
+            self._reclaim_stale_replays()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """停止收件；背景 task 寫完手上這批並排空佇列後結束（逾時則取消，未寫入的事件 spill）"""
+        self._closing = True
+        timed_out = False
+        if self._task is not None:
+            try:
+                self._queue.put_nowait(_CLOSE)
+            except asyncio.QueueFull:
+                pass                                      # 佇列滿 → worker 正在排空，佇列清空後自行結束
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+
+        # 逾時取消時手上這批可能已部分寫入；一併 spill，回放時 ON CONFLICT 去重
+        rows = self._inflight + [r for r in self._drain(self._queue.qsize()) if r is not _CLOSE]
+        self._inflight = []
+        if not rows:
+            return
+        if timed_out:
+            logger.warning(f"[usage] 關閉逾時，{len(rows)} 筆寫入 spill")
+            await asyncio.to_thread(self._spill, rows)
+            return
+        try:
+            await asyncio.wait_for(self._flush_all(rows), timeout)
+        except Exception as e:
+            logger.warning(f"[usage] 關閉時寫入失敗，{len(rows)} 筆寫入 spill：{e}")
+            await asyncio.to_thread(self._spill, rows)
+
+    async def _flush_all(self, rows: List[Dict[str, Any]]) -> None:
+        for i in range(0, len(rows), self.batch_size):
+            await self._flush(rows[i:i + self.batch_size])
+
+    async def _run(self) -> None:
+        while True:
+            # 等到第一筆，再於 flush_interval 內湊滿一批
+            first = await self._queue.get()
+            if first is _CLOSE:
+                return
+            batch = self._inflight = [first]
+            closed = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if row is _CLOSE:
+                    closed = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+            self._inflight = []
+            if closed or (self._closing and self._queue.empty()):
+                return
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return rows
+
+    # ── 寫入 / spill ──
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        t0 = time.perf_counter()
+        try:
+            await insert_rows(self.db_pool, rows)
+        except Exception as e:                            # 寧漏勿堵：落地待回放
+            self.stats["flush_errors"] += 1
+            self.stats["last_error"] = f"{type(e).__name__}: {e}"
+            logger.warning(f"[usage] 批次寫入失敗，{len(rows)} 筆寫入 spill：{e}")
+            await asyncio.to_thread(self._spill, rows)
+            return
+        self.stats["written"] += len(rows)
+        self.stats["batches"] += 1
+        self.stats["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if self._spill_files():
+            await self._replay_spill()
+
+    def _spill(self, rows: List[Dict[str, Any]], count: bool = True) -> None:
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(_row_to_json(row) + "\n")
+            if count:
+                self.stats["spilled"] += len(rows)
+        except Exception as e:
+            self.stats["dropped"] += len(rows)
+            logger.warning(f"[usage] spill 寫檔失敗，丟棄 {len(rows)} 筆：{e}")
+
+    def _spill_files(self) -> List[str]:
+        return glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl"))
+
+    def _reclaim_stale_replays(self) -> None:
+        """回放中途崩潰留下的 .replay-<pid> 檔（認領者是自己或已不在）改名回 spill-*.jsonl，待下次回放"""
+        for claimed in glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl.replay-*")):
+            try:
+                pid = int(claimed.rsplit("-", 1)[1])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue                                  # 其他 worker 正在回放
+            base = claimed.split(".jsonl.replay-", 1)[0]
+            try:
+                os.replace(claimed, f"{base}-reclaimed-{time.time_ns()}.jsonl")
+                logger.info(f"[usage] 認領中斷的 spill 回放檔：{claimed}")
+            except OSError:
+                continue                                  # 已被其他 worker 認領
+
+    async def _replay_spill(self) -> None:
+        """回放 spill 檔（含其他 / 已結束 worker 留下的）；先 rename 認領，避免多 worker 重複回放"""
+        for path in self._spill_files():
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.replace(path, claimed)
+            except OSError:
+                continue                                  # 已被其他 worker 認領
+            rows = await asyncio.to_thread(self._read_spill, claimed)
+            for i in range(0, len(rows), self.batch_size):
+                chunk = rows[i:i + self.batch_size]
+                try:
+                    await insert_rows(self.db_pool, chunk)
+                except Exception as e:
+                    logger.warning(f"[usage] spill 回放中斷，剩餘 {len(rows) - i} 筆留待下次：{e}")
+                    await asyncio.to_thread(self._spill, rows[i:], False)   # 回寫不計為新的 spill
+                    break
+                self.stats["replayed"] += len(chunk)
+            os.remove(claimed)
+            logger.info(f"[usage] spill 回放完成：{path}")
+
+    @staticmethod
+    def _read_spill(path: str) -> List[Dict[str, Any]]:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(_row_from_json(line))
+                except Exception as e:                    # 單行損毀不影響其他列
+                    logger.warning(f"[usage] spill 行解析失敗（略過）：{e}")
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "spill_files": len(self._spill_files()),
+            **self.stats,
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ── 行程單例（lifespan 啟停）──
+
+_writer: Optional[UsageEventWriter] = None
+
+
+def get_usage_writer() -> Optional[UsageEventWriter]:
+    """已啟動的 writer；未啟動（腳本 / 測試 / USAGE_WRITER_ENABLED=false）回 None"""
+    return _writer
+
+
+def start_usage_writer(db_pool) -> Optional[UsageEventWriter]:
+    global _writer
+    if os.getenv("USAGE_WRITER_ENABLED", "true").lower() == "false":
+        return None
+    _writer = UsageEventWriter(db_pool)
+    _writer.start()
+    return _writer
+
+
+async def stop_usage_writer() -> None:
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        await writer.stop()
@@ -2,8 +2,9 @@
 
 以 contextvar 承載「本請求」的計量狀態：middleware 進場 begin、
 llm_provider 尾端 add_llm_usage、chat 流程 set_path、出場/串流 finally
-finalize（冪等，雙落點只寫一次）→ asyncio.create_task fire-and-forget 寫
-usage_events。任何失敗只 log，不得影響回答（R1.3）。
+finalize（冪等，雙落點只寫一次）→ 入 usage_event_writer 有界佇列，背景批次寫
+usage_events（writer 未啟動時 asyncio.create_task fire-and-forget 單列寫）。
+任何失敗只 log，不得影響回答（R1.3）。
 
 鐵律：不存問題原文與回答全文（R7，只存 message_len）；
 USAGE_METERING_ENABLED=false 時全鏈 no-op（R8.2）；
@@ -21,6 +22,8 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Any, Dict, Optional
 
+from .usage_event_writer import get_usage_writer
+
 logger = logging.getLogger(__name__)
 
 _TPE = timezone(timedelta(hours=8))          # Asia/Taipei 日界（research 裁決）
@@ -229,7 +232,7 @@ async def _safe_write(db_pool, row: Dict[str, Any]) -> None:
 
 
 def finalize(status: str = "success", http_status: int = 200, db_pool=None) -> None:
-    """冪等收尾：算成本、發 fire-and-forget 寫入。雙落點（middleware/串流 finally）安全。"""
+    """冪等收尾：算成本、交給批次寫入器（未啟動時 fire-and-forget 單列寫入）。雙落點（middleware/串流 finally）安全。"""
     ctx = _ctx.get()
     if ctx is None or ctx._finalized:
         return
@@ -244,6 +247,10 @@ def finalize(status: str = "success", http_status: int = 200, db_pool=None) -> N
         return
     try:
         row = _to_row(ctx)
+        writer = get_usage_writer()
+        if writer is not None:                        # lifespan 已啟動批次寫入器：只入佇列
+            writer.submit(row)
+            return
 
         async def _task():
             await _safe_write(db_pool, row)
@@ -0,0 +1,87 @@
+"""
+向量二進位編碼工具
+
+Redis 快取與服務間傳輸改用緊湊的二進位格式，取代 json.dumps(list)：
+- f32：little-endian float32，1536 維 = 6 KB（JSON 約 30 KB）
+- f16：little-endian float16，1536 維 = 3 KB（精度約 3 位有效數字，cosine 誤差 < 1e-3）
+
+格式寫在快取 key 的版本前綴中（例如 rag:vector:v2:f32:...），
+讀取端依 key 決定解碼方式；舊版 JSON 條目由呼叫端 lazy 遷移。
+
+embedding-service 為獨立容器，內含同一份編碼邏輯（需保持一致）。
+"""
+import base64
+import os
+import struct
+import sys
+from array import array
+from typing import List, Optional, Sequence
+
+SUPPORTED_FORMATS = ("f32", "f16")
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+# knowledge-admin backend/embedding_regeneration.py 使用同一精度（需保持一致）
+_PG_FLOAT = "{:.9g}"
+
+
+def get_vector_format() -> str:
+    """讀取快取向量格式（VECTOR_CACHE_FORMAT，預設 f32；不認得的值一律 f32）"""
+    fmt = os.getenv("VECTOR_CACHE_FORMAT", "f32").lower()
+    return fmt if fmt in SUPPORTED_FORMATS else "f32"
+
+
+def encode_vector(vector: Sequence[float], fmt: str = "f32") -> bytes:
+    """
+    將向量編碼為 little-endian 二進位
+
+    Args:
+        vector: 浮點數序列
+        fmt: 'f32' 或 'f16'
+
+    Returns:
+        二進位資料
+    """
+    if fmt == "f16":
+        return struct.pack(f"<{len(vector)}e", *vector)
+    buf = array("f", vector)
+    if not _LITTLE_ENDIAN:
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def decode_vector(data: bytes, fmt: str = "f32") -> List[float]:
+    """
+    將二進位資料解碼回 float list
+
+    Raises:
+        ValueError: 資料長度與格式不符
+    """
+    if fmt == "f16":
+        if len(data) % 2:
+            raise ValueError("invalid f16 vector payload length")
+        return list(struct.unpack(f"<{len(data) // 2}e", data))
+    if len(data) % 4:
+        raise ValueError("invalid f32 vector payload length")
+    buf = array("f")
+    buf.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        buf.byteswap()
+    return buf.tolist()
+
+
+def decode_b64_vector(data: Optional[str], fmt: str = "f32") -> Optional[List[float]]:
+    """解碼 base64 編碼的二進位向量（embedding-service encoding_format=base64 回應）"""
+    if not data:
+        return None
+    return decode_vector(base64.b64decode(data), fmt)
+
+
+def to_pgvector_literal(vector: Sequence[float]) -> str:
+    """
+    轉為 pgvector 文字格式（'[0.1,0.2,...]'）
+
+    以 9 位有效數字輸出：pgvector 以 float32 儲存，9 位是 float32 來回轉換
+    不失真所需的最少位數（8 位會有部分值差 1 ulp）。與 str(list) 的
+    17 位 repr 相比 SQL 參數仍短三成以上，也省去逗號後空白。
+    """
+    return '[' + ','.join(map(_PG_FLOAT.format, vector)) + ']'
@@ -0,0 +1,287 @@
+"""
+knowledge_base 向量索引（ANN）管理與查詢調校
+
+背景：原本 02-create-knowledge-base.sql 建的是 ivfflat 索引，但 _vector_search 以
+`(1 - (embedding <=> q)) DESC, priority DESC` 排序，planner 無法用距離運算子走索引，
+加上多個陣列重疊過濾，實際上常退化為 Seq Scan。
+
+這裡集中管理：
+- 索引定義：HNSW（m / ef_construction 可調），主索引為部分索引（啟用中且有 embedding），
+  另依常見 target_user 組合、熱門業者建立分區部分索引
+- 查詢端：內層 ORDER BY 純距離（可走索引）多取候選，外層再依相似度 + priority 排序取 LIMIT；
+  每次查詢以 set_config(..., is_local=true) 設定 hnsw.ef_search / ivfflat.probes，
+  pgvector >= 0.8 另設 hnsw.iterative_scan，業者 / 角色過濾後不足 LIMIT 時繼續掃描
+  （僅影響該交易，連接歸還連接池時即 rollback）
+- 健康檢查：EXPLAIN 檢索 SQL，確認計畫使用向量索引
+
+部分索引能被使用的前提是查詢 WHERE 含與索引述詞相同的子句，
+因此過濾子句統一由 target_user_clause() / vendor_clause() 產生，檢索器與索引定義共用。
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_TABLE = "knowledge_base"
+VECTOR_INDEX_METHODS = ("hnsw", "ivfflat")
+
+# 主索引述詞：與檢索 SQL 的固定條件一致
+BASE_PREDICATE = "kb.embedding IS NOT NULL AND kb.is_active = TRUE"
+
+# 常見 target_user 組合（與 VendorKnowledgeRetrieverV2 實際送出的參數一致）：
+# b2c 為 [角色, 'all_users']；b2b 為 [角色]
+DEFAULT_TARGET_USER_PARTITIONS: Tuple[Tuple[str, ...], ...] = (
+    ("tenant", "all_users"),
+    ("landlord", "all_users"),
+    ("property_manager",),
+)
+
+
+@dataclass
+class VectorIndexConfig:
+    """向量索引建立與查詢參數"""
+
+    m: int = 16                       # HNSW 每節點連線數
+    ef_construction: int = 64         # HNSW 建索引時的候選數
+    ef_search: int = 100              # HNSW 查詢候選數（需 >= LIMIT，過濾越多需越大）
+    probes: int = 10                  # ivfflat 查詢的 list 數（僅舊 ivfflat 索引仍存在時有用）
+    iterative_scan: str = "relaxed_order"  # pgvector >= 0.8：off / relaxed_order / strict_order（空字串 = 不設定）
+    overfetch: int = 2                # 內層索引掃描取 LIMIT × overfetch 筆候選，外層依相似度 + priority 排序後取 LIMIT
+    min_rows_for_index: int = 1000    # 資料筆數低於此值時 planner 走 Seq Scan 屬正常，健康檢查不告警
+
+    @classmethod
+    def from_env(cls) -> "VectorIndexConfig":
+        return cls(
+            m=int(os.getenv("VECTOR_INDEX_HNSW_M", "16")),
+            ef_construction=int(os.getenv("VECTOR_INDEX_EF_CONSTRUCTION", "64")),
+            ef_search=int(os.getenv("VECTOR_INDEX_EF_SEARCH", "100")),
+            probes=int(os.getenv("VECTOR_INDEX_PROBES", "10")),
+            iterative_scan=os.getenv("VECTOR_INDEX_ITERATIVE_SCAN", "relaxed_order").strip(),
+            overfetch=max(1, int(os.getenv("VECTOR_INDEX_OVERFETCH", "2"))),
+            min_rows_for_index=int(os.getenv("VECTOR_INDEX_MIN_ROWS", "1000")),
+        )
+
+
+_config: Optional[VectorIndexConfig] = None
+
+
+def get_vector_index_config() -> VectorIndexConfig:
+    """獲取向量索引參數（單例，讀環境變數）"""
+    global _config
+    if _config is None:
+        _config = VectorIndexConfig.from_env()
+    return _config
+
+
+# ==================== 共用過濾子句 ====================
+
+def target_user_clause() -> str:
+    """target_user 過濾子句（NULL 一律放行）；參數為 text[]"""
+    return "(kb.target_user IS NULL OR kb.target_user && %s::text[])"
+
+
+def vendor_clause() -> str:
+    """業者過濾子句（vendor_ids 為空視為通用知識）；參數為 int[]"""
+    return "(array_length(kb.vendor_ids, 1) IS NULL OR kb.vendor_ids && %s::int[])"
+
+
+def _text_array_literal(values: Sequence[str]) -> str:
+    # 與 psycopg2 將 list 轉為 ARRAY[...] 的寫法一致，planner 才能證明查詢述詞蘊含索引述詞
+    return "ARRAY[" + ",".join("'" + str(v).replace("'", "''") + "'" for v in values) + "]"
+
+
+def _int_array_literal(values: Sequence[int]) -> str:
+    return "ARRAY[" + ",".join(str(int(v)) for v in values) + "]"
+
+
+# ==================== 查詢端 ====================
+
+# pgvector 是否支援 hnsw.iterative_scan（>= 0.8；舊版保留 hnsw.* 前綴，設定未知參數會報錯）
+_iterative_scan_supported: Optional[bool] = None
+
+
+def _supports_iterative_scan(cursor) -> bool:
+    """查一次 pgvector 版本（行程內快取）"""
+    global _iterative_scan_supported
+    if _iterative_scan_supported is None:
+        try:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"無法取得 pgvector 版本，本次不設定 hnsw.iterative_scan: {e}")
+            return False
+        version = (row.get("extversion") if isinstance(row, dict) else row[0]) if row else None
+        try:
+            parts = tuple(int(p) for p in str(version).split(".")[:2])
+        except ValueError:
+            parts = (0, 0)
+        _iterative_scan_supported = parts >= (0, 8)
+        if not _iterative_scan_supported:
+            logger.info(f"pgvector {version} 不支援 hnsw.iterative_scan，過濾後候選不足時請調高 VECTOR_INDEX_EF_SEARCH")
+    return _iterative_scan_supported
+
+
+def candidate_limit(limit: int, config: Optional[VectorIndexConfig] = None) -> int:
+    """內層索引掃描的候選筆數（外層排序後取 limit）"""
+    config = config or get_vector_index_config()
+    return limit * config.overfetch
+
+
+def apply_search_settings(cursor, config: Optional[VectorIndexConfig] = None):
+    """
+    設定本交易的 ANN 查詢參數（set_config is_local=true，交易結束即失效）
+
+    Args:
+        cursor: psycopg2 cursor（非 autocommit 連線）
+        config: 參數（預設讀環境變數）
+    """
+    config = config or get_vector_index_config()
+    settings = [("hnsw.ef_search", config.ef_search), ("ivfflat.probes", config.probes)]
+    if config.iterative_scan and _supports_iterative_scan(cursor):
+        settings.append(("hnsw.iterative_scan", config.iterative_scan))
+    cursor.execute(
+        "SELECT " + ", ".join("set_config(%s, %s, true)" for _ in settings),
+        tuple(v for name, value in settings for v in (name, str(value))),
+    )
+
+
+# ==================== 索引定義 ====================
+
+@dataclass
+class IndexSpec:
+    """一個向量索引的定義"""
+
+    name: str
+    predicate: str
+
+    def create_sql(self, config: VectorIndexConfig, concurrently: bool = True) -> str:
+        # 索引述詞不可帶表別名，改寫為欄位名稱
+        predicate = self.predicate.replace("kb.", "")
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} "
+            f"ON {KNOWLEDGE_TABLE} USING hnsw (embedding vector_cosine_ops) "
+            f"WITH (m = {int(config.m)}, ef_construction = {int(config.ef_construction)}) "
+            f"WHERE {predicate}"
+        )
+
+
+def knowledge_index_specs(
+    target_user_partitions: Iterable[Sequence[str]] = DEFAULT_TARGET_USER_PARTITIONS,
+    vendor_ids: Iterable[int] = (),
+) -> List[IndexSpec]:
+    """
+    產生 knowledge_base 的 HNSW 索引定義
+
+    Args:
+        target_user_partitions: 要建分區索引的 target_user 參數組合
+        vendor_ids: 要建分區索引的熱門業者 ID
+
+    Returns:
+        主索引 + 各分區索引
+    """
+    specs = [IndexSpec("idx_kb_embedding_hnsw", BASE_PREDICATE)]
+    for users in target_user_partitions:
+        clause = target_user_clause().replace("%s", _text_array_literal(users))
+        specs.append(IndexSpec(
+            f"idx_kb_embedding_hnsw_tu_{'_'.join(users)}",
+            f"{BASE_PREDICATE} AND {clause}",
+        ))
+    for vendor_id in vendor_ids:
+        clause = vendor_clause().replace("%s", _int_array_literal([vendor_id]))
+        specs.append(IndexSpec(
+            f"idx_kb_embedding_hnsw_vendor_{int(vendor_id)}",
+            f"{BASE_PREDICATE} AND {clause}",
+        ))
+    return specs
+
+
+def list_vector_indexes(cursor) -> Dict[str, str]:
+    """列出 knowledge_base 上的向量索引（name → indexdef）"""
+    cursor.execute(
+        """
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE tablename = %s
+          AND (indexdef ILIKE '%%USING hnsw%%' OR indexdef ILIKE '%%USING ivfflat%%')
+        ORDER BY indexname
+        """,
+        (KNOWLEDGE_TABLE,),
+    )
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def ensure_knowledge_indexes(
+    conn,
+    specs: List[IndexSpec],
+    config: Optional[VectorIndexConfig] = None,
+    drop_ivfflat: bool = False,
+) -> List[str]:
+    """
+    建立缺少的 HNSW 索引（CREATE INDEX CONCURRENTLY，需 autocommit 連線）
+
+    Args:
+        conn: psycopg2 連線（會設為 autocommit）
+        specs: 索引定義
+        config: 建立參數
+        drop_ivfflat: 建立完成後移除舊的 ivfflat 索引
+
+    Returns:
+        本次建立（或移除）的索引名稱
+    """
+    config = config or get_vector_index_config()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    changed = []
+    try:
+        existing = list_vector_indexes(cursor)
+        for spec in specs:
+            if spec.name in existing:
+                continue
+            logger.info(f"建立向量索引: {spec.name}")
+            cursor.execute(spec.create_sql(config))
+            changed.append(spec.name)
+        if drop_ivfflat:
+            for name, indexdef in existing.items():
+                if "USING ivfflat" in indexdef:
+                    logger.info(f"移除 ivfflat 索引: {name}")
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                    changed.append(name)
+        cursor.execute(f"ANALYZE {KNOWLEDGE_TABLE}")
+    finally:
+        cursor.close()
+    return changed
+
+
+# ==================== EXPLAIN 檢查 ====================
+
+def plan_index_names(plan: Dict) -> List[str]:
+    """從 EXPLAIN (FORMAT JSON) 的計畫樹收集所有使用到的索引名稱"""
+    names = []
+    stack = [plan.get("Plan", plan)]
+    while stack:
+        node = stack.pop()
+        if node.get("Index Name"):
+            names.append(node["Index Name"])
+        stack.extend(node.get("Plans", []))
+    return names
+
+
+def explain_uses_vector_index(cursor, sql: str, params: Tuple) -> Dict:
+    """
+    EXPLAIN 檢索 SQL，判斷是否使用向量索引
+
+    Returns:
+        {"uses_index": bool, "indexes": [計畫中使用的向量索引], "vector_indexes": [表上現有向量索引]}
+    """
+    vector_indexes = list_vector_indexes(cursor)
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    raw = cursor.fetchone()[0]
+    plan = raw[0] if isinstance(raw, list) else raw
+    used = [name for name in plan_index_names(plan) if name in vector_indexes]
+    return {
+        "uses_index": bool(used),
+        "indexes": used,
+        "vector_indexes": sorted(vector_indexes),
+    }
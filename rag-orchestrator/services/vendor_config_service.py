@@ -6,6 +6,8 @@ import asyncpg
 from typing import Dict, List, Optional, Any
 from asyncpg.pool import Pool
 
+from .cache_bus import get_cache_bus
+
 
 class VendorConfigService:
     """業者配置服務 - 提供業者參數查詢"""
@@ -18,7 +20,8 @@ class VendorConfigService:
             db_pool: 資料庫連接池
         """
         self.db_pool = db_pool
-        self._cache: Dict[int, Dict[str, Any]] = {}  # vendor_id -> configs
+        self._cache: Dict[str, Dict[str, Any]] = {}  # "vendor_id:category" -> configs
+        get_cache_bus().register("vendor_configs", self.clear_cache)
 
     async def get_vendor_configs(self, vendor_id: int, category: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -348,6 +351,11 @@ class VendorConfigService:
 
         return context
 
-    def clear_cache(self):
-        """清除快取"""
-        self._cache.clear()
+    def clear_cache(self, vendor_id: Optional[int] = None):
+        """清除快取（vendor_id=None 表示全部）"""
+        if vendor_id is None:
+            self._cache.clear()
+            return
+        prefix = f"{vendor_id}:"
+        for cache_key in [k for k in self._cache if k.startswith(prefix)]:
+            del self._cache[cache_key]
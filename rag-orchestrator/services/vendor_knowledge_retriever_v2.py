@@ -9,6 +9,9 @@ from typing import Dict, List, Optional
 from .base_retriever import BaseRetriever
 from .vendor_parameter_resolver import VendorParameterResolver as VendorParamResolver
 from .retrieval_types import make_default_result
+from .vector_codec import to_pgvector_literal
+from .keyword_index import get_keyword_index, keyword_index_enabled, tokenize_keyword
+from .vector_index import BASE_PREDICATE, apply_search_settings, candidate_limit, target_user_clause, vendor_clause
 
 
 class VendorKnowledgeRetrieverV2(BaseRetriever):
@@ -46,6 +49,20 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
         top_k: int,
         similarity_threshold: float,
         **kwargs
+    ) -> List[Dict]:
+        """向量檢索（於 DB 執行緒池執行，不阻塞 event loop）"""
+        return await self._run_db(
+            self._vector_search_sync,
+            query_embedding, vendor_id, top_k, similarity_threshold, **kwargs
+        )
+
+    def _vector_search_sync(
+        self,
+        query_embedding: List[float],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
     ) -> List[Dict]:
         """
         知識庫向量檢索
@@ -54,6 +71,35 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
         - SELECT alias 為 `as vector_similarity`（純向量分數）
         - LIMIT 預設 20（可由 kwargs['vector_limit'] 覆寫）
         """
+        vendor_business_types, target_user_param, is_b2b_mode, vector_limit = \
+            self._resolve_vector_filters(vendor_id, **kwargs)
+
+        conn = self._get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            sql_query, query_params = self._build_vector_search_query(
+                to_pgvector_literal(query_embedding), vendor_id, vendor_business_types,
+                target_user_param, is_b2b_mode, vector_limit,
+            )
+
+            # 本交易的 ANN 參數（hnsw.ef_search / ivfflat.probes）
+            apply_search_settings(cursor)
+            cursor.execute(sql_query, query_params)
+            rows = cursor.fetchall()
+            cursor.close()
+
+            return self._rank_vector_rows(rows)
+
+        finally:
+            conn.close()
+
+    def _resolve_vector_filters(self, vendor_id: int, **kwargs):
+        """
+        向量檢索的過濾參數（單查詢與多查詢共用）
+
+        Returns:
+            (vendor_business_types, target_user_param, is_b2b_mode, vector_limit)
+        """
         # 獲取額外參數
         target_user = kwargs.get('target_user', 'tenant')
         mode = kwargs.get('mode', 'b2c')
@@ -67,90 +113,224 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
         target_user_param = [self._effective_target_user(target_user)]
         if is_b2b_mode:
             vendor_business_types = ['system_provider']
-            business_type_filter_sql = "kb.business_types && %s::text[]"
-            target_user_filter_sql = "AND (kb.target_user IS NULL OR kb.target_user && %s::text[])"
         else:
             vendor_info = self.param_resolver.get_vendor_info(vendor_id)
             # 修正(retrieval-fixes #4):vendor_id 查無時 get_vendor_info 回 None,
             #   None.get() 會 AttributeError 使整個請求 500;改為 null-safe 降級為空業態。
             vendor_business_types = (vendor_info or {}).get('business_types', [])
-            business_type_filter_sql = "(kb.business_types IS NULL OR kb.business_types && %s::text[])"
             # 修正(retrieval-fixes #5):b2c 也過濾 target_user(預設 tenant),避免租客↔房東知識互漏;
             #   'all_users' 為通用標記須一併放行(否則原本對 b2c 可見的通用知識會被擋掉)。
-            target_user_filter_sql = "AND (kb.target_user IS NULL OR kb.target_user && %s::text[])"
             target_user_param = [self._effective_target_user(target_user), 'all_users']
+        return vendor_business_types, target_user_param, is_b2b_mode, vector_limit
+
+    def _rank_vector_rows(self, rows) -> List[Dict]:
+        """SQL 已依相似度 + priority 排序；此處再排一次保證順序（同分 priority DESC，NULL 最前，同 PostgreSQL）"""
+        rows = sorted(
+            rows,
+            key=lambda r: (r['vector_similarity'], r.get('priority') is None, r.get('priority') or 0),
+            reverse=True,
+        )
+        return [self._format_result(dict(row)) for row in rows]
 
-        conn = self._get_db_connection()
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            vector_str = str(query_embedding)
+    async def _vector_search_multi(
+        self,
+        query_embeddings: List[List[float]],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
+    ) -> List[List[Dict]]:
+        """多查詢向量檢索（一條 SQL；於 DB 執行緒池執行）"""
+        if not query_embeddings:
+            return []
+        return await self._run_db(
+            self._vector_search_multi_sync,
+            query_embeddings, vendor_id, top_k, similarity_threshold, **kwargs
+        )
 
-            # 建構 SQL 查詢（不在 SQL 端 threshold 過濾）
-            sql_query = f"""
-                SELECT
-                    kb.id,
-                    kb.question_summary,
-                    kb.answer,
-                    kb.scope,
-                    kb.priority,
-                    kb.vendor_ids,
-                    kb.business_types,
-                    kb.target_user,
-                    kb.keywords,
-                    kb.video_url,
-                    kb.form_id,
-                    kb.action_type,
-                    kb.api_config,
-                    kb.category,
-                    kb.categories,
-                    1 - (kb.embedding <=> %s::vector) as vector_similarity
-                FROM knowledge_base kb
-                WHERE
-                    (array_length(kb.vendor_ids, 1) IS NULL OR kb.vendor_ids && %s::int[])
-                    AND kb.embedding IS NOT NULL
-                    AND kb.is_active = TRUE
-                    AND kb.category IS DISTINCT FROM '{self.SYSTEM_DOC_CATEGORY}'
-                    AND kb.category IS DISTINCT FROM '{self.RULES_DOC_CATEGORY}'
-                    AND {business_type_filter_sql}
-                    {target_user_filter_sql}
-                ORDER BY
-                    (1 - (kb.embedding <=> %s::vector)) DESC,
-                    kb.priority DESC
-                LIMIT %s
-            """
+    def _vector_search_multi_sync(
+        self,
+        query_embeddings: List[List[float]],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
+    ) -> List[List[Dict]]:
+        """
+        多查詢向量檢索：每個查詢向量各取 top-k，一次 DB 往返
 
-            # 構建參數列表（target_user 過濾參數須緊接 business_types 之後、ORDER BY vector_str 之前）
-            query_params = [
-                vector_str,
-                [vendor_id],  # 用於 kb.vendor_ids && %s::int[]
-                vendor_business_types,
-            ]
-            if target_user_filter_sql:
-                query_params.append(target_user_param)
-            query_params += [
-                vector_str,
-                vector_limit
-            ]
+        過濾條件、LIMIT 與排序皆與 _vector_search_sync 相同；結果與 query_embeddings 對齊。
+        """
+        vendor_business_types, target_user_param, is_b2b_mode, vector_limit = \
+            self._resolve_vector_filters(vendor_id, **kwargs)
 
-            cursor.execute(sql_query, tuple(query_params))
+        conn = self._get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            sql_query, query_params = self._build_multi_vector_search_query(
+                [to_pgvector_literal(e) for e in query_embeddings], vendor_id, vendor_business_types,
+                target_user_param, is_b2b_mode, vector_limit,
+            )
+            apply_search_settings(cursor)
+            cursor.execute(sql_query, query_params)
             rows = cursor.fetchall()
             cursor.close()
 
-            results = []
+            grouped: List[List[Dict]] = [[] for _ in query_embeddings]
             for row in rows:
-                results.append(self._format_result(dict(row)))
-
-            return results
+                row = dict(row)
+                grouped[row.pop('query_index') - 1].append(row)
+            return [self._rank_vector_rows(g) for g in grouped]
 
         finally:
             conn.close()
 
+    @classmethod
+    def _vector_search_body(cls, query_vector_sql: str, is_b2b_mode: bool) -> str:
+        """
+        向量檢索的內層 SELECT（單查詢與多查詢共用）
+
+        Args:
+            query_vector_sql: 查詢向量的 SQL 表示式（`%s::vector` 或 LATERAL 外層的 `q.embedding`）
+
+        內層 ORDER BY 純距離（可走 HNSW 索引）取 candidate_limit 筆候選，外層再依
+        相似度 DESC、priority DESC 排序後取 limit：同分的 priority 取捨在 LIMIT 之前完成。
+
+        佔位符順序：[query_vector,] vendor_ids, business_types, target_user, [query_vector,]
+        candidate_limit, limit
+        """
+        if is_b2b_mode:
+            business_type_filter_sql = "kb.business_types && %s::text[]"
+        else:
+            business_type_filter_sql = "(kb.business_types IS NULL OR kb.business_types && %s::text[])"
+
+        return f"""
+            SELECT cand.* FROM (
+            SELECT
+                kb.id,
+                kb.question_summary,
+                kb.answer,
+                kb.scope,
+                kb.priority,
+                kb.vendor_ids,
+                kb.business_types,
+                kb.target_user,
+                kb.keywords,
+                kb.video_url,
+                kb.form_id,
+                kb.action_type,
+                kb.api_config,
+                kb.category,
+                kb.categories,
+                kb.updated_at,
+                1 - (kb.embedding <=> {query_vector_sql}) as vector_similarity
+            FROM knowledge_base kb
+            WHERE
+                {vendor_clause()}
+                AND {BASE_PREDICATE}
+                AND kb.category IS DISTINCT FROM '{cls.SYSTEM_DOC_CATEGORY}'
+                AND kb.category IS DISTINCT FROM '{cls.RULES_DOC_CATEGORY}'
+                AND {business_type_filter_sql}
+                AND {target_user_clause()}
+            ORDER BY kb.embedding <=> {query_vector_sql}
+            LIMIT %s
+            ) cand
+            ORDER BY cand.vector_similarity DESC, cand.priority DESC
+            LIMIT %s
+        """
+
+    @classmethod
+    def _build_vector_search_query(
+        cls,
+        vector_str: str,
+        vendor_id: int,
+        vendor_business_types: List[str],
+        target_user_param: List[str],
+        is_b2b_mode: bool,
+        limit: int,
+    ):
+        """
+        組裝向量檢索 SQL（檢索與 pipeline 健康檢查的 EXPLAIN 共用）
+
+        - 不在 SQL 端 threshold 過濾
+        - 內層 ORDER BY 純距離 `embedding <=> q`，planner 才能使用 HNSW 索引；
+          vendor / target_user 子句與 vector_index 的部分索引述詞一致
+        - 內層多取 limit × VECTOR_INDEX_OVERFETCH 筆，外層依相似度 + priority 取 limit
+
+        Returns:
+            (sql, params)
+        """
+        sql_query = cls._vector_search_body("%s::vector", is_b2b_mode)
+
+        # 參數順序：target_user 緊接 business_types 之後、ORDER BY vector_str 之前
+        query_params = (
+            vector_str,
+            [vendor_id],  # 用於 kb.vendor_ids && %s::int[]
+            vendor_business_types,
+            target_user_param,
+            vector_str,
+            candidate_limit(limit),
+            limit,
+        )
+        return sql_query, query_params
+
+    @classmethod
+    def _build_multi_vector_search_query(
+        cls,
+        vector_strs: List[str],
+        vendor_id: int,
+        vendor_business_types: List[str],
+        target_user_param: List[str],
+        is_b2b_mode: bool,
+        limit: int,
+    ):
+        """
+        組裝多查詢向量檢索 SQL（改寫查詢用）
+
+        查詢向量以 text[] 傳入、unnest 展開（WITH ORDINALITY 標記來源），
+        再以 CROSS JOIN LATERAL 對每個向量執行與單查詢相同的內層 SELECT，
+        每個查詢仍是各自的 `ORDER BY embedding <=> q LIMIT k`（可走 HNSW 索引）。
+
+        Returns:
+            (sql, params)；結果列帶 query_index（1-based，對應 vector_strs 順序）
+        """
+        sql_query = f"""
+            SELECT q.query_index, c.*
+            FROM (
+                SELECT u.vec::vector AS embedding, u.query_index
+                FROM unnest(%s::text[]) WITH ORDINALITY AS u(vec, query_index)
+            ) q
+            CROSS JOIN LATERAL ({cls._vector_search_body("q.embedding", is_b2b_mode)}) c
+            ORDER BY q.query_index, c.vector_similarity DESC, c.priority DESC
+        """
+        query_params = (
+            list(vector_strs),
+            [vendor_id],
+            vendor_business_types,
+            target_user_param,
+            candidate_limit(limit),
+            limit,
+        )
+        return sql_query, query_params
+
     async def _keyword_search(
         self,
         query: str,
         vendor_id: int,
         limit: int,
         **kwargs
+    ) -> List[Dict]:
+        """關鍵字檢索（於 DB 執行緒池執行，jieba 分詞也一併移出 event loop）"""
+        return await self._run_db(
+            self._keyword_search_sync, query, vendor_id, limit, **kwargs
+        )
+
+    def _keyword_search_sync(
+        self,
+        query: str,
+        vendor_id: int,
+        limit: int,
+        **kwargs
     ) -> List[Dict]:
         """
         知識庫關鍵字檢索實作
@@ -210,6 +390,7 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
                     kb.api_config,
                     kb.category,
                     kb.categories,
+                    kb.updated_at,
                     kim.intent_id
                 FROM knowledge_base kb
                 LEFT JOIN knowledge_intent_mapping kim ON kb.id = kim.knowledge_id
@@ -231,68 +412,103 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
                 base_params.append(target_user_param)
 
             all_rows = []
-
-            # 快速路徑：SQL 用 keywords && query_tokens 過濾（精確配對）
-            if query_tokens_for_sql:
-                cursor.execute(
-                    base_sql + " AND kb.keywords && %s::text[] ORDER BY kb.priority DESC, kb.id DESC LIMIT %s",
-                    tuple(base_params + [query_tokens_for_sql, max_rows])
-                )
-                all_rows = cursor.fetchall()
-
-            # Fallback：精確配對 0 結果時撈全部，讓 Python jieba 處理多字詞 keyword
-            if not all_rows:
-                cursor.execute(
-                    base_sql + " ORDER BY kb.priority DESC, kb.id DESC LIMIT %s",
-                    tuple(base_params + [max_rows])
-                )
-                all_rows = cursor.fetchall()
+            order_sql = " ORDER BY kb.priority DESC, kb.id DESC LIMIT %s"
+
+            # 倒排索引已載入：候選 id 由索引給出，只以主鍵取回這些資料列（過濾條件同上）
+            index = get_keyword_index()
+            if index.is_ready and keyword_index_enabled():
+                exact_ids = index.match_keywords(query_tokens_for_sql)
+                if exact_ids:
+                    cursor.execute(
+                        base_sql + " AND kb.id = ANY(%s)" + order_sql,
+                        tuple(base_params + [list(exact_ids), max_rows])
+                    )
+                    all_rows = cursor.fetchall()
+                if not all_rows:
+                    token_ids = index.match_tokens(query_tokens)
+                    if token_ids:
+                        cursor.execute(
+                            base_sql + " AND kb.id = ANY(%s)" + order_sql,
+                            tuple(base_params + [list(token_ids), max_rows])
+                        )
+                        all_rows = cursor.fetchall()
+            else:
+                # 快速路徑：SQL 用 keywords && query_tokens 過濾（精確配對）
+                if query_tokens_for_sql:
+                    cursor.execute(
+                        base_sql + " AND kb.keywords && %s::text[]" + order_sql,
+                        tuple(base_params + [query_tokens_for_sql, max_rows])
+                    )
+                    all_rows = cursor.fetchall()
+
+                # Fallback：精確配對 0 結果時撈全部，讓 Python jieba 處理多字詞 keyword
+                if not all_rows:
+                    cursor.execute(
+                        base_sql + order_sql,
+                        tuple(base_params + [max_rows])
+                    )
+                    all_rows = cursor.fetchall()
 
             cursor.close()
 
-            # 篩選包含匹配關鍵字的知識
-            keyword_matched_knowledge = []
+            candidates = [
+                (row, [(kw, tokenize_keyword(kw)) for kw in (row.get('keywords') or [])])
+                for row in all_rows
+            ]
+            return self._score_keyword_matches(candidates, query_tokens, limit)
 
-            for row in all_rows:
-                keywords = row.get('keywords', [])
-                if not keywords:
-                    continue
+        finally:
+            conn.close()
 
-                # 計算關鍵字匹配
-                matched_keywords = []
-                match_score = 0.0
+    def _score_keyword_matches(self, candidates, query_tokens: set, limit: int) -> List[Dict]:
+        """
+        篩選包含匹配關鍵字的知識並計分
 
-                for keyword in keywords:
-                    keyword_tokens = set(jieba.cut(keyword.lower()))
-                    intersection = query_tokens & keyword_tokens
+        Args:
+            candidates: [(row, [(keyword, keyword_tokens)])]，已依 priority DESC, id DESC 排序
+            query_tokens: 查詢分詞
+            limit: 回傳筆數
 
-                    if intersection:
-                        matched_keywords.append(keyword)
-                        match_score += len(intersection) / len(keyword_tokens)
+        Returns:
+            依 keyword_score 排序的結果
+        """
+        keyword_matched_knowledge = []
 
-                # 如果有匹配，加入結果
-                if matched_keywords:
-                    item = dict(row)
-                    normalized_score = min(1.0, match_score / max(1, len(matched_keywords)))
+        for row, keyword_tokens_list in candidates:
+            if not keyword_tokens_list:
+                continue
 
-                    result = self._format_result(item)
-                    # task 3.2：keyword 路徑寫入獨立欄位
-                    # vector_similarity 預設 0.0（代表「向量沒命中、純靠 keyword 找到」）
-                    result['keyword_score'] = normalized_score
-                    result['vector_similarity'] = 0.0
-                    result['original_similarity'] = 0.0  # alias 同步
-                    result['similarity'] = 0.0  # 待 _finalize_scores 重算
-                    result['keyword_matches'] = matched_keywords
-                    result['search_method'] = 'keyword'
+            # 計算關鍵字匹配
+            matched_keywords = []
+            match_score = 0.0
 
-                    keyword_matched_knowledge.append(result)
+            for keyword, keyword_tokens in keyword_tokens_list:
+                intersection = query_tokens & keyword_tokens
 
-            # 按 keyword_score 排序，取前 limit 個（final similarity 由 _finalize_scores 算）
-            keyword_matched_knowledge.sort(key=lambda x: x.get('keyword_score') or 0, reverse=True)
-            return keyword_matched_knowledge[:limit]
+                if intersection:
+                    matched_keywords.append(keyword)
+                    match_score += len(intersection) / len(keyword_tokens)
 
-        finally:
-            conn.close()
+            # 如果有匹配，加入結果
+            if matched_keywords:
+                item = dict(row)
+                normalized_score = min(1.0, match_score / max(1, len(matched_keywords)))
+
+                result = self._format_result(item)
+                # task 3.2：keyword 路徑寫入獨立欄位
+                # vector_similarity 預設 0.0（代表「向量沒命中、純靠 keyword 找到」）
+                result['keyword_score'] = normalized_score
+                result['vector_similarity'] = 0.0
+                result['original_similarity'] = 0.0  # alias 同步
+                result['similarity'] = 0.0  # 待 _finalize_scores 重算
+                result['keyword_matches'] = matched_keywords
+                result['search_method'] = 'keyword'
+
+                keyword_matched_knowledge.append(result)
+
+        # 按 keyword_score 排序，取前 limit 個（final similarity 由 _finalize_scores 算）
+        keyword_matched_knowledge.sort(key=lambda x: x.get('keyword_score') or 0, reverse=True)
+        return keyword_matched_knowledge[:limit]
 
     def _format_result(self, row: Dict) -> Dict:
         """
@@ -327,6 +543,8 @@ class VendorKnowledgeRetrieverV2(BaseRetriever):
             'category': row.get('category'),
             'categories': row.get('categories'),
             'intent_id': row.get('intent_id'),
+            # 知識版本（相關性把關的判定快取 key；字串化以便 JSON 序列化）
+            'updated_at': str(row['updated_at']) if row.get('updated_at') else None,
             # ─── 分數欄位（task 3.3） ───
             'vector_similarity': vector_similarity,
             'keyword_score': defaults['keyword_score'],
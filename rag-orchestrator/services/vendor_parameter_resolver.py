@@ -10,6 +10,7 @@ import psycopg2.extras
 from typing import Dict, List, Optional, Set
 from decimal import Decimal
 from .db_utils import get_db_config
+from .cache_bus import get_cache_bus
 
 
 class VendorParameterResolver:
@@ -17,8 +18,9 @@ class VendorParameterResolver:
 
     def __init__(self):
         """初始化參數解析器"""
-        # 參數快取（避免重複查詢）
+        # 參數快取（避免重複查詢；vendor_configs 異動經 cache_bus 跨 worker 失效）
         self._cache: Dict[int, Dict[str, any]] = {}
+        get_cache_bus().register("vendor_configs", self.clear_cache)
 
     def _get_db_connection(self):
         """建立資料庫連接（使用共用配置）"""
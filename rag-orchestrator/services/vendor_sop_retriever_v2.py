@@ -9,6 +9,9 @@ from typing import Dict, List, Optional
 from .base_retriever import BaseRetriever
 from .db_utils import get_db_config
 from .retrieval_types import make_default_result
+from .vector_codec import to_pgvector_literal
+from .keyword_index import tokenize_keyword
+from .cache_bus import get_cache_bus
 
 
 class VendorSOPRetrieverV2(BaseRetriever):
@@ -18,7 +21,8 @@ class VendorSOPRetrieverV2(BaseRetriever):
         """初始化 SOP 檢索器"""
         super().__init__()  # 調用基類初始化
 
-        self._cache: Dict[int, Dict] = {}  # vendor_id -> vendor_info
+        self._cache: Dict[int, Dict] = {}  # vendor_id -> vendor_info（vendors 異動經 cache_bus 失效）
+        get_cache_bus().register("vendors", self.clear_cache)
 
         # SOP 特定配置
         import os
@@ -53,6 +57,13 @@ class VendorSOPRetrieverV2(BaseRetriever):
         finally:
             conn.close()
 
+    def clear_cache(self, vendor_id: Optional[int] = None):
+        """清除業者資訊快取（vendor_id=None 表示全部）"""
+        if vendor_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(vendor_id, None)
+
     async def _vector_search(
         self,
         query_embedding: List[float],
@@ -60,6 +71,20 @@ class VendorSOPRetrieverV2(BaseRetriever):
         top_k: int,
         similarity_threshold: float,
         **kwargs
+    ) -> List[Dict]:
+        """向量檢索（於 DB 執行緒池執行，不阻塞 event loop）"""
+        return await self._run_db(
+            self._vector_search_sync,
+            query_embedding, vendor_id, top_k, similarity_threshold, **kwargs
+        )
+
+    def _vector_search_sync(
+        self,
+        query_embedding: List[float],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
     ) -> List[Dict]:
         """
         SOP 向量檢索
@@ -74,10 +99,99 @@ class VendorSOPRetrieverV2(BaseRetriever):
         conn = self._get_db_connection()
         try:
             cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            vector_str = str(query_embedding)
+            vector_str = to_pgvector_literal(query_embedding)
 
             # SQL 查詢：向量相似度檢索（不在 SQL 端 threshold 過濾）
-            cursor.execute("""
+            cursor.execute(self._vector_search_body("%s::vector"), (
+                vector_str, vector_str,
+                vendor_id,
+                vector_str, vector_str,
+                vector_limit
+            ))
+
+            rows = cursor.fetchall()
+            cursor.close()
+
+            results = []
+            for row in rows:
+                results.append(self._format_result(dict(row)))
+
+            return results
+
+        finally:
+            conn.close()
+
+    async def _vector_search_multi(
+        self,
+        query_embeddings: List[List[float]],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
+    ) -> List[List[Dict]]:
+        """多查詢向量檢索（一條 SQL；於 DB 執行緒池執行）"""
+        if not query_embeddings:
+            return []
+        return await self._run_db(
+            self._vector_search_multi_sync,
+            query_embeddings, vendor_id, top_k, similarity_threshold, **kwargs
+        )
+
+    def _vector_search_multi_sync(
+        self,
+        query_embeddings: List[List[float]],
+        vendor_id: int,
+        top_k: int,
+        similarity_threshold: float,
+        **kwargs
+    ) -> List[List[Dict]]:
+        """
+        多查詢 SOP 向量檢索：每個查詢向量各取 top-k，一次 DB 往返
+
+        查詢向量以 text[] 傳入、unnest 展開（WITH ORDINALITY 標記來源），
+        CROSS JOIN LATERAL 對每個向量執行與 _vector_search_sync 相同的內層 SELECT。
+        結果與 query_embeddings 對齊。
+        """
+        vector_limit = kwargs.get('vector_limit', 50)
+
+        conn = self._get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(f"""
+                SELECT q.query_index, c.*
+                FROM (
+                    SELECT u.vec::vector AS embedding, u.query_index
+                    FROM unnest(%s::text[]) WITH ORDINALITY AS u(vec, query_index)
+                ) q
+                CROSS JOIN LATERAL ({self._vector_search_body("q.embedding")}) c
+                ORDER BY q.query_index
+            """, (
+                [to_pgvector_literal(e) for e in query_embeddings],
+                vendor_id,
+                vector_limit
+            ))
+
+            rows = cursor.fetchall()
+            cursor.close()
+
+            grouped: List[List[Dict]] = [[] for _ in query_embeddings]
+            for row in rows:
+                row = dict(row)
+                grouped[row.pop('query_index') - 1].append(self._format_result(row))
+            return grouped
+
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _vector_search_body(query_vector_sql: str) -> str:
+        """
+        SOP 向量檢索的內層 SELECT（單查詢與多查詢共用）
+
+        Args:
+            query_vector_sql: 查詢向量的 SQL 表示式（`%s::vector` 或 LATERAL 外層的 `q.embedding`）
+        """
+        return f"""
                 SELECT
                     si.id,
                     si.vendor_id,
@@ -98,8 +212,8 @@ class VendorSOPRetrieverV2(BaseRetriever):
                     si.immediate_prompt,
                     si.followup_prompt,
                     GREATEST(
-                        COALESCE(1 - (si.primary_embedding <=> %s::vector), 0),
-                        COALESCE(1 - (si.fallback_embedding <=> %s::vector), 0)
+                        COALESCE(1 - (si.primary_embedding <=> {query_vector_sql}), 0),
+                        COALESCE(1 - (si.fallback_embedding <=> {query_vector_sql}), 0)
                     ) as vector_similarity
                 FROM vendor_sop_items si
                 INNER JOIN vendor_sop_categories sc ON si.category_id = sc.id
@@ -111,29 +225,12 @@ class VendorSOPRetrieverV2(BaseRetriever):
                     AND (si.primary_embedding IS NOT NULL OR si.fallback_embedding IS NOT NULL)
                 ORDER BY
                     GREATEST(
-                        COALESCE(1 - (si.primary_embedding <=> %s::vector), 0),
-                        COALESCE(1 - (si.fallback_embedding <=> %s::vector), 0)
+                        COALESCE(1 - (si.primary_embedding <=> {query_vector_sql}), 0),
+                        COALESCE(1 - (si.fallback_embedding <=> {query_vector_sql}), 0)
                     ) DESC,
                     si.priority DESC
                 LIMIT %s
-            """, (
-                vector_str, vector_str,
-                vendor_id,
-                vector_str, vector_str,
-                vector_limit
-            ))
-
-            rows = cursor.fetchall()
-            cursor.close()
-
-            results = []
-            for row in rows:
-                results.append(self._format_result(dict(row)))
-
-            return results
-
-        finally:
-            conn.close()
+            """
 
     async def _keyword_search(
         self,
@@ -141,6 +238,18 @@ class VendorSOPRetrieverV2(BaseRetriever):
         vendor_id: int,
         limit: int,
         **kwargs
+    ) -> List[Dict]:
+        """關鍵字檢索（於 DB 執行緒池執行，jieba 分詞也一併移出 event loop）"""
+        return await self._run_db(
+            self._keyword_search_sync, query, vendor_id, limit, **kwargs
+        )
+
+    def _keyword_search_sync(
+        self,
+        query: str,
+        vendor_id: int,
+        limit: int,
+        **kwargs
     ) -> List[Dict]:
         """
         SOP 關鍵字檢索實作
@@ -226,7 +335,7 @@ class VendorSOPRetrieverV2(BaseRetriever):
                 match_score = 0.0
 
                 for keyword in keywords:
-                    keyword_tokens = set(jieba.cut(keyword.lower()))
+                    keyword_tokens = tokenize_keyword(keyword)  # 分詞結果有快取
                     intersection = query_tokens & keyword_tokens
 
                     if intersection:
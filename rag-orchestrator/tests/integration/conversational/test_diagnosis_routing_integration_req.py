@@ -32,6 +32,7 @@ def _req():
     req = MagicMock()
     req.app.state.db_pool = MagicMock()
     req.app.state.cache_service = MagicMock()
+    req.app.state.cache_service.semantic_available.return_value = False
     req.app.state.sop_orchestrator = MagicMock()
     req.app.state.conversational_engine = MagicMock()
     return req
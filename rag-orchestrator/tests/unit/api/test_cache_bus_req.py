@@ -0,0 +1,96 @@
+"""unit：行程內快取跨 worker 失效匯流排（services/cache_bus.CacheBus）。
+
+- 依資料來源名稱 + key 失效；短命實例（bound method 弱參考）不被匯流排留住
+- 其他 worker 的訊息套用、自己發的略過；格式錯誤時全部失效
+- 訂閱正常時有發布者的來源無限期（ttl() 回 None），無發布者的來源與中斷時保留原 TTL
+- 在 event loop 中發布改走背景執行緒；其他頻道（API 金鑰異動）共用同一條訂閱連線
+"""
+import asyncio
+import gc
+import json
+import threading
+
+import pytest
+
+import services.cache_bus as cache_bus_module
+from services.cache_bus import CacheBus
+from services.vendor_config_service import VendorConfigService
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    monkeypatch.setenv("CACHE_BUS_ENABLED", "false")  # 不連 Redis，只測本行程
+    b = CacheBus()
+    monkeypatch.setattr(cache_bus_module, "_cache_bus", b)
+    return b
+
+
+def test_invalidate_by_vendor_and_weakref_drop(bus):
+    svc = VendorConfigService(db_pool=None)
+    svc._cache = {"1:all": {"a": 1}, "1:billing": {"b": 2}, "12:all": {"c": 3}}
+
+    assert bus.invalidate("vendor_configs", 1) == 1
+    assert list(svc._cache) == ["12:all"]
+    bus.invalidate("vendor_configs")
+    assert svc._cache == {}
+
+    del svc
+    gc.collect()
+    assert bus.invalidate_local("vendor_configs") == 0
+    assert bus.get_stats()["registered"]["vendor_configs"] == 0
+
+
+def test_handle_message_skips_own_origin(bus):
+    seen = []
+    bus.register("vendors", seen.append)
+    bus.register("conversational", lambda _key: seen.append("conv"))
+
+    bus.handle_message(json.dumps({"cache": "vendors", "key": 7, "origin": bus.worker_id}))
+    assert seen == []
+    bus.handle_message(json.dumps({"cache": "vendors", "key": 7, "origin": "other"}))
+    assert seen == [7]
+
+    bus.handle_message("garbage")
+    assert set(seen[1:]) == {None, "conv"}
+    assert bus.get_stats()["applied"] == 3
+
+
+def test_ttl_while_live(bus):
+    assert bus.ttl("vendors", 300) == 300
+    bus.live = True
+    assert bus.ttl("vendors", 300) is None
+    assert bus.ttl("digression_config", 300) == 300          # 無發布者：保留 TTL
+
+
+async def test_publish_runs_off_event_loop(bus):
+    bus.enabled = True
+    threads = []
+    bus._publish_sync = lambda payload: threads.append((threading.get_ident(), payload["cache"]))
+
+    bus.invalidate("vendors", 3)
+    assert threads == []                                     # 未在呼叫端同步發布
+    await asyncio.gather(*bus._publish_tasks)
+    assert threads[0][1] == "vendors" and threads[0][0] != threading.get_ident()
+
+
+def test_extra_channel_dispatch_and_resync(bus):
+    from services.api_key_auth import API_KEY_CHANNEL, ApiKeyCache, subscribe_api_key_changes
+    import services.api_key_auth as api_key_auth
+
+    cache = ApiKeyCache()
+    api_key_auth._api_key_cache, saved = cache, api_key_auth._api_key_cache
+    try:
+        subscribe_api_key_changes(bus)
+        assert bus.has_subscriptions() and bus.get_stats()["channels"] == [API_KEY_CHANNEL]
+
+        cache.store("h1", {"id": 3, "name": "crm"})
+        cache.store("h2", {"id": 4, "name": "line"})
+        bus._dispatch(API_KEY_CHANNEL, json.dumps({"key_id": 3}))
+        assert cache.lookup("h1") == (False, None) and cache.lookup("h2")[0]
+
+        bus._resync()                                        # 重連：整個清空
+        assert cache.lookup("h2") == (False, None)
+    finally:
+        api_key_auth._api_key_cache = saved
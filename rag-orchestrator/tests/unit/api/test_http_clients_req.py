@@ -0,0 +1,94 @@
+"""unit：服務間共用 HTTP 客戶端註冊表（services/http_clients.py）。
+
+- 同一 event loop 內重複取用回傳同一個 AsyncClient（連線可重用），關閉後重建
+- 目標設定可由 HTTP_{NAME}_* 環境變數覆寫
+- 在途請求數 / 飽和度 / 錯誤數統計，含連線失敗（取不到回應）的情況
+- 監控回呼收到事件，回呼例外不影響請求
+
+不需真實服務：以 httpx.MockTransport 注入。
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from services.http_clients import HttpClientRegistry, HttpTarget
+
+pytestmark = pytest.mark.unit
+
+
+def _registry(handler, **kw):
+    reg = HttpClientRegistry()
+    reg.register(HttpTarget(name="svc", transport=httpx.MockTransport(handler), **kw))
+    return reg
+
+
+async def test_async_client_is_shared_and_rebuilt_after_close():
+    reg = _registry(lambda r: httpx.Response(200))
+    c1 = reg.get_async_client("svc")
+    assert reg.get_async_client("svc") is c1
+    await reg.aclose()
+    assert c1.is_closed
+    assert reg.get_async_client("svc") is not c1
+    await reg.aclose()
+
+
+def test_target_env_overrides(monkeypatch):
+    monkeypatch.setenv("HTTP_FOO_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("HTTP_FOO_TIMEOUT", "3.5")
+    monkeypatch.setenv("HTTP_FOO_RETRIES", "0")
+    t = HttpTarget.from_env("foo", max_connections=50, timeout=60.0, retries=2)
+    assert (t.max_connections, t.timeout, t.retries) == (7, 3.5, 0)
+    assert not HttpTarget(name="x", base_url="http://plain").use_http2
+
+
+async def test_in_flight_and_saturation_tracked():
+    gate = asyncio.Event()
+    seen_in_flight = []
+
+    async def slow(request):
+        seen_in_flight.append(reg.stats()["svc"]["in_flight"])
+        await gate.wait()
+        return httpx.Response(200)
+
+    reg = HttpClientRegistry()
+    reg.register(HttpTarget(name="svc", max_connections=4, transport=httpx.MockTransport(slow)))
+    client = reg.get_async_client("svc")
+    tasks = [asyncio.create_task(client.get("http://svc/")) for _ in range(2)]
+    while len(seen_in_flight) < 2:
+        await asyncio.sleep(0)
+    assert reg.stats()["svc"]["saturation"] == 0.5
+    gate.set()
+    await asyncio.gather(*tasks)
+
+    stats = reg.stats()["svc"]
+    assert stats["requests"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["peak_saturation"] == 0.5
+    await reg.aclose()
+
+
+def test_sync_client_counts_connect_errors_and_calls_hook():
+    def boom(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    events = []
+    reg = _registry(boom)
+    reg.set_instrumentation_hook(events.append)
+    with pytest.raises(httpx.ConnectError):
+        reg.get_sync_client("svc").get("http://svc/")
+
+    stats = reg.stats()["svc"]
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0, "連線失敗也要歸還在途計數"
+    assert events[-1]["event"] == "error"
+
+
+def test_hook_exception_does_not_break_request():
+    reg = _registry(lambda r: httpx.Response(204))
+
+    def bad_hook(event):
+        raise RuntimeError("monitoring down")
+
+    reg.set_instrumentation_hook(bad_hook)
+    assert reg.get_sync_client("svc").get("http://svc/").status_code == 204
@@ -0,0 +1,89 @@
+"""unit：知識更新時轉發 reranker pair 分數快取失效（routers/cache.py → SemanticReranker）。
+
+- /api/v1/cache/invalidate（knowledge_update）呼叫 SemanticReranker.invalidate_pair_cache([knowledge_id])
+- invalidate_pair_cache POST 語義模型服務 /cache/invalidate，回傳清除筆數
+- 服務不可用 / 呼叫失敗回 0，不影響知識更新的其他失效
+
+不碰真實語義模型服務：以假 HTTP client 記錄請求。
+"""
+import pytest
+from unittest.mock import MagicMock
+
+import routers.cache as cache_router
+import services.semantic_reranker as sr
+from routers.cache import CacheInvalidationRequest, invalidate_cache
+
+pytestmark = pytest.mark.unit
+
+
+class _Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class _Client:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append((url, json))
+        if self.error:
+            raise self.error
+        return self.response
+
+
+def _reranker(available=True):
+    reranker = object.__new__(sr.SemanticReranker)
+    reranker.semantic_api_url = "http://semantic:8000"
+    reranker.is_available = available
+    return reranker
+
+
+def test_invalidate_pair_cache_posts_knowledge_ids(monkeypatch):
+    client = _Client(_Response(200, {"success": True, "invalidated_count": 3}))
+    monkeypatch.setattr(sr, "get_sync_client", lambda target: client)
+
+    assert _reranker().invalidate_pair_cache([7]) == 3
+    assert client.posts == [("http://semantic:8000/cache/invalidate", {"knowledge_ids": [7]})]
+
+
+def test_invalidate_pair_cache_never_raises(monkeypatch):
+    client = _Client(error=ConnectionError("down"))
+    monkeypatch.setattr(sr, "get_sync_client", lambda target: client)
+
+    assert _reranker().invalidate_pair_cache([7]) == 0
+    assert _reranker(available=False).invalidate_pair_cache([7]) == 0
+    assert _reranker().invalidate_pair_cache([]) == 0
+    assert len(client.posts) == 1
+
+
+async def test_knowledge_update_forwards_to_reranker(monkeypatch):
+    reranker = MagicMock()
+    reranker.invalidate_pair_cache.return_value = 2
+    monkeypatch.setattr(cache_router, "get_semantic_reranker", lambda: reranker)
+    monkeypatch.setattr(cache_router, "get_keyword_index", lambda: MagicMock(is_ready=False))
+
+    async def _no_process_caches(request, db_pool):
+        return None
+
+    monkeypatch.setattr(cache_router, "_invalidate_process_caches", _no_process_caches)
+    cache_service = MagicMock()
+    cache_service._is_available.return_value = True
+    cache_service.invalidate_by_knowledge_id.return_value = 1
+    req = MagicMock()
+    req.app.state.cache_service = cache_service
+
+    response = await invalidate_cache(CacheInvalidationRequest(type="knowledge_update", knowledge_id=7), req)
+
+    reranker.invalidate_pair_cache.assert_called_once_with([7])
+    assert response.success and response.invalidated_count == 1
+
+    reranker.reset_mock()
+    await invalidate_cache(CacheInvalidationRequest(type="vendor_update", vendor_id=3), req)
+    reranker.invalidate_pair_cache.assert_not_called()
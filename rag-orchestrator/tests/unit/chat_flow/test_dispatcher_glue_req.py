@@ -141,7 +141,7 @@ def _collecting_req_env(monkeypatch, *, form_result):
 
     monkeypatch.setattr(chat, "_maybe_synthesize_presales_leaf", _passthrough)
     fm = SimpleNamespace(collect_field_data=_collect)
-    ic = SimpleNamespace(classify=lambda msg: {})
+    ic = SimpleNamespace(knn_ready=False, classify=lambda msg, query_embedding=None: {})
     sop = SimpleNamespace(trigger_handler=SimpleNamespace(delete_context=lambda sid: None))
     return _req(form_manager=fm, intent_classifier=ic, sop_orchestrator=sop)
 
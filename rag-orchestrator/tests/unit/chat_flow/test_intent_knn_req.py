@@ -0,0 +1,95 @@
+"""unit：IntentClassifier kNN 快速層（services/intent_knn.py）。
+
+- 意圖明確（top1 夠高且領先 top2 足夠）時直接回傳，不呼叫 LLM
+- 模糊（差距不足）或未帶 embedding 時升級 LLM
+- 意圖 ID 由 reload 時建立的記憶體對照表解析，不再逐筆查 DB
+- pgvector 字串解析、維度不符時不判斷
+
+不需真實 DB / LLM：以 object.__new__ 建立分類器並注入索引。
+"""
+import pytest
+from unittest.mock import MagicMock
+
+from services.intent_classifier import IntentClassifier
+from services.intent_knn import IntentKnnConfig, IntentKnnIndex, parse_vector
+
+pytestmark = pytest.mark.unit
+
+INTENTS = [
+    {"name": "帳務查詢", "type": "knowledge", "description": "租金帳單", "keywords": ["租金", "帳單"],
+     "confidence_threshold": 0.7, "api_required": False},
+    {"name": "退租流程", "type": "knowledge", "description": "退租", "keywords": ["退租"],
+     "confidence_threshold": 0.7, "api_required": False},
+    {"name": "設備報修", "type": "action", "description": "報修", "keywords": ["報修"],
+     "confidence_threshold": 0.7, "api_required": True, "api_endpoint": "repair", "api_action": "create"},
+]
+
+
+def _index(**config):
+    return IntentKnnIndex.build(
+        [("帳務查詢", [1.0, 0.0, 0.0]), ("退租流程", [0.0, 1.0, 0.0]), ("設備報修", [0.0, 0.0, 1.0])],
+        [("帳務查詢", [0.9, 0.1, 0.0]), ("已停用意圖", [0.5, 0.5, 0.0])],
+        IntentKnnConfig(**config),
+    )
+
+
+def _classifier(**config):
+    c = object.__new__(IntentClassifier)
+    c.intents = INTENTS
+    c.use_database = False
+    c.intent_ids = {"帳務查詢": 11, "退租流程": 12, "設備報修": 13}
+    c.knn_config = IntentKnnConfig(**config)
+    c.knn_index = _index(**config)
+    c._stats = {"knn": 0, "llm": 0, "knn_latency_ms": 0.0, "llm_latency_ms": 0.0}
+    c._classify_with_llm = MagicMock(return_value={"intent_name": "退租流程", "intent_ids": [12]})
+    return c
+
+
+def test_confident_query_returns_without_llm():
+    c = _classifier(min_score=0.8, min_margin=0.05)
+
+    result = c.classify("這個月租金帳單多少", query_embedding=[0.95, 0.05, 0.0])
+
+    c._classify_with_llm.assert_not_called()
+    assert result["intent_name"] == "帳務查詢"
+    assert result["classifier"] == "knn"
+    assert result["intent_ids"] == [11]
+    assert result["keywords"] == ["租金", "帳單"]
+    assert result["confidence"] == pytest.approx(0.9986, abs=1e-3)
+    assert c.get_classification_stats()["knn"] == 1
+
+
+def test_ambiguous_or_missing_embedding_escalates_to_llm():
+    c = _classifier(min_score=0.5, min_margin=0.05)
+
+    # 帳務 / 退租 幾乎同分 → 模糊
+    result = c.classify("退租時押金與租金怎麼算", query_embedding=[0.65, 0.75, 0.0])
+    assert result["classifier"] == "llm" and result["intent_name"] == "退租流程"
+
+    c.classify("退租")
+    assert c._classify_with_llm.call_count == 2
+    stats = c.get_classification_stats()
+    assert stats["llm"] == 2 and stats["knn"] == 0
+
+
+def test_score_picks_max_per_intent_and_ignores_bad_vectors():
+    index = _index()
+    assert index.intent_names == ["帳務查詢", "退租流程", "設備報修"]
+    assert index.intent_vectors == 3 and index.exemplar_vectors == 1
+
+    ranked = index.score([0.0, 0.0, 2.0])
+    assert ranked[0] == ("設備報修", pytest.approx(1.0))
+    assert index.score([1.0, 0.0]) == []  # 維度不符
+    assert index.decide([0.0, 0.0, 0.0]) is None
+
+    # api 意圖帶 api 資訊；次要意圖需達 min_score
+    c = _classifier(min_score=0.55, min_margin=0.05)
+    result = c.classify("冷氣壞了要報修", query_embedding=[0.0, 0.6, 0.8])
+    assert result["intent_name"] == "設備報修" and result["api_endpoint"] == "repair"
+    assert result["secondary_intents"] == ["退租流程"] and result["intent_ids"] == [13, 12]
+
+
+def test_parse_vector_and_disabled_config():
+    assert parse_vector("[0.1,0.2, 0.3]") == [0.1, 0.2, 0.3]
+    assert parse_vector(None) is None and parse_vector("[]") is None
+    assert not _index(enabled=False).ready
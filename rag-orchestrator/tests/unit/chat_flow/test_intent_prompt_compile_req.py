@@ -0,0 +1,62 @@
+"""unit：IntentClassifier LLM 分類的 schema / prompt 預先編譯。
+
+- 意圖載入時編譯一次；每次 LLM 分類重用同一份 functions 與 system prompt
+- 意圖依名稱排序：載入順序不同仍產生相同前綴與 prompt_version；意圖異動則版本變更
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import MagicMock
+
+from services.intent_classifier import IntentClassifier
+
+pytestmark = pytest.mark.unit
+
+INTENTS = [
+    {"name": "退租流程", "type": "knowledge", "description": "退租", "keywords": ["退租"],
+     "confidence_threshold": 0.7, "api_required": False},
+    {"name": "帳務查詢", "type": "knowledge", "description": "租金帳單", "keywords": ["租金", "帳單"],
+     "confidence_threshold": 0.7, "api_required": False},
+]
+
+
+def _classifier(intents):
+    c = object.__new__(IntentClassifier)
+    c.intents = intents
+    c.use_database = False
+    c.intent_ids = {"帳務查詢": 11, "退租流程": 12}
+    c.default_config = {"confidence_threshold": 0.7}
+    c.classifier_config = {"model": "test", "temperature": 0, "max_tokens": 100}
+    arguments = json.dumps({"primary_intent": {"name": "帳務查詢", "confidence": 0.9}, "keywords": ["租金"]})
+    message = SimpleNamespace(function_call=SimpleNamespace(name="classify_intent", arguments=arguments))
+    c.llm_provider = MagicMock()
+    c.llm_provider.chat_completion.return_value = {
+        "raw_response": SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    }
+    return c
+
+
+def test_schema_and_prompt_reused_across_calls():
+    c = _classifier(INTENTS)
+    assert c._classify_with_llm("租金多少")["intent_ids"] == [11]
+    c._classify_with_llm("帳單")
+
+    first, second = c.llm_provider.chat_completion.call_args_list
+    assert first.kwargs["functions"] is second.kwargs["functions"]
+    assert first.kwargs["messages"][0]["content"] is second.kwargs["messages"][0]["content"]
+    name_schema = first.kwargs["functions"][0]["parameters"]["properties"]["primary_intent"]["properties"]["name"]
+    assert name_schema["enum"] == ["帳務查詢", "退租流程", "unclear"]
+    assert "- 帳務查詢 (knowledge): 租金帳單\n  關鍵字: 租金, 帳單" in first.kwargs["messages"][0]["content"]
+
+
+def test_prompt_version_stable_across_load_order_and_changes_on_edit():
+    a = _classifier(INTENTS)
+    b = _classifier(list(reversed(INTENTS)))
+    assert a.prompt_version == b.prompt_version
+    assert a._llm_system_prompt == b._llm_system_prompt
+
+    b.intents = INTENTS + [{"name": "設備報修", "type": "action", "description": "報修", "keywords": [],
+                            "confidence_threshold": 0.7, "api_required": False}]
+    assert b.prompt_version != a.prompt_version
+    assert b.get_intent_config("設備報修")["type"] == "action"
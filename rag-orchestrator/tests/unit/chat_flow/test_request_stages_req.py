@@ -0,0 +1,178 @@
+"""unit：/message 檢索路徑的階段排程（services/request_stages.py）。
+
+- 阻塞階段卸載到執行緒、彼此並行；每階段記錄 start/end 與狀態
+- 前置階段失敗回傳 default；raise_errors 的階段例外照常拋出
+- 依宣告的依賴推出關鍵路徑
+- 檢索器接受尚未完成的 rewrite Task：原始查詢向量檢索不等改寫，改寫查詢檢索時才取用
+
+不碰真實 DB / LLM / embedding 服務。
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from unittest.mock import AsyncMock
+
+from services.base_retriever import BaseRetriever
+from services.request_stages import StageScheduler
+
+pytestmark = pytest.mark.unit
+
+
+async def test_blocking_stages_run_concurrently_and_are_timed():
+    stages = StageScheduler()
+    stages.start_blocking("rewrite", lambda: time.sleep(0.2) or ["改寫"], default=[])
+    stages.start_blocking("sop_context", lambda: time.sleep(0.2) or {"state": "WAITING"})
+
+    t0 = time.perf_counter()
+    assert await stages.get("rewrite") == ["改寫"]
+    assert await stages.get("sop_context") == {"state": "WAITING"}
+    assert time.perf_counter() - t0 < 0.35
+
+    report = stages.report()["stages"]
+    assert report["rewrite"]["status"] == "ok"
+    assert report["rewrite"]["duration_ms"] >= 150
+    assert await stages.get("missing", default="x") == "x"
+
+
+async def test_failures_fall_back_to_default_unless_raise_errors():
+    stages = StageScheduler()
+
+    async def _boom():
+        raise RuntimeError("embedding down")
+
+    stages.start("embedding", _boom(), default=None)
+    assert await stages.get("embedding") is None
+    assert stages.timings["embedding"]["status"] == "error"
+
+    stages.start("kb_retrieval", _boom(), raise_errors=True)
+    with pytest.raises(RuntimeError):
+        await stages.get("kb_retrieval")
+
+
+async def test_critical_path_follows_latest_dependency():
+    stages = StageScheduler()
+
+    async def _sleep(seconds, value=None):
+        await asyncio.sleep(seconds)
+        return value
+
+    stages.start("embedding", _sleep(0.02, [0.1]))
+    stages.start("sop_context", _sleep(0.0))
+    stages.start("rewrite", _sleep(0.08, ["改寫"]))
+
+    async def _kb():
+        await stages.get("embedding")
+        return await stages.get("rewrite")
+
+    stages.start("kb_retrieval", _kb(), deps=("embedding", "rewrite"))
+    stages.start("intent", _sleep(0.0), deps=("embedding",))
+    await stages.get("kb_retrieval")
+    await stages.get("intent")
+
+    assert stages.critical_path() == ["rewrite", "kb_retrieval"]
+    assert stages.report()["stages"]["kb_retrieval"]["deps"] == ["embedding", "rewrite"]
+
+
+class _Retriever(BaseRetriever):
+    async def _vector_search(self, *a, **k):
+        return []
+
+    async def _keyword_search(self, *a, **k):
+        return []
+
+    def _format_result(self, row):
+        return row
+
+
+async def test_retriever_searches_original_query_before_rewrite_is_ready():
+    r = _Retriever()
+    r.query_rewriter = None
+    r.semantic_reranker = None
+    r._get_embedding = AsyncMock(return_value=[0.3, 0.4])
+    r._get_embeddings_batch = AsyncMock(side_effect=lambda texts: [[0.3, 0.4] for _ in texts])
+
+    rewrite_released = threading.Event()
+    calls = []
+
+    async def _vector_search(embedding, *a, **k):
+        calls.append(embedding)
+        if len(calls) == 1:
+            # 原始查詢檢索時改寫尚未完成
+            assert not rewrite_task.done()
+            rewrite_released.set()
+            return [{"id": 1, "vector_similarity": 0.9}]
+        return [{"id": 2, "vector_similarity": 0.9}]
+
+    r._vector_search = _vector_search
+    stages = StageScheduler()
+    rewrite_task = stages.start_blocking("rewrite", lambda: rewrite_released.wait(2) and ["改寫查詢"], default=[])
+
+    out = await r.retrieve("q", 1, top_k=10, enable_keyword_fallback=False, enable_keyword_boost=False,
+                           precomputed_embedding=[0.1, 0.2], precomputed_rewrites=rewrite_task)
+
+    assert calls[0] == [0.1, 0.2]
+    assert {x["id"] for x in out} == {1, 2}
+    assert next(x for x in out if x["id"] == 2)["rewrite_source"] == "改寫查詢"
+
+
+async def test_retriever_cancels_own_rewrite_when_vector_search_fails(monkeypatch):
+    r = _Retriever()
+    r.semantic_reranker = None
+    release = threading.Event()
+
+    class _Rewriter:
+        def rewrite(self, query):
+            release.wait(2)
+            return ["改寫查詢"]
+
+    r.query_rewriter = _Rewriter()
+
+    async def _vector_search(*a, **k):
+        raise RuntimeError("db down")
+
+    r._vector_search = _vector_search
+    seen = []
+    real_ensure_future = asyncio.ensure_future
+
+    def _spy(coro):
+        task = real_ensure_future(coro)
+        seen.append(task)
+        return task
+
+    monkeypatch.setattr(asyncio, "ensure_future", _spy)
+    try:
+        with pytest.raises(RuntimeError):
+            await r.retrieve("q", 1, enable_keyword_fallback=False, precomputed_embedding=[0.1, 0.2])
+        await asyncio.sleep(0)
+        assert len(seen) == 1 and seen[0].cancelled()   # 自己啟動的改寫被取消，不留下無人 await 的 Task
+    finally:
+        release.set()
+
+async def test_rewrite_stage_waits_for_semantic_cache_miss(monkeypatch):
+    import routers.chat as chat
+
+    monkeypatch.setenv("ENABLE_QUERY_REWRITE", "true")
+    monkeypatch.setattr(chat, "get_embedding_client", lambda: type("C", (), {"get_embedding": AsyncMock(return_value=[0.1])})())
+    rewrites = []
+
+    class _Rewriter:
+        enabled = True
+
+        def rewrite(self, query):
+            rewrites.append(query)
+            return ["改寫"]
+
+    import services.query_rewriter as qr
+    monkeypatch.setattr(qr, "get_query_rewriter", lambda: _Rewriter())
+    request = type("R", (), {"message": "租金怎麼繳", "mode": "b2b", "skip_sop": True, "session_id": None})()
+
+    stages = chat._start_retrieval_stages(request, None, start_rewrite=False)
+    assert not stages.has("rewrite")          # 語義緩存命中時不付改寫的 LLM 呼叫
+
+    chat._start_rewrite_stage(request, stages)
+    assert await stages.get("rewrite") == ["改寫"]
+    chat._start_rewrite_stage(request, stages)  # 重複呼叫不重跑
+    stages.cancel_pending()
+    assert rewrites == ["租金怎麼繳"]
@@ -0,0 +1,188 @@
+"""unit：請求 span 追蹤（services/tracing.py）。
+
+- 未啟用 / 未抽中：span 為共用 no-op，不記錄
+- 父子關係經 ContextVar 傳遞：並行 Task、asyncio.to_thread、StageScheduler 階段內的檢索 span 掛在正確父 span 下
+- ring buffer 查詢、各 span p50/p95/p99、JSONL / OTLP 檔案匯出（背景執行緒寫檔，佇列滿丟棄）
+- 串流回應：root span 延續到 body 排空才結束，串流內的 llm_synthesis 掛在 root 下
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+from unittest.mock import AsyncMock
+
+import services.tracing as tracing
+from services.base_retriever import BaseRetriever
+from services.request_stages import StageScheduler
+from services.tracing import NOOP_SPAN, Tracer, TracingConfig, span, start_trace
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    def _make(**config):
+        t = Tracer(TracingConfig(**{"enabled": True, **config}))
+        monkeypatch.setattr(tracing, "_tracer", t)
+        return t
+    return _make
+
+
+def test_disabled_and_sampled_out_are_noop(tracer):
+    t = tracer(enabled=False)
+    with start_trace("chat.message") as root:
+        assert root is NOOP_SPAN
+        assert span("embedding") is NOOP_SPAN
+    assert t.recent() == []
+
+    t = tracer(sample_rate=0.0)
+    with start_trace("chat.message") as root:
+        assert root is NOOP_SPAN
+    assert t.stats["sampled_out"] == 1 and t.recent() == []
+
+
+async def test_spans_nest_across_tasks_and_threads(tracer):
+    t = tracer()
+
+    def _blocking():
+        with span("rewrite.llm"):
+            return "ok"
+
+    async def _stage(name):
+        with span(name):
+            await asyncio.sleep(0.01)
+            return await asyncio.to_thread(_blocking)
+
+    with start_trace("chat.message", vendor_id=1) as root:
+        await asyncio.gather(asyncio.ensure_future(_stage("kb")), asyncio.ensure_future(_stage("sop")))
+        root.set(decision="knowledge")
+
+    trace, = t.recent()
+    by_name = {}
+    for s in trace["spans"]:
+        by_name.setdefault(s["name"], []).append(s)
+    root_id = by_name["chat.message"][0]["span_id"]
+    assert {s["parent_id"] for s in by_name["kb"] + by_name["sop"]} == {root_id}
+    stage_ids = {s["span_id"] for s in by_name["kb"] + by_name["sop"]}
+    assert {s["parent_id"] for s in by_name["rewrite.llm"]} == stage_ids
+    assert trace["attributes"] == {"vendor_id": 1, "decision": "knowledge"}
+    assert by_name["kb"][0]["duration_ms"] >= 10
+
+    stats = t.span_stats()
+    assert stats["rewrite.llm"]["count"] == 2 and stats["kb"]["p99"] >= stats["kb"]["p50"]
+    assert t.recent(min_ms=10_000) == [] and t.recent(span_name="missing") == []
+    assert t.get(trace["trace_id"])["trace_id"] == trace["trace_id"]
+
+
+class _Retriever(BaseRetriever):
+    async def _vector_search(self, *a, **k):
+        return [{"id": 1, "vector_similarity": 0.9}]
+
+    async def _keyword_search(self, *a, **k):
+        return []
+
+    def _format_result(self, row):
+        return row
+
+
+async def test_retriever_spans_hang_under_stage(tracer):
+    t = tracer()
+    r = _Retriever()
+    r.query_rewriter = None
+    r.semantic_reranker = None
+    r._get_embedding = AsyncMock(return_value=[0.1])
+
+    with start_trace("chat.message"):
+        stages = StageScheduler()
+        stages.start("kb_retrieval", r.retrieve("q", 1, top_k=3, enable_keyword_fallback=True,
+                                                enable_keyword_boost=False))
+        await stages.get("kb_retrieval")
+
+    spans = {s["name"]: s for s in t.recent()[0]["spans"]}
+    assert spans["retrieve"]["parent_id"] == spans["kb_retrieval"]["span_id"]
+    assert spans["retrieve"]["attributes"]["retriever"] == "_Retriever"
+    assert spans["vector_search"]["parent_id"] == spans["retrieve"]["span_id"]
+    assert spans["vector_search"]["attributes"]["results"] == 1
+    assert spans["keyword_fallback"]["attributes"]["added"] == 0
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "otlp"])
+def test_file_export(tracer, tmp_path, fmt):
+    path = tmp_path / "traces.jsonl"
+    tracer(export_path=str(path), export_format=fmt)
+    t = tracing.get_tracer()
+    with start_trace("chat.message"):
+        with span("cache.question", hit=False):
+            pass
+    assert t.flush(timeout=2)
+    t.close()
+
+    line, = path.read_text(encoding="utf-8").splitlines()
+    payload = json.loads(line)
+    if fmt == "jsonl":
+        assert [s["name"] for s in payload["spans"]] == ["chat.message", "cache.question"]
+    else:
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        child = next(s for s in spans if s["name"] == "cache.question")
+        assert child["parentSpanId"] and len(child["traceId"]) == 32
+        assert child["attributes"] == [{"key": "hit", "value": {"boolValue": False}}]
+        assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+
+
+def test_export_is_written_off_the_recording_thread(tracer, tmp_path, monkeypatch):
+    t = tracer(export_path=str(tmp_path / "traces.jsonl"), export_queue_size=1)
+    writer_threads = []
+    release = threading.Event()
+    real_to_dict = tracing.Trace.to_dict
+
+    def _slow_to_dict(self):
+        writer_threads.append(threading.get_ident())
+        release.wait(2)
+        return real_to_dict(self)
+
+    monkeypatch.setattr(tracing.Trace, "to_dict", _slow_to_dict)
+    for _ in range(4):
+        with start_trace("chat.message"):
+            pass
+    # 寫檔卡住時 record 不等待；佇列滿了丟棄並計數
+    assert t.get_config()["export_dropped"] >= 1
+    release.set()
+    assert t.flush(timeout=2)
+    t.close()
+    assert writer_threads and threading.get_ident() not in writer_threads
+    assert t.get_config()["recorded"] == 4
+
+
+async def test_stream_response_keeps_root_trace_open_until_drained(tracer, monkeypatch):
+    import routers.chat as chat
+    from starlette.responses import StreamingResponse
+
+    t = tracer()
+
+    async def _body():
+        with span("llm_synthesis", model="gpt"):
+            await asyncio.sleep(0.01)
+            yield "data: hi\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def _fake_handler(request, req):
+        with span("retrieval"):
+            pass
+        return StreamingResponse(_body(), media_type="text/event-stream")
+
+    monkeypatch.setattr(chat, "_vendor_chat_message", _fake_handler)
+    request = type("R", (), {"vendor_id": 1, "mode": "b2c", "target_user": "tenant", "stream": True})()
+
+    response = await chat.vendor_chat_message(request, None)
+    assert t.recent() == []                       # handler 回傳時 root 尚未結束
+
+    chunks = [chunk async for chunk in response.body_iterator]
+    assert chunks == ["data: hi\n\n", "data: [DONE]\n\n"]
+
+    trace, = t.recent()
+    spans = {s["name"]: s for s in trace["spans"]}
+    root = spans["chat.message"]
+    assert spans["llm_synthesis"]["parent_id"] == root["span_id"]
+    assert spans["retrieval"]["parent_id"] == root["span_id"]
+    assert root["duration_ms"] >= spans["llm_synthesis"]["duration_ms"] >= 10
@@ -0,0 +1,240 @@
+"""unit：知識匯入批次寫入（services/knowledge_bulk_writer + KnowledgeImportService 寫入階段）。
+
+- 內容指紋與順序無關，同內容重複出現以 #n 區分
+- 每 chunk 一個交易：COPY 暫存表 + 集合式寫入 + checkpoint
+- 續跑時略過 checkpoint 中已提交的知識
+- 集合式寫入失敗時改逐筆（savepoint）寫入，只略過出錯的列，checkpoint 只記成功列
+- _write_chunk 退回逐筆時，成功列與 checkpoint 在同一個頂層交易提交（任一失敗則一起回滾）
+"""
+import json
+import uuid
+
+import pytest
+
+from services.knowledge_bulk_writer import KB_STAGE_COLUMNS, row_keys
+from services.knowledge_import_service import KnowledgeImportService
+
+pytestmark = pytest.mark.unit
+
+JOB_ID = str(uuid.uuid4())
+
+
+class _Tx:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.tx_depth += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.tx_depth -= 1
+        self.conn.tx_log.append("rollback" if exc_type else "commit")
+        return False
+
+
+class _Conn:
+    def __init__(self, committed=(), copy_fails=False, fail_question=None):
+        self.committed = list(committed)
+        self.copy_fails = copy_fails
+        self.fail_question = fail_question
+        self.copies = []
+        self.checkpoints = []
+        self.tx_depth = 0
+        self.tx_log = []
+        self._next_id = 100
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def transaction(self):
+        return _Tx(self)
+
+    async def copy_records_to_table(self, table, records, columns):
+        assert self.tx_depth >= 1
+        if self.copy_fails:
+            raise RuntimeError("copy failed")
+        self.copies.append((table, list(columns), list(records)))
+
+    async def fetchval(self, sql, *args):
+        if "FROM intents" in sql:
+            return 1
+        if "write_checkpoint,keys" in sql:
+            return json.dumps(self.committed) if self.committed else None
+        if "SELECT EXISTS" in sql:
+            return False
+        if "WITH upd" in sql:
+            return 0
+        if "WITH ins" in sql:
+            return len(self.copies[-1][2])
+        if self.fail_question is not None and self.fail_question in args:
+            raise RuntimeError("row failed")
+        self._next_id += 1
+        return self._next_id
+
+    async def execute(self, sql, *args):
+        if "UPDATE unified_jobs" in sql:
+            assert self.tx_depth >= 1  # checkpoint 與資料同交易
+            self.checkpoints.append(json.loads(args[1]))
+        elif self.fail_question is not None and self.fail_question in args:
+            raise RuntimeError("row failed")
+        return "OK"
+
+
+class _Pool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        return self.conn
+
+
+def _service(conn, chunk_size=2):
+    service = object.__new__(KnowledgeImportService)
+    service.db_pool = _Pool(conn)
+    service.bulk_write_chunk_size = chunk_size
+    return service
+
+
+def _knowledge(n):
+    return [
+        {
+            "question_summary": f"問題 {i}",
+            "answer": f"答案 {i}",
+            "keywords": ["租金"],
+            "source_file": "kb.xlsx",
+            "embedding": [0.5, 0.25],
+            "target_user": "tenant",
+        }
+        for i in range(n)
+    ]
+
+
+def test_row_keys_stable_and_occurrence_suffix():
+    rows = [{"question_summary": "A", "answer": "1"}, {"question_summary": "B", "answer": "2"},
+            {"question_summary": "A", "answer": "1"}]
+    keys = row_keys(rows, ("question_summary", "answer"))
+    assert keys[2] == f"{keys[0]}#1"
+    assert row_keys(list(reversed(rows[:2])), ("question_summary", "answer")) == [keys[1], keys[0]]
+
+
+async def test_import_to_database_chunks_copy_and_checkpoint():
+    conn = _Conn()
+    service = _service(conn)
+    knowledge = _knowledge(5)
+
+    result = await service._import_to_database(knowledge, vendor_id=3, import_mode="append", job_id=JOB_ID)
+
+    assert result["imported"] == 5 and result["errors"] == 0 and result["resumed"] == 0
+    assert [len(c[2]) for c in conn.copies] == [2, 2, 1]
+    table, columns, records = conn.copies[0]
+    assert columns == KB_STAGE_COLUMNS
+    row = dict(zip(columns, records[0]))
+    assert row["vendor_ids"] == [3] and row["scope"] == "vendor" and row["intent_id"] == 1
+    assert row["embedding"].startswith("[") and row["target_user"] == ["tenant"]
+    assert sum(conn.checkpoints, []) == service._write_keys(knowledge)
+    assert conn.tx_log == ["commit"] * 3
+
+
+async def test_import_resumes_from_checkpoint():
+    knowledge = _knowledge(4)
+    done = row_keys(knowledge, ("id", "question_summary", "answer"))[:3]
+    conn = _Conn(committed=done)
+    service = _service(conn, chunk_size=10)
+
+    result = await service._import_to_database(knowledge, vendor_id=None, import_mode="append", job_id=JOB_ID)
+
+    assert result["resumed"] == 3 and result["imported"] == 1
+    assert len(conn.copies) == 1 and conn.copies[0][2][0][KB_STAGE_COLUMNS.index("question_summary")] == "問題 3"
+
+
+async def test_bulk_failure_falls_back_to_per_row_savepoints():
+    conn = _Conn(copy_fails=True, fail_question="問題 1")
+    service = _service(conn, chunk_size=10)
+    knowledge = _knowledge(3)
+    knowledge[2]["quality_evaluation"] = {"is_acceptable": False, "quality_score": 3}
+
+    result = await service._import_to_review_queue(
+        knowledge, vendor_id=None, created_by="admin", file_name="kb.xlsx", job_id=JOB_ID
+    )
+
+    keys = service._write_keys(knowledge)
+    assert result["imported"] == 2 and result["errors"] == 1
+    assert result["auto_rejected"] == 1 and result["pending_review"] == 1
+    assert conn.checkpoints == [[keys[0], keys[2]]]
+    # 批次交易回滾 → 外層交易內每列一個 savepoint（失敗的那列回滾）
+    assert conn.tx_log[0] == "rollback" and conn.tx_log.count("rollback") == 2
+
+
+class _TxDb:
+    """交易語意的 fake：寫入先進目前交易的暫存，commit 併入外層、rollback 丟棄（巢狀即 savepoint）"""
+
+    def __init__(self, fail_seq=(), checkpoint_fails=False):
+        self.fail_seq = set(fail_seq)
+        self.checkpoint_fails = checkpoint_fails
+        self.committed = {"rows": [], "checkpoint": []}
+        self.stack = []
+        self.commits = []
+
+    def transaction(self):
+        return _TxScope(self)
+
+    async def execute(self, sql, *args):
+        assert "UPDATE unified_jobs" in sql and self.stack   # checkpoint 必在交易內
+        if self.checkpoint_fails:
+            raise RuntimeError("checkpoint failed")
+        self.stack[-1]["checkpoint"].extend(json.loads(args[1]))
+
+
+class _TxScope:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        self.db.stack.append({"rows": [], "checkpoint": []})
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pending = self.db.stack.pop()
+        if exc_type is None:
+            target = self.db.stack[-1] if self.db.stack else self.db.committed
+            for name in ("rows", "checkpoint"):
+                target[name].extend(pending[name])
+            if not self.db.stack:
+                self.db.commits.append(pending)
+        return False
+
+
+async def _bulk_write_fails(conn, chunk):
+    conn.stack[-1]["rows"].extend(row["key"] for row in chunk)   # 寫了一半才失敗 → 應整批回滾
+    raise RuntimeError("bulk insert failed")
+
+
+async def _write_row(conn, row):
+    conn.stack[-1]["rows"].append(row["key"])
+    if row["seq"] in conn.fail_seq:
+        raise RuntimeError("row failed")
+
+
+async def test_write_chunk_savepoint_fallback_commits_checkpoint_with_rows():
+    db = _TxDb(fail_seq={2})
+    chunk = [{"key": f"k{i}", "seq": i} for i in range(1, 4)]
+
+    written = await _service(db)._write_chunk(db, chunk, JOB_ID, _bulk_write_fails, _write_row)
+
+    assert written == {"k1", "k3"}
+    assert db.committed == {"rows": ["k1", "k3"], "checkpoint": ["k1", "k3"]}
+    # 資料與 checkpoint 在同一個頂層交易提交（批次交易已回滾，不留半批資料）
+    assert db.commits == [{"rows": ["k1", "k3"], "checkpoint": ["k1", "k3"]}]
+
+
+async def test_write_chunk_fallback_checkpoint_failure_rolls_back_rows():
+    db = _TxDb(checkpoint_fails=True)
+    chunk = [{"key": "k1", "seq": 1}]
+
+    with pytest.raises(RuntimeError, match="checkpoint failed"):
+        await _service(db)._write_chunk(db, chunk, JOB_ID, _bulk_write_fails, _write_row)
+
+    assert db.committed == {"rows": [], "checkpoint": []}
@@ -0,0 +1,135 @@
+"""unit：規格書轉 Q&A 並行轉換（DocumentConverterService.convert_to_qa）。
+
+- 各段並行抽取（不再固定 sleep），結果依段落順序合併
+- 意圖清單每個作業載入一次；意圖推薦一次呼叫處理多個 Q&A，不存在的意圖 ID 視為未分類
+- 每完成一段即把目前累積的 Q&A 寫回作業（result.partial）
+"""
+import asyncio
+import json
+import re
+
+import pytest
+
+import services.openai_rate_limiter as rl
+from services.document_converter_service import DocumentConverterService
+
+pytestmark = pytest.mark.unit
+
+
+class _Conn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetch(self, sql):
+        self.pool.intent_loads += 1
+        return [{"id": 1, "name": "帳務查詢", "description": "租金"}, {"id": 4, "name": "服務說明", "description": ""}]
+
+
+class _Pool:
+    def __init__(self):
+        self.intent_loads = 0
+
+    def acquire(self):
+        return _Conn(self)
+
+
+class _Provider:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.intent_batches = []
+
+    async def async_chat_completion(self, model, messages, temperature=0.7, max_tokens=None, **kwargs):
+        prompt = messages[-1]["content"]
+        if "response_format" in kwargs:
+            indices = [int(i) for i in re.findall(r"^\[(\d+)\]$", prompt, re.M)]
+            self.intent_batches.append(len(indices))
+            results = [{"index": i, "intent_id": 99 if i == 2 else 1, "confidence": 0.9} for i in indices]
+            return {"content": json.dumps({"results": results})}
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        section = re.search(r"段落(\d)", prompt).group(1)
+        qa_list = [{"question_summary": f"第{section}段問題{j}", "content": "答案", "keywords": ["租金"]} for j in range(3)]
+        return {"content": json.dumps(qa_list, ensure_ascii=False)}
+
+
+async def test_convert_to_qa_concurrent_batched_and_streamed(monkeypatch):
+    monkeypatch.setattr(rl, "_rate_limiters", {})
+    provider = _Provider()
+    pool = _Pool()
+    service = object.__new__(DocumentConverterService)
+    service.db_pool = pool
+    service.llm_provider = provider
+    service.model = "gpt-4o"
+    service.convert_concurrency = 3
+    service.intent_batch_size = 2
+    service.llm_max_retries = 3
+    service._cached_intents = None
+
+    content = "\n".join(f"段落{i}" + "內容" * 4500 for i in range(4))
+    job = {"result": {"content": content}}
+    updates = []
+
+    async def fake_get_job(job_id):
+        return job
+
+    async def fake_update_status(job_id, status, progress=None, result=None, **kwargs):
+        updates.append((status, progress, result))
+        if result is not None:
+            job["result"] = result
+
+    service.get_job = fake_get_job
+    service.update_status = fake_update_status
+
+    await service.convert_to_qa("job")
+
+    final = job["result"]
+    assert [qa["question_summary"] for qa in final["qa_list"][:4]] == ["第0段問題0", "第0段問題1", "第0段問題2", "第1段問題0"]
+    assert final["qa_count"] == 12 and "partial" not in final
+    assert provider.max_in_flight > 1                      # 各段並行抽取
+    assert pool.intent_loads == 1                          # 意圖清單每個作業只載入一次
+    assert provider.intent_batches == [2, 1] * 4           # 每段 3 個 Q&A → 2 + 1 批
+    assert final["qa_list"][0]["recommended_intent"]["intent_name"] == "帳務查詢"
+    assert final["qa_list"][1]["recommended_intent"]["intent_id"] is None   # 99 不在意圖清單
+    assert final["intent_recommended"] == 8
+
+    partial = [r for s, p, r in updates if s == "processing" and r is not None]
+    assert [len(r["qa_list"]) for r in partial] == [3, 6, 9, 12] and all(r["partial"] for r in partial)
+    assert all(r["content"] == content for r in partial)
+    assert updates[-1][0] == "completed"
+
+
+async def test_call_with_limiter_falls_back_to_sync_provider_and_retries_429(monkeypatch):
+    monkeypatch.setattr(rl, "_rate_limiters", {})
+    penalties = []
+
+    class _SyncProvider:                   # openrouter / ollama：只有同步 chat_completion
+        def __init__(self):
+            self.calls = 0
+
+        def chat_completion(self, model, messages, temperature=0.7, max_tokens=None, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("Error code: 429 - rate_limit_exceeded")
+            return {"content": f"{model}:{messages[-1]['content']}:{kwargs['response_format']['type']}"}
+
+    provider = _SyncProvider()
+    limiter = rl.get_rate_limiter("chat")
+    monkeypatch.setattr(limiter, "penalize", penalties.append)
+
+    result = await rl.call_with_limiter(
+        provider, "m", [{"role": "user", "content": "hi"}], 10, response_format={"type": "json_object"}
+    )
+
+    assert result["content"] == "m:hi:json_object"
+    assert provider.calls == 2 and penalties == [5]
+    assert limiter.stats["acquired"] == 2
@@ -0,0 +1,130 @@
+"""unit：知識匯入串流管線（services/item_pipeline、services/openai_rate_limiter）。
+
+- 項目逐筆流經各階段：丟棄的項目不進下一階段、結果維持原始順序、批次階段一次收多筆
+- 任一階段例外取消整條管線並拋給呼叫端
+- RPM token bucket 用盡時等待補充；penalize 暫停所有呼叫
+- KnowledgeImportService：摘要 / embedding 批次 / 意圖推薦經管線完成並回報進度
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+import services.openai_rate_limiter as rl
+from services.item_pipeline import PipelineStage, run_item_pipeline
+from services.knowledge_import_service import KnowledgeImportService
+from services.openai_rate_limiter import OpenAIRateLimiter
+
+pytestmark = pytest.mark.unit
+
+
+async def test_pipeline_order_drop_and_batches():
+    batches = []
+
+    async def slow_double(x):
+        await asyncio.sleep(0.001 * (10 - x))  # 後進先出，驗證結果仍依原始順序
+        return x * 2
+
+    async def drop_multiples_of_three(batch):
+        batches.append(len(batch))
+        return [None if x % 3 == 0 else x for x in batch]
+
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append((done, total))
+
+    out = await run_item_pipeline(
+        list(range(10)),
+        [PipelineStage("double", slow_double, concurrency=4),
+         PipelineStage("dedup", drop_multiples_of_three, batch_size=4, batch_wait=0.05)],
+        queue_size=2,
+        on_progress=on_progress,
+    )
+    assert out == [2, 4, 8, 10, 14, 16]
+    assert sum(batches) == 10 and max(batches) > 1
+    assert progress[-1] == (10, 10)
+
+
+async def test_pipeline_error_propagates():
+    async def boom(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError):
+        await run_item_pipeline(list(range(20)), [PipelineStage("s", boom, concurrency=2)], queue_size=1)
+
+
+async def test_rate_limiter_waits_for_refill():
+    limiter = OpenAIRateLimiter(rpm=600, tpm=1_000_000)  # 每 0.1s 補 1 個請求
+    limiter._requests = 1
+    t0 = time.monotonic()
+    await limiter.acquire(10)
+    await limiter.acquire(10)
+    assert time.monotonic() - t0 >= 0.08
+    assert limiter.get_stats()["waits"] == 1
+
+    limiter.penalize(0.05)
+    limiter._requests = 5
+    t0 = time.monotonic()
+    await limiter.acquire(10)
+    assert time.monotonic() - t0 >= 0.04
+
+
+class _Conn:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetch(self, sql):
+        return [{"id": 1, "name": "帳務查詢", "description": "租金"}, {"id": 4, "name": "服務說明", "description": ""}]
+
+
+class _Pool:
+    def acquire(self):
+        return _Conn()
+
+
+class _Provider:
+    def __init__(self):
+        self.embedding_calls = []
+
+    async def async_chat_completion(self, model, messages, temperature=0.7, max_tokens=None, **kwargs):
+        if "response_format" in kwargs:
+            return {"content": json.dumps({"intent_id": 1, "intent_name": "帳務查詢", "confidence": 0.9})}
+        return {"content": "租金怎麼繳"}
+
+    async def async_embeddings(self, texts, model=None):
+        self.embedding_calls.append(len(texts))
+        return [[float(len(t))] for t in texts]
+
+
+async def test_import_service_enrichment_pipeline(monkeypatch):
+    monkeypatch.setattr(rl, "_rate_limiters", {})
+    provider = _Provider()
+    service = KnowledgeImportService(_Pool(), llm_provider=provider)
+    service.embedding_batch_size = 50
+    statuses = []
+
+    async def fake_update_status(job_id, status, progress=None, **kwargs):
+        statuses.append(progress)
+    service.update_status = fake_update_status
+
+    knowledge = [{"question_summary": None, "answer": f"答案 {i}"} for i in range(30)]
+    knowledge[0]["question_summary"] = "既有摘要"
+    knowledge[1]["intent"] = "服務說明"
+
+    kept = await service._run_enrichment_pipeline(
+        "job", knowledge, enable_deduplication=False, skip_review=False, enable_quality_evaluation=False
+    )
+    assert kept == knowledge
+    assert kept[0]["question_summary"] == "既有摘要" and kept[2]["question_summary"] == "租金怎麼繳"
+    assert all(k["embedding"] for k in kept)
+    assert sum(provider.embedding_calls) == 30 and len(provider.embedding_calls) < 30
+    assert kept[1]["recommended_intent"]["intent_id"] == 4
+    assert kept[2]["recommended_intent"]["reasoning"] == "已關閉質量評估，跳過自動推薦"
+    assert statuses[-1]["items_done"] == 30 and statuses[-1]["current"] == 78
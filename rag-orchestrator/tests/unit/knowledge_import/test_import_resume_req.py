@@ -0,0 +1,118 @@
+"""unit：續跑失敗的匯入任務（routers/knowledge_import.resume_import_job）。
+
+- 以 UPDATE ... WHERE status = 'failed' RETURNING 原子地取得續跑權，只排一個背景作業
+- 並發的重複續跑請求拿不到 row → 409，不會把同一任務排進兩次
+- 非 failed 狀態 409、任務不存在 404、原檔案不存在 410（皆不改狀態）
+"""
+import asyncio
+import json
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from routers.knowledge_import import resume_import_job
+from services.knowledge_import_service import KnowledgeImportService
+
+pytestmark = pytest.mark.unit
+
+JOB_ID = str(uuid.uuid4())
+
+
+class _Conn:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.updates = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetchrow(self, sql, job_id):
+        assert "UPDATE unified_jobs" in sql and "status = 'failed'" in sql and "RETURNING" in sql
+        self.updates.append(job_id)
+        await asyncio.sleep(0)                    # 讓並發請求交錯
+        job = self.jobs[str(job_id)]
+        if job["status"] != "failed":
+            return None
+        job["status"] = "processing"
+        return {"job_config": json.dumps(job["config"]), "vendor_id": job["vendor_id"], "user_id": job["user_id"]}
+
+
+class _Pool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        return self.conn
+
+
+@pytest.fixture
+def jobs(monkeypatch, tmp_path):
+    upload = tmp_path / "kb.xlsx"
+    upload.write_bytes(b"x")
+    jobs = {JOB_ID: {
+        "job_id": JOB_ID, "job_type": "knowledge_import", "status": "failed", "file_path": str(upload),
+        "vendor_id": 3, "user_id": "alice",
+        "config": {"import_mode": "append", "write_checkpoint": {"keys": ["k1", "k2"]}},
+    }}
+
+    async def _get_job(self, job_id):
+        job = jobs.get(job_id)
+        return dict(job) if job else None
+
+    monkeypatch.setattr(KnowledgeImportService, "get_job", _get_job)
+    return jobs
+
+
+def _request(conn):
+    request = MagicMock()
+    request.app.state.db_pool = _Pool(conn)
+    return request
+
+
+async def test_resume_claims_failed_job_and_schedules_once(jobs):
+    conn = _Conn(jobs)
+    background = BackgroundTasks()
+
+    result = await resume_import_job(JOB_ID, _request(conn), background)
+
+    assert result["status"] == "processing" and result["already_written"] == 2
+    assert jobs[JOB_ID]["status"] == "processing"
+    assert len(background.tasks) == 1
+    kwargs = background.tasks[0].kwargs
+    assert kwargs["vendor_id"] == 3 and kwargs["user_id"] == "alice" and kwargs["import_mode"] == "append"
+
+
+async def test_concurrent_resume_only_one_wins(jobs):
+    conn = _Conn(jobs)
+    background = BackgroundTasks()
+
+    results = await asyncio.gather(
+        *(resume_import_job(JOB_ID, _request(conn), background) for _ in range(2)),
+        return_exceptions=True,
+    )
+
+    errors = [r for r in results if isinstance(r, HTTPException)]
+    assert len(errors) == 1 and errors[0].status_code == 409
+    assert len(background.tasks) == 1
+
+
+@pytest.mark.parametrize("change, status_code", [
+    ({"status": "processing"}, 409),
+    ({"job_type": "test_scenario_import"}, 404),
+    ({"file_path": "/nonexistent/kb.xlsx"}, 410),
+])
+async def test_resume_rejections_leave_job_untouched(jobs, change, status_code):
+    jobs[JOB_ID].update(change)
+    conn = _Conn(jobs)
+    background = BackgroundTasks()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await resume_import_job(JOB_ID, _request(conn), background)
+
+    assert exc_info.value.status_code == status_code
+    assert conn.updates == [] and background.tasks == []
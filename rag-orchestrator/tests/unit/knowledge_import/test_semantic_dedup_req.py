@@ -0,0 +1,73 @@
+"""unit：匯入批次語意去重（services/semantic_dedup.SemanticDedupEngine）。
+
+- 與既有知識相似 ≥ 門檻 → 重複並回報來源；同一份上傳內的近似重複（含跨批次）也會剔除
+- 分塊計算與一次計算結果一致
+- load_corpus 依 skip_review 決定比對範圍，並解析 pgvector 字串
+"""
+import numpy as np
+import pytest
+
+from services.semantic_dedup import SOURCE_UPLOAD, SemanticDedupEngine
+
+pytestmark = pytest.mark.unit
+
+
+def _vec(*head):
+    v = np.zeros(8, dtype=np.float32)
+    v[:len(head)] = head
+    return v.tolist()
+
+
+def test_corpus_and_intra_upload_duplicates():
+    engine = SemanticDedupEngine(threshold=0.9)
+    engine.set_corpus([_vec(1, 0), _vec(0, 1)], [("knowledge_base", 11, "租金"), ("test_scenarios", 7, "報修")])
+
+    first = engine.dedupe([_vec(1, 0.05), _vec(0, 0, 1), _vec(0, 0, 1, 0.1), None], ["a", "b", "c", "d"])
+    assert [m and (m.source, m.matched_id) for m in first.matches] == [
+        ("knowledge_base", 11), None, (SOURCE_UPLOAD, 1), None,
+    ]
+    # 下一批仍會與前一批保留的項目比對；上傳位置跨批次累計
+    second = engine.dedupe([_vec(0, 0, 0.98, 0.05)], ["e"])
+    assert second.matches[0].source == SOURCE_UPLOAD and second.matches[0].matched_id == 1
+    assert second.matches[0].matched_question == "b"
+    assert {(g.source, g.matched_id): g.members for g in first.groups}[("knowledge_base", 11)][0][0] == 0
+    assert engine.stats["duplicates"] == 3 and engine.stats["upload_duplicates"] == 2
+
+
+def test_chunked_equals_unchunked():
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(50, 16))
+    batch = np.vstack([corpus[:5] + rng.normal(scale=0.01, size=(5, 16)), rng.normal(size=(20, 16))])
+    batch = np.vstack([batch, batch[-3:] + 0.001])
+    sources = [("knowledge_base", i, str(i)) for i in range(50)]
+
+    results = []
+    for chunk in (3, 4096):
+        engine = SemanticDedupEngine(threshold=0.95, chunk_size=chunk)
+        engine.set_corpus(corpus, sources)
+        results.append([m and (m.source, m.matched_id) for m in engine.dedupe(batch.tolist()).matches])
+    assert results[0] == results[1]
+    assert sum(1 for m in results[0] if m) == 8
+
+
+class _Conn:
+    def __init__(self):
+        self.sql = []
+
+    async def fetch(self, sql, *args):
+        self.sql.append(sql)
+        if "FROM knowledge_base" in sql:
+            return [{"id": 1, "question": "租金", "vec": "[1,0,0]"}]
+        return [{"id": 2, "question": "草稿", "vec": "[0,1,0]"}]
+
+
+async def test_load_corpus_scope():
+    conn = _Conn()
+    engine = SemanticDedupEngine()
+    await engine.load_corpus(conn, vendor_id=3, skip_review=True)
+    assert len(conn.sql) == 1 and engine.stats["corpus_rows"] == 1
+
+    conn = _Conn()
+    await engine.load_corpus(conn, vendor_id=None, skip_review=False)
+    assert len(conn.sql) == 3 and engine.stats["corpus_rows"] == 3
+    assert engine.dedupe([[0, 1, 0]]).matches[0].source == "review_queue"
@@ -0,0 +1,121 @@
+"""unit：檢索器 DB 存取層（同步連接池 + 有界 DB 執行緒池）。
+
+- PooledConnection.close() 是歸還連接池、不是真的關閉，且重複 close 冪等
+- BoundedConnectionPool 用盡時阻塞等待（逾時拋 PoolError），而非像 ThreadedConnectionPool 立即拋錯；
+  在 event loop 執行緒上取用則立即失敗，不卡住 loop
+- _vector_search / _keyword_search 在 DB 執行緒池執行，不佔 event loop 執行緒
+
+不需真實 DB：以假 pool / 假連接替換。
+"""
+import threading
+
+import psycopg2.pool
+import pytest
+
+from services import db_utils
+from services.db_utils import BoundedConnectionPool, PooledConnection
+from services.vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2
+from services.vendor_sop_retriever_v2 import VendorSOPRetrieverV2
+
+pytestmark = pytest.mark.unit
+
+
+class _FakeConn:
+    closed = 0
+
+    def __init__(self, store):
+        self.store = store
+
+    def cursor(self, *a, **k):
+        store = self.store
+
+        class _Cur:
+            def execute(self, sql, params=None):
+                store["thread"] = threading.get_ident()
+
+            def fetchall(self):
+                return []
+
+            def close(self):
+                pass
+
+        return _Cur()
+
+    def close(self):
+        pass
+
+
+class _FakeInnerPool:
+    def __init__(self):
+        self.put = []
+
+    def getconn(self):
+        return _FakeConn({})
+
+    def putconn(self, conn, close=False):
+        self.put.append((conn, close))
+
+
+def _bounded(maxconn, timeout=0.05):
+    pool = object.__new__(BoundedConnectionPool)
+    pool._pool = _FakeInnerPool()
+    pool._slots = threading.BoundedSemaphore(maxconn)
+    pool.maxconn = maxconn
+    pool.acquire_timeout = timeout
+    return pool
+
+
+def test_pooled_connection_close_returns_to_pool_once():
+    pool = _bounded(1)
+    conn = PooledConnection(pool, pool.getconn())
+    conn.close()
+    conn.close()  # 冪等：不可重複歸還
+    assert len(pool._pool.put) == 1
+    # 歸還後 slot 釋放，可再次取得
+    PooledConnection(pool, pool.getconn()).close()
+    assert len(pool._pool.put) == 2
+
+
+def test_bounded_pool_waits_then_raises_when_exhausted():
+    pool = _bounded(1, timeout=0.05)
+    held = pool.getconn()
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
+    pool.putconn(held)
+    pool.putconn(pool.getconn())  # 歸還後恢復可用
+
+
+@pytest.mark.parametrize("cls", [VendorKnowledgeRetrieverV2, VendorSOPRetrieverV2])
+async def test_searches_run_off_event_loop_thread(cls):
+    store = {}
+    r = object.__new__(cls)
+    r._get_db_connection = lambda: _FakeConn(store)
+    r.param_resolver = type("PR", (), {"get_vendor_info": lambda self, vid: {"business_types": []}})()
+    loop_thread = threading.get_ident()
+
+    await r._vector_search([0.1, 0.2], vendor_id=1, top_k=5, similarity_threshold=0.6)
+    assert store["thread"] != loop_thread, "向量檢索不應在 event loop 執行緒上執行"
+
+    store.clear()
+    await r._keyword_search("租金繳費", 1, 5)
+    assert store["thread"] != loop_thread, "關鍵字檢索不應在 event loop 執行緒上執行"
+
+
+def test_db_executor_bounded_by_pool_size(monkeypatch):
+    monkeypatch.setenv("DB_SYNC_POOL_MAX", "3")
+    monkeypatch.setattr(db_utils, "_db_executor", None)
+    try:
+        assert db_utils.get_db_executor()._max_workers == 3
+    finally:
+        db_utils._db_executor.shutdown(wait=False)
+        monkeypatch.setattr(db_utils, "_db_executor", None)
+
+
+async def test_bounded_pool_fails_fast_on_event_loop_thread():
+    pool = _bounded(1, timeout=5)
+    held = pool.getconn()
+    # event loop 執行緒上不排隊等 acquire_timeout（5 秒），立即拋錯
+    with pytest.raises(psycopg2.pool.PoolError, match="event loop"):
+        pool.getconn()
+    pool.putconn(held)
+    pool.putconn(pool.getconn())
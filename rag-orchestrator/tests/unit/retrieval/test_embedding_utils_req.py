@@ -15,3 +15,44 @@ def test_to_pgvector_empty_raises():
     c = EmbeddingClient()
     with pytest.raises(ValueError):
         c.to_pgvector_format([])
+
+
+def _patch_transport(monkeypatch, handler):
+    """讓共用 HTTP 客戶端註冊表的 embedding 目標走 MockTransport。"""
+    import httpx
+    from services import http_clients
+
+    registry = http_clients.HttpClientRegistry()
+    registry.register(http_clients.HttpTarget(name="embedding", transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(http_clients, "_registry", registry)
+
+
+async def test_get_embeddings_batch_uses_batch_endpoint_in_chunks(monkeypatch):
+    import httpx
+
+    seen = []
+
+    def handler(request: httpx.Request):
+        import json
+        body = json.loads(request.content)
+        seen.append((request.url.path, len(body["texts"])))
+        return httpx.Response(200, json={"embeddings": [[float(len(t))] for t in body["texts"]]})
+
+    _patch_transport(monkeypatch, handler)
+    c = EmbeddingClient(api_url="http://emb/api/v1/embeddings")
+    out = await c.get_embeddings_batch(["a", "bb", "ccc"], batch_size=2)
+    assert out == [[1.0], [2.0], [3.0]]
+    assert seen == [("/api/v1/embeddings/batch", 2), ("/api/v1/embeddings/batch", 1)]
+
+
+async def test_get_embeddings_batch_falls_back_to_single_calls(monkeypatch):
+    import httpx
+
+    def handler(request: httpx.Request):
+        if request.url.path.endswith("/batch"):
+            return httpx.Response(404)
+        return httpx.Response(200, json={"embedding": [0.5]})
+
+    _patch_transport(monkeypatch, handler)
+    c = EmbeddingClient(api_url="http://emb/api/v1/embeddings")
+    assert await c.get_embeddings_batch(["a", "b"]) == [[0.5], [0.5]]
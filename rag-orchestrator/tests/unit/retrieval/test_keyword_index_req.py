@@ -0,0 +1,126 @@
+"""unit：知識庫關鍵字倒排索引（services/keyword_index.py）。
+
+- 只存 id 與 keywords：match_keywords 完全比對、match_tokens 走 jieba token 交集
+- apply_rows 增量更新：移除舊條目（含倒排表）、加入仍有效者
+- 索引就緒時 _keyword_search_sync 只以候選 id 主鍵查詢（不撈 1000 筆全表），
+  完全比對過濾後 0 筆才改用 token 交集的候選
+
+不需真實 DB：以 load_rows 餵假資料列、以假 cursor 記錄 SQL。
+"""
+import pytest
+
+from services import keyword_index as keyword_index_module
+from services.keyword_index import KeywordIndex
+from services.vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2
+
+pytestmark = pytest.mark.unit
+
+
+def _row(kid, keywords, updated_at=None):
+    return {"id": kid, "keywords": keywords, "updated_at": updated_at}
+
+
+def test_match_keywords_and_tokens():
+    index = KeywordIndex()
+    index.load_rows([
+        _row(1, ["租金"]),
+        _row(2, ["繳租金方式"]),
+    ])
+
+    assert index.match_keywords(["租金", "怎麼"]) == {1}
+    # 沒有完全相同的 keyword → 分詞 token 交集
+    assert index.match_keywords(["方式"]) == set()
+    assert index.match_tokens({"方式"}) == {2}
+    assert index.match_tokens({"租金"}) == {1, 2}
+
+
+def test_apply_rows_replaces_and_removes_entries():
+    index = KeywordIndex()
+    index.load_rows([_row(1, ["租金"]), _row(2, ["押金"])])
+
+    # 1 改 keywords；2 已停用（查無資料列）
+    index.apply_rows([1, 2], [_row(1, ["水費"])])
+
+    assert index.match_keywords(["租金", "押金"]) == set()
+    assert index.match_tokens({"租金", "押金"}) == set()
+    assert index.match_keywords(["水費"]) == {1}
+    assert len(index) == 1
+    assert index.get_stats()["keywords"] == 1
+
+
+class _Cursor:
+    def __init__(self, rows_by_ids):
+        self.rows_by_ids = rows_by_ids
+        self.executed = []
+        self._rows = []
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+        ids = frozenset(params[-2]) if "kb.id = ANY" in sql else None
+        self._rows = self.rows_by_ids.get(ids, [])
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, cursor_factory=None):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+def _full_row(kid, keywords):
+    return {
+        "id": kid, "question_summary": f"Q{kid}", "answer": f"A{kid}", "scope": "global",
+        "priority": 0, "vendor_ids": None, "business_types": None, "target_user": None,
+        "keywords": keywords, "video_url": None, "form_id": None, "action_type": "direct_answer",
+        "api_config": None, "category": None, "categories": None, "updated_at": None, "intent_id": None,
+    }
+
+
+def _retriever(cursor):
+    retriever = object.__new__(VendorKnowledgeRetrieverV2)
+
+    class _Resolver:
+        def get_vendor_info(self, vendor_id):
+            return {"business_types": ["full_service"]}
+
+    retriever.param_resolver = _Resolver()
+    retriever._get_db_connection = lambda: _Conn(cursor)
+    return retriever
+
+
+def test_keyword_search_fetches_only_index_candidates(monkeypatch):
+    index = KeywordIndex()
+    index.load_rows([_row(1, ["租金"]), _row(2, ["押金"]), _row(3, ["租金"])])
+    monkeypatch.setattr(keyword_index_module, "_keyword_index", index)
+
+    # 3 被業者過濾（SQL 不回傳）
+    cursor = _Cursor({frozenset({1, 3}): [_full_row(1, ["租金"])]})
+    results = _retriever(cursor)._keyword_search_sync("租金", vendor_id=1, limit=10)
+
+    assert [r["id"] for r in results] == [1]
+    assert results[0]["search_method"] == "keyword" and results[0]["keyword_matches"] == ["租金"]
+    assert len(cursor.executed) == 1 and "kb.id = ANY" in cursor.executed[0][0]
+
+
+def test_keyword_search_falls_back_to_token_candidates(monkeypatch):
+    index = KeywordIndex()
+    index.load_rows([_row(1, ["租金"]), _row(2, ["繳租金方式"])])
+    monkeypatch.setattr(keyword_index_module, "_keyword_index", index)
+
+    # 完全比對的 1 被過濾 → 改用 token 交集候選 {1, 2}
+    cursor = _Cursor({frozenset({1, 2}): [_full_row(2, ["繳租金方式"])]})
+    results = _retriever(cursor)._keyword_search_sync("租金", vendor_id=1, limit=10)
+
+    assert [r["id"] for r in results] == [2]
+    assert [sorted(params[-2]) for _, params in cursor.executed] == [[1], [1, 2]]
+    assert all("kb.keywords &&" not in sql for sql, _ in cursor.executed)
@@ -0,0 +1,160 @@
+"""unit：LLM 判斷快取（services/llm_judgment_cache.py）。
+
+- Query Rewrite：相同問題（正規化後）第二次不呼叫 LLM
+- 相關性把關：判定以 (問題, 知識 id, updated_at) 記憶；updated_at 變更即重判；
+  知識失效（CacheService.invalidate_by_knowledge_id）清除判定
+- RELEVANCE_GATE_BATCH=true：多筆候選一次 prompt 判定
+- 命中率與省下的 LLM 延遲統計
+- 相關性把關走 aget / aset：L1 命中同步回傳，L2 Redis 往返不在 event loop 執行緒
+
+不碰真實 Redis / LLM。
+"""
+import threading
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import services.llm_judgment_cache as judgment_mod
+from services.cache_service import CacheService
+from services.llm_judgment_cache import LlmJudgmentCache, normalize_question
+from services.query_rewriter import QueryRewriter
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    c = LlmJudgmentCache()
+    monkeypatch.setattr(judgment_mod, "_llm_judgment_cache", c)
+    return c
+
+
+def _row(id, updated_at="2026-10-01 10:00:00", vec=0.6):
+    return {"id": id, "question_summary": f"知識{id}", "answer": "內容", "vector_similarity": vec,
+            "similarity": 0.9, "action_type": "direct_answer", "updated_at": updated_at}
+
+
+def test_lru_ttl_and_knowledge_invalidation(cache):
+    cache.max_entries = 2
+    cache.set("relevance_gate", ("q", 1), True, knowledge_id=1, llm_ms=400)
+    cache.set("relevance_gate", ("q", 2), False, knowledge_id=2, llm_ms=200)
+    assert cache.get("relevance_gate", ("q", 1)) is True
+    cache.set("query_rewrite", ("q",), ["改寫"])        # 擠掉最久未用的 ("q", 2)
+    assert cache.get("relevance_gate", ("q", 2)) is None
+
+    assert cache.invalidate_knowledge(1) == 1
+    assert cache.get("relevance_gate", ("q", 1)) is None
+
+    stats = cache.get_stats()["namespaces"]["relevance_gate"]
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["hit_ratio"] == pytest.approx(1 / 3, abs=1e-3)
+    assert stats["avg_llm_ms"] == 300.0 and stats["saved_latency_ms_est"] == 300.0
+
+    cache.ttl = -1
+    cache.set("query_rewrite", ("q2",), ["x"])
+    assert cache.get("query_rewrite", ("q2",)) is None
+    assert normalize_question("  怎麼繳 房租？ ") == normalize_question("怎麼繳　房租?")
+
+
+def test_query_rewrite_is_memoized(cache):
+    rw = QueryRewriter()
+    rw.enabled, rw.model, rw.temperature, rw.max_tokens = True, "test", 0, 100
+    rw._cache = cache
+    rw._provider = MagicMock()
+    rw._provider.chat_completion.return_value = {"content": "租金繳納方式\n房租付款"}
+
+    assert rw.rewrite("怎麼繳房租") == ["租金繳納方式", "房租付款"]
+    assert rw.rewrite(" 怎麼繳房租 ") == ["租金繳納方式", "房租付款"]
+    assert rw._provider.chat_completion.call_count == 1
+
+
+async def test_relevance_verdicts_cached_per_knowledge_version(cache):
+    from routers import chat as chat_mod
+    with patch.object(chat_mod, "chat_completion", return_value={"content": "NO"}) as cc:
+        assert await chat_mod._top1_relevance_gate("電表度數登記錯誤", [_row(1), _row(2)]) == []
+        assert await chat_mod._top1_relevance_gate("電表度數登記錯誤", [_row(1), _row(2)]) == []
+        assert cc.call_count == 2
+
+        # 知識被編輯（updated_at 變更）→ 重判
+        cc.return_value = {"content": "YES"}
+        out = await chat_mod._top1_relevance_gate("電表度數登記錯誤", [_row(1, "2026-10-02 09:00:00")])
+        assert [k["id"] for k in out] == [1] and cc.call_count == 3
+
+        # 失效通知清除判定
+        cache_service = object.__new__(CacheService)
+        cache_service.enabled, cache_service.redis_client = False, None
+        cache_service.judgment_cache = cache
+        assert cache_service.invalidate_by_knowledge_id(2) == 1
+        out = await chat_mod._top1_relevance_gate("電表度數登記錯誤", [_row(1), _row(2)])
+        assert [k["id"] for k in out] == [2] and cc.call_count == 4
+
+
+async def test_batch_mode_judges_candidates_in_one_call(cache, monkeypatch):
+    from routers import chat as chat_mod
+    monkeypatch.setenv("RELEVANCE_GATE_BATCH", "true")
+    with patch.object(chat_mod, "chat_completion", return_value={"content": "1:NO\n2:YES"}) as cc:
+        out = await chat_mod._top1_relevance_gate("q", [_row(1), _row(2), _row(3)])
+        assert [k["id"] for k in out] == [2, 3]
+        assert cc.call_count == 1
+        assert "[2] 知識標題：知識2" in cc.call_args.kwargs["messages"][1]["content"]
+
+        # 批次結果已寫入快取
+        out = await chat_mod._top1_relevance_gate("q", [_row(1), _row(2)])
+        assert [k["id"] for k in out] == [2] and cc.call_count == 1
+
+
+class _ThreadRecordingRedis:
+    """記錄每次 Redis 往返所在執行緒的 fake"""
+
+    def __init__(self):
+        self.data = {}
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return self.data.get(key)
+
+    def pipeline(self):
+        redis = self
+
+        class _Pipe:
+            def __init__(self):
+                self.ops = []
+
+            def setex(self, key, ttl, value):
+                self.ops.append((key, value))
+
+            def sadd(self, key, member):
+                pass
+
+            def expire(self, key, ttl):
+                pass
+
+            def execute(self):
+                redis.threads.append(threading.get_ident())
+                redis.data.update(self.ops)
+
+        return _Pipe()
+
+
+async def test_relevance_gate_keeps_redis_io_off_the_event_loop(cache):
+    from routers import chat as chat_mod
+    redis = _ThreadRecordingRedis()
+    cache.redis_client = redis
+    loop_thread = threading.get_ident()
+
+    with patch.object(chat_mod, "chat_completion", return_value={"content": "YES"}) as cc:
+        assert [k["id"] for k in await chat_mod._top1_relevance_gate("q", [_row(1)])] == [1]
+        assert len(redis.threads) == 2                      # L2 讀（未命中）+ 寫
+        assert loop_thread not in redis.threads
+
+        # L1 命中：同步回傳，不碰 Redis
+        assert [k["id"] for k in await chat_mod._top1_relevance_gate("q", [_row(1)])] == [1]
+        assert len(redis.threads) == 2 and cc.call_count == 1
+
+        # 其他 worker 寫入的 L2 條目：在執行緒內讀取並回填 L1
+        cache.clear()
+        assert [k["id"] for k in await chat_mod._top1_relevance_gate("q", [_row(1)])] == [1]
+        assert len(redis.threads) == 3 and loop_thread not in redis.threads and cc.call_count == 1
+
+    stats = cache.get_stats()["namespaces"]["relevance_gate"]
+    assert stats["local_hits"] == 1 and stats["redis_hits"] == 1 and stats["misses"] == 1
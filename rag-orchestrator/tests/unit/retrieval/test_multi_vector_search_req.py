@@ -0,0 +1,128 @@
+"""unit：改寫查詢的多查詢向量檢索（一條 SQL、一次批次 embedding）。
+
+- 所有改寫一次 _get_embeddings_batch、一次 _vector_search_multi（不再每個改寫各一次）
+- 知識庫 / SOP 多查詢 SQL：unnest 查詢向量陣列 + CROSS JOIN LATERAL，單一 execute
+- 結果依 query_index 分組、與輸入對齊，組內排序與單查詢一致
+- 過濾參數與單查詢相同
+
+不需真實 DB：以 __new__ 繞過 __init__，攔截 cursor.execute。
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.base_retriever import BaseRetriever
+from services.vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2
+from services.vendor_sop_retriever_v2 import VendorSOPRetrieverV2
+
+pytestmark = pytest.mark.unit
+
+
+class _Cursor:
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        self.store.setdefault("executes", []).append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def cursor(self, *a, **k):
+        return _Cursor(self.store, self.rows)
+
+    def close(self):
+        pass
+
+
+def _search_sql(store):
+    """略過 apply_search_settings 的 set_config / pgvector 版本查詢，取檢索本體"""
+    return [(sql, params) for sql, params in store["executes"]
+            if "set_config" not in sql and "pg_extension" not in sql]
+
+
+async def test_kb_multi_search_is_one_lateral_query_grouped_by_source():
+    store = {}
+    rows = [
+        {"query_index": 2, "id": 20, "vector_similarity": 0.7, "priority": 0},
+        {"query_index": 1, "id": 10, "vector_similarity": 0.6, "priority": 0},
+        {"query_index": 1, "id": 11, "vector_similarity": 0.9, "priority": 0},
+    ]
+    r = object.__new__(VendorKnowledgeRetrieverV2)
+    r._get_db_connection = lambda: _Conn(store, rows)
+    r.param_resolver = MagicMock()
+    r.param_resolver.get_vendor_info.return_value = {"business_types": ["landlord_individual"]}
+    r._format_result = lambda row: row
+
+    out = await r._vector_search_multi(
+        [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], 1, 5, 0.6, target_user="tenant", mode="b2c"
+    )
+
+    (sql, params), = _search_sql(store)
+    assert "unnest(%s::text[]) WITH ORDINALITY" in sql and "CROSS JOIN LATERAL" in sql
+    assert "ORDER BY kb.embedding <=> q.embedding" in sql
+    assert sql.count("%s") == len(params)
+    assert params[0] == ["[0.1,0.2]", "[0.3,0.4]", "[0.5,0.6]"]
+    assert params[1:] == ([1], ["landlord_individual"], ["tenant", "all_users"], 40, 20)
+
+    assert [[x["id"] for x in g] for g in out] == [[11, 10], [20], []]
+    assert "query_index" not in out[0][0]
+
+
+async def test_sop_multi_search_is_one_lateral_query():
+    store = {}
+    rows = [{"query_index": 1, "id": 5, "vector_similarity": 0.8}]
+    r = object.__new__(VendorSOPRetrieverV2)
+    r._get_db_connection = lambda: _Conn(store, rows)
+    r._format_result = lambda row: row
+
+    out = await r._vector_search_multi([[0.1], [0.2]], 7, 5, 0.6)
+
+    (sql, params), = _search_sql(store)
+    assert "CROSS JOIN LATERAL" in sql and "si.primary_embedding <=> q.embedding" in sql
+    assert sql.count("%s") == len(params)
+    assert params == (["[0.1]", "[0.2]"], 7, 50)
+    assert out == [[{"id": 5, "vector_similarity": 0.8}], []]
+
+
+class _Retriever(BaseRetriever):
+    async def _vector_search(self, *a, **k):
+        return [{"id": 1, "vector_similarity": 0.9}]
+
+    async def _keyword_search(self, *a, **k):
+        return []
+
+    def _format_result(self, row):
+        return row
+
+
+async def test_rewrites_use_one_batch_embedding_and_one_multi_search():
+    r = _Retriever()
+    r.query_rewriter = None
+    r.semantic_reranker = None
+    r._get_embedding = AsyncMock(return_value=[0.1])
+    # 第二個改寫 embedding 失敗 → 略過，其餘照常
+    r._get_embeddings_batch = AsyncMock(return_value=[[0.2], None, [0.4]])
+    r._vector_search_multi = AsyncMock(return_value=[
+        [{"id": 1, "vector_similarity": 0.9}, {"id": 2, "vector_similarity": 0.8}],
+        [{"id": 2, "vector_similarity": 0.85}, {"id": 3, "vector_similarity": 0.7}],
+    ])
+
+    out = await r.retrieve("q", 1, top_k=10, enable_keyword_fallback=False, enable_keyword_boost=False,
+                           precomputed_embedding=[0.1], precomputed_rewrites=["改寫A", "改寫B", "改寫C"])
+
+    r._get_embeddings_batch.assert_awaited_once_with(["改寫A", "改寫B", "改寫C"])
+    r._vector_search_multi.assert_awaited_once()
+    assert r._vector_search_multi.await_args.args[0] == [[0.2], [0.4]]
+    by_id = {x["id"]: x for x in out}
+    assert set(by_id) == {1, 2, 3}
+    assert by_id[2]["rewrite_source"] == "改寫A" and by_id[3]["rewrite_source"] == "改寫C"
@@ -39,6 +39,7 @@ def retriever():
     r.query_rewriter = None
     r.semantic_reranker = None
     r._get_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
+    r._get_embeddings_batch = AsyncMock(side_effect=lambda texts: [[0.1, 0.2, 0.3] for _ in texts])
     return r
 
 
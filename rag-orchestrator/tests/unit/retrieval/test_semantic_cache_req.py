@@ -0,0 +1,214 @@
+"""unit：CacheService 語義緩存（Layer 1.5）。
+
+- 改寫說法（embedding 餘弦相似度 ≥ 門檻）命中同業者 / 角色 / 配置版本下已緩存的答案
+- 低於門檻、不同角色分區皆不命中
+- 答案經 invalidate_by_knowledge_id 失效後，語義條目 lazy 移除（不回舊答案）
+- 命中率與省下的延遲統計
+- 其他 worker 的增刪依變更記錄套用到本地鏡像（不整組 HGETALL 重載）
+- 分區滿時依登錄時間淘汰最舊條目（不掃描整個分區）
+
+不需真實 Redis：以記憶體假 Redis 取代（文字 / 二進位 client 共用同一份資料）。
+"""
+import time
+
+import pytest
+
+from services import cache_service as cache_module
+from services.cache_service import CacheService, set_semantic_query
+
+pytestmark = pytest.mark.unit
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.hgetall_calls = 0
+
+    # string
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        return sum(1 for k in keys if self.data.pop(k, None) is not None)
+
+    def expire(self, key, ttl):
+        return True
+
+    # set
+    def sadd(self, key, value):
+        self.data.setdefault(key, set()).add(value)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    # hash
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hkeys(self, key):
+        return list(self.data.get(key, {}))
+
+    def hgetall(self, key):
+        self.hgetall_calls += 1
+        return dict(self.data.get(key, {}))
+
+    def hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def hmget(self, key, fields):
+        return [self.data.get(key, {}).get(f) for f in fields]
+
+    # list
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+
+    def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.lrange(key, start, end)
+
+    # sorted set
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def zpopmin(self, key, count=1):
+        zset = self.data.get(key, {})
+        popped = sorted(zset.items(), key=lambda kv: kv[1])[:count]
+        for member, _ in popped:
+            del zset[member]
+        return popped
+
+    def zrem(self, key, *members):
+        for m in members:
+            self.data.get(key, {}).pop(m, None)
+
+    def hdel(self, key, *fields):
+        for f in fields:
+            self.data.get(key, {}).pop(f, None)
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        def _queue(*args):
+            self.ops.append((name, args))
+            return self
+        return _queue
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.ops]
+
+
+def _service(monkeypatch, threshold="0.95"):
+    monkeypatch.setenv("CACHE_ENABLED", "false")
+    monkeypatch.setenv("SEMANTIC_CACHE_THRESHOLD", threshold)
+    svc = CacheService()
+    fake = _FakeRedis()
+    svc.enabled = True
+    svc.redis_client = fake
+    svc.redis_binary = fake
+    svc.vector_format = "f32"
+    return svc
+
+
+ANSWER = {"answer": "每月 5 號前轉帳繳租金", "sources": [{"id": 42}]}
+
+
+def _cache_with_embedding(svc, question, embedding, target_user="tenant", elapsed_s=1.5):
+    set_semantic_query(embedding, time.time() - elapsed_s)
+    try:
+        assert svc.cache_answer(1, question, ANSWER, target_user=target_user, config_version="pm90_st80")
+    finally:
+        cache_module._semantic_query.set(None)
+
+
+def test_paraphrase_hits_within_partition(monkeypatch):
+    svc = _service(monkeypatch)
+    _cache_with_embedding(svc, "租金怎麼繳", [1.0, 0.0, 0.1])
+
+    hit = svc.get_semantic_cached_answer(1, [0.98, 0.02, 0.12], "tenant", "pm90_st80")
+    assert hit == ANSWER
+
+    # 不同角色 / 配置版本為不同分區
+    assert svc.get_semantic_cached_answer(1, [0.98, 0.02, 0.12], "landlord", "pm90_st80") is None
+    assert svc.get_semantic_cached_answer(1, [0.98, 0.02, 0.12], "tenant", "pm80_st70") is None
+
+    stats = svc.get_semantic_stats()
+    assert stats["hits"] == 1 and stats["lookups"] == 3
+    assert stats["saved_latency_ms_total"] > 1000
+
+
+def test_below_threshold_misses(monkeypatch):
+    svc = _service(monkeypatch, threshold="0.99")
+    _cache_with_embedding(svc, "租金怎麼繳", [1.0, 0.0, 0.0])
+
+    assert svc.get_semantic_cached_answer(1, [0.9, 0.4, 0.0], "tenant", "pm90_st80") is None
+    assert svc.get_semantic_stats()["misses"] == 1
+
+
+def test_knowledge_invalidation_drops_semantic_entry(monkeypatch):
+    svc = _service(monkeypatch)
+    _cache_with_embedding(svc, "租金怎麼繳", [1.0, 0.0, 0.0])
+    assert svc.get_semantic_cached_answer(1, [1.0, 0.0, 0.0], "tenant", "pm90_st80") == ANSWER
+
+    assert svc.invalidate_by_knowledge_id(42) == 1
+
+    assert svc.get_semantic_cached_answer(1, [1.0, 0.0, 0.0], "tenant", "pm90_st80") is None
+    assert svc.get_semantic_stats()["stale"] == 1
+    assert svc.redis_binary.hkeys("rag:semantic:1:tenant:pm90_st80") == []
+
+
+def test_cache_answer_without_embedding_skips_semantic_index(monkeypatch):
+    svc = _service(monkeypatch)
+    assert svc.cache_answer(1, "租金怎麼繳", ANSWER, config_version="pm90_st80")
+    assert "rag:semantic:1:tenant:pm90_st80" not in svc.redis_client.data
+
+
+def test_other_worker_changes_applied_incrementally(monkeypatch):
+    writer = _service(monkeypatch)
+    reader = _service(monkeypatch)
+    reader.redis_client = reader.redis_binary = writer.redis_binary
+    fake = writer.redis_binary
+
+    _cache_with_embedding(writer, "租金怎麼繳", [1.0, 0.0, 0.0])
+    assert reader.get_semantic_cached_answer(1, [1.0, 0.0, 0.0], "tenant", "pm90_st80") == ANSWER
+    assert fake.hgetall_calls == 2                           # 首次載入：向量 + 延遲
+
+    _cache_with_embedding(writer, "押金何時退", [0.0, 1.0, 0.0])
+    assert reader.get_semantic_cached_answer(1, [0.0, 1.0, 0.0], "tenant", "pm90_st80") == ANSWER
+    writer._remove_semantic_entry("1:tenant:pm90_st80", next(iter(fake.data["rag:semantic:1:tenant:pm90_st80"])))
+    assert reader.get_semantic_cached_answer(1, [1.0, 0.0, 0.0], "tenant", "pm90_st80") is None
+    assert fake.hgetall_calls == 2                           # 之後只套用變更記錄
+    assert len(reader._semantic_partitions["1:tenant:pm90_st80"].keys) == 1
+
+
+def test_full_partition_evicts_oldest(monkeypatch):
+    monkeypatch.setenv("SEMANTIC_CACHE_MAX_ENTRIES", "2")
+    svc = _service(monkeypatch)
+    for i, question in enumerate(["租金怎麼繳", "押金何時退", "合約怎麼續"]):
+        _cache_with_embedding(svc, question, [float(i == 0), float(i == 1), float(i == 2)])
+
+    assert svc.redis_binary.hlen("rag:semantic:1:tenant:pm90_st80") == 2
+    assert svc.get_semantic_cached_answer(1, [1.0, 0.0, 0.0], "tenant", "pm90_st80") is None   # 最舊者被淘汰
+    assert svc.get_semantic_cached_answer(1, [0.0, 0.0, 1.0], "tenant", "pm90_st80") == ANSWER
@@ -0,0 +1,114 @@
+"""unit：向量二進位編碼（vector_codec）與 CacheService 向量快取 v2 格式 + 舊 JSON lazy 遷移。"""
+import base64
+import json
+
+import pytest
+
+from services.cache_service import CacheService
+from services.vector_codec import (
+    decode_b64_vector,
+    decode_vector,
+    encode_vector,
+    to_pgvector_literal,
+)
+
+pytestmark = pytest.mark.unit
+
+VEC = [0.5, -0.25, 0.125, 1.0]
+
+
+def test_f32_roundtrip_and_size():
+    data = encode_vector(VEC, "f32")
+    assert len(data) == 4 * len(VEC)
+    assert decode_vector(data, "f32") == VEC
+
+
+def test_f16_roundtrip_and_size():
+    data = encode_vector(VEC, "f16")
+    assert len(data) == 2 * len(VEC)
+    assert decode_vector(data, "f16") == VEC
+
+
+def test_binary_much_smaller_than_json():
+    import random
+    rng = random.Random(0)
+    vec = [round(rng.uniform(-0.08, 0.08), 10) for _ in range(1536)]  # 形似 OpenAI 回傳值
+    assert len(json.dumps(vec)) > 3 * len(encode_vector(vec, "f32"))
+    assert len(json.dumps(vec)) > 6 * len(encode_vector(vec, "f16"))
+
+
+def test_decode_rejects_bad_length():
+    with pytest.raises(ValueError):
+        decode_vector(b"\x00\x00\x00", "f32")
+
+
+def test_decode_b64():
+    assert decode_b64_vector(base64.b64encode(encode_vector(VEC)).decode()) == VEC
+    assert decode_b64_vector(None) is None
+
+
+def test_pgvector_literal():
+    assert to_pgvector_literal([0.1, 0.2, 0.3]) == "[0.1,0.2,0.3]"
+
+
+def test_pgvector_literal_roundtrips_float32_exactly():
+    import numpy as np
+    rng = np.random.default_rng(0)
+    for scale in (0.08, 1.0, 1e-5):
+        vec = (rng.standard_normal(1536) * scale).astype(np.float32)
+        literal = to_pgvector_literal(vec.tolist())
+        parsed = np.array(literal[1:-1].split(","), dtype=np.float32)
+        assert np.array_equal(parsed, vec)
+
+
+class _FakeBinaryRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def ttl(self, key):
+        return 100
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def execute(self):
+        return []
+
+
+def _cache_service(fmt="f32"):
+    svc = object.__new__(CacheService)
+    svc.enabled = True
+    svc.redis_client = object()
+    svc.redis_binary = _FakeBinaryRedis()
+    svc.vector_format = fmt
+    svc.ttl_config = {"vector_cache": 7200}
+    return svc
+
+
+@pytest.mark.parametrize("fmt", ["f32", "f16"])
+def test_cache_vector_stores_binary_under_versioned_key(fmt):
+    svc = _cache_service(fmt)
+    assert svc.cache_vector("租金怎麼繳", VEC)
+    key = svc._make_vector_key("租金怎麼繳")
+    assert key.startswith(f"rag:vector:v2:{fmt}:")
+    assert isinstance(svc.redis_binary.data[key], bytes)
+    assert svc.get_cached_vector("租金怎麼繳") == VEC
+
+
+def test_legacy_json_entry_is_migrated_on_read():
+    svc = _cache_service()
+    legacy_key = svc._make_legacy_vector_key("押金")
+    svc.redis_binary.data[legacy_key] = json.dumps(VEC).encode()
+
+    assert svc.get_cached_vector("押金") == VEC
+    assert legacy_key not in svc.redis_binary.data, "舊 JSON key 應於遷移後刪除"
+    assert svc.redis_binary.data[svc._make_vector_key("押金")] == encode_vector(VEC)
@@ -0,0 +1,163 @@
+"""unit：knowledge_base 向量索引管理與查詢形狀（services/vector_index.py）。
+
+- 向量檢索 SQL 內層以純距離 ORDER BY（可走 HNSW）多取候選，查詢前設定本交易 ef_search / probes
+- 外層依相似度 DESC、priority DESC 排序後才取 LIMIT（同分取捨不在 LIMIT 之後）
+- hnsw.iterative_scan 預設啟用，但僅在 pgvector >= 0.8 時設定
+- 健康檢查以第一個啟用中的業者組檢索 SQL（不寫死業者）
+- 部分索引述詞與檢索 SQL 的過濾子句逐字一致（planner 才能證明蘊含）
+- EXPLAIN 計畫樹解析：找出使用到的向量索引
+
+不需真實 DB：攔截 cursor.execute。
+"""
+import pytest
+from unittest.mock import MagicMock
+
+import services.vector_index as vector_index
+from services.pipeline_health_service import PipelineHealthService
+from services.vector_index import (
+    BASE_PREDICATE,
+    VectorIndexConfig,
+    apply_search_settings,
+    explain_uses_vector_index,
+    knowledge_index_specs,
+    plan_index_names,
+)
+from services.vendor_knowledge_retriever_v2 import VendorKnowledgeRetrieverV2
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture(autouse=True)
+def _pgvector_08(monkeypatch):
+    monkeypatch.setattr(vector_index, "_iterative_scan_supported", True)
+
+
+class _Cursor:
+    def __init__(self, rows=None, fetchone=None):
+        self.calls = []
+        self.rows = rows or []
+        self._fetchone = fetchone
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self._fetchone
+
+    def close(self):
+        pass
+
+
+def _make_retriever(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    r = object.__new__(VendorKnowledgeRetrieverV2)
+    r._get_db_connection = lambda: conn
+    r.param_resolver = MagicMock()
+    r.param_resolver.get_vendor_info.return_value = {"business_types": ["full_service"]}
+    return r
+
+
+async def test_vector_search_orders_by_pure_distance_with_session_settings():
+    cursor = _Cursor(rows=[
+        {"id": 1, "priority": 0, "vector_similarity": 0.8},
+        {"id": 2, "priority": 5, "vector_similarity": 0.8},
+        {"id": 3, "priority": None, "vector_similarity": 0.9},
+    ])
+    r = _make_retriever(cursor)
+
+    results = await r._vector_search([0.1, 0.2], vendor_id=1, top_k=5, similarity_threshold=0.6)
+
+    settings_sql, settings_params = cursor.calls[0]
+    assert "set_config" in settings_sql
+    assert "hnsw.ef_search" in settings_params and "ivfflat.probes" in settings_params
+
+    sql, params = cursor.calls[1]
+    inner_order_by, outer_order_by = sql.split("ORDER BY")[1:]
+    assert "kb.embedding <=> %s::vector" in inner_order_by
+    assert "priority" not in inner_order_by and "1 -" not in inner_order_by
+    assert "cand.vector_similarity DESC, cand.priority DESC" in outer_order_by
+    assert params[-2:] == (40, 20)                           # 內層多取候選，外層取 LIMIT
+
+    assert [x["id"] for x in results] == [3, 2, 1]
+
+
+def test_iterative_scan_on_by_default_only_for_pgvector_08(monkeypatch):
+    cursor = _Cursor()
+    apply_search_settings(cursor, VectorIndexConfig(iterative_scan=""))
+    assert "hnsw.iterative_scan" not in cursor.calls[0][1]
+
+    cursor = _Cursor()
+    apply_search_settings(cursor, VectorIndexConfig())
+    assert cursor.calls[0][1][-2:] == ("hnsw.iterative_scan", "relaxed_order")
+
+    monkeypatch.setattr(vector_index, "_iterative_scan_supported", None)
+    cursor = _Cursor(fetchone={"extversion": "0.7.4"})
+    apply_search_settings(cursor, VectorIndexConfig())
+    assert "pg_extension" in cursor.calls[0][0]
+    assert "hnsw.iterative_scan" not in cursor.calls[1][1]
+
+
+def test_index_usage_check_uses_first_active_vendor(monkeypatch):
+    class _HealthCursor(_Cursor):
+        def __init__(self):
+            super().__init__()
+            self.results = [(5000,), (7, ["full_service"])]
+
+        def fetchone(self):
+            return self.results.pop(0)
+
+    captured = {}
+
+    def fake_explain(cursor, sql, params):
+        captured["params"] = params
+        return {"uses_index": True, "indexes": ["idx_kb_embedding_hnsw"], "vector_indexes": ["idx_kb_embedding_hnsw"]}
+
+    monkeypatch.setattr(vector_index, "explain_uses_vector_index", fake_explain)
+    cursor = _HealthCursor()
+    assert PipelineHealthService._check_vector_index_usage(cursor, "[0.1]") is None
+    assert "FROM vendors WHERE is_active" in cursor.calls[1][0]
+    assert captured["params"][1:3] == ([7], ["full_service"])
+
+
+def test_partition_predicates_match_retriever_filters():
+    """部分索引的分區子句須逐字出現在以 psycopg2 方式代入參數後的檢索 SQL 中。"""
+    sql, params = VendorKnowledgeRetrieverV2._build_vector_search_query(
+        "[0.1]", 2, ["full_service"], ["tenant", "all_users"], False, 20,
+    )
+    specs = {s.name: s for s in knowledge_index_specs(vendor_ids=[2])}
+
+    rendered = sql
+    for value in params:
+        if isinstance(value, list):
+            literal = "ARRAY[" + ",".join(f"'{v}'" if isinstance(v, str) else str(v) for v in value) + "]"
+        else:
+            literal = repr(value)
+        rendered = rendered.replace("%s", literal, 1)
+
+    assert BASE_PREDICATE in rendered
+    for name in ("idx_kb_embedding_hnsw_tu_tenant_all_users", "idx_kb_embedding_hnsw_vendor_2"):
+        clause = specs[name].predicate[len(BASE_PREDICATE + " AND "):]
+        assert clause in rendered, name
+    assert "USING hnsw" in specs["idx_kb_embedding_hnsw"].create_sql(VectorIndexConfig(m=24))
+    assert "m = 24" in specs["idx_kb_embedding_hnsw"].create_sql(VectorIndexConfig(m=24))
+
+
+def test_explain_detects_vector_index_usage():
+    plan = {"Plan": {"Node Type": "Limit", "Plans": [
+        {"Node Type": "Index Scan", "Index Name": "idx_kb_embedding_hnsw_tu_tenant_all_users"},
+    ]}}
+    assert plan_index_names(plan) == ["idx_kb_embedding_hnsw_tu_tenant_all_users"]
+
+    class _ExplainCursor(_Cursor):
+        def fetchall(self):
+            return [("idx_kb_embedding_hnsw", "CREATE INDEX ... USING hnsw ...")]
+
+    seq_plan = [{"Plan": {"Node Type": "Limit", "Plans": [{"Node Type": "Sort", "Plans": [
+        {"Node Type": "Seq Scan", "Relation Name": "knowledge_base"},
+    ]}]}}]
+    result = explain_uses_vector_index(_ExplainCursor(fetchone=(seq_plan,)), "SELECT 1", ())
+    assert result == {"uses_index": False, "indexes": [], "vector_indexes": ["idx_kb_embedding_hnsw"]}
@@ -0,0 +1,120 @@
+"""unit：API Key 驗證快取（services/api_key_auth.ApiKeyCache）。
+
+- 有效金鑰第二次起零 DB 往返；last_used_at 節流更新（背景 Task 保留參照）
+- 無效金鑰負向快取；DB 錯誤不寫負向快取
+- 金鑰異動通知（rag:api_keys:changed）剔除該金鑰並清空負向快取；TTL 到期重查
+- 建立金鑰的 create 通知清掉建立前留下的負向條目，新金鑰立即可用
+"""
+import asyncio
+import json
+
+import pytest
+
+import services.api_key_auth as auth
+from services.api_key_auth import ApiKeyCache, hash_key, verify_api_key
+
+pytestmark = pytest.mark.unit
+
+
+class _Conn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetchrow(self, sql, key_hash):
+        self.pool.fetches += 1
+        if self.pool.fail:
+            raise ConnectionError("db down")
+        return self.pool.keys.get(key_hash)
+
+    async def execute(self, sql, key_id):
+        self.pool.touches.append(key_id)
+
+
+class _Pool:
+    def __init__(self, **plain_to_row):
+        self.keys = {hash_key(k): row for k, row in plain_to_row.items()}
+        self.fetches = 0
+        self.touches = []
+        self.fail = False
+
+    def acquire(self):
+        return _Conn(self)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    c = ApiKeyCache()
+    monkeypatch.setattr(auth, "_api_key_cache", c)
+    return c
+
+
+async def test_valid_key_cached_and_last_used_throttled(cache):
+    pool = _Pool(good={"id": 3, "name": "jgb"})
+    for _ in range(5):
+        assert await verify_api_key(pool, "good") == {"id": 3, "name": "jgb"}
+    assert len(auth._touch_tasks) == 1            # 背景更新保留參照，完成後移除
+    await asyncio.wait(set(auth._touch_tasks))
+    await asyncio.sleep(0)
+    assert pool.fetches == 1 and pool.touches == [3]
+    assert not auth._touch_tasks
+    assert cache.get_stats()["hits"] == 4
+
+
+async def test_negative_cache_and_db_errors(cache):
+    pool = _Pool()
+    assert await verify_api_key(pool, "bad") is None
+    assert await verify_api_key(pool, "bad") is None
+    assert pool.fetches == 1 and cache.get_stats()["negative_hits"] == 1
+
+    pool.fail = True
+    assert await verify_api_key(pool, "other") is None
+    pool.fail = False
+    pool.keys[hash_key("other")] = {"id": 4, "name": "x"}
+    assert await verify_api_key(pool, "other") == {"id": 4, "name": "x"}
+
+
+async def test_change_notification_and_ttl(cache):
+    pool = _Pool(good={"id": 3, "name": "jgb"}, other={"id": 4, "name": "x"})
+    await verify_api_key(pool, "good")
+    await verify_api_key(pool, "other")
+    await verify_api_key(pool, "nope")
+    assert pool.fetches == 3
+
+    # 後台停用 key 3：只剔除該金鑰（與負向快取），key 4 仍命中
+    del pool.keys[hash_key("good")]
+    assert cache.handle_message(json.dumps({"key_id": 3, "action": "deactivate"})) == 1
+    assert await verify_api_key(pool, "good") is None
+    assert await verify_api_key(pool, "other") is not None
+    assert pool.fetches == 4
+    assert cache.get_stats()["negative_entries"] == 1
+
+    # 格式錯誤的訊息：全部清空
+    cache.handle_message("garbage")
+    assert cache.get_stats()["entries"] == 0
+
+    cache.ttl = -1
+    await verify_api_key(pool, "other")
+    await verify_api_key(pool, "other")
+    assert pool.fetches == 6
+
+
+async def test_create_event_clears_negative_entry(cache, monkeypatch):
+    monkeypatch.setattr(auth, "_touch_tasks", set())
+    pool = _Pool()
+    assert await verify_api_key(pool, "fresh") is None          # 建立前先試打 → 負向快取
+    assert await verify_api_key(pool, "fresh") is None
+    assert pool.fetches == 1 and cache.get_stats()["negative_entries"] == 1
+
+    # 後台建立金鑰並發布 create：負向條目清除，下一次請求重查 DB 即通過
+    pool.keys[hash_key("fresh")] = {"id": 9, "name": "new"}
+    cache.handle_message(json.dumps({"key_id": 9, "action": "create"}))
+    assert cache.get_stats()["negative_entries"] == 0
+    assert await verify_api_key(pool, "fresh") == {"id": 9, "name": "new"}
+    assert pool.fetches == 2
+    await asyncio.wait(set(auth._touch_tasks))
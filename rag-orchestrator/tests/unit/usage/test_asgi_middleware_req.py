@@ -0,0 +1,128 @@
+"""unit：純 ASGI 計量 / 認證 middleware（services/asgi_middleware.py）。
+
+- 計量路徑：request body 原樣交給下游、計量 context 取得 vendor_id、回應標頭送出時 finalize 一次
+- SSE 串流直通（不 finalize、不暫存）；非計量路徑不讀 body
+- 達限短路回攔截回應；對話內額度提示改寫多 chunk JSON 並重算 content-length
+- API Key：強制時缺 / 錯金鑰回 401，豁免路徑與 OPTIONS 放行
+"""
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import services.asgi_middleware as mw
+from services import usage_metering as um
+from services.asgi_middleware import ApiKeyGuardMiddleware, UsageMeteringMiddleware
+
+pytestmark = pytest.mark.unit
+
+
+async def _message(request):
+    body = await request.json()
+    ctx = um._ctx.get()
+    return JSONResponse({"answer": "您好", "echo": body, "ctx_vendor": ctx.vendor_id if ctx else None})
+
+
+async def _stream(request):
+    async def gen():
+        for i in range(3):
+            yield f"data: {i}\n\n"
+    return StreamingResponse(gen(), media_type="text/event-stream")
+
+
+async def _chunked_json(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", b"17")]})
+    await send({"type": "http.response.body", "body": b'{"answer":', "more_body": True})
+    await send({"type": "http.response.body", "body": b'"hi"}', "more_body": False})
+
+
+def _client(routes, middleware=UsageMeteringMiddleware):
+    app = middleware(Starlette(routes=routes))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+
+@pytest.fixture
+def finalized(monkeypatch):
+    monkeypatch.setenv("USAGE_METERING_ENABLED", "true")
+    calls = []
+    monkeypatch.setattr(um, "finalize", lambda status="success", http_status=200, db_pool=None:
+                        calls.append((status, http_status)))
+    um._ctx.set(None)
+    yield calls
+    um._ctx.set(None)
+
+
+async def test_metered_body_replayed_and_finalized_once(finalized):
+    payload = {"message": "帳單", "vendor_id": 7, "target_user": "tenant"}
+    async with _client([Route("/api/v1/message", _message, methods=["POST"])]) as c:
+        resp = await c.post("/api/v1/message", json=payload)
+    assert resp.status_code == 200
+    assert resp.json()["echo"] == payload and resp.json()["ctx_vendor"] == 7
+    assert finalized == [("success", 200)]
+
+
+async def test_sse_passes_through_and_other_paths_untouched(finalized):
+    routes = [Route("/api/v1/message", _stream, methods=["POST"]),
+              Route("/api/v1/other", _message, methods=["POST"])]
+    async with _client(routes) as c:
+        resp = await c.post("/api/v1/message", json={"vendor_id": 1})
+        assert resp.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+        um._ctx.set(None)                     # ASGITransport 不像 server 每請求獨立 context
+        resp = await c.post("/api/v1/other", json={"vendor_id": 1})
+        assert resp.json()["ctx_vendor"] is None
+    assert finalized == []
+
+
+async def test_quota_blocked_short_circuits(finalized, monkeypatch):
+    async def _blocked(pool, vendor_id, is_internal):
+        return um.QuotaState("blocked", 100, 100, 100)
+    monkeypatch.setattr(um, "quota_check", _blocked)
+    called = []
+
+    async def _handler(request):
+        called.append(1)
+        return JSONResponse({})
+
+    async with _client([Route("/api/v1/message", _handler, methods=["POST"])]) as c:
+        resp = await c.post("/api/v1/message", json={"vendor_id": 1, "target_user": "tenant"})
+    assert resp.json()["action_type"] == "quota_blocked" and called == []
+    assert finalized == [("blocked", 200)]
+
+
+async def test_quota_hint_rewrites_chunked_json(finalized, monkeypatch):
+    async def _warn(pool, vendor_id, is_internal):
+        return um.QuotaState("warn", 80, 100, 80)
+    monkeypatch.setattr(um, "quota_check", _warn)
+    monkeypatch.setenv("QUOTA_WARN_IN_CHAT", "true")
+
+    async def _app(scope, receive, send):
+        await _chunked_json(scope, receive, send)
+
+    app = UsageMeteringMiddleware(_app)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+        resp = await c.post("/api/v1/message", json={"vendor_id": 1, "target_user": "property_manager"})
+    assert resp.json()["answer"].startswith("hi\n\n──\n📊 本月 AI 客服額度已使用 80%")
+    assert int(resp.headers["content-length"]) == len(resp.content)
+    assert finalized == [("success", 200)]
+
+
+async def test_api_key_guard(monkeypatch):
+    monkeypatch.setenv("RAG_API_AUTH_ENFORCE", "true")
+
+    async def _verify(pool, key):
+        return {"id": 1, "name": "jgb"} if key == "good" else None
+    monkeypatch.setattr(mw, "verify_api_key", _verify)
+
+    async def _ok(request):
+        return JSONResponse({"ok": True})
+
+    routes = [Route("/api/v1/knowledge", _ok, methods=["GET", "OPTIONS"]), Route("/api/v1/health", _ok)]
+    async with _client(routes, ApiKeyGuardMiddleware) as c:
+        assert (await c.get("/api/v1/knowledge")).status_code == 401
+        assert (await c.get("/api/v1/knowledge", headers={"X-API-Key": "bad"})).status_code == 401
+        assert (await c.get("/api/v1/knowledge", headers={"X-API-Key": "good"})).json() == {"ok": True}
+        assert (await c.get("/api/v1/health")).status_code == 200
+        assert (await c.options("/api/v1/knowledge")).status_code == 200
@@ -0,0 +1,143 @@
+"""unit：usage_events 批次寫入器（services/usage_event_writer.py）。
+
+- 事件依筆數 / 間隔整批一次多列 INSERT（ON CONFLICT 去重）
+- 佇列滿丟棄並計數（不阻塞）；finalize 在 writer 啟動時只入佇列
+- DB 失敗落地 spill 檔（datetime / date / Decimal 可還原），恢復後回放
+- stop() 排空佇列寫入最後一批（含 worker 已取出、尚在湊批的事件）
+- 回放中途崩潰留下的 .replay-<pid> 檔於啟動時認領回放
+
+不碰真實 DB。
+"""
+import asyncio
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+import services.usage_event_writer as writer_mod
+from services import usage_metering as um
+from services.usage_event_writer import UsageEventWriter
+
+pytestmark = pytest.mark.unit
+
+
+class _Conn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, *args):
+        if self.pool.fail:
+            raise ConnectionError("db down")
+        self.pool.calls.append((sql, args))
+
+
+class _Pool:
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def acquire(self):
+        return _Conn(self)
+
+
+def _row(i):
+    return {"request_id": f"r{i}", "ts": datetime(2026, 10, 1, 8, tzinfo=timezone.utc),
+            "date_tpe": date(2026, 10, 1), "vendor_id": 2, "est_cost_usd": Decimal("0.000123"),
+            "model_breakdown": '{"gpt-4o-mini": 1}'}
+
+
+async def test_batches_by_size_and_interval(tmp_path):
+    pool = _Pool()
+    w = UsageEventWriter(pool, max_queue=100, batch_size=3, flush_interval=0.05, spill_dir=str(tmp_path))
+    w.start()
+    for i in range(4):
+        assert w.submit(_row(i))
+    await asyncio.sleep(0.15)
+
+    assert [len(args) for _, args in pool.calls] == [3 * 6, 1 * 6]
+    sql, args = pool.calls[0]
+    assert "VALUES ($1, $2, $3, $4, $5, $6), ($7," in sql and "ON CONFLICT (request_id) DO NOTHING" in sql
+    assert args[0] == "r0" and args[6] == "r1"
+    await w.stop()
+    assert w.get_stats()["written"] == 4 and w.get_stats()["batches"] == 2
+
+
+async def test_queue_full_drops_and_finalize_enqueues(tmp_path, monkeypatch):
+    w = UsageEventWriter(_Pool(), max_queue=1, spill_dir=str(tmp_path))
+    assert w.submit(_row(1)) and not w.submit(_row(2))
+    assert w.get_stats()["dropped"] == 1 and w.get_stats()["queue_depth"] == 1
+
+    monkeypatch.setenv("USAGE_METERING_ENABLED", "true")
+    monkeypatch.setattr(writer_mod, "_writer", UsageEventWriter(_Pool(), spill_dir=str(tmp_path)))
+    um._ctx.set(None)
+    um.begin({"message": "帳單", "vendor_id": 2, "target_user": "tenant", "session_id": "s"})
+    um.finalize("success", 200, db_pool=_Pool())
+    assert writer_mod._writer.get_stats()["queue_depth"] == 1
+    um._ctx.set(None)
+
+
+async def test_spill_on_db_failure_then_replay(tmp_path):
+    pool = _Pool()
+    pool.fail = True
+    w = UsageEventWriter(pool, batch_size=10, spill_dir=str(tmp_path))
+    await w._flush([_row(1), _row(2)])
+    assert w.stats["spilled"] == 2 and w.stats["flush_errors"] == 1
+    assert len(list(tmp_path.glob("spill-*.jsonl"))) == 1
+
+    pool.fail = False
+    await w._flush([_row(3)])
+    assert w.stats["replayed"] == 2 and list(tmp_path.iterdir()) == []
+    _, replay_args = pool.calls[1]
+    assert replay_args[:6] == tuple(_row(1).values())        # 型別還原後與原列相同
+
+
+async def test_stop_flushes_remaining_or_spills(tmp_path):
+    pool = _Pool()
+    w = UsageEventWriter(pool, batch_size=2, flush_interval=60, spill_dir=str(tmp_path))
+    for i in range(5):
+        w.submit(_row(i))
+    await w.stop()
+    assert sum(len(args) for _, args in pool.calls) == 5 * 6
+    assert not w.submit(_row(9))                             # 關閉後不再收件
+
+    pool.fail = True
+    w = UsageEventWriter(pool, spill_dir=str(tmp_path))
+    w.submit(_row(10))
+    await w.stop()
+    assert w.stats["spilled"] == 1
+
+
+async def test_stop_writes_batch_held_by_running_worker(tmp_path):
+    pool = _Pool()
+    w = UsageEventWriter(pool, batch_size=10, flush_interval=60, spill_dir=str(tmp_path))
+    w.start()
+    for i in range(3):
+        w.submit(_row(i))
+    await asyncio.sleep(0.01)                                # worker 已取出 3 筆，正在等湊滿一批
+    assert w.get_stats()["queue_depth"] == 0
+
+    await w.stop()
+    stats = w.get_stats()
+    assert stats["written"] == 3 and stats["spilled"] == 0 and stats["dropped"] == 0
+    assert not stats["running"]
+
+
+async def test_stale_replay_file_reclaimed_on_start(tmp_path):
+    pool = _Pool()
+    w = UsageEventWriter(pool, batch_size=10, flush_interval=0.01, spill_dir=str(tmp_path))
+    w._spill([_row(1)])
+    os.replace(w.spill_path, f"{w.spill_path}.replay-{os.getpid()}")   # 上次回放中途崩潰
+    w.start()
+    assert [p.name.startswith("spill-") and p.suffix == ".jsonl" for p in tmp_path.iterdir()] == [True]
+
+    w.submit(_row(2))
+    await asyncio.sleep(0.05)
+    await w.stop()
+    assert w.stats["replayed"] == 1 and list(tmp_path.iterdir()) == []
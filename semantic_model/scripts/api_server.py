@@ -7,12 +7,16 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Union, Any
 import uvicorn
+import asyncio
 import json
 import os
 from datetime import datetime
-from sentence_transformers import CrossEncoder
 import logging
 
+from reranker_backends import load_reranker_backend
+from inference_scheduler import InferenceScheduler, SchedulerOverloaded
+from pair_score_cache import create_pair_score_cache
+
 # 設定日誌
 logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
 logger = logging.getLogger(__name__)
@@ -27,6 +31,8 @@ app = FastAPI(
 # 全局變數
 model = None
 knowledge_base = None
+scheduler = None  # /rerank 跨請求動態批次排程器
+pair_cache = None  # /rerank (query, text) 分數快取
 
 # Request/Response 模型
 class SearchRequest(BaseModel):
@@ -59,19 +65,39 @@ class HealthResponse(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """啟動時載入模型和知識庫"""
-    global model, knowledge_base
+    global model, knowledge_base, scheduler, pair_cache
 
     logger.info("正在載入語義模型...")
 
-    # 載入模型
-    model_name = os.getenv('MODEL_NAME', 'BAAI/bge-reranker-base')
+    # 載入模型（後端由 config/models.json 的 serving 區塊決定：torch / onnx / onnx-int8）
+    config_path = os.getenv('MODELS_CONFIG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'models.json'))
     try:
-        model = CrossEncoder(model_name, max_length=512)
-        logger.info(f"✅ 模型載入成功: {model_name}")
+        model = load_reranker_backend(config_path)
+        model_info = model.get_info()
+        model_name = model_info["model_path"]
+        max_length = model_info["max_length"]
+        logger.info(f"✅ 模型載入成功: {model_name} (backend={model_info['backend']})")
     except Exception as e:
         logger.error(f"❌ 模型載入失敗: {e}")
         raise
 
+    # 推論排程器：/rerank 的 pairs 在專用 worker 執行緒跨請求合批推論，不卡 event loop
+    scheduler = InferenceScheduler(
+        predict_fn=lambda pairs: model.predict(pairs, batch_size=len(pairs)),
+        max_length=max_length,
+        max_batch_pairs=int(os.getenv('RERANK_MAX_BATCH_PAIRS', os.getenv('BATCH_SIZE', 32))),
+        max_batch_tokens=int(os.getenv('RERANK_MAX_BATCH_TOKENS', 8192)),
+        max_wait_ms=float(os.getenv('RERANK_BATCH_WAIT_MS', 5)),
+        max_queue_pairs=int(os.getenv('RERANK_MAX_QUEUE_PAIRS', 2048)),
+        latency_slo_ms=float(os.getenv('RERANK_LATENCY_SLO_MS', 20000)),
+        num_workers=int(os.getenv('RERANK_WORKERS', 1)),
+    )
+    scheduler.start()
+
+    # pair 分數快取：熱門 FAQ 重複的 (query, question_summary) 不再重跑模型
+    # （量化後端分數略有差異，key 含後端名稱）
+    pair_cache = create_pair_score_cache(f"{model_name}:{model_info['backend']}", os.environ)
+
     # 載入知識庫
     try:
         kb_path = '/app/data/knowledge_base.json'
@@ -82,6 +108,12 @@ async def startup_event():
         logger.error(f"❌ 知識庫載入失敗: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止推論排程器"""
+    if scheduler:
+        scheduler.stop()
+
 # API 端點
 @app.get("/", response_model=HealthResponse)
 async def health_check():
@@ -110,25 +142,28 @@ async def search(request: SearchRequest):
             candidates = [kb for kb in knowledge_base
                          if kb.get('vendor_id') == request.vendor_id]
 
-        # 批次計算分數
+        # 批次計算分數（全庫掃描耗時，丟到執行緒避免卡住 event loop）
         batch_size = 100
         all_results = []
 
-        for i in range(0, len(candidates), batch_size):
-            batch = candidates[i:i+batch_size]
-            pairs = [[request.query, kb['content']] for kb in batch]
-            scores = model.predict(pairs)
-
-            for kb, score in zip(batch, scores):
-                if score >= request.min_score:
-                    all_results.append({
-                        'knowledge_id': kb['id'],
-                        'title': kb['title'],
-                        'content': kb['content'][:200] + "...",
-                        'score': float(score),
-                        'action_type': kb.get('action_type'),
-                        'form_id': kb.get('form_id')  # 現在可以直接傳遞，支援 int 或 str
-                    })
+        def _score_all():
+            scored = []
+            for i in range(0, len(candidates), batch_size):
+                batch = candidates[i:i+batch_size]
+                pairs = [[request.query, kb['content']] for kb in batch]
+                scored.extend(zip(batch, model.predict(pairs)))
+            return scored
+
+        for kb, score in await asyncio.to_thread(_score_all):
+            if score >= request.min_score:
+                all_results.append({
+                    'knowledge_id': kb['id'],
+                    'title': kb['title'],
+                    'content': kb['content'][:200] + "...",
+                    'score': float(score),
+                    'action_type': kb.get('action_type'),
+                    'form_id': kb.get('form_id')  # 現在可以直接傳遞，支援 int 或 str
+                })
 
         # 排序並返回前 K 個
         all_results.sort(key=lambda x: x['score'], reverse=True)
@@ -166,7 +201,7 @@ async def rerank(request: RerankRequest):
     """
     重新排序候選結果
     """
-    if not model:
+    if not model or not scheduler:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
     # 準備模型輸入
@@ -177,11 +212,28 @@ async def rerank(request: RerankRequest):
     for candidate in request.candidates:
         question = candidate.get("question_summary", "")
         text = question if question else (candidate.get("answer") or candidate.get("content", ""))
-        pairs.append([request.query, text])
+        pairs.append((request.query, text))
 
-    # 計算分數
+    # 計算分數：先查 pair 分數快取，只把未命中的交給排程器
+    # （與其他並發請求合批；佇列超過延遲 SLO 時回 503 讓呼叫端降級）
     if pairs:
-        scores = model.predict(pairs)
+        scores = await _cache_call(pair_cache.get_many, pairs) if pair_cache else [None] * len(pairs)
+        miss_idx = [i for i, score in enumerate(scores) if score is None]
+        if miss_idx:
+            miss_pairs = [pairs[i] for i in miss_idx]
+            try:
+                miss_scores = await scheduler.submit(miss_pairs)
+            except SchedulerOverloaded as e:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Reranker overloaded: {e}",
+                    headers={"Retry-After": str(max(1, int(e.estimated_wait_ms / 1000)))}
+                )
+            for i, score in zip(miss_idx, miss_scores):
+                scores[i] = score
+            if pair_cache:
+                ids = [request.candidates[i].get("id") for i in miss_idx]
+                await _cache_call(pair_cache.put_many, miss_pairs, miss_scores, ids)
 
         # 組合結果
         results = []
@@ -200,6 +252,32 @@ async def rerank(request: RerankRequest):
 
     return RerankResponse(results=[])
 
+async def _cache_call(fn, *args):
+    """快取有 Redis 時為網路 I/O，丟到執行緒；純本地 LRU 直接呼叫"""
+    if pair_cache.redis is not None:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+class CacheInvalidateRequest(BaseModel):
+    knowledge_ids: List[Any] = []
+    clear_all: bool = False
+
+@app.post("/cache/invalidate")
+async def invalidate_pair_cache(request: CacheInvalidateRequest):
+    """
+    清除 pair 分數快取（知識編輯時由 rag-orchestrator 轉發）
+
+    key 已含候選文字 hash，文字變更本來就不會命中舊分數；
+    這裡主動清除讓舊條目不佔用 LRU / Redis 空間。
+    """
+    if not pair_cache:
+        return {"success": True, "invalidated_count": 0, "message": "pair 分數快取未啟用"}
+    if request.clear_all:
+        await asyncio.to_thread(pair_cache.clear)
+        return {"success": True, "invalidated_count": None, "message": "已清除全部 pair 分數快取"}
+    count = await asyncio.to_thread(pair_cache.invalidate_knowledge, request.knowledge_ids)
+    return {"success": True, "invalidated_count": count, "message": f"清除 {count} 筆 pair 分數"}
+
 @app.post("/reload")
 async def reload_knowledge_base():
     """
@@ -228,8 +306,13 @@ async def get_metrics():
         "model_loaded": model is not None,
         "knowledge_base_size": len(knowledge_base) if knowledge_base else 0,
         "model_name": os.getenv('MODEL_NAME', 'BAAI/bge-reranker-base'),
+        "model_backend": model.get_info() if model else None,
         "api_version": "1.0.0",
-        "python_version": "3.9"
+        "python_version": "3.9",
+        # 排程器：queue_depth / avg_batch_size / batch_size_histogram / rejected（503 次數）等
+        "rerank_scheduler": scheduler.get_metrics() if scheduler else None,
+        # pair 分數快取：hit_rate / hits_local / hits_redis / misses 等
+        "rerank_cache": pair_cache.get_stats() if pair_cache else None
     }
 
 # 主程式
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Reranker 後端比較：準確度 vs 延遲
+
+以回測題庫（test_scenarios，有 related_knowledge_ids 者）建立 rerank 情境：
+- 正解：related_knowledge_ids 中的知識
+- 干擾項：與正解 embedding 最相近的其他知識（難負例，貼近線上向量召回結果）
+
+對每個後端 × 每個候選數上限（--caps），量測：
+- 延遲：單次 rerank 的 p50 / p95 / p99（ms）
+- 準確度：top-1 命中率、MRR
+- 與 torch 的一致性：top-1 一致率、分數最大絕對誤差
+
+用途：評估換成 onnx-int8 後，RERANKER_INPUT_LIMIT 能否從 20 調高而 p99 不變。
+
+使用方式：
+    # 從資料庫建立情境並存檔（之後可離線重跑）
+    python scripts/compare_backends.py --dump data/rerank_scenarios.json
+
+    # 用存檔比較
+    python scripts/compare_backends.py --scenarios data/rerank_scenarios.json \\
+        --backends torch onnx onnx-int8 --caps 20 40 60 --threads 4
+
+資料庫連線：DATABASE_URL 或 DB_HOST / DB_PORT / DB_USER / DB_PASSWORD / DB_NAME。
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from reranker_backends import SUPPORTED_BACKENDS, create_backend, load_serving_config  # noqa: E402
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """nearest-rank 百分位數"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _connect():
+    import psycopg2
+
+    if os.getenv("DATABASE_URL"):
+        return psycopg2.connect(os.getenv("DATABASE_URL"))
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST", "postgres"),
+        port=int(os.getenv("DB_PORT", 5432)),
+        user=os.getenv("DB_USER", "aichatbot"),
+        password=os.getenv("DB_PASSWORD", "aichatbot_password"),
+        dbname=os.getenv("DB_NAME", "aichatbot_admin"),
+    )
+
+
+def load_scenarios_from_db(max_candidates: int, limit: int) -> List[Dict]:
+    """
+    從 test_scenarios 建立 rerank 情境
+
+    Returns:
+        [{"question", "relevant_ids", "candidates": [{"id", "question_summary"}]}]
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, test_question, related_knowledge_ids
+            FROM test_scenarios
+            WHERE status = 'approved'
+              AND related_knowledge_ids IS NOT NULL
+              AND cardinality(related_knowledge_ids) > 0
+            ORDER BY id
+            LIMIT %s
+        """, (limit,))
+        scenarios = []
+        for scenario_id, question, related_ids in cur.fetchall():
+            gold = related_ids[0]
+            # 以正解的 embedding 找最相近的知識當干擾項（含正解本身）
+            cur.execute("""
+                SELECT kb.id, kb.question_summary
+                FROM knowledge_base kb,
+                     (SELECT embedding FROM knowledge_base WHERE id = %s) g
+                WHERE kb.embedding IS NOT NULL
+                  AND kb.question_summary IS NOT NULL
+                  AND g.embedding IS NOT NULL
+                ORDER BY kb.embedding <=> g.embedding
+                LIMIT %s
+            """, (gold, max_candidates))
+            candidates = [{"id": kid, "question_summary": qs} for kid, qs in cur.fetchall()]
+            if any(c["id"] in related_ids for c in candidates):
+                scenarios.append({
+                    "scenario_id": scenario_id,
+                    "question": question,
+                    "relevant_ids": list(related_ids),
+                    "candidates": candidates,
+                })
+        cur.close()
+        return scenarios
+    finally:
+        conn.close()
+
+
+def evaluate(backend, scenarios: List[Dict], cap: int, baseline: Dict = None) -> Dict:
+    """
+    以指定候選數上限跑一輪
+
+    Returns:
+        指標 dict；另含 "_scores"（每題分數，供與 baseline 比較）
+    """
+    latencies, reciprocal_ranks, top1_hits = [], [], 0
+    all_scores = {}
+    for scenario in scenarios:
+        candidates = scenario["candidates"][:cap]
+        pairs = [(scenario["question"], c["question_summary"]) for c in candidates]
+        t0 = time.perf_counter()
+        scores = backend.predict(pairs, batch_size=len(pairs))
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        ranked = [candidates[i]["id"] for i in sorted(range(len(scores)), key=lambda i: -scores[i])]
+        relevant = set(scenario["relevant_ids"])
+        rank = next((r for r, kid in enumerate(ranked, 1) if kid in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        top1_hits += 1 if rank == 1 else 0
+        all_scores[scenario["question"]] = [float(s) for s in scores]
+
+    n = max(1, len(scenarios))
+    result = {
+        "cap": cap,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "top1": round(top1_hits / n, 4),
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "_scores": all_scores,
+    }
+    if baseline:
+        agree, max_diff = 0, 0.0
+        for question, scores in all_scores.items():
+            base = baseline.get(question)
+            if not base:
+                continue
+            agree += int(max(range(len(scores)), key=scores.__getitem__) == max(range(len(base)), key=base.__getitem__))
+            max_diff = max(max_diff, max(abs(a - b) for a, b in zip(scores, base)))
+        result["top1_agreement"] = round(agree / n, 4)
+        result["max_abs_diff"] = round(max_diff, 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reranker 後端準確度 vs 延遲比較")
+    parser.add_argument("--scenarios", help="情境 JSON 檔（未指定則從資料庫建立）")
+    parser.add_argument("--dump", help="將資料庫建立的情境存檔後結束")
+    parser.add_argument("--limit", type=int, default=300, help="最多載入幾題")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-int8"], choices=SUPPORTED_BACKENDS)
+    parser.add_argument("--caps", nargs="+", type=int, default=[20, 40, 60], help="候選數上限（RERANKER_INPUT_LIMIT）")
+    parser.add_argument("--threads", type=int, default=0, help="推論執行緒數（0 = 框架預設）")
+    parser.add_argument("--warmup", type=int, default=3, help="每個後端暖機題數")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "models.json"))
+    parser.add_argument("--output", help="結果 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    if args.scenarios:
+        with open(args.scenarios, "r", encoding="utf-8") as f:
+            scenarios = json.load(f)
+    else:
+        scenarios = load_scenarios_from_db(max(args.caps), args.limit)
+    print(f"📖 載入 {len(scenarios)} 題情境")
+
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8") as f:
+            json.dump(scenarios, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已存檔: {args.dump}")
+        return
+    if not scenarios:
+        print("❌ 沒有可用情境")
+        return
+
+    # torch 先跑，作為一致性比較基準
+    args.backends.sort(key=lambda b: b != "torch")
+    serving = load_serving_config(args.config)
+    model_path = os.getenv("MODEL_NAME", serving["model_path"])
+    results, baselines = [], {}
+    for backend_name in args.backends:
+        print(f"\n🔧 載入後端: {backend_name}")
+        backend = create_backend(
+            backend_name, model_path,
+            max_length=int(os.getenv("MAX_LENGTH", 512)),
+            num_threads=args.threads,
+            onnx_options=serving["onnx"],
+        )
+        for scenario in scenarios[:args.warmup]:
+            backend.predict([(scenario["question"], c["question_summary"]) for c in scenario["candidates"][:max(args.caps)]])
+
+        for cap in args.caps:
+            result = evaluate(backend, scenarios, cap, baselines.get(cap))
+            if backend_name == "torch":
+                baselines[cap] = result["_scores"]
+            result.pop("_scores")
+            result["backend"] = backend_name
+            results.append(result)
+
+    print("\n" + "=" * 96)
+    print(f"{'backend':<10} {'cap':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'top1':>7} {'MRR':>7} {'top1≈torch':>11} {'max|Δ|':>8}")
+    print("-" * 96)
+    for r in results:
+        print(f"{r['backend']:<10} {r['cap']:>4} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['top1']:>7} {r['mrr']:>7} {r.get('top1_agreement', '-'):>11} {r.get('max_abs_diff', '-'):>8}")
+    print("=" * 96)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"threads": args.threads, "scenarios": len(scenarios), "results": results}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"✅ 結果已輸出: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
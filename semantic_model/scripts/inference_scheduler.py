@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+推論排程器 - 跨請求動態批次
+
+/rerank 原本在 async endpoint 內直接呼叫 CrossEncoder.predict，會卡住 event loop，
+並發請求只能一個接一個排隊（CPU 大批次 25-30s，見 rag-orchestrator semantic_reranker 註解）。
+
+改為：
+- 各請求把 (query, text) pairs 丟進佇列，拿回 asyncio future
+- 專用 worker 執行緒收集一小段時間窗內所有請求的 pairs，依長度排序後切成批次，
+  每批「pair 數 × 批內最長 token 數」不超過 token 預算（padding 浪費最少）
+- 推論完成後把分數依原順序送回各請求的 future
+- 佇列預估等待時間超過延遲 SLO 時直接拒絕（呼叫端回 503），避免排隊到 client timeout
+
+token 數以字元數估算（bge-reranker 的 XLM-R tokenizer 對中文約 1 字 1 token），
+上限為模型 max_length。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 批次大小直方圖分桶（pair 數上界）
+BATCH_SIZE_BUCKETS = (1, 4, 8, 16, 32, 64, 128)
+
+
+class SchedulerOverloaded(Exception):
+    """佇列預估等待時間超過 SLO，拒絕新請求"""
+
+    def __init__(self, estimated_wait_ms: float):
+        super().__init__(f"estimated queue wait {estimated_wait_ms:.0f}ms exceeds SLO")
+        self.estimated_wait_ms = estimated_wait_ms
+
+
+@dataclass
+class _Job:
+    pairs: List[Tuple[str, str]]
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class InferenceScheduler:
+    """跨請求動態批次推論排程器"""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[Tuple[str, str]]], Sequence[float]],
+        max_length: int = 512,
+        max_batch_pairs: int = 32,
+        max_batch_tokens: int = 8192,
+        max_wait_ms: float = 5.0,
+        max_queue_pairs: int = 2048,
+        latency_slo_ms: float = 20000.0,
+        num_workers: int = 1,
+    ):
+        """
+        Args:
+            predict_fn: 批次推論函式（pairs → 分數序列），於 worker 執行緒呼叫
+            max_length: 單一 pair 的 token 上限（模型 max_length）
+            max_batch_pairs: 單次推論的 pair 數上限
+            max_batch_tokens: 單次推論的 padded token 預算（pair 數 × 批內最長長度）
+            max_wait_ms: 收集批次的等待時間窗
+            max_queue_pairs: 佇列 pair 數硬上限
+            latency_slo_ms: 預估排隊時間超過此值即拒絕
+            num_workers: worker 執行緒數
+        """
+        self.predict_fn = predict_fn
+        self.max_length = max_length
+        self.max_batch_pairs = max(1, max_batch_pairs)
+        self.max_batch_tokens = max(max_length, max_batch_tokens)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_pairs = max_queue_pairs
+        self.latency_slo_ms = latency_slo_ms
+        self.num_workers = max(1, num_workers)
+
+        self._queue: deque = deque()
+        self._queued_pairs = 0
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._running = False
+
+        # 指標
+        self._pairs_per_sec = 0.0  # 推論吞吐 EWMA（用於預估排隊時間）
+        self._stats = {
+            "requests": 0,
+            "rejected": 0,
+            "pairs": 0,
+            "batches": 0,
+            "inference_ms_total": 0.0,
+            "queue_wait_ms_total": 0.0,
+            "completed": 0,
+            "batch_size_histogram": {**{str(b): 0 for b in BATCH_SIZE_BUCKETS}, "inf": 0},
+        }
+        self._stats_lock = threading.Lock()
+
+    # ==================== 生命週期 ====================
+
+    def start(self):
+        """啟動 worker 執行緒"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"rerank-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        logger.info(
+            f"✅ 推論排程器已啟動 (workers={self.num_workers}, max_batch_pairs={self.max_batch_pairs}, "
+            f"max_batch_tokens={self.max_batch_tokens}, wait={self.max_wait * 1000:.0f}ms)"
+        )
+
+    def stop(self, timeout: float = 5.0):
+        """停止 worker；佇列中尚未處理的請求以例外結束"""
+        with self._cond:
+            self._running = False
+            pending = list(self._queue)
+            self._queue.clear()
+            self._queued_pairs = 0
+            self._cond.notify_all()
+        for job in pending:
+            self._resolve(job, exc=RuntimeError("scheduler stopped"))
+        for t in self._workers:
+            t.join(timeout=timeout)
+        self._workers = []
+
+    # ==================== 提交 ====================
+
+    def estimated_wait_ms(self) -> float:
+        """依佇列 pair 數與吞吐 EWMA 預估新請求的排隊時間"""
+        if self._pairs_per_sec <= 0:
+            return 0.0
+        return self._queued_pairs / self._pairs_per_sec * 1000
+
+    async def submit(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """
+        提交一組 pairs，等待分數（順序與輸入相同）
+
+        Raises:
+            SchedulerOverloaded: 佇列已超過 SLO / 上限
+        """
+        if not pairs:
+            return []
+        loop = asyncio.get_running_loop()
+        job = _Job(pairs=list(pairs), future=loop.create_future(), loop=loop)
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("scheduler not running")
+            wait_ms = self.estimated_wait_ms()
+            if wait_ms > self.latency_slo_ms or self._queued_pairs + len(pairs) > self.max_queue_pairs:
+                with self._stats_lock:
+                    self._stats["rejected"] += 1
+                raise SchedulerOverloaded(wait_ms)
+            self._queue.append(job)
+            self._queued_pairs += len(job.pairs)
+            with self._stats_lock:
+                self._stats["requests"] += 1
+            self._cond.notify()
+        return await job.future
+
+    # ==================== worker ====================
+
+    def _take_jobs(self) -> List[_Job]:
+        """等第一個請求到來，再於時間窗內盡量收集，直到 pair 數達上限"""
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if not self._running:
+                return []
+            deadline = time.perf_counter() + self.max_wait
+            while self._running and self._queued_pairs < self.max_batch_pairs:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            jobs, taken = [], 0
+            # 至少取一個請求；之後只取放得進同一批的（單一請求超過上限時由 _plan_batches 切批）
+            while self._queue and (not jobs or taken + len(self._queue[0].pairs) <= self.max_batch_pairs):
+                job = self._queue.popleft()
+                jobs.append(job)
+                taken += len(job.pairs)
+            self._queued_pairs -= taken
+            return jobs
+
+    def _estimate_tokens(self, pair: Tuple[str, str]) -> int:
+        # [CLS] query [SEP][SEP] text [SEP]
+        return min(self.max_length, len(pair[0]) + len(pair[1]) + 4)
+
+    def _plan_batches(self, jobs: List[_Job]) -> List[List[Tuple[int, int]]]:
+        """
+        將所有 pairs 依長度排序後切批
+
+        Returns:
+            批次列表，每批為 (job 索引, pair 索引) 列表
+        """
+        items = [
+            (self._estimate_tokens(pair), j, p)
+            for j, job in enumerate(jobs)
+            for p, pair in enumerate(job.pairs)
+        ]
+        items.sort()
+        # 已依長度遞增排序，目前這筆就是批內最長者
+        batches, current = [], []
+        for tokens, j, p in items:
+            if current and (
+                len(current) >= self.max_batch_pairs
+                or (len(current) + 1) * tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+            current.append((j, p))
+        if current:
+            batches.append(current)
+        return batches
+
+    def _worker_loop(self):
+        while True:
+            jobs = self._take_jobs()
+            if not jobs:
+                if not self._running:
+                    return
+                continue
+            now = time.perf_counter()
+            scores: List[List[float]] = [[0.0] * len(job.pairs) for job in jobs]
+            try:
+                for batch in self._plan_batches(jobs):
+                    t0 = time.perf_counter()
+                    batch_scores = self.predict_fn([jobs[j].pairs[p] for j, p in batch])
+                    elapsed = time.perf_counter() - t0
+                    for (j, p), score in zip(batch, batch_scores):
+                        scores[j][p] = float(score)
+                    self._record_batch(len(batch), elapsed)
+            except Exception as e:
+                logger.error(f"批次推論失敗: {e}")
+                for job in jobs:
+                    self._resolve(job, exc=e)
+                continue
+            with self._stats_lock:
+                self._stats["completed"] += len(jobs)
+                self._stats["queue_wait_ms_total"] += sum((now - job.enqueued_at) * 1000 for job in jobs)
+            for job, job_scores in zip(jobs, scores):
+                self._resolve(job, result=job_scores)
+
+    def _record_batch(self, size: int, elapsed: float):
+        bucket = next((str(b) for b in BATCH_SIZE_BUCKETS if size <= b), "inf")
+        with self._stats_lock:
+            stats = self._stats
+            stats["batches"] += 1
+            stats["pairs"] += size
+            stats["inference_ms_total"] += elapsed * 1000
+            stats["batch_size_histogram"][bucket] += 1
+            if elapsed > 0:
+                # 多 worker 並行時以單 worker 吞吐 × worker 數估算
+                rate = size / elapsed * self.num_workers
+                self._pairs_per_sec = rate if self._pairs_per_sec == 0 else 0.8 * self._pairs_per_sec + 0.2 * rate
+
+    @staticmethod
+    def _resolve(job: _Job, result=None, exc: Exception = None):
+        def _set():
+            if job.future.done():
+                return  # 請求端已取消（client 斷線）
+            if exc is not None:
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(result)
+
+        try:
+            job.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            pass  # event loop 已關閉
+
+    # ==================== 指標 ====================
+
+    def get_metrics(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats, batch_size_histogram=dict(self._stats["batch_size_histogram"]))
+        batches = stats["batches"] or 1
+        return {
+            "queue_depth": len(self._queue),
+            "queued_pairs": self._queued_pairs,
+            "estimated_wait_ms": round(self.estimated_wait_ms(), 1),
+            "latency_slo_ms": self.latency_slo_ms,
+            "requests": stats["requests"],
+            "rejected": stats["rejected"],
+            "batches": stats["batches"],
+            "pairs": stats["pairs"],
+            "avg_batch_size": round(stats["pairs"] / batches, 2),
+            "avg_inference_ms": round(stats["inference_ms_total"] / batches, 2),
+            "avg_queue_wait_ms": round(stats["queue_wait_ms_total"] / max(1, stats["completed"]), 2),
+            "throughput_pairs_per_sec": round(self._pairs_per_sec, 1),
+            "batch_size_histogram": stats["batch_size_histogram"],
+            "config": {
+                "workers": self.num_workers,
+                "max_batch_pairs": self.max_batch_pairs,
+                "max_batch_tokens": self.max_batch_tokens,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_queue_pairs": self.max_queue_pairs,
+            },
+        }
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Reranker pair 分數快取
+
+/rerank 只對 question_summary 評分，而熱門問題整天命中同一批候選，
+每次都把 ~20 個 pair 重跑 cross-encoder。這裡快取 (query, text) 的分數，
+只把未命中的 pair 送進模型。
+
+- key：模型名稱 + 候選文字 hash + 正規化 query hash
+  （文字內容定址：知識編輯改了 question_summary 就自然換 key，不會讀到舊分數）
+- 第一層：行程內 LRU + TTL
+- 第二層（可選）：Redis，多個 replica 共用；Redis 故障時只用本地層
+- 失效：依 knowledge_id 清除（/rerank 寫入時記錄 knowledge_id → 文字 hash），
+  由 rag-orchestrator 收到知識更新通知時轉呼叫 /cache/invalidate
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+KEY_PREFIX = "rerank:score"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """正規化 query：全形轉半形（NFKC）、轉小寫、合併空白、去頭尾空白與句末標點"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip("?？!！。.~ ")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+class PairScoreCache:
+    """兩層 (query, text) → score 快取"""
+
+    def __init__(
+        self,
+        model_name: str,
+        max_entries: int = 100000,
+        ttl_seconds: int = 86400,
+        redis_client=None,
+    ):
+        """
+        Args:
+            model_name: 模型名稱（寫入 key，換模型即不共用分數）
+            max_entries: 本地 LRU 上限
+            ttl_seconds: 有效期限（本地與 Redis 相同）
+            redis_client: 可選 Redis 連線（decode_responses=True）
+        """
+        self.model_tag = _digest(model_name)[:8]
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.redis = redis_client
+
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._by_knowledge: Dict[str, set] = {}  # knowledge_id → 文字 hash
+        self._lock = threading.Lock()
+        self._stats = {"hits_local": 0, "hits_redis": 0, "misses": 0, "invalidated": 0, "redis_errors": 0}
+
+    # ==================== key ====================
+
+    def make_key(self, query: str, text: str) -> str:
+        return self._key_for(_digest(normalize_query(query)), _digest(text))
+
+    def _key_for(self, query_hash: str, text_hash: str) -> str:
+        # 文字 hash 在前：依 knowledge 失效時可用前綴 SCAN
+        return f"{KEY_PREFIX}:{self.model_tag}:{text_hash}:{query_hash}"
+
+    # ==================== 讀寫 ====================
+
+    def get_many(self, pairs: Sequence[Tuple[str, str]]) -> List[Optional[float]]:
+        """
+        批次查詢分數
+
+        Returns:
+            與 pairs 對齊的分數列表，未命中為 None
+        """
+        keys = [self.make_key(q, t) for q, t in pairs]
+        results: List[Optional[float]] = [None] * len(keys)
+        now = time.time()
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._local.get(key)
+                if entry is not None and entry[1] > now:
+                    self._local.move_to_end(key)
+                    results[i] = entry[0]
+                    self._stats["hits_local"] += 1
+                else:
+                    if entry is not None:
+                        del self._local[key]
+                    missing.append(i)
+
+        if missing and self.redis is not None:
+            try:
+                values = self.redis.mget([keys[i] for i in missing])
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Redis 讀取 pair 分數失敗: {e}")
+                values = [None] * len(missing)
+            still_missing = []
+            for i, value in zip(missing, values):
+                if value is None:
+                    still_missing.append(i)
+                else:
+                    results[i] = float(value)
+                    self._stats["hits_redis"] += 1
+                    self._put_local(keys[i], results[i], now)
+            missing = still_missing
+
+        self._stats["misses"] += len(missing)
+        return results
+
+    def put_many(
+        self,
+        pairs: Sequence[Tuple[str, str]],
+        scores: Sequence[float],
+        knowledge_ids: Optional[Sequence] = None,
+    ):
+        """寫入分數；knowledge_ids 與 pairs 對齊，用於之後依知識失效"""
+        now = time.time()
+        entries = []
+        for idx, ((query, text), score) in enumerate(zip(pairs, scores)):
+            text_hash = _digest(text)
+            key = self._key_for(_digest(normalize_query(query)), text_hash)
+            entries.append((key, float(score)))
+            self._put_local(key, float(score), now)
+            kid = knowledge_ids[idx] if knowledge_ids else None
+            if kid is not None:
+                with self._lock:
+                    self._by_knowledge.setdefault(str(kid), set()).add(text_hash)
+                if self.redis is not None:
+                    entries.append((f"{KEY_PREFIX}:kid:{kid}", text_hash))
+
+        if self.redis is not None and entries:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in entries:
+                    if key.startswith(f"{KEY_PREFIX}:kid:"):
+                        pipe.sadd(key, value)
+                        pipe.expire(key, self.ttl)
+                    else:
+                        pipe.setex(key, self.ttl, repr(value))
+                pipe.execute()
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Redis 寫入 pair 分數失敗: {e}")
+
+    def _put_local(self, key: str, score: float, now: float):
+        with self._lock:
+            self._local[key] = (score, now + self.ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    # ==================== 失效 ====================
+
+    def invalidate_knowledge(self, knowledge_ids: Iterable) -> int:
+        """清除指定知識相關的所有 pair 分數，回傳清除筆數"""
+        removed = 0
+        for kid in knowledge_ids:
+            kid = str(kid)
+            with self._lock:
+                text_hashes = self._by_knowledge.pop(kid, set())
+            if self.redis is not None:
+                try:
+                    index_key = f"{KEY_PREFIX}:kid:{kid}"
+                    text_hashes |= set(self.redis.smembers(index_key) or ())
+                    self.redis.delete(index_key)
+                except Exception as e:
+                    self._stats["redis_errors"] += 1
+                    logger.warning(f"Redis 讀取知識索引失敗: {e}")
+            for text_hash in text_hashes:
+                removed += self._invalidate_text_hash(text_hash)
+        self._stats["invalidated"] += removed
+        return removed
+
+    def _invalidate_text_hash(self, text_hash: str) -> int:
+        prefix = f"{KEY_PREFIX}:{self.model_tag}:{text_hash}:"
+        with self._lock:
+            stale = [k for k in self._local if k.startswith(prefix)]
+            for k in stale:
+                del self._local[k]
+        removed = len(stale)
+        if self.redis is not None:
+            try:
+                redis_keys = list(self.redis.scan_iter(match=prefix + "*", count=500))
+                if redis_keys:
+                    self.redis.delete(*redis_keys)
+                    removed = max(removed, len(redis_keys))
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Redis 清除 pair 分數失敗: {e}")
+        return removed
+
+    def clear(self):
+        """清除全部（本地 + 本模型在 Redis 的 key）"""
+        with self._lock:
+            self._local.clear()
+            self._by_knowledge.clear()
+        if self.redis is not None:
+            try:
+                for key in self.redis.scan_iter(match=f"{KEY_PREFIX}:{self.model_tag}:*", count=1000):
+                    self.redis.delete(key)
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Redis 清除 pair 分數失敗: {e}")
+
+    # ==================== 指標 ====================
+
+    def get_stats(self) -> Dict:
+        stats = dict(self._stats)
+        lookups = stats["hits_local"] + stats["hits_redis"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits_local"] + stats["hits_redis"]) / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self._local)
+        stats["redis_enabled"] = self.redis is not None
+        stats["ttl_seconds"] = self.ttl
+        return stats
+
+
+def create_pair_score_cache(model_name: str, env) -> Optional[PairScoreCache]:
+    """
+    依環境變數建立快取（RERANK_CACHE_ENABLED=false 時回傳 None）
+
+    Args:
+        model_name: 模型名稱
+        env: 環境變數對應（通常為 os.environ）
+    """
+    if env.get("RERANK_CACHE_ENABLED", "true").lower() != "true":
+        return None
+
+    redis_client = None
+    if env.get("RERANK_CACHE_REDIS_ENABLED", "false").lower() == "true":
+        if redis is None:
+            logger.warning("⚠️ 未安裝 redis 套件，pair 分數快取僅使用本地 LRU")
+        else:
+            try:
+                redis_client = redis.Redis(
+                    host=env.get("REDIS_HOST", "redis"),
+                    port=int(env.get("REDIS_PORT", 6379)),
+                    db=int(env.get("RERANK_CACHE_REDIS_DB", 0)),
+                    decode_responses=True,
+                    socket_timeout=0.2,
+                    socket_connect_timeout=1,
+                )
+                redis_client.ping()
+                logger.info("✅ pair 分數快取已連接 Redis")
+            except Exception as e:
+                logger.warning(f"⚠️ Redis 不可用，pair 分數快取僅使用本地 LRU: {e}")
+                redis_client = None
+
+    return PairScoreCache(
+        model_name=model_name,
+        max_entries=int(env.get("RERANK_CACHE_MAX_ENTRIES", 100000)),
+        ttl_seconds=int(env.get("RERANK_CACHE_TTL", 86400)),
+        redis_client=redis_client,
+    )
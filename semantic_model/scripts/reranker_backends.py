@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Reranker 推論後端
+
+由 config/models.json 的 "serving" 區塊選擇（環境變數 RERANK_BACKEND 可覆寫）：
+- torch：sentence-transformers CrossEncoder（原本的做法）
+- onnx：匯出 ONNX Runtime 圖（fp32）
+- onnx-int8：ONNX 圖 + 動態 int8 量化（CPU 上最快，分數與 torch 有微小差異）
+
+共同行為：
+- 依長度排序後分批（padding 浪費最少），結果依原順序回傳
+- num_threads 控制推論執行緒數（0 = 框架預設）
+- 分數與 CrossEncoder 一致：單一 logit 經 sigmoid
+
+ONNX 檔首次啟動時匯出到 export_dir，之後直接載入。
+ONNX 後端無法載入（未安裝 onnxruntime 等）或後端名稱無效時退回 torch；
+serving 區塊格式錯誤的欄位以預設值取代。
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+DEFAULT_SERVING = {
+    "reranker": "bge_reranker",
+    "backend": "torch",
+    "num_threads": 0,
+    "batch_size": 32,
+    "sort_by_length": True,
+    "onnx": {
+        "export_dir": "models/onnx",
+        "opset": 14,
+    },
+}
+
+
+class RerankerBackend:
+    """後端基底類別：子類別實作 _predict_batch"""
+
+    name = "base"
+
+    def __init__(self, model_path: str, max_length: int = 512, batch_size: int = 32,
+                 sort_by_length: bool = True, num_threads: int = 0):
+        self.model_path = model_path
+        self.max_length = max_length
+        self.batch_size = max(1, batch_size)
+        self.sort_by_length = sort_by_length
+        self.num_threads = num_threads
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        計算 (query, text) pairs 的相關性分數
+
+        Args:
+            pairs: (query, text) 列表
+            batch_size: 每批 pair 數（None 用預設值）
+
+        Returns:
+            與 pairs 對齊的分數陣列
+        """
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        size = batch_size or self.batch_size
+        order = list(range(len(pairs)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        scores = np.empty(len(pairs), dtype=np.float32)
+        for start in range(0, len(order), size):
+            idx = order[start:start + size]
+            scores[idx] = self._predict_batch([pairs[i] for i in idx])
+        return scores
+
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_info(self) -> Dict:
+        return {
+            "backend": self.name,
+            "model_path": self.model_path,
+            "max_length": self.max_length,
+            "batch_size": self.batch_size,
+            "sort_by_length": self.sort_by_length,
+            "num_threads": self.num_threads,
+        }
+
+
+class TorchBackend(RerankerBackend):
+    """sentence-transformers CrossEncoder"""
+
+    name = "torch"
+
+    def __init__(self, model_path: str, **kwargs):
+        super().__init__(model_path, **kwargs)
+        import torch
+        from sentence_transformers import CrossEncoder
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        self.model = CrossEncoder(model_path, max_length=self.max_length)
+
+    def _predict_batch(self, pairs):
+        return np.asarray(
+            self.model.predict(list(pairs), batch_size=len(pairs), show_progress_bar=False),
+            dtype=np.float32,
+        )
+
+
+class OnnxBackend(RerankerBackend):
+    """ONNX Runtime（可選動態 int8 量化）"""
+
+    def __init__(self, model_path: str, quantize: bool = False, export_dir: str = "models/onnx",
+                 opset: int = 14, **kwargs):
+        super().__init__(model_path, **kwargs)
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        onnx_path = self._ensure_exported(model_path, export_dir, opset, quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.onnx_path = onnx_path
+
+    @staticmethod
+    def _ensure_exported(model_path: str, export_dir: str, opset: int, quantize: bool) -> str:
+        """匯出（與量化）ONNX 檔；已存在則直接使用"""
+        target_dir = os.path.join(export_dir, model_path.replace("/", "__"))
+        fp32_path = os.path.join(target_dir, "model.onnx")
+        int8_path = os.path.join(target_dir, "model.int8.onnx")
+
+        if not os.path.exists(fp32_path):
+            import torch
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+            logger.info(f"匯出 ONNX 模型: {model_path} → {fp32_path}")
+            os.makedirs(target_dir, exist_ok=True)
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+            model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+            dummy = tokenizer(["查詢"], ["候選文字"], return_tensors="pt")
+            # 依 forward 參數順序傳入（XLM-R 無 token_type_ids）
+            input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+            dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+            dynamic_axes["logits"] = {0: "batch"}
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    tuple(dummy[n] for n in input_names),
+                    fp32_path,
+                    input_names=input_names,
+                    output_names=["logits"],
+                    dynamic_axes=dynamic_axes,
+                    opset_version=opset,
+                )
+
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info(f"動態 int8 量化: {int8_path}")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _predict_batch(self, pairs):
+        encoded = self.tokenizer(
+            [q for q, _ in pairs],
+            [t for _, t in pairs],
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        if logits.shape[1] == 1:
+            # 與 CrossEncoder 預設一致：單一 label 經 sigmoid
+            return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+        return logits[:, 1]
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info["onnx_path"] = self.onnx_path
+        return info
+
+
+def load_serving_config(config_path: str) -> Dict:
+    """讀取 config/models.json 的 serving 區塊（缺漏欄位補預設值）"""
+    serving = json.loads(json.dumps(DEFAULT_SERVING))
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ 無法讀取 {config_path}，使用預設 serving 設定: {e}")
+        config = {}
+
+    if not isinstance(config, dict):
+        logger.warning(f"⚠️ {config_path} 格式錯誤（非 JSON 物件），使用預設 serving 設定")
+        config = {}
+    user_serving = config.get("serving", {})
+    if not isinstance(user_serving, dict):
+        logger.warning(f"⚠️ serving 區塊格式錯誤，使用預設值: {user_serving!r}")
+        user_serving = {}
+    user_onnx = user_serving.get("onnx", {})
+    onnx_opts = {**serving["onnx"], **(user_onnx if isinstance(user_onnx, dict) else {})}
+    serving.update(user_serving)
+    serving["onnx"] = onnx_opts
+    for key in ("num_threads", "batch_size"):
+        serving[key] = _as_int(serving[key], DEFAULT_SERVING[key], key)
+
+    models = config.get("models", {})
+    model_entry = models.get(serving["reranker"], {}) if isinstance(models, dict) else {}
+    serving["model_path"] = (model_entry if isinstance(model_entry, dict) else {}).get("path", "BAAI/bge-reranker-base")
+    return serving
+
+
+def _as_int(value, default: int, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        logger.warning(f"⚠️ serving.{name} 不是整數（{value!r}），使用預設值 {default}")
+        return default
+
+
+def create_backend(
+    backend: str,
+    model_path: str,
+    max_length: int = 512,
+    batch_size: int = 32,
+    sort_by_length: bool = True,
+    num_threads: int = 0,
+    onnx_options: Optional[Dict] = None,
+) -> RerankerBackend:
+    """
+    建立指定後端
+
+    Raises:
+        ValueError: 不支援的後端名稱
+    """
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unsupported reranker backend: {backend} (supported: {', '.join(SUPPORTED_BACKENDS)})")
+    common = dict(max_length=max_length, batch_size=batch_size,
+                  sort_by_length=sort_by_length, num_threads=num_threads)
+    if backend == "torch":
+        return TorchBackend(model_path, **common)
+    onnx_options = onnx_options or DEFAULT_SERVING["onnx"]
+    return OnnxBackend(
+        model_path,
+        quantize=(backend == "onnx-int8"),
+        export_dir=onnx_options.get("export_dir", "models/onnx"),
+        opset=int(onnx_options.get("opset", 14)),
+        **common,
+    )
+
+
+def load_reranker_backend(config_path: str, env=None) -> RerankerBackend:
+    """
+    依 config/models.json + 環境變數建立 reranker 後端
+
+    環境變數覆寫：MODEL_NAME（模型路徑）、RERANK_BACKEND、RERANK_NUM_THREADS、MAX_LENGTH
+    """
+    env = env if env is not None else os.environ
+    serving = load_serving_config(config_path)
+    backend = env.get("RERANK_BACKEND", serving["backend"])
+    model_path = env.get("MODEL_NAME", serving["model_path"])
+    options = dict(
+        max_length=int(env.get("MAX_LENGTH", 512)),
+        batch_size=serving["batch_size"],
+        sort_by_length=bool(serving.get("sort_by_length", True)),
+        num_threads=_as_int(env.get("RERANK_NUM_THREADS", serving["num_threads"]), 0, "num_threads"),
+        onnx_options=serving["onnx"],
+    )
+    if backend == "torch":
+        return create_backend(backend, model_path, **options)
+    try:
+        return create_backend(backend, model_path, **options)
+    except (ImportError, ValueError) as e:
+        # 未安裝 onnxruntime / transformers 或後端名稱錯誤：退回 torch，服務照常啟動
+        logger.warning(f"⚠️ reranker 後端 {backend!r} 無法使用，退回 torch: {e}")
+        return create_backend("torch", model_path, **options)
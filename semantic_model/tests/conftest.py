@@ -0,0 +1,13 @@
+"""semantic_model 測試前置（對齊 rag-orchestrator / knowledge-admin 慣例）。
+
+- 匯入路徑：把 scripts/ 加進 sys.path，測試可 `from inference_scheduler import ...`
+  （服務本身以 scripts/ 為工作目錄啟動，模組間為 bare import）。
+- 不載入真實模型：推論以 fake predict_fn、後端以 stub 取代。
+"""
+import os
+import sys
+
+# semantic_model/scripts（本檔位於 semantic_model/tests/）
+_SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+if _SCRIPTS not in sys.path:
+    sys.path.insert(0, _SCRIPTS)
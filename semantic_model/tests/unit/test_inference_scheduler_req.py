@@ -0,0 +1,172 @@
+"""unit：/rerank 跨請求動態批次排程器（scripts/inference_scheduler.py）。
+
+- 批次依長度排序切批，每批「pair 數 × 批內最長 token 數」不超過 token 預算
+- worker 執行緒合批推論後，分數依原順序送回各請求（並發請求不互相錯置）
+- 佇列預估等待超過 SLO：submit 拋 SchedulerOverloaded，/rerank 回 503 + Retry-After
+- /metrics 帶出排程器指標
+- stop()：已在推論中的請求照常完成，佇列中尚未處理的請求以例外結束
+
+不載入模型：predict_fn 為 fake（分數 = 文字長度，可由結果反推對應 pair）。
+"""
+import asyncio
+import threading
+
+import pytest
+
+from inference_scheduler import InferenceScheduler, SchedulerOverloaded, _Job
+
+pytestmark = pytest.mark.unit
+
+
+def _score(pair):
+    return float(len(pair[1]))
+
+
+@pytest.fixture
+def make_scheduler():
+    created = []
+
+    def _make(predict_fn=None, **kwargs):
+        s = InferenceScheduler(predict_fn or (lambda pairs: [_score(p) for p in pairs]), **kwargs)
+        s.start()
+        created.append(s)
+        return s
+
+    yield _make
+    for s in created:
+        s.stop(timeout=1)
+
+
+def test_plan_batches_respects_token_budget_and_sorts_by_length():
+    s = InferenceScheduler(lambda pairs: [], max_length=100, max_batch_pairs=8, max_batch_tokens=200)
+    loop = asyncio.new_event_loop()
+    try:
+        lengths = [90, 5, 40, 10, 60, 20, 96, 30]
+        jobs = [_Job(pairs=[("q", "x" * n) for n in lengths[:4]], future=loop.create_future(), loop=loop),
+                _Job(pairs=[("q", "x" * n) for n in lengths[4:]], future=loop.create_future(), loop=loop)]
+        batches = s._plan_batches(jobs)
+    finally:
+        loop.close()
+
+    planned = sorted((j, p) for batch in batches for j, p in batch)
+    assert planned == [(j, p) for j in range(2) for p in range(4)]     # 每個 pair 恰好一次
+    previous_max = 0
+    for batch in batches:
+        tokens = [s._estimate_tokens(jobs[j].pairs[p]) for j, p in batch]
+        assert tokens == sorted(tokens) and tokens[0] >= previous_max  # 依長度遞增
+        assert len(batch) * max(tokens) <= s.max_batch_tokens         # padded token 預算
+        assert len(batch) <= s.max_batch_pairs
+        previous_max = max(tokens)
+
+
+async def test_concurrent_requests_coalesce_and_map_back_in_order(make_scheduler):
+    seen_batches = []
+
+    def _predict(pairs):
+        seen_batches.append(list(pairs))
+        return [_score(p) for p in pairs]
+
+    s = make_scheduler(_predict, max_length=64, max_batch_pairs=16, max_batch_tokens=160, max_wait_ms=30)
+    requests = [[("q", "x" * n) for n in lengths] for lengths in ([30, 2, 17], [9, 25], [1, 12, 40, 5])]
+
+    results = await asyncio.gather(*(s.submit(pairs) for pairs in requests))
+
+    assert results == [[_score(p) for p in pairs] for pairs in requests]   # 各自原順序
+    assert len(seen_batches) < len(requests) * 2                           # 跨請求合批
+    for batch in seen_batches:
+        assert len(batch) * max(s._estimate_tokens(p) for p in batch) <= s.max_batch_tokens
+    metrics = s.get_metrics()
+    assert metrics["requests"] == 3 and metrics["pairs"] == 9 and metrics["rejected"] == 0
+    assert sum(metrics["batch_size_histogram"].values()) == metrics["batches"] == len(seen_batches)
+
+
+async def test_predict_failure_rejects_the_batch_callers(make_scheduler):
+    def _predict(pairs):
+        raise ValueError("model crashed")
+
+    s = make_scheduler(_predict)
+    with pytest.raises(ValueError, match="model crashed"):
+        await s.submit([("q", "a")])
+
+
+async def test_overloaded_queue_rejects_with_estimated_wait(make_scheduler):
+    s = make_scheduler(latency_slo_ms=100)
+    s._pairs_per_sec = 10.0          # 吞吐 EWMA：每秒 10 pairs
+    s._queued_pairs = 5              # 已排隊 5 pairs → 預估 500ms > SLO
+
+    with pytest.raises(SchedulerOverloaded) as exc_info:
+        await s.submit([("q", "a")])
+
+    assert exc_info.value.estimated_wait_ms == pytest.approx(500)
+    assert s.get_metrics()["rejected"] == 1
+
+    s._queued_pairs = 0
+    s.max_queue_pairs = 2            # pair 數硬上限
+    with pytest.raises(SchedulerOverloaded):
+        await s.submit([("q", "a")] * 3)
+
+
+async def test_stop_completes_in_flight_and_rejects_queued(make_scheduler):
+    started, release = threading.Event(), threading.Event()
+
+    def _predict(pairs):
+        started.set()
+        release.wait(2)
+        return [_score(p) for p in pairs]
+
+    s = make_scheduler(_predict, max_batch_pairs=1, max_wait_ms=0)
+    in_flight = asyncio.ensure_future(s.submit([("q", "abc")]))
+    assert await asyncio.to_thread(started.wait, 2)
+    queued = asyncio.ensure_future(s.submit([("q", "de")]))
+    await asyncio.sleep(0)
+
+    stopping = asyncio.ensure_future(asyncio.to_thread(s.stop, 2))
+    while s._running or s._queue:
+        await asyncio.sleep(0.005)
+    release.set()
+    await stopping
+
+    assert await in_flight == [3.0]
+    with pytest.raises(RuntimeError, match="scheduler stopped"):
+        await queued
+    with pytest.raises(RuntimeError, match="not running"):
+        await s.submit([("q", "x")])
+
+
+class _Model:
+    def get_info(self):
+        return {"backend": "torch", "model_path": "stub", "max_length": 512}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    import api_server
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api_server, "model", _Model())
+    monkeypatch.setattr(api_server, "pair_cache", None)
+    return api_server, TestClient(api_server.app)
+
+
+def test_rerank_returns_503_with_retry_after_when_overloaded(api, monkeypatch):
+    api_server, client = api
+    s = InferenceScheduler(lambda pairs: [_score(p) for p in pairs], latency_slo_ms=1000)
+    s.start()
+    try:
+        monkeypatch.setattr(api_server, "scheduler", s)
+        candidates = [{"id": 1, "question_summary": "繳費"}, {"id": 2, "question_summary": "租金怎麼繳"}]
+
+        ok = client.post("/rerank", json={"query": "q", "candidates": candidates})
+        assert ok.status_code == 200
+        assert [r["id"] for r in ok.json()["results"]] == [2, 1]
+
+        s._pairs_per_sec, s._queued_pairs = 1.0, 3          # 預估 3000ms > SLO
+        busy = client.post("/rerank", json={"query": "q", "candidates": candidates})
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"] == "3"
+
+        metrics = client.get("/metrics").json()["rerank_scheduler"]
+        assert metrics["rejected"] == 1 and metrics["requests"] == 1
+        assert metrics["queued_pairs"] == 3 and metrics["estimated_wait_ms"] == pytest.approx(3000)
+    finally:
+        s.stop(timeout=1)
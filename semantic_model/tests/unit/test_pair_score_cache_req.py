@@ -0,0 +1,187 @@
+"""unit：Reranker pair 分數快取（scripts/pair_score_cache.py）。
+
+- key 內容定址：query 正規化後相同即同 key；候選文字變更即換 key（不讀到舊分數）
+- get_many / put_many 與 pairs 對齊；本地 LRU 上限與 TTL 到期
+- invalidate_knowledge 依 knowledge_id → 文字 hash 只清該知識的 pair，其他知識不受影響
+- 無 Redis 與 fake Redis 兩種模式：Redis 層跨 replica 共用、TTL 一致、故障時降級為本地層
+- /cache/invalidate 端點轉呼叫 invalidate_knowledge / clear
+
+不需真實 Redis：以 dict 實作的 fake（mget / pipeline / smembers / scan_iter / delete）。
+"""
+import fnmatch
+
+import pytest
+
+import pair_score_cache as psc
+from pair_score_cache import PairScoreCache, create_pair_score_cache, normalize_query
+
+pytestmark = pytest.mark.unit
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+        self.ttls = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis down")
+
+    def mget(self, keys):
+        self._check()
+        return [self.values.get(k) for k in keys]
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    def smembers(self, key):
+        self._check()
+        return set(self.sets.get(key, set()))
+
+    def delete(self, *keys):
+        self._check()
+        removed = 0
+        for key in keys:
+            removed += (self.values.pop(key, None) is not None) + (self.sets.pop(key, None) is not None)
+            self.ttls.pop(key, None)
+        return removed
+
+    def scan_iter(self, match="*", count=None):
+        self._check()
+        return [k for k in list(self.values) + list(self.sets) if fnmatch.fnmatchcase(k, match)]
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def sadd(self, key, value):
+        self.ops.append(lambda: self.redis.sets.setdefault(key, set()).add(value))
+
+    def expire(self, key, seconds):
+        self.ops.append(lambda: self.redis.ttls.__setitem__(key, seconds))
+
+    def setex(self, key, seconds, value):
+        def _op():
+            self.redis.values[key] = value
+            self.redis.ttls[key] = seconds
+        self.ops.append(_op)
+
+    def execute(self):
+        self.redis._check()
+        for op in self.ops:
+            op()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(psc.time, "time", lambda: now[0])
+    return now
+
+
+def test_keys_are_content_addressed():
+    cache = PairScoreCache("bge-reranker")
+    assert normalize_query("  租金 怎麼繳？ ") == normalize_query("租金　怎麼繳") == "租金 怎麼繳"
+    assert cache.make_key("租金怎麼繳?", "繳費方式") == cache.make_key("租金怎麼繳", "繳費方式")
+    assert cache.make_key("租金怎麼繳", "繳費方式") != cache.make_key("租金怎麼繳", "繳費方式（新）")
+    # 換模型不共用分數
+    assert PairScoreCache("other-model").make_key("租金怎麼繳", "繳費方式") != cache.make_key("租金怎麼繳", "繳費方式")
+
+
+def test_get_many_put_many_align_with_pairs():
+    cache = PairScoreCache("m")
+    pairs = [("q", "a"), ("q", "b"), ("q", "c")]
+    assert cache.get_many(pairs) == [None, None, None]
+
+    cache.put_many([pairs[0], pairs[2]], [0.9, 0.1], knowledge_ids=[1, 3])
+
+    assert cache.get_many(pairs) == [0.9, None, 0.1]
+    stats = cache.get_stats()
+    assert stats["hits_local"] == 2 and stats["misses"] == 4 and stats["redis_enabled"] is False
+
+
+def test_local_lru_bound_and_ttl_expiry(clock):
+    cache = PairScoreCache("m", max_entries=2, ttl_seconds=60)
+    cache.put_many([("q", "a"), ("q", "b")], [1.0, 2.0])
+    assert cache.get_many([("q", "a")]) == [1.0]            # a 最近使用 → b 成為最舊
+
+    cache.put_many([("q", "c")], [3.0])
+    assert cache.get_stats()["local_entries"] == 2
+    assert cache.get_many([("q", "a"), ("q", "b"), ("q", "c")]) == [1.0, None, 3.0]
+
+    clock[0] += 61
+    assert cache.get_many([("q", "a"), ("q", "c")]) == [None, None]
+    assert cache.get_stats()["local_entries"] == 0         # 過期條目讀到即移除
+
+
+def test_text_change_invalidates_only_that_knowledge():
+    cache = PairScoreCache("m")
+    cache.put_many([("q1", "舊標題"), ("q2", "舊標題"), ("q1", "其他知識")], [0.8, 0.7, 0.5],
+                   knowledge_ids=[1, 1, 2])
+
+    # 知識 1 改了 question_summary：新文字本來就換 key，不會讀到舊分數
+    assert cache.get_many([("q1", "新標題")]) == [None]
+
+    assert cache.invalidate_knowledge([1]) == 2
+    assert cache.get_many([("q1", "舊標題"), ("q2", "舊標題")]) == [None, None]
+    assert cache.get_many([("q1", "其他知識")]) == [0.5]     # 知識 2 不受影響
+    assert cache.invalidate_knowledge([1, 99]) == 0
+    assert cache.get_stats()["invalidated"] == 2
+
+
+def test_redis_layer_shared_across_replicas_with_ttl(clock):
+    redis = _FakeRedis()
+    writer = PairScoreCache("m", ttl_seconds=120, redis_client=redis)
+    reader = PairScoreCache("m", ttl_seconds=120, redis_client=redis)
+
+    writer.put_many([("q", "a"), ("q", "b")], [0.9, 0.4], knowledge_ids=[1, 2])
+    assert set(redis.ttls.values()) == {120}               # 分數與 kid 索引同 TTL
+
+    assert reader.get_many([("q", "a"), ("q", "b")]) == [0.9, 0.4]
+    assert reader.get_stats()["hits_redis"] == 2
+    assert reader.get_many([("q", "a")]) == [0.9]          # 回填本地層
+    assert reader.get_stats()["hits_local"] == 1
+
+    # 另一個 replica 依 Redis 的 kid 索引清除（本地沒有 knowledge_id 記錄也能清）
+    fresh = PairScoreCache("m", ttl_seconds=120, redis_client=redis)
+    assert fresh.invalidate_knowledge([1]) == 1
+    assert PairScoreCache("m", redis_client=redis).get_many([("q", "a"), ("q", "b")]) == [None, 0.4]
+    assert f"{psc.KEY_PREFIX}:kid:1" not in redis.sets
+
+
+def test_redis_failure_falls_back_to_local_layer():
+    redis = _FakeRedis()
+    cache = PairScoreCache("m", redis_client=redis)
+    redis.fail = True
+
+    cache.put_many([("q", "a")], [0.3], knowledge_ids=[1])
+    assert cache.get_many([("q", "a"), ("q", "b")]) == [0.3, None]
+    assert cache.invalidate_knowledge([1]) == 1
+    assert cache.get_stats()["redis_errors"] >= 3
+
+
+def test_create_pair_score_cache_from_env():
+    assert create_pair_score_cache("m", {"RERANK_CACHE_ENABLED": "false"}) is None
+    cache = create_pair_score_cache("m", {"RERANK_CACHE_MAX_ENTRIES": "10", "RERANK_CACHE_TTL": "30"})
+    assert cache.redis is None and cache.max_entries == 10 and cache.ttl == 30
+
+
+def test_cache_invalidate_endpoint(monkeypatch):
+    import api_server
+    from fastapi.testclient import TestClient
+
+    cache = PairScoreCache("m")
+    cache.put_many([("q", "a"), ("q", "b")], [0.9, 0.4], knowledge_ids=[1, 2])
+    monkeypatch.setattr(api_server, "pair_cache", cache)
+    client = TestClient(api_server.app)
+
+    body = client.post("/cache/invalidate", json={"knowledge_ids": [1]}).json()
+    assert body["success"] and body["invalidated_count"] == 1
+    assert cache.get_many([("q", "a"), ("q", "b")]) == [None, 0.4]
+
+    assert client.post("/cache/invalidate", json={"clear_all": True}).json()["invalidated_count"] is None
+    assert cache.get_stats()["local_entries"] == 0
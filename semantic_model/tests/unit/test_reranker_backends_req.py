@@ -0,0 +1,157 @@
+"""unit：Reranker 推論後端選擇與批次（scripts/reranker_backends.py）。
+
+- load_serving_config：讀 models.json 的 serving 區塊、補預設值；格式錯誤的欄位退回預設
+- create_backend / load_reranker_backend：依 serving.backend（或 RERANK_BACKEND）選 torch / onnx / onnx-int8
+- ONNX 無法載入（未安裝 onnxruntime）或後端名稱無效時退回 torch
+- predict 依長度排序分批，分數依原輸入順序回傳
+
+不載入真實模型：TorchBackend / OnnxBackend 以 stub 取代，predict 以 stub _predict_batch 測試。
+"""
+import json
+
+import numpy as np
+import pytest
+
+import reranker_backends as rb
+from reranker_backends import RerankerBackend, create_backend, load_reranker_backend, load_serving_config
+
+pytestmark = pytest.mark.unit
+
+
+class _LengthBackend(RerankerBackend):
+    """分數 = 候選文字長度；記錄每批收到的 pairs"""
+
+    name = "stub"
+
+    def __init__(self, **kwargs):
+        super().__init__("stub-model", **kwargs)
+        self.batches = []
+
+    def _predict_batch(self, pairs):
+        self.batches.append(list(pairs))
+        return np.array([float(len(t)) for _, t in pairs], dtype=np.float32)
+
+
+@pytest.fixture
+def stub_backends(monkeypatch):
+    created = []
+
+    class _Torch:
+        name = "torch"
+
+        def __init__(self, model_path, **kwargs):
+            created.append(("torch", model_path, kwargs))
+
+    class _Onnx:
+        def __init__(self, model_path, quantize=False, export_dir=None, opset=None, **kwargs):
+            self.name = "onnx-int8" if quantize else "onnx"
+            created.append((self.name, model_path, dict(kwargs, export_dir=export_dir, opset=opset)))
+
+    monkeypatch.setattr(rb, "TorchBackend", _Torch)
+    monkeypatch.setattr(rb, "OnnxBackend", _Onnx)
+    return created
+
+
+def _write_config(tmp_path, serving, models=None):
+    path = tmp_path / "models.json"
+    config = {"models": models if models is not None else {"bge_reranker": {"path": "BAAI/bge-reranker-base"},
+                                                            "large": {"path": "BAAI/bge-reranker-large"}}}
+    if serving is not None:
+        config["serving"] = serving
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return str(path)
+
+
+def test_predict_returns_scores_in_input_order():
+    backend = _LengthBackend(batch_size=2)
+    pairs = [("q", "x" * n) for n in (5, 1, 4, 2, 3)]
+
+    scores = backend.predict(pairs)
+
+    assert scores.tolist() == [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert [[len(t) for _, t in b] for b in backend.batches] == [[1, 2], [3, 4], [5]]   # 依長度分批
+    assert backend.predict([]).shape == (0,)
+
+
+def test_predict_without_sorting_keeps_input_batches():
+    backend = _LengthBackend(batch_size=3, sort_by_length=False)
+    scores = backend.predict([("q", "x" * n) for n in (5, 1, 4, 2)], batch_size=2)
+    assert scores.tolist() == [5.0, 1.0, 4.0, 2.0]
+    assert [[len(t) for _, t in b] for b in backend.batches] == [[5, 1], [4, 2]]
+
+
+def test_load_serving_config_merges_defaults(tmp_path):
+    path = _write_config(tmp_path, {"reranker": "large", "backend": "onnx-int8", "onnx": {"opset": 17}})
+    serving = load_serving_config(path)
+    assert serving["backend"] == "onnx-int8"
+    assert serving["model_path"] == "BAAI/bge-reranker-large"
+    assert serving["onnx"] == {"export_dir": "models/onnx", "opset": 17}
+    assert serving["batch_size"] == 32 and serving["sort_by_length"] is True
+
+
+@pytest.mark.parametrize("content", [
+    "not json",
+    json.dumps([1, 2]),
+    json.dumps({"serving": "onnx"}),
+    json.dumps({"serving": {"onnx": "x", "num_threads": "many", "batch_size": None}, "models": []}),
+])
+def test_load_serving_config_malformed_falls_back_to_defaults(tmp_path, content):
+    path = tmp_path / "models.json"
+    path.write_text(content, encoding="utf-8")
+    serving = load_serving_config(str(path))
+    assert serving["backend"] == "torch"
+    assert serving["onnx"] == rb.DEFAULT_SERVING["onnx"]
+    assert serving["num_threads"] == 0 and serving["batch_size"] == 32
+    assert serving["model_path"] == "BAAI/bge-reranker-base"
+    assert load_serving_config(str(tmp_path / "missing.json"))["backend"] == "torch"
+
+
+@pytest.mark.parametrize("backend", ["torch", "onnx", "onnx-int8"])
+def test_load_reranker_backend_selects_serving_backend(tmp_path, stub_backends, backend):
+    path = _write_config(tmp_path, {"backend": backend, "num_threads": 4, "batch_size": 16})
+
+    model = load_reranker_backend(path, env={})
+
+    assert model.name == backend
+    name, model_path, kwargs = stub_backends[-1]
+    assert (name, model_path) == (backend, "BAAI/bge-reranker-base")
+    assert kwargs["num_threads"] == 4 and kwargs["batch_size"] == 16
+    if backend != "torch":
+        assert kwargs["export_dir"] == "models/onnx" and kwargs["opset"] == 14
+
+
+def test_env_overrides_serving_block(tmp_path, stub_backends):
+    path = _write_config(tmp_path, {"backend": "torch"})
+    model = load_reranker_backend(path, env={"RERANK_BACKEND": "onnx", "MODEL_NAME": "local/model",
+                                             "RERANK_NUM_THREADS": "2", "MAX_LENGTH": "256"})
+    assert model.name == "onnx"
+    _, model_path, kwargs = stub_backends[-1]
+    assert model_path == "local/model" and kwargs["num_threads"] == 2 and kwargs["max_length"] == 256
+
+
+def test_missing_onnx_runtime_falls_back_to_torch(tmp_path, stub_backends, monkeypatch):
+    class _NoOnnx:
+        def __init__(self, *args, **kwargs):
+            raise ImportError("No module named 'onnxruntime'")
+
+    monkeypatch.setattr(rb, "OnnxBackend", _NoOnnx)
+    path = _write_config(tmp_path, {"backend": "onnx-int8"})
+
+    assert load_reranker_backend(path, env={}).name == "torch"
+
+
+def test_unknown_backend_falls_back_to_torch(tmp_path, stub_backends):
+    path = _write_config(tmp_path, {"backend": "tensorrt"})
+    assert load_reranker_backend(path, env={}).name == "torch"
+    with pytest.raises(ValueError, match="Unsupported reranker backend"):
+        create_backend("tensorrt", "m")
+
+
+def test_torch_load_failure_is_not_swallowed(tmp_path, monkeypatch):
+    class _BrokenTorch:
+        def __init__(self, *args, **kwargs):
+            raise ImportError("No module named 'torch'")
+
+    monkeypatch.setattr(rb, "TorchBackend", _BrokenTorch)
+    with pytest.raises(ImportError):
+        load_reranker_backend(_write_config(tmp_path, {"backend": "torch"}), env={})